@@ -0,0 +1,62 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+PRIVATE = "private, no-cache"
+
+
+def _opaque(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Weak comparison against If-None-Match, as RFC 7232 prescribes for GET."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    wanted = _opaque(etag)
+    return any(_opaque(t.strip()) == wanted for t in header.split(","))
+
+
+def _http_date(ts: datetime) -> str:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return format_datetime(ts.astimezone(timezone.utc), usegmt=True)
+
+
+def _not_modified_since(request: Request, last_modified: Optional[datetime]) -> bool:
+    header = request.headers.get("if-modified-since")
+    if not header or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)
+    # HTTP dates have one-second resolution
+    return last_modified.replace(microsecond=0) <= since
+
+
+def conditional(request: Request, response: Response, etag: str,
+                last_modified: Optional[datetime] = None,
+                cache_control: str = PRIVATE) -> Optional[Response]:
+    """
+    Sets the validators on `response` and returns a 304 to send instead when
+    the client's copy is current. If-Modified-Since only counts when the
+    request has no If-None-Match.
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = _http_date(last_modified)
+    response.headers.update(headers)
+
+    if "if-none-match" in request.headers:
+        fresh = etag_matches(request, etag)
+    else:
+        fresh = _not_modified_since(request, last_modified)
+    return Response(status_code=304, headers=headers) if fresh else None
@@ -1,16 +1,20 @@
-from typing import Optional, Union
-from fastapi import Depends, HTTPException, status
+from typing import List, Optional, Tuple, Union
+from fastapi import Depends, HTTPException, Query, WebSocket, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.config import settings
 from app.core import security
+from app.db import session as db_session
+from app.db.loaders import loaders
 from app.db.session import get_db
 from app.models.doctor import Doctor
 from app.models.patient import Patient
 from app.schemas.user import TokenPayload
 from app.models.user import User
+from app.services.model_runtime import CONDITION_SLUGS
+from app.services.prediction import OUTPUTS, RISK_CONDITIONS
 from sqlalchemy import select
 
 reusable_oauth2 = OAuth2PasswordBearer(
@@ -19,9 +23,7 @@ reusable_oauth2 = OAuth2PasswordBearer(
 )
 
 
-async def get_current_user_data(
-    db: AsyncSession = Depends(get_db), token: Optional[str] = Depends(reusable_oauth2)
-) -> dict:
+def decode_access_token(token: Optional[str]) -> dict:
     if not token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -49,6 +51,23 @@ async def get_current_user_data(
     return {"id": int(token_data.sub), "role": role}
 
 
+def websocket_token(websocket: WebSocket, token: Optional[str]) -> Optional[str]:
+    # Browsers can't set headers on a WebSocket, so the token may also come as ?token=
+    if token is not None:
+        return token
+    scheme, _, credentials = websocket.headers.get("authorization", "").partition(" ")
+    return credentials if scheme.lower() == "bearer" else None
+
+
+async def get_current_user_data(
+    db: AsyncSession = Depends(get_db), token: Optional[str] = Depends(reusable_oauth2)
+) -> dict:
+    auth_data = decode_access_token(token)
+    # Routes this client's reads to the primary for a while after it writes
+    db.info["client"] = (auth_data["role"], auth_data["id"])
+    return auth_data
+
+
 async def get_current_doctor(
     db: AsyncSession = Depends(get_db),
     auth_data: dict = Depends(get_current_user_data)
@@ -56,28 +75,31 @@ async def get_current_doctor(
     if auth_data["role"] != "doctor":
         raise HTTPException(status_code=403, detail="Not authorized as doctor")
 
-    result = await db.execute(select(Doctor).filter(Doctor.id == auth_data["id"]))
-    doctor = result.scalars().first()
+    # Comes with its hospital; later lookups in the request reuse it.
+    doctor = await loaders(db).doctors.load(auth_data["id"])
     if not doctor:
         raise HTTPException(status_code=404, detail="Doctor not found")
     return doctor
 
 
-async def get_current_patient(
-    db: AsyncSession = Depends(get_db),
-    auth_data: dict = Depends(get_current_user_data)
-) -> Patient:
+async def load_patient(db: AsyncSession, auth_data: dict) -> Patient:
     if auth_data["role"] != "patient":
         raise HTTPException(
             status_code=403, detail="Not authorized as patient")
 
-    result = await db.execute(select(Patient).filter(Patient.id == auth_data["id"]))
-    patient = result.scalars().first()
+    patient = await loaders(db).patients.load(auth_data["id"])
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
     return patient
 
 
+async def get_current_patient(
+    db: AsyncSession = Depends(get_db),
+    auth_data: dict = Depends(get_current_user_data)
+) -> Patient:
+    return await load_patient(db, auth_data)
+
+
 async def get_current_user_optional(
     db: AsyncSession = Depends(get_db),
     token: Optional[str] = Depends(reusable_oauth2)
@@ -94,13 +116,24 @@ async def get_current_user_optional(
         return None
 
     if role == "doctor":
-        result = await db.execute(select(Doctor).filter(Doctor.id == int(token_data.sub)))
-    elif role == "patient":
-        result = await db.execute(select(Patient).filter(Patient.id == int(token_data.sub)))
-    else:
-        return None
+        return await loaders(db).doctors.load(int(token_data.sub))
+    if role == "patient":
+        return await loaders(db).patients.load(int(token_data.sub))
+    return None
+
 
-    return result.scalars().first()
+async def token_is_admin(token: Optional[str]) -> bool:
+    """Admin check for code outside the dependency system, such as middleware."""
+    try:
+        auth_data = decode_access_token(token)
+    except HTTPException:
+        return False
+    # Patient, doctor and user ids overlap, so the token must say it is an admin's.
+    if auth_data["role"] != "admin":
+        return False
+    async with db_session.SessionLocal() as db:
+        result = await db.execute(select(User.role).filter(User.id == auth_data["id"]))
+        return result.scalar() == "admin"
 
 
 async def get_current_user(
@@ -113,3 +146,26 @@ async def get_current_user(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
+
+
+def _names(value: Optional[str], known, aliases=None) -> Optional[List[str]]:
+    if value is None:
+        return None
+    names = [(aliases or {}).get(v.strip(), v.strip()) for v in value.split(",") if v.strip()]
+    unknown = sorted(set(names) - set(known))
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown names: {', '.join(unknown)}")
+    return names
+
+
+def prediction_selection(
+    conditions: Optional[str] = Query(
+        None, description="Comma-separated conditions (names or slugs such as diabetes); "
+                          "all of them when omitted"),
+    outputs: Optional[str] = Query(
+        None, description=f"Comma-separated parts out of {', '.join(OUTPUTS)} to return "
+                          "with the predictions; all of them when omitted"),
+) -> Tuple[Optional[List[str]], Optional[List[str]]]:
+    """The conditions and outputs a predictions request asks for; only those are computed."""
+    slugs = {slug: condition for condition, slug in CONDITION_SLUGS.items()}
+    return _names(conditions, RISK_CONDITIONS, slugs), _names(outputs, OUTPUTS)
@@ -1,12 +1,16 @@
 import random
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from app.db.session import get_db
 from app.models.user import User
-from app.models.health_metrics import HealthMetric
+from app.db.partitioning import metrics_source
 from app.schemas.user import User as UserSchema
 from app.api.deps import get_current_user
+from app.core.profiling import folded_text, profile_store
+from app.services import retention, risk_batch
+from app.services.model_runtime import model_runtime
 from typing import List
 
 router = APIRouter()
@@ -33,7 +37,8 @@ async def get_system_stats(
     admin_user: User = Depends(is_admin)
 ):
     user_count = await db.execute(select(func.count(User.id)))
-    metric_count = await db.execute(select(func.count(HealthMetric.id)))
+    metrics = await metrics_source(db)
+    metric_count = await db.execute(select(func.count()).select_from(metrics))
 
     return {
         "total_users": user_count.scalar(),
@@ -41,3 +46,75 @@ async def get_system_stats(
         "system_status": "Healthy",
         "active_devices": random.randint(5, 20)  # Simulated
     }
+
+
+@router.post("/retention/run")
+async def run_retention(
+    dry_run: bool = False,
+    admin_user: User = Depends(is_admin)
+):
+    try:
+        progress = retention.start_retention_run(dry_run=dry_run)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return progress.as_dict()
+
+
+@router.get("/retention/status")
+async def get_retention_status(admin_user: User = Depends(is_admin)):
+    status = retention.retention_status()
+    if status is None:
+        raise HTTPException(status_code=404, detail="No retention run yet")
+    return status
+
+
+@router.post("/risk-assessment/run")
+async def run_risk_assessment(
+    resume: bool = True,
+    admin_user: User = Depends(is_admin)
+):
+    try:
+        progress = risk_batch.start_risk_run(resume=resume)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return progress.as_dict()
+
+
+@router.get("/risk-assessment/status")
+async def get_risk_assessment_status(admin_user: User = Depends(is_admin)):
+    status = risk_batch.risk_run_status()
+    if status is None:
+        raise HTTPException(status_code=404, detail="No risk assessment run yet")
+    return status
+
+
+@router.get("/models")
+async def get_models(admin_user: User = Depends(is_admin)):
+    return model_runtime.status()
+
+
+@router.post("/models/reload")
+async def reload_models(admin_user: User = Depends(is_admin)):
+    changes = await model_runtime.reload()
+    return {"changed": changes, "models": model_runtime.status()}
+
+
+@router.get("/profiles")
+async def list_profiles(admin_user: User = Depends(is_admin)):
+    return profile_store.list()
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(
+    profile_id: str,
+    format: str = "json",
+    admin_user: User = Depends(is_admin)
+):
+    # format=folded downloads the stacks for flamegraph.pl or speedscope
+    profile = profile_store.load(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "folded":
+        return PlainTextResponse(folded_text(profile), headers={
+            "Content-Disposition": f'attachment; filename="{profile_id}.folded"'})
+    return profile
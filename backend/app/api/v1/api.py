@@ -1,6 +1,6 @@
 import time
 from fastapi import APIRouter
-from app.api.v1 import auth, predictions, hospitals, doctors, patients, admin
+from app.api.v1 import auth, predictions, hospitals, doctors, patients, admin, exports
 
 api_router = APIRouter()
 api_router.include_router(auth.router, prefix="/auth", tags=["auth"])
@@ -12,6 +12,7 @@ api_router.include_router(
 api_router.include_router(
     predictions.router, prefix="/predictions", tags=["predictions"])
 api_router.include_router(admin.router, prefix="/admin", tags=["admin"])
+api_router.include_router(exports.router, prefix="/exports", tags=["exports"])
 
 
 @api_router.get("/health")
@@ -9,6 +9,7 @@ from app.schemas.doctor import DoctorCreate, Doctor as DoctorSchema, DoctorLogin
 from app.schemas.patient import PatientLogin, Patient as PatientSchema
 from app.schemas.user import Token
 from app.core.security import verify_password, create_access_token, get_password_hash
+from app.services.events import REFERENCE_UPDATED, publish_on_commit
 
 router = APIRouter()
 
@@ -32,6 +33,7 @@ async def doctor_signup(doctor_in: DoctorCreate, db: AsyncSession = Depends(get_
             )
         )
         db.add(hospital)
+        publish_on_commit(db, REFERENCE_UPDATED, {"table": "hospitals"})
         await db.commit()
         await db.refresh(hospital)
         hospital_id = hospital.id
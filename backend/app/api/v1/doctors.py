@@ -1,29 +1,45 @@
-from sqlalchemy.orm import selectinload
 from app.models.appointment import Appointment
 from app.schemas.appointment import AppointmentCreate, Appointment as AppointmentSchema
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, or_
 from sqlalchemy.orm import joinedload
 
 from typing import List, Optional
-from app.db.session import get_db
-from app.api.deps import get_current_doctor
+from datetime import date, datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from app.db.session import get_db, get_read_db
+from app.api.caching import conditional
+from app.api.deps import (
+    decode_access_token, get_current_doctor, prediction_selection, websocket_token,
+)
+from app.db import session as db_session
+from app.db.loaders import loaders
 from app.models.doctor import Doctor
 from app.models.patient import Patient
-from app.models.hospital import Hospital
-from app.models.health_metrics import HealthMetric
+from app.models.risk_assessment import RiskAssessment
 from app.schemas.patient import PatientCreate, Patient as PatientSchema
 from app.schemas.doctor import Doctor as DoctorSchema, DoctorUpdate
 from app.schemas.health_metric import HealthMetric as HealthMetricSchema
+from app.schemas.prediction import RiskAssessment as RiskAssessmentSchema
+from app.core.config import settings
 from app.core.security import get_password_hash
+from app.services.appointments import CANCELLED, find_conflict, free_slots
+from app.services.dashboard import FIELDS as DASHBOARD_FIELDS, doctor_dashboard
+from app.services.events import APPOINTMENT_CHANGED, PROFILE_UPDATED, publish_on_commit
+from app.services.data_quality import patient_data_quality, quality_version
+from app.services.features import patient_features
+from app.services.model_runtime import model_runtime
+from app.services.live import relay_feed
+from app.services.versions import metrics_validators
+from app.services.vitals import metric_history
 
 router = APIRouter()
 
 
 @router.get("/stats")
 async def get_doctor_stats(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_doctor: Doctor = Depends(get_current_doctor)
 ):
     # Total patients for this doctor
@@ -51,23 +67,39 @@ async def get_doctor_stats(
     }
 
 
+@router.get("/dashboard")
+async def get_dashboard(
+    fields: Optional[str] = Query(
+        None, description=f"Comma-separated sections out of {', '.join(DASHBOARD_FIELDS)}; "
+                          "all of them when omitted"),
+    patient_limit: int = Query(10, ge=1, le=100),
+    appointment_limit: int = Query(20, ge=1, le=200),
+    db: AsyncSession = Depends(get_read_db),
+    current_doctor: Doctor = Depends(get_current_doctor)
+):
+    # Everything the dashboard shows, for one token decode and one doctor lookup.
+    wanted = [f.strip() for f in fields.split(",") if f.strip()] if fields else DASHBOARD_FIELDS
+    unknown = sorted(set(wanted) - set(DASHBOARD_FIELDS))
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown fields: {', '.join(unknown)}")
+    return await doctor_dashboard(db, _with_hospital(current_doctor), wanted,
+                                  patient_limit, appointment_limit)
+
+
+def _with_hospital(doctor: Doctor) -> Doctor:
+    # The doctor loader brings the hospital along, so this doesn't query.
+    if doctor.hospital:
+        doctor.hospital_name = doctor.hospital.name
+        doctor.hospital_address = doctor.hospital.address
+        doctor.hospital_contact = doctor.hospital.contact_number
+    return doctor
+
+
 @router.get("/me", response_model=DoctorSchema)
 async def get_doctor_me(
-    db: AsyncSession = Depends(get_db),
     current_doctor: Doctor = Depends(get_current_doctor)
 ):
-    # Ensure hospital is loaded
-    result = await db.execute(
-        select(Doctor).options(joinedload(Doctor.hospital)).where(
-            Doctor.id == current_doctor.id)
-    )
-    doc = result.scalars().first()
-    if doc:
-        doc.hospital_name = doc.hospital.name
-        doc.hospital_address = doc.hospital.address
-        doc.hospital_contact = doc.hospital.contact_number
-        return doc
-    return current_doctor
+    return _with_hospital(current_doctor)
 
 
 @router.patch("/me", response_model=DoctorSchema)
@@ -81,14 +113,11 @@ async def update_doctor_me(
         setattr(current_doctor, field, value)
 
     db.add(current_doctor)
+    publish_on_commit(db, PROFILE_UPDATED, {"kind": "doctor", "id": current_doctor.id})
     await db.commit()
-    await db.refresh(current_doctor)
-
-    # Repopulate hospital info
-    current_doctor.hospital_name = current_doctor.hospital.name
-    current_doctor.hospital_address = current_doctor.hospital.address
-    current_doctor.hospital_contact = current_doctor.hospital.contact_number
-    return current_doctor
+    # No refresh: it would expire the hospital, and reading it back would
+    # need a lazy load, which AsyncSession can't do.
+    return _with_hospital(current_doctor)
 
 
 @router.post("/patients", response_model=PatientSchema)
@@ -101,8 +130,7 @@ async def add_patient(
     # HOSPCODE + PID + NUMBER (e.g. HOSP-PID-1001)
 
     # Get hospital code
-    result = await db.execute(select(Hospital).where(Hospital.id == current_doctor.hospital_id))
-    hospital = result.scalars().first()
+    hospital = await loaders(db).hospitals.load(current_doctor.hospital_id)
     if not hospital:
         raise HTTPException(status_code=404, detail="Hospital not found")
 
@@ -143,7 +171,7 @@ async def add_patient(
 
 @router.get("/patients", response_model=List[PatientSchema])
 async def list_patients(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_doctor: Doctor = Depends(get_current_doctor),
     skip: int = 0,
     limit: int = 20,
@@ -171,7 +199,7 @@ async def list_patients(
 
 @router.get("/appointments", response_model=List[AppointmentSchema])
 async def list_appointments(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_doctor: Doctor = Depends(get_current_doctor)
 ):
     result = await db.execute(
@@ -185,26 +213,71 @@ async def list_appointments(
     return appointments
 
 
+def _conflict(conflict) -> HTTPException:
+    start, end, appointment_id = conflict
+    return HTTPException(
+        status_code=409,
+        detail=f"Overlaps appointment {appointment_id} "
+               f"({start:%Y-%m-%d %H:%M}-{end:%H:%M} UTC)")
+
+
 @router.post("/appointments", response_model=AppointmentSchema)
 async def book_appointment(
     appointment_in: AppointmentCreate,
     db: AsyncSession = Depends(get_db),
     current_doctor: Doctor = Depends(get_current_doctor)
 ):
+    if appointment_in.status != CANCELLED:
+        conflict = await find_conflict(db, current_doctor.id, appointment_in.start_at,
+                                       appointment_in.end_at)
+        if conflict:
+            raise _conflict(conflict)
     db_obj = Appointment(
         doctor_id=current_doctor.id,
         patient_id=appointment_in.patient_id,
         date=appointment_in.date,
         time=appointment_in.time,
+        start_at=appointment_in.start_at,
+        end_at=appointment_in.end_at,
         reason=appointment_in.reason,
         status=appointment_in.status
     )
     db.add(db_obj)
-    await db.commit()
+    publish_on_commit(db, APPOINTMENT_CHANGED, {"doctor_id": current_doctor.id})
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Postgres' exclusion constraint caught a concurrent booking.
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Overlaps another appointment")
     await db.refresh(db_obj)
     return db_obj
 
 
+@router.get("/availability")
+async def get_availability(
+    start: date,
+    end: Optional[date] = None,
+    slot_minutes: Optional[int] = Query(None, ge=5, le=480),
+    db: AsyncSession = Depends(get_read_db),
+    current_doctor: Doctor = Depends(get_current_doctor)
+):
+    """Free slots in clinic hours from `start` through `end` (inclusive, UTC days)."""
+    end = end or start
+    if end < start:
+        raise HTTPException(status_code=422, detail="end is before start")
+    if (end - start).days >= settings.AVAILABILITY_MAX_DAYS:
+        raise HTTPException(
+            status_code=422, detail=f"At most {settings.AVAILABILITY_MAX_DAYS} days at a time")
+    slot_minutes = slot_minutes or settings.APPOINTMENT_DEFAULT_MINUTES
+    slots = await free_slots(db, current_doctor.id, start, end, timedelta(minutes=slot_minutes))
+    return {
+        "doctor_id": current_doctor.id,
+        "slot_minutes": slot_minutes,
+        "slots": [{"start": s.isoformat(), "end": e.isoformat()} for s, e in slots],
+    }
+
+
 @router.patch("/appointments/{appointment_id}", response_model=AppointmentSchema)
 async def update_appointment_status(
     appointment_id: int,
@@ -221,17 +294,32 @@ async def update_appointment_status(
     if not appointment:
         raise HTTPException(status_code=404, detail="Appointment not found")
 
+    if appointment.status == CANCELLED and status != CANCELLED and appointment.start_at:
+        # Reinstating a cancelled booking must not double-book its slot.
+        conflict = await find_conflict(db, current_doctor.id, appointment.start_at,
+                                       appointment.end_at, exclude_id=appointment.id)
+        if conflict:
+            raise _conflict(conflict)
     appointment.status = status
     db.add(appointment)
+    publish_on_commit(db, APPOINTMENT_CHANGED, {"doctor_id": current_doctor.id})
     await db.commit()
     await db.refresh(appointment)
     return appointment
 
 
+async def _own_patient(db: AsyncSession, doctor: Doctor, patient_id: int) -> Optional[Patient]:
+    """The patient, through the request's loader, if they are under `doctor`."""
+    patient = await loaders(db).patients.load(patient_id)
+    if patient is None or patient.doctor_id != doctor.id:
+        return None
+    return patient
+
+
 @router.get("/patients/by-clinical-id/{clinical_id}", response_model=PatientSchema)
 async def get_patient_by_clinical_id(
     clinical_id: str,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_doctor: Doctor = Depends(get_current_doctor)
 ):
     result = await db.execute(
@@ -254,17 +342,10 @@ async def get_patient_by_clinical_id(
 @router.get("/patients/{patient_id}", response_model=PatientSchema)
 async def get_patient_detail(
     patient_id: int,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_doctor: Doctor = Depends(get_current_doctor)
 ):
-    result = await db.execute(
-        select(Patient)
-        .options(joinedload(Patient.hospital))
-        .where(Patient.id == patient_id)
-        .where(Patient.doctor_id == current_doctor.id)
-        .options(selectinload(Patient.hospital))
-    )
-    patient = result.scalars().first()
+    patient = await _own_patient(db, current_doctor, patient_id)
     if not patient:
         raise HTTPException(
             status_code=404, detail=f"Patient ID {patient_id} not found for current doctor")
@@ -282,58 +363,106 @@ async def get_patient_detail(
 @router.get("/patients/{patient_id}/metrics", response_model=List[HealthMetricSchema])
 async def list_patient_metrics(
     patient_id: int,
-    db: AsyncSession = Depends(get_db),
+    request: Request,
+    response: Response,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_read_db),
     current_doctor: Doctor = Depends(get_current_doctor)
 ):
     # Verify patient belongs to doctor
-    result = await db.execute(
-        select(Patient)
-        .where(Patient.id == patient_id)
-        .where(Patient.doctor_id == current_doctor.id)
-    )
-    if not result.scalars().first():
+    if not await _own_patient(db, current_doctor, patient_id):
         raise HTTPException(status_code=404, detail="Patient not found")
 
-    metric_result = await db.execute(
-        select(HealthMetric)
-        .where(HealthMetric.patient_id == patient_id)
-        .order_by(HealthMetric.timestamp.desc())
-    )
-    return metric_result.scalars().all()
+    etag, last_modified = await metrics_validators(db, patient_id)
+    not_modified = conditional(request, response, etag, last_modified)
+    if not_modified:
+        return not_modified
+
+    # A time range lets partitioned storage skip months outside it
+    return await metric_history(db, patient_id, start=start, end=end)
 
 
 @router.get("/patients/{patient_id}/predictions")
 async def get_patient_predictions(
     patient_id: int,
-    db: AsyncSession = Depends(get_db),
+    request: Request,
+    response: Response,
+    selection: tuple = Depends(prediction_selection),
+    db: AsyncSession = Depends(get_read_db),
     current_doctor: Doctor = Depends(get_current_doctor)
 ):
     # Verify patient belongs to doctor
-    p_result = await db.execute(
-        select(Patient)
-        .where(Patient.id == patient_id)
-        .where(Patient.doctor_id == current_doctor.id)
-    )
-    patient = p_result.scalars().first()
-    if not patient:
+    if not await _own_patient(db, current_doctor, patient_id):
         raise HTTPException(status_code=404, detail="Patient not found")
 
-    # Fetch latest metrics for the patient
-    metrics_query = select(HealthMetric).where(
-        HealthMetric.patient_id == patient_id
-    ).order_by(HealthMetric.timestamp.desc()).limit(20)
-
-    result = await db.execute(metrics_query)
-    metrics_list = result.scalars().all()
+    # Data quality, and the confidences it lowers, drift without any new reading.
+    quality = await patient_data_quality(db, patient_id)
+    etag, last_modified = await metrics_validators(
+        db, patient_id, model_runtime.fingerprint, quality_version(quality))
+    not_modified = conditional(request, response, etag, last_modified)
+    if not_modified:
+        return not_modified
 
-    # Simple mapping to latest values
-    latest_metrics = {}
-    for m in metrics_list:
-        if m.metric_type not in latest_metrics:
-            latest_metrics[m.metric_type] = m.value
+    # Fetch latest metrics for the patient
+    latest_metrics = await loaders(db).latest_metrics.load(patient_id)
 
-    from app.services.prediction import predict_multi_disease_risk
     # Use default age/bmi for now or pull from patient profile if we add those fields
-    analysis = predict_multi_disease_risk(
-        latest_metrics, {"age": 52, "bmi": 28.4})
+    conditions, outputs = selection
+    analysis = await model_runtime.predict(
+        latest_metrics, {"age": 52, "bmi": 28.4}, await patient_features(db, patient_id),
+        conditions, outputs, quality)
     return analysis
+
+
+@router.get("/patients/{patient_id}/risk-history", response_model=List[RiskAssessmentSchema])
+async def get_patient_risk_history(
+    patient_id: int,
+    condition: Optional[str] = None,
+    start: Optional[datetime] = None,
+    limit: int = Query(200, ge=1, le=1000),
+    db: AsyncSession = Depends(get_read_db),
+    current_doctor: Doctor = Depends(get_current_doctor)
+):
+    # Precomputed by the batch risk job; only changes in risk are stored.
+    if not await _own_patient(db, current_doctor, patient_id):
+        raise HTTPException(status_code=404, detail="Patient not found")
+
+    query = select(RiskAssessment).where(RiskAssessment.patient_id == patient_id)
+    if condition:
+        query = query.where(RiskAssessment.disease_type == condition)
+    if start:
+        query = query.where(RiskAssessment.assessment_date >= start)
+    result = await db.execute(
+        query.order_by(RiskAssessment.assessment_date.desc(), RiskAssessment.id.desc())
+        .limit(limit))
+    return result.scalars().all()
+
+
+@router.websocket("/patients/{patient_id}/live")
+async def live_patient_feed(
+    websocket: WebSocket,
+    patient_id: int,
+    token: Optional[str] = None,
+):
+    # Pushes the patient's new readings and alerts as they are ingested,
+    # whichever worker ingested them.
+    token = websocket_token(websocket, token)
+    try:
+        auth_data = decode_access_token(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    async with db_session.SessionLocal() as db:
+        result = await db.execute(
+            select(Patient.id)
+            .where(Patient.id == patient_id)
+            .where(Patient.doctor_id == auth_data["id"])
+        )
+        owned = result.scalar() is not None
+    if auth_data["role"] != "doctor" or not owned:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    await relay_feed(websocket, patient_id)
@@ -0,0 +1,79 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from app.db.routing import read_engine
+from app.db.session import get_read_db
+from app.api.deps import get_current_doctor
+from app.models.doctor import Doctor
+from app.models.patient import Patient
+from app.services.export import (
+    DEFAULT_CHUNK_SIZE, MEDIA_TYPES, ExportError, ExportScope,
+    export_filename, stream_export, validate_options,
+)
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def export_metrics(
+    scope: str = Query("patient", pattern="^(patient|panel|hospital)$"),
+    patient_id: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    format: str = "csv",
+    compression: str = "none",
+    after_id: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    db: AsyncSession = Depends(get_read_db),
+    current_doctor: Doctor = Depends(get_current_doctor)
+):
+    """
+    Streams health_metrics for one patient, the doctor's panel or the doctor's
+    hospital. Rows are ordered by id; pass the last id received as `after_id`
+    to resume an interrupted download.
+    """
+    try:
+        validate_options(format, compression, chunk_size)
+    except ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if scope == "patient":
+        if patient_id is None:
+            raise HTTPException(
+                status_code=400, detail="patient_id is required for patient scope")
+        result = await db.execute(
+            select(Patient.id)
+            .where(Patient.id == patient_id)
+            .where(Patient.doctor_id == current_doctor.id)
+        )
+        if result.scalar() is None:
+            raise HTTPException(status_code=404, detail="Patient not found")
+        export_scope = ExportScope(patient_id=patient_id)
+    elif scope == "panel":
+        export_scope = ExportScope(doctor_id=current_doctor.id)
+    else:
+        export_scope = ExportScope(hospital_id=current_doctor.hospital_id)
+
+    body = stream_export(
+        export_scope,
+        fmt=format,
+        compression=compression,
+        start=start,
+        end=end,
+        after_id=after_id,
+        chunk_size=chunk_size,
+        include_header=after_id is None,
+        engine=read_engine(db.info.get("client")),
+    )
+    filename = export_filename(export_scope, format, compression)
+    media_type = MEDIA_TYPES[format]
+    if format != "parquet" and compression == "gzip":
+        media_type = "application/gzip"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
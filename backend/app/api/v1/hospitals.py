@@ -1,15 +1,21 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from fastapi import APIRouter, Request, Response
 from typing import List
-from app.db.session import get_db
-from app.models.hospital import Hospital
+from app.api.caching import conditional
 from app.schemas.hospital import Hospital as HospitalSchema
+from app.services.reference import hospitals_cache
+from app.services.versions import weak_etag
 
 router = APIRouter()
 
 
 @router.get("/", response_model=List[HospitalSchema])
-async def get_hospitals(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Hospital))
-    return result.scalars().all()
+async def get_hospitals(request: Request, response: Response):
+    # Served pre-encoded from the process cache; the database is only read on expiry.
+    body, generation = await hospitals_cache.get()
+    not_modified = conditional(request, response, weak_etag("hospitals", generation),
+                               cache_control="public, no-cache")
+    if not_modified:
+        return not_modified
+    return Response(content=body, media_type="application/json",
+                    headers={"ETag": response.headers["etag"],
+                             "Cache-Control": response.headers["cache-control"]})
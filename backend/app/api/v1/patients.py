@@ -1,46 +1,65 @@
-from fastapi import APIRouter, Depends
+import math
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, WebSocket, status
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload, joinedload
-from typing import List
-from app.db.session import get_db
-from app.api.deps import get_current_patient
+from typing import List, Optional
+from app.db import session as db_session
+from app.db.loaders import loaders
+from app.db.session import get_db, get_read_db
+from app.api.caching import conditional
+from app.api.deps import (
+    decode_access_token, get_current_patient, load_patient, prediction_selection,
+    websocket_token,
+)
 from app.models.patient import Patient
 from app.models.appointment import Appointment
-from app.models.health_metrics import HealthMetric
 from app.schemas.patient import Patient as PatientSchema, PatientUpdate
 from app.schemas.appointment import Appointment as AppointmentSchema
 from app.schemas.health_metric import HealthMetric as HealthMetricSchema, HealthMetricCreate
+from app.services.device_stream import ENCODINGS, IngestStream
+from app.services.idempotency import original_reading, recent_keys
+from app.services.ingestion import Reading, reading_key, store_values
+from app.services.rate_limit import admit
+from app.services.events import PROFILE_UPDATED, publish_on_commit
+from app.services.data_quality import patient_data_quality, quality_version
+from app.services.features import patient_features
+from app.services.model_runtime import model_runtime
+from app.services.versions import DOCTOR, PROFILE, metrics_validators, version, weak_etag
+from app.services.vitals import metric_history
 
 router = APIRouter()
 
 
+def _with_display_fields(p: Patient) -> Patient:
+    # The patient loader brings the doctor and hospital along, so this doesn't query.
+    p.doctor_name = p.doctor.full_name
+    p.doctor_specialization = p.doctor.role
+    p.doctor_qualification = p.doctor.qualification
+    p.hospital_name = p.hospital.name
+    p.hospital_address = p.hospital.address
+    p.hospital_contact = p.hospital.contact_number
+    # Simple DOB display format
+    dob = p.dob  # assuming DDMMYYYY
+    if len(dob) == 8:
+        p.dob_display = f"{dob[:2]}-{dob[2:4]}-{dob[4:]}"
+    return p
+
+
 @router.get("/me", response_model=PatientSchema)
 async def get_patient_me(
-    db: AsyncSession = Depends(get_db),
+    request: Request,
+    response: Response,
     current_patient: Patient = Depends(get_current_patient)
 ):
-    # Ensure relationships are loaded
-    result = await db.execute(
-        select(Patient)
-        .options(joinedload(Patient.doctor), joinedload(Patient.hospital))
-        .where(Patient.id == current_patient.id)
-    )
-    p = result.scalars().first()
-    if p:
-        # Add display fields for frontend
-        p.doctor_name = p.doctor.full_name
-        p.doctor_specialization = p.doctor.role
-        p.doctor_qualification = p.doctor.qualification
-        p.hospital_name = p.hospital.name
-        p.hospital_address = p.hospital.address
-        p.hospital_contact = p.hospital.contact_number
-        # Simple DOB display format
-        dob = p.dob  # assuming DDMMYYYY
-        if len(dob) == 8:
-            p.dob_display = f"{dob[:2]}-{dob[2:4]}-{dob[4:]}"
-        return p
-    return current_patient
+    etag = weak_etag(PROFILE, version(PROFILE, current_patient.id),
+                     version(DOCTOR, current_patient.doctor_id or 0))
+    not_modified = conditional(request, response, etag)
+    if not_modified:
+        return not_modified
+
+    return _with_display_fields(current_patient)
 
 
 @router.patch("/me", response_model=PatientSchema)
@@ -54,33 +73,15 @@ async def update_patient_me(
         setattr(current_patient, field, value)
 
     db.add(current_patient)
+    publish_on_commit(db, PROFILE_UPDATED, {"kind": "patient", "id": current_patient.id})
     await db.commit()
-    await db.refresh(current_patient)
-
-    # Re-fetch with relationships
-    result = await db.execute(
-        select(Patient)
-        .options(joinedload(Patient.doctor), joinedload(Patient.hospital))
-        .where(Patient.id == current_patient.id)
-    )
-    p = result.scalars().first()
-    if p:
-        p.doctor_name = p.doctor.full_name
-        p.doctor_specialization = p.doctor.role
-        p.doctor_qualification = p.doctor.qualification
-        p.hospital_name = p.hospital.name
-        p.hospital_address = p.hospital.address
-        p.hospital_contact = p.hospital.contact_number
-        dob = p.dob
-        if len(dob) == 8:
-            p.dob_display = f"{dob[:2]}-{dob[2:4]}-{dob[4:]}"
-        return p
-    return current_patient
+    # Not refreshed: that would expire the doctor and hospital loaded with it.
+    return _with_display_fields(current_patient)
 
 
 @router.get("/appointments", response_model=List[AppointmentSchema])
 async def list_appointments(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_patient: Patient = Depends(get_current_patient)
 ):
     result = await db.execute(
@@ -96,56 +97,131 @@ async def list_appointments(
 
 @router.get("/metrics", response_model=List[HealthMetricSchema])
 async def list_metrics(
-    db: AsyncSession = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
     current_patient: Patient = Depends(get_current_patient)
 ):
-    result = await db.execute(
-        select(HealthMetric)
-        .where(HealthMetric.patient_id == current_patient.id)
-        .order_by(HealthMetric.timestamp.desc())
-        .limit(100)
-    )
-    return result.scalars().all()
+    etag, last_modified = await metrics_validators(db, current_patient.id)
+    not_modified = conditional(request, response, etag, last_modified)
+    if not_modified:
+        return not_modified
+    return await metric_history(db, current_patient.id, limit=100)
 
 
 @router.get("/predictions")
 async def get_predictions(
-    db: AsyncSession = Depends(get_db),
+    request: Request,
+    response: Response,
+    selection: tuple = Depends(prediction_selection),
+    db: AsyncSession = Depends(get_read_db),
     current_patient: Patient = Depends(get_current_patient)
 ):
-    # Fetch latest metrics for the patient
-    metrics_query = select(HealthMetric).where(
-        HealthMetric.patient_id == current_patient.id
-    ).order_by(HealthMetric.timestamp.desc()).limit(20)
-
-    result = await db.execute(metrics_query)
-    metrics_list = result.scalars().all()
+    # Data quality, and the confidences it lowers, drift without any new reading.
+    quality = await patient_data_quality(db, current_patient.id)
+    etag, last_modified = await metrics_validators(
+        db, current_patient.id, model_runtime.fingerprint, quality_version(quality))
+    not_modified = conditional(request, response, etag, last_modified)
+    if not_modified:
+        return not_modified
 
-    # Simple mapping to latest values
-    latest_metrics = {}
-    for m in metrics_list:
-        if m.metric_type not in latest_metrics:
-            latest_metrics[m.metric_type] = m.value
+    # Fetch latest metrics for the patient
+    latest_metrics = await loaders(db).latest_metrics.load(current_patient.id)
 
-    from app.services.prediction import predict_multi_disease_risk
     # Use profile data or defaults
-    analysis = predict_multi_disease_risk(
-        latest_metrics, {"age": 52, "bmi": 28.4})
+    conditions, outputs = selection
+    analysis = await model_runtime.predict(
+        latest_metrics, {"age": 52, "bmi": 28.4},
+        await patient_features(db, current_patient.id),
+        conditions, outputs, quality)
     return analysis
 
 
+def _admit_or_429(patient_id: int, device: str, readings: List[HealthMetricCreate]) -> list:
+    # Rejected before any database work, so a device stuck retrying stays cheap.
+    device = device[:64]
+    fresh, repeats = [], []
+    for r in readings:
+        reading = Reading(r.metric_type, r.value, reading_key(device, r), r.timestamp)
+        # A retry of a reading already stored spends no tokens; ingestion
+        # drops it as a repeat and the caller gets the original back.
+        if reading.key is not None and (patient_id, reading.key) in recent_keys:
+            repeats.append(reading)
+        else:
+            fresh.append(reading)
+    admitted, retry_after = admit(patient_id, device, fresh, "rest")
+    if fresh and not admitted:
+        raise HTTPException(
+            status_code=429, detail="Device is over its ingestion rate limit",
+            headers={"Retry-After": str(max(math.ceil(retry_after), 1))})
+    return admitted + repeats
+
+
 @router.post("/metrics", response_model=HealthMetricSchema)
 async def create_metric(
     metric_in: HealthMetricCreate,
     db: AsyncSession = Depends(get_db),
-    current_patient: Patient = Depends(get_current_patient)
+    current_patient: Patient = Depends(get_current_patient),
+    x_device_id: str = Header("default"),
 ):
-    db_obj = HealthMetric(
-        patient_id=current_patient.id,
-        metric_type=metric_in.metric_type,
-        value=metric_in.value
-    )
-    db.add(db_obj)
+    admitted = _admit_or_429(current_patient.id, x_device_id, [metric_in])
+    result = await store_values(db, current_patient.id, admitted)
     await db.commit()
-    await db.refresh(db_obj)
-    return db_obj
+    if result.stored:
+        return result.stored[0]
+    if result.rolled_up:
+        # Too old to keep raw; it only exists in the hourly rollups now.
+        return JSONResponse(status_code=202, content={"rolled_up": 1})
+    # A retry of a reading already stored gets the original back.
+    original = await original_reading(db, current_patient.id, admitted[0].key)
+    if original is None:
+        raise HTTPException(status_code=409, detail="Reading was already submitted")
+    return original
+
+
+MAX_BULK_METRICS = 1000
+
+
+@router.post("/metrics/bulk")
+async def create_metrics_bulk(
+    metrics_in: List[HealthMetricCreate],
+    db: AsyncSession = Depends(get_db),
+    current_patient: Patient = Depends(get_current_patient),
+    x_device_id: str = Header("default"),
+):
+    # Devices that buffer readings upload them in one transaction
+    if len(metrics_in) > MAX_BULK_METRICS:
+        raise HTTPException(
+            status_code=413, detail=f"At most {MAX_BULK_METRICS} readings per request")
+
+    # Over the device's limit, the batch is thinned rather than refused.
+    admitted = _admit_or_429(current_patient.id, x_device_id, metrics_in)
+    result = await store_values(db, current_patient.id, admitted)
+    await db.commit()
+    return {"inserted": len(result.stored), "rolled_up": result.rolled_up,
+            "dropped": len(metrics_in) - len(admitted),
+            "duplicates": len(admitted) - len(result.stored) - result.rolled_up}
+
+
+@router.websocket("/metrics/ingest")
+async def ingest_metrics_stream(
+    websocket: WebSocket,
+    token: Optional[str] = None,
+    encoding: str = "json",
+    device: str = "default",
+):
+    # Authenticate once per connection instead of once per reading.
+    token = websocket_token(websocket, token)
+    if encoding not in ENCODINGS:
+        await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+        return
+    try:
+        auth_data = decode_access_token(token)
+        async with db_session.SessionLocal() as db:
+            patient = await load_patient(db, auth_data)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    await IngestStream(websocket, patient.id, device[:64], encoding).run()
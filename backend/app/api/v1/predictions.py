@@ -1,14 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from typing import Optional, List
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc
-from app.services.prediction import predict_multi_disease_risk
+from sqlalchemy import select
+from app.api.caching import conditional
+from app.services.data_quality import patient_data_quality, quality_version
+from app.services.features import patient_features
+from app.services.model_runtime import model_runtime
 from app.api.deps import get_current_user_optional, get_db, get_current_doctor
+from app.db.session import get_read_db
 from app.schemas.prediction import HealthAnalysisRequest, HealthAnalysisResponse
 from app.models.user import User
 from app.models.patient import Patient
 from app.models.doctor import Doctor
-from app.models.health_metrics import HealthMetric
+from app.services.versions import metrics_validators
+from app.services.vitals import latest_metric_values
 
 router = APIRouter()
 
@@ -19,7 +24,7 @@ async def analyze_health(
     current_user: Optional[User] = Depends(get_current_user_optional)
 ):
     metrics_dict = request.metrics.dict(exclude_unset=True)
-    prediction = predict_multi_disease_risk(metrics_dict)
+    prediction = await model_runtime.predict(metrics_dict)
 
     return {
         "user_id": str(current_user.id) if current_user else "demo_user",
@@ -28,20 +33,8 @@ async def analyze_health(
 
 
 async def _get_patient_latest_metrics(db: AsyncSession, patient_id: int):
-    # Fetch most recent metrics across types
-    result = await db.execute(
-        select(HealthMetric)
-        .where(HealthMetric.patient_id == patient_id)
-        .order_by(desc(HealthMetric.timestamp))
-        .limit(20)
-    )
-    metrics_list = result.scalars().all()
-
-    # Simple aggregation of latest unique types
-    metrics_dict = {}
-    for m in metrics_list:
-        if m.metric_type not in metrics_dict:
-            metrics_dict[m.metric_type] = float(m.value)
+    # Latest value of each metric type
+    metrics_dict = await latest_metric_values(db, patient_id)
 
     # Defaults for simulation if empty
     if not metrics_dict:
@@ -53,29 +46,34 @@ async def _get_patient_latest_metrics(db: AsyncSession, patient_id: int):
     return metrics_dict
 
 
-@router.get("/patient/{patient_clinical_id}/all", response_model=HealthAnalysisResponse)
-async def get_patient_all_predictions(
-    patient_clinical_id: str,
-    db: AsyncSession = Depends(get_db),
-    current_doctor: Doctor = Depends(get_current_doctor)
-):
+async def _get_registered_patient(db: AsyncSession, doctor: Doctor,
+                                 patient_clinical_id: str) -> Patient:
     # Verify patient belongs to doctor
     result = await db.execute(
         select(Patient).where(Patient.patient_id == patient_clinical_id)
-        .where(Patient.doctor_id == current_doctor.id)
+        .where(Patient.doctor_id == doctor.id)
     )
     patient = result.scalars().first()
     if not patient:
         raise HTTPException(
             status_code=404, detail="Patient profile not found in your clinical registry")
+    return patient
 
+
+async def _patient_summary(db: AsyncSession, patient: Patient,
+                           conditions: Optional[List[str]] = None,
+                           outputs: Optional[List[str]] = None,
+                           quality: Optional[dict] = None) -> dict:
     metrics_dict = await _get_patient_latest_metrics(db, patient.id)
+    if quality is None:
+        quality = await patient_data_quality(db, patient.id)
 
     # Calculate age for better prediction
     # dob is hashed in this system, so we might need to store age or just use default
     # For now, let's use a default age from a hypothetical field or just 45
-    prediction = predict_multi_disease_risk(
-        metrics_dict, {"age": 52, "bmi": 28.4})
+    prediction = await model_runtime.predict(
+        metrics_dict, {"age": 52, "bmi": 28.4}, await patient_features(db, patient.id),
+        conditions, outputs, quality)
 
     return {
         "user_id": str(patient.id),
@@ -83,44 +81,70 @@ async def get_patient_all_predictions(
     }
 
 
+async def _conditional_prediction(request: Request, response: Response,
+                                  patient_clinical_id: str, db: AsyncSession,
+                                  current_doctor: Doctor, condition: Optional[str] = None):
+    patient = await _get_registered_patient(db, current_doctor, patient_clinical_id)
+    # A new reading, a model swap or data quality drifting into another bucket
+    # (inputs going stale lower the confidences) changes the response.
+    quality = await patient_data_quality(db, patient.id)
+    etag, last_modified = await metrics_validators(
+        db, patient.id, model_runtime.fingerprint, quality_version(quality))
+    not_modified = conditional(request, response, etag, last_modified)
+    if not_modified:
+        return not_modified
+
+    if condition is None:
+        return await _patient_summary(db, patient, quality=quality)
+    # Only the one condition is scored
+    summary = await _patient_summary(db, patient, [condition], outputs=[], quality=quality)
+    return summary["predictions"][0]
+
+
+@router.get("/patient/{patient_clinical_id}/all", response_model=HealthAnalysisResponse)
+async def get_patient_all_predictions(
+    patient_clinical_id: str,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_read_db),
+    current_doctor: Doctor = Depends(get_current_doctor)
+):
+    return await _conditional_prediction(request, response, patient_clinical_id, db, current_doctor)
+
+
 # Individual endpoints as requested
 @router.get("/patient/{patient_clinical_id}/diabetes")
-async def get_diabetes_prediction(patient_clinical_id: str, db: AsyncSession = Depends(get_db), current_doctor: Doctor = Depends(get_current_doctor)):
-    summary = await get_patient_all_predictions(patient_clinical_id, db, current_doctor)
-    return next(p for p in summary["predictions"] if p["condition"] == "Diabetes")
+async def get_diabetes_prediction(patient_clinical_id: str, request: Request, response: Response, db: AsyncSession = Depends(get_read_db), current_doctor: Doctor = Depends(get_current_doctor)):
+    return await _conditional_prediction(request, response, patient_clinical_id, db, current_doctor, "Diabetes")
 
 
 @router.get("/patient/{patient_clinical_id}/hypertension")
-async def get_hypertension_prediction(patient_clinical_id: str, db: AsyncSession = Depends(get_db), current_doctor: Doctor = Depends(get_current_doctor)):
-    summary = await get_patient_all_predictions(patient_clinical_id, db, current_doctor)
-    return next(p for p in summary["predictions"] if p["condition"] == "Hypertension")
+async def get_hypertension_prediction(patient_clinical_id: str, request: Request, response: Response, db: AsyncSession = Depends(get_read_db), current_doctor: Doctor = Depends(get_current_doctor)):
+    return await _conditional_prediction(request, response, patient_clinical_id, db, current_doctor, "Hypertension")
 
 
 @router.get("/patient/{patient_clinical_id}/arrhythmia")
-async def get_arrhythmia_prediction(patient_clinical_id: str, db: AsyncSession = Depends(get_db), current_doctor: Doctor = Depends(get_current_doctor)):
-    summary = await get_patient_all_predictions(patient_clinical_id, db, current_doctor)
-    return next(p for p in summary["predictions"] if p["condition"] == "Cardiac Arrhythmia")
+async def get_arrhythmia_prediction(patient_clinical_id: str, request: Request, response: Response, db: AsyncSession = Depends(get_read_db), current_doctor: Doctor = Depends(get_current_doctor)):
+    return await _conditional_prediction(request, response, patient_clinical_id, db, current_doctor, "Cardiac Arrhythmia")
 
 
 @router.get("/patient/{patient_clinical_id}/respiratory")
-async def get_respiratory_prediction(patient_clinical_id: str, db: AsyncSession = Depends(get_db), current_doctor: Doctor = Depends(get_current_doctor)):
-    summary = await get_patient_all_predictions(patient_clinical_id, db, current_doctor)
-    return next(p for p in summary["predictions"] if p["condition"] == "Respiratory Breakdown")
+async def get_respiratory_prediction(patient_clinical_id: str, request: Request, response: Response, db: AsyncSession = Depends(get_read_db), current_doctor: Doctor = Depends(get_current_doctor)):
+    return await _conditional_prediction(request, response, patient_clinical_id, db, current_doctor, "Respiratory Breakdown")
 
 
 @router.get("/patient/{patient_clinical_id}/stress")
-async def get_stress_prediction(patient_clinical_id: str, db: AsyncSession = Depends(get_db), current_doctor: Doctor = Depends(get_current_doctor)):
-    summary = await get_patient_all_predictions(patient_clinical_id, db, current_doctor)
-    return next(p for p in summary["predictions"] if p["condition"] == "Stress Disorder")
+async def get_stress_prediction(patient_clinical_id: str, request: Request, response: Response, db: AsyncSession = Depends(get_read_db), current_doctor: Doctor = Depends(get_current_doctor)):
+    return await _conditional_prediction(request, response, patient_clinical_id, db, current_doctor, "Stress Disorder")
 
 
 @router.get("/patient/{patient_clinical_id}/cholesterol")
-async def get_cholesterol_prediction(patient_clinical_id: str, db: AsyncSession = Depends(get_db), current_doctor: Doctor = Depends(get_current_doctor)):
-    summary = await get_patient_all_predictions(patient_clinical_id, db, current_doctor)
-    return next(p for p in summary["predictions"] if p["condition"] == "Cholesterol")
+async def get_cholesterol_prediction(patient_clinical_id: str, request: Request, response: Response, db: AsyncSession = Depends(get_read_db), current_doctor: Doctor = Depends(get_current_doctor)):
+    return await _conditional_prediction(request, response, patient_clinical_id, db, current_doctor, "Cholesterol")
 
 
 @router.post("/patient/{patient_clinical_id}/refresh")
 async def refresh_predictions(patient_clinical_id: str, db: AsyncSession = Depends(get_db), current_doctor: Doctor = Depends(get_current_doctor)):
     # In a real system, this might trigger a background ML job. Here we just re-run the heuristic.
-    return await get_patient_all_predictions(patient_clinical_id, db, current_doctor)
+    patient = await _get_registered_patient(db, current_doctor, patient_clinical_id)
+    return await _patient_summary(db, patient)
@@ -1,3 +1,5 @@
+from typing import Dict, Tuple
+
 from pydantic_settings import BaseSettings
 
 
@@ -12,6 +14,160 @@ class Settings(BaseSettings):
     POSTGRES_PASSWORD: str = "postgres"
     POSTGRES_DB: str = "biosense_live"
     SQLALCHEMY_DATABASE_URI: str | None = None
+    SQLALCHEMY_ECHO: bool = True
+
+    # Read replicas, e.g. SQLALCHEMY_REPLICA_URIS='["postgresql+asyncpg://.../biosense_live"]'.
+    # Read-only endpoints use them in turn, skipping any more than
+    # REPLICA_MAX_LAG_SECONDS behind (checked every ..._CHECK_INTERVAL_SECONDS).
+    # A client that wrote in the last READ_YOUR_WRITES_SECONDS reads from the primary.
+    SQLALCHEMY_REPLICA_URIS: list[str] = []
+    REPLICA_MAX_LAG_SECONDS: float = 5.0
+    REPLICA_LAG_CHECK_INTERVAL_SECONDS: float = 2.0
+    READ_YOUR_WRITES_SECONDS: float = 10.0
+    READ_YOUR_WRITES_MAX_CLIENTS: int = 100000
+
+    # Raw health_metrics retention. Per-type overrides in days, e.g.
+    # METRIC_RETENTION_DAYS='{"heart_rate": 30, "glucose": 180}'
+    METRIC_RETENTION_DAYS: dict[str, int] = {}
+    METRIC_RETENTION_DEFAULT_DAYS: int = 365
+    METRIC_ROLLUP_BUCKET_SECONDS: int = 3600
+    RETENTION_BATCH_SIZE: int = 5000
+    RETENTION_INTERVAL_SECONDS: int = 0  # 0 disables the scheduled job
+
+    # Metric types accepted besides the built-in ones (app/models/metric_type.py);
+    # added to the metric_types dictionary at startup, e.g. '["weight", "steps"]'
+    EXTRA_METRIC_TYPES: list[str] = []
+
+    # Monthly health_metrics partitions (native on Postgres, routed tables on SQLite)
+    METRIC_PARTITION_MONTHS_AHEAD: int = 3
+    SQLITE_METRIC_PARTITIONS: bool = False
+    PARTITION_MAINTENANCE_INTERVAL_SECONDS: int = 24 * 3600
+    # Latest-vitals lookups look this far back before falling back to a full scan
+    LATEST_METRICS_LOOKBACK_DAYS: int = 30
+
+    # Device ingestion WebSocket: readings are committed (and acked) once this
+    # many are buffered or the oldest has waited INGEST_WS_FLUSH_MS.
+    INGEST_WS_BATCH_SIZE: int = 500
+    INGEST_WS_FLUSH_MS: int = 50
+    INGEST_WS_MAX_FRAME_READINGS: int = 1000
+    # Device timestamps are trusted from INGEST_MAX_BACKFILL_DAYS back to
+    # INGEST_MAX_CLOCK_SKEW_SECONDS ahead (pulled back to receipt time);
+    # outside that the device clock is wrong and receipt time is used.
+    INGEST_MAX_CLOCK_SKEW_SECONDS: int = 300
+    INGEST_MAX_BACKFILL_DAYS: int = 90
+
+    # Ingestion rate limits per (patient, device, metric type): readings per
+    # second and burst size, overridable per metric type. Over the limit,
+    # batches are thinned; a request with nothing left gets 429.
+    INGEST_RATE_LIMIT_ENABLED: bool = True
+    INGEST_RATE_PER_SECOND: float = 5.0
+    INGEST_RATE_BURST: int = 1000
+    INGEST_RATE_LIMITS: Dict[str, Tuple[float, int]] = {"heart_rate": (25.0, 2000)}
+    INGEST_RATE_MAX_BUCKETS: int = 200_000
+
+    # Readings with an idempotency key are stored once: repeats are caught in
+    # memory for IDEMPOTENCY_MEMORY_SECONDS, and by the ingestion_keys table
+    # for IDEMPOTENCY_WINDOW_SECONDS (purged every ..._PURGE_INTERVAL_SECONDS)
+    IDEMPOTENCY_MEMORY_SECONDS: int = 900
+    IDEMPOTENCY_MEMORY_MAX_KEYS: int = 500_000
+    IDEMPOTENCY_WINDOW_SECONDS: int = 48 * 3600
+    IDEMPOTENCY_PURGE_INTERVAL_SECONDS: int = 3600
+
+    # Appointments: bookings default to APPOINTMENT_DEFAULT_MINUTES and may
+    # not exceed APPOINTMENT_MAX_MINUTES, which bounds overlap lookups on the
+    # (doctor_id, start_at) index. Availability offers slots between the
+    # clinic hours (UTC), and each doctor's schedule from yesterday through
+    # APPOINTMENT_CACHE_DAYS ahead is kept in memory.
+    APPOINTMENT_DEFAULT_MINUTES: int = 30
+    APPOINTMENT_MAX_MINUTES: int = 8 * 60
+    CLINIC_DAY_START_HOUR: int = 9
+    CLINIC_DAY_END_HOUR: int = 17
+    APPOINTMENT_CACHE_DAYS: int = 14
+    APPOINTMENT_CACHE_MAX_DOCTORS: int = 5000
+    AVAILABILITY_MAX_DAYS: int = 31
+
+    # Process-level cache of reference tables such as hospitals
+    REFERENCE_CACHE_TTL_SECONDS: int = 300
+
+    # Cross-worker events for cache invalidation and live feeds:
+    # "memory" (single process), "unix" (workers on one host) or "redis"
+    EVENT_BUS_BACKEND: str = "memory"
+    EVENT_BUS_SOCKET: str = "/tmp/biosense-events.sock"
+    EVENT_BUS_REDIS_URL: str = "redis://localhost:6379/0"
+    EVENT_BUS_CHANNEL: str = "biosense:events"
+    LIVE_FEED_QUEUE_SIZE: int = 1000
+
+    # Batch risk scoring into risk_assessments. A row is written only when a
+    # score moves by more than the threshold or the risk level changes.
+    RISK_JOB_INTERVAL_SECONDS: int = 3600  # 0 disables the scheduled job
+    RISK_JOB_CHUNK_SIZE: int = 500
+    RISK_JOB_CONCURRENCY: int = 4  # chunks in flight; always 1 on SQLite
+    RISK_JOB_LEASE_SECONDS: int = 600  # a "running" checkpoint older than this is resumed
+    RISK_SCORE_CHANGE_THRESHOLD: float = 2.0
+
+    # Per-patient ring buffers of recent readings behind trend features
+    FEATURE_WINDOW_SIZE: int = 120
+    FEATURE_MAX_PATIENTS: int = 10000
+    FEATURE_STALE_SECONDS: int = 6 * 3600  # older windows are not used for scoring
+
+    # Data quality over the last DATA_QUALITY_WINDOW_HOURS from hourly reading
+    # counts kept on ingest: coverage against each metric's expected interval,
+    # gaps, and metrics with no reading for DATA_QUALITY_STALE_INTERVALS
+    # intervals, which lower the confidence of predictions reading them.
+    DATA_QUALITY_WINDOW_HOURS: int = 24
+    DATA_QUALITY_EXPECTED_INTERVAL_SECONDS: dict[str, int] = {
+        "heart_rate": 60, "spo2": 60, "respiratory_rate": 60, "stress_level": 300,
+        "temperature": 900, "glucose": 900, "blood_pressure_sys": 3600,
+        "blood_pressure_dia": 3600,
+    }
+    DATA_QUALITY_STALE_INTERVALS: float = 3.0
+    DATA_QUALITY_MAX_PATIENTS: int = 100000
+    DATA_QUALITY_WARM_MAX_ROWS: int = 20000  # history counted for a patient not yet tracked
+
+    # Streaming anomaly detection per (patient, metric) for the metrics listed,
+    # each with the smallest standard deviation its baseline is taken to have.
+    # An EWMA z-score over ANOMALY_Z_THRESHOLD or a two-sided CUSUM of the
+    # z-scores over ANOMALY_CUSUM_LIMIT raises an alert, at most one per series
+    # per cooldown. Detector state is checkpointed to the database.
+    ANOMALY_DETECTION_ENABLED: bool = True
+    ANOMALY_METRICS: dict[str, float] = {
+        "heart_rate": 2.0, "spo2": 1.0, "glucose": 5.0, "respiratory_rate": 1.0,
+        "blood_pressure_sys": 3.0, "blood_pressure_dia": 2.0, "temperature": 0.3,
+    }
+    ANOMALY_EWMA_ALPHA: float = 0.05
+    ANOMALY_WARMUP_READINGS: int = 20
+    ANOMALY_Z_THRESHOLD: float = 4.0
+    ANOMALY_CUSUM_SLACK: float = 0.5
+    ANOMALY_CUSUM_LIMIT: float = 8.0
+    ANOMALY_ALERT_COOLDOWN_SECONDS: int = 300
+    ANOMALY_MAX_SERIES: int = 1_000_000
+    ANOMALY_IDLE_DAYS: int = 30  # series without readings for longer are dropped
+    ANOMALY_CHECKPOINT_INTERVAL_SECONDS: int = 300  # 0 disables checkpointing
+
+    # Trained risk models (see app/services/model_runtime.py and train_models.py)
+    MODEL_DIR: str = "models"
+    MODEL_RELOAD_INTERVAL_SECONDS: int = 60
+    MODEL_BATCH_MAX_SIZE: int = 64
+    MODEL_BATCH_MAX_WAIT_MS: float = 2.0
+    MODEL_THREADS: int = 2
+    MODEL_PRELOAD: bool = True  # load in the background after startup, not on first request
+
+    # `import main` must stay under this; see profile_imports.py. The test suite
+    # allows the larger of the budget and this multiple of importing the
+    # frameworks alone, so slow machines don't fail it.
+    STARTUP_IMPORT_BUDGET_MS: int = 2500
+    STARTUP_IMPORT_BASELINE_FACTOR: float = 3.0
+
+    # Telemetry served at /metrics; event-loop lag is sampled this often (0 disables)
+    TELEMETRY_LOOP_LAG_INTERVAL_SECONDS: float = 0.5
+
+    # Request profiler: admins send `X-Profile: 1` (or ?profile=1) to profile a
+    # request; PROFILE_SAMPLE_RATE also profiles that fraction of all requests
+    PROFILING_ENABLED: bool = True
+    PROFILE_SAMPLE_RATE: float = 0.0
+    PROFILE_INTERVAL_MS: float = 1.0
+    PROFILE_DIR: str = "profiles"
+    PROFILE_MAX_FILES: int = 100
 
     @property
     def database_url(self) -> str:
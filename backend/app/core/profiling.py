@@ -0,0 +1,276 @@
+"""
+Opt-in sampling profiler for individual HTTP requests.
+
+A request is profiled when an admin sends it with an `X-Profile: 1` header
+(or `?profile=1`), or when it is picked at random at PROFILE_SAMPLE_RATE.
+Other requests only pay for a scan of their header list; with
+PROFILING_ENABLED off the middleware is not installed at all.
+
+While a request is profiled, a sampler thread looks at it every
+PROFILE_INTERVAL_MS. If the request's task is running on the event loop,
+the sample is the loop thread's Python stack, down to whatever sync code
+it is in; if the task is suspended, the sample is its chain of awaiting
+coroutines ending in what it waits on. Each sample is weighted by the
+time since the previous one, so the profile adds up to wall-clock time
+spent running and waiting. Work handed to other threads (run_in_executor,
+threadpool endpoints) shows up as time waiting on that future.
+
+Profiles are written as JSON to PROFILE_DIR, keeping the newest
+PROFILE_MAX_FILES, and the response carries their id in X-Profile-Id. The
+stacks are in the folded format ("outer;inner count", counts in
+microseconds) read by flamegraph.pl and speedscope.
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.core.config import settings
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID_HEADER = b"x-profile-id"
+_PROFILE_ID = re.compile(r"^[0-9TZ]+-[0-9a-f]{8}$")
+_STDLIB = os.path.dirname(os.__file__) + os.sep
+_SITE_PACKAGES = "site-packages" + os.sep
+
+
+@lru_cache(maxsize=4096)
+def _location(filename: str) -> str:
+    """Paths relative to site-packages, the stdlib or the working directory."""
+    index = filename.rfind(_SITE_PACKAGES)
+    if index >= 0:
+        return filename[index + len(_SITE_PACKAGES):]
+    if filename.startswith(_STDLIB):
+        return filename[len(_STDLIB):]
+    try:
+        return os.path.relpath(filename)
+    except ValueError:
+        return filename
+
+
+def _label(frame) -> str:
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({_location(code.co_filename)}:{code.co_firstlineno})"
+
+
+class RequestSampler:
+    """Samples one asyncio task's stack from a background thread."""
+
+    def __init__(self, task: asyncio.Task, interval: float):
+        self.task = task
+        self.loop = task.get_loop()
+        self.loop_thread = threading.get_ident()
+        self.root = task.get_coro()
+        self.interval = interval
+        self.stacks: Dict[str, float] = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._last = 0.0
+
+    def start(self):
+        self._last = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            weight, self._last = now - self._last, now
+            try:
+                stack = self._stack()
+            except Exception:
+                # The frames can change under us; a torn sample is simply dropped.
+                continue
+            if stack:
+                key = ";".join(stack)
+                self.stacks[key] = self.stacks.get(key, 0.0) + weight
+                self.samples += 1
+
+    def _stack(self) -> List[str]:
+        if asyncio.current_task(self.loop) is self.task:
+            frame = sys._current_frames().get(self.loop_thread)
+            root_frame = getattr(self.root, "cr_frame", None)
+            stack = []
+            while frame is not None:
+                stack.append(_label(frame))
+                if frame is root_frame:
+                    break
+                frame = frame.f_back
+            stack.reverse()
+            return stack
+        return self._awaiting()
+
+    def _awaiting(self) -> List[str]:
+        stack = []
+        awaitable = self.root
+        while awaitable is not None:
+            frame = (getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+                     or getattr(awaitable, "ag_frame", None))
+            if frame is None:
+                stack.append(f"[await {type(awaitable).__name__}]")
+                break
+            stack.append(_label(frame))
+            awaitable = (getattr(awaitable, "cr_await", None)
+                         or getattr(awaitable, "gi_yieldfrom", None)
+                         or getattr(awaitable, "ag_await", None))
+        return stack
+
+    def folded(self) -> Dict[str, int]:
+        return {stack: max(int(seconds * 1_000_000), 1)
+                for stack, seconds in sorted(self.stacks.items(), key=lambda kv: -kv[1])}
+
+
+def folded_text(profile: dict) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in profile["stacks"].items())
+
+
+class ProfileStore:
+    """The newest `max_files` profiles as JSON files in `directory`."""
+
+    def __init__(self, directory: str, max_files: int):
+        self.directory = directory
+        self.max_files = max_files
+
+    @staticmethod
+    def new_id() -> str:
+        return f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S%fZ}-{uuid.uuid4().hex[:8]}"
+
+    def _path(self, profile_id: str) -> Optional[str]:
+        if not _PROFILE_ID.match(profile_id):
+            return None
+        return os.path.join(self.directory, profile_id + ".json")
+
+    def _ids(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-len(".json")] for name in os.listdir(self.directory)
+                      if name.endswith(".json") and _PROFILE_ID.match(name[:-len(".json")]))
+
+    def save(self, profile: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(profile["id"])
+        with open(path + ".tmp", "w") as f:
+            json.dump(profile, f)
+        os.replace(path + ".tmp", path)
+        ids = self._ids()
+        for old in ids[:max(len(ids) - self.max_files, 0)]:
+            try:
+                os.remove(self._path(old))
+            except FileNotFoundError:
+                pass
+
+    def load(self, profile_id: str) -> Optional[dict]:
+        path = self._path(profile_id)
+        if path is None or not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def list(self) -> List[dict]:
+        """Newest first, without the stacks."""
+        out = []
+        for profile_id in reversed(self._ids()):
+            profile = self.load(profile_id)
+            if profile is not None:
+                profile.pop("stacks", None)
+                out.append(profile)
+        return out
+
+
+profile_store = ProfileStore(settings.PROFILE_DIR, settings.PROFILE_MAX_FILES)
+
+
+def _requested(scope) -> bool:
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER:
+            return value not in (b"", b"0", b"false")
+    query = scope.get("query_string", b"")
+    return b"profile=" in query and (b"profile=1" in query or b"profile=true" in query)
+
+
+def _bearer(scope) -> Optional[str]:
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, credentials = value.decode("latin-1").partition(" ")
+            return credentials if scheme.lower() == "bearer" else None
+    return None
+
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware profiling the requests described above.
+    `authorize(token)` decides whether a requester may ask for a profile.
+    """
+
+    def __init__(self, app, authorize: Callable[[Optional[str]], Awaitable[bool]],
+                 store: ProfileStore, sample_rate: float = 0.0, interval_ms: float = 1.0):
+        self.app = app
+        self.authorize = authorize
+        self.store = store
+        self.sample_rate = sample_rate
+        self.interval = interval_ms / 1000
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if _requested(scope):
+            trigger = "request"
+            # Unauthorised asks are served normally, without saying why.
+            if not await self.authorize(_bearer(scope)):
+                trigger = None
+        elif self.sample_rate > 0 and random.random() < self.sample_rate:
+            trigger = "sampled"
+        else:
+            trigger = None
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+        await self._profile(scope, receive, send, trigger)
+
+    async def _profile(self, scope, receive, send, trigger: str):
+        profile_id = self.store.new_id()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (PROFILE_ID_HEADER, profile_id.encode())]
+            await send(message)
+
+        sampler = RequestSampler(asyncio.current_task(), self.interval)
+        started_at = datetime.now(timezone.utc)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            profile = {
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status,
+                "trigger": trigger,
+                "started_at": started_at.isoformat(),
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                "interval_ms": self.interval * 1000,
+                "samples": sampler.samples,
+                "stacks": sampler.folded(),
+            }
+            await asyncio.get_running_loop().run_in_executor(None, self.store.save, profile)
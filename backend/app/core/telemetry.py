@@ -0,0 +1,316 @@
+"""
+Runtime telemetry in the Prometheus text format, scraped from /metrics.
+
+Instruments are plain Python objects updated from the event loop, where a
+float increment cannot be interleaved, so the hot path takes no locks.
+Histogram buckets are preallocated and labelled children are created
+once, on first use; after that, a request costs a couple of dict lookups,
+a bisect and a few increments. Values that are cheap to read when needed,
+such as pool occupancy or subscriber counts, are gauges with a callback
+evaluated at scrape time instead of being tracked on every change.
+"""
+import asyncio
+import math
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+
+    def labels(self, *values) -> "_Metric":
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _series(self):
+        """(label values, child) pairs to expose."""
+        if self.labelnames:
+            return list(self._children.items())
+        return [((), self)]
+
+    def _label_text(self, values, extra: str = "") -> str:
+        pairs = [f'{n}="{_escape(v)}"' for n, v in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._series():
+            lines.extend(child._render_samples(self, values))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self.value = 0.0
+
+    def _new_child(self):
+        return Counter(self.name, self.help)
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def _render_samples(self, parent, values):
+        return [f"{parent.name}{parent._label_text(values)} {_format_value(self.value)}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, labelnames)
+        self.value = 0.0
+        self.callback = callback
+
+    def _new_child(self):
+        return Gauge(self.name, self.help)
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set_function(self, callback: Callable[[], float]):
+        self.callback = callback
+
+    def _render_samples(self, parent, values):
+        value = self.value
+        if self.callback is not None:
+            try:
+                value = self.callback()
+            except Exception:
+                value = math.nan
+        return [f"{parent.name}{parent._label_text(values)} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def _new_child(self):
+        return Histogram(self.name, self.help, buckets=self.buckets)
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def _render_samples(self, parent, values):
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.buckets + (math.inf,), self.counts):
+            cumulative += n
+            le = 'le="' + _format_value(bound) + '"'
+            lines.append(f"{parent.name}_bucket{parent._label_text(values, le)} {cumulative}")
+        labels = parent._label_text(values)
+        lines.append(f"{parent.name}_sum{labels} {_format_value(self.sum)}")
+        lines.append(f"{parent.name}_count{labels} {self.count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _add(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()) -> Counter:
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=(), callback=None) -> Gauge:
+        return self._add(Gauge(name, help, labelnames, callback))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.counter(
+    "biosense_http_requests_total", "HTTP requests handled.", ("method", "route", "status"))
+HTTP_LATENCY = registry.histogram(
+    "biosense_http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+HTTP_IN_FLIGHT = registry.gauge(
+    "biosense_http_requests_in_flight", "HTTP requests being handled.")
+DB_POOL = registry.gauge(
+    "biosense_db_pool_connections", "Database pool connections by state.", ("state",))
+DB_READ_ROUTES = registry.counter(
+    "biosense_db_read_routes_total",
+    "Read-only sessions by where their reads went (replica, primary, pinned, no_replica).",
+    ("target",))
+REPLICA_LAG = registry.gauge(
+    "biosense_db_replica_lag_seconds", "Last measured replication lag (+Inf when unreachable).",
+    ("replica",))
+INGESTED_READINGS = registry.counter(
+    "biosense_ingested_readings_total", "Readings stored, by ingestion path.", ("source",))
+INGEST_BATCH_SIZE = registry.histogram(
+    "biosense_ingest_batch_size", "Readings per ingestion commit.", ("source",), SIZE_BUCKETS)
+INGEST_DUPLICATES = registry.counter(
+    "biosense_ingest_duplicate_readings_total",
+    "Retried readings dropped, by where the repeat was caught.", ("source", "caught_by"))
+INGEST_RATE_LIMITED = registry.counter(
+    "biosense_ingest_rate_limited_readings_total",
+    "Readings over a device's rate limit, thinned out of a batch or refused.",
+    ("source", "outcome"))
+INGEST_TIMESTAMPS = registry.counter(
+    "biosense_ingest_adjusted_timestamps_total",
+    "Device timestamps not stored as sent (clamped, replaced) or late enough "
+    "to go straight to rollups.", ("source", "outcome"))
+ANOMALIES_DETECTED = registry.counter(
+    "biosense_anomalies_detected_total", "Anomalous readings flagged, by detector.",
+    ("metric_type", "detector"))
+ANOMALY_SERIES = registry.gauge(
+    "biosense_anomaly_detector_series", "(patient, metric) series with detector state in memory.")
+RATE_LIMIT_BUCKETS = registry.gauge(
+    "biosense_ingest_rate_limit_buckets", "Devices with a partly drained rate-limit bucket.")
+WEBSOCKETS = registry.gauge(
+    "biosense_websocket_connections", "Open WebSocket connections.", ("kind",))
+EVENT_LOOP_LAG = registry.gauge(
+    "biosense_event_loop_lag_seconds", "Last measured event loop scheduling delay.")
+EVENT_LOOP_LAG_HISTOGRAM = registry.histogram(
+    "biosense_event_loop_lag_histogram_seconds", "Event loop scheduling delay.",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+PREDICTION_SECONDS = registry.histogram(
+    "biosense_prediction_compute_seconds", "Risk scoring compute time per call.", ("kind",))
+
+_STATUS_CLASS = ("0xx", "1xx", "2xx", "3xx", "4xx", "5xx")
+UNMATCHED_ROUTE = "unmatched"
+
+
+def route_template(scope) -> str:
+    """
+    The full path template ("/api/v1/doctors/patients/{patient_id}") of the
+    route that handled the request. Routes of included routers may only know
+    their own tail of it, so the prefix is recovered from the request path.
+    """
+    route = scope.get("route")
+    tail = getattr(route, "path_format", None) or getattr(route, "path", None)
+    if tail is None:
+        return UNMATCHED_ROUTE
+    path = scope["path"]
+    params = scope.get("path_params")
+    try:
+        actual = tail.format(**params) if params else tail
+    except (KeyError, IndexError, ValueError):
+        return tail
+    return path[:-len(actual)] + tail if actual and path.endswith(actual) else tail
+
+
+class TelemetryMiddleware:
+    """Pure ASGI middleware timing HTTP requests by route template."""
+
+    def __init__(self, app):
+        self.app = app
+        # route path -> method -> (latency histogram, {status class: counter})
+        self._routes: Dict[str, Dict[str, tuple]] = {}
+
+    def _children(self, route: str, method: str):
+        by_method = self._routes.get(route)
+        if by_method is None:
+            by_method = self._routes[route] = {}
+        children = by_method.get(method)
+        if children is None:
+            children = by_method[method] = (
+                HTTP_LATENCY.labels(method, route),
+                {cls: HTTP_REQUESTS.labels(method, route, cls) for cls in _STATUS_CLASS})
+        return children
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.value += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.value -= 1
+            latency, counters = self._children(route_template(scope), scope["method"])
+            latency.observe(elapsed)
+            counters[_STATUS_CLASS[min(status // 100, 5)]].value += 1
+
+
+async def monitor_event_loop(interval: float):
+    """Measures how late a sleep wakes up; the overshoot is time the loop was busy."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - started - interval, 0.0)
+        EVENT_LOOP_LAG.value = lag
+        EVENT_LOOP_LAG_HISTOGRAM.observe(lag)
+
+
+def observe_pool(get_pool: Callable):
+    """Exposes checked-out, idle and overflow connections of the current engine's pool."""
+    def reader(method):
+        def read():
+            value = getattr(get_pool(), method, None)
+            # Pools without these counters (e.g. NullPool) report 0.
+            return max(value(), 0) if value else 0
+        return read
+
+    DB_POOL.labels("checked_out").set_function(reader("checkedout"))
+    DB_POOL.labels("idle").set_function(reader("checkedin"))
+    DB_POOL.labels("overflow").set_function(reader("overflow"))
+    DB_POOL.labels("size").set_function(reader("size"))
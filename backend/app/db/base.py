@@ -1,7 +1,14 @@
 from app.db.session import Base
 from app.models.user import User
+from app.models.metric_type import MetricType
 from app.models.health_metrics import HealthMetric
+from app.models.health_metric_rollup import HealthMetricRollup
 from app.models.doctor import Doctor
 from app.models.hospital import Hospital
 from app.models.patient import Patient
 from app.models.appointment import Appointment
+from app.models.risk_assessment import RiskAssessment
+from app.models.health_alert import HealthAlert
+from app.models.job_checkpoint import JobCheckpoint
+from app.models.ingestion_key import IngestionKey
+from app.models.anomaly_state import AnomalyDetectorState
@@ -0,0 +1,147 @@
+"""
+Request-scoped batching loaders.
+
+Every request works in one session, and the session carries a Loaders set
+(`loaders(db)`). A Loader coalesces lookups by key: keys asked for in the
+same pass of the event loop, e.g. from coroutines run with
+asyncio.gather, are fetched together in one IN query, and each result is
+kept for the rest of the session, so the auth dependency, the handler and
+whatever it calls can all ask for the same doctor without another SELECT.
+
+An AsyncSession runs one statement at a time, so the batches of a
+session's loaders are run one after another, in dispatch order, under a
+lock they share.
+
+Doctors and patients come with the many-to-one relationships handlers
+read (hospital, and the patient's doctor) already loaded, since touching
+an unloaded relationship on an AsyncSession fails instead of lazy loading.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set
+
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+
+from app.models.doctor import Doctor
+from app.models.hospital import Hospital
+from app.models.patient import Patient
+from app.services.vitals import latest_metric_values, latest_values_for_patients
+
+Batch = Callable[[Any, List[Hashable]], Awaitable[Dict[Hashable, Any]]]
+
+
+class Loader:
+    """Loads values by key through `batch(db, keys) -> {key: value}`; missing keys load as None."""
+
+    def __init__(self, db, batch: Batch, lock: asyncio.Lock, tasks: Set[asyncio.Task]):
+        self._db = db
+        self._batch = batch
+        self._lock = lock
+        self._tasks = tasks
+        self._results: Dict[Hashable, asyncio.Future] = {}
+        self._pending: List[Hashable] = []
+
+    def load(self, key: Hashable) -> Awaitable[Optional[Any]]:
+        future = self._results.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._results[key] = loop.create_future()
+            self._pending.append(key)
+            if len(self._pending) == 1:
+                # Give the other lookups of this pass a chance to join the batch.
+                loop.call_soon(self._dispatch)
+        return future
+
+    async def load_many(self, keys: Iterable[Hashable]) -> List[Optional[Any]]:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def prime(self, key: Hashable, value: Any):
+        """Records a value that arrived some other way, such as joined onto another row."""
+        future = self._results.get(key)
+        if future is None or future.done():
+            future = self._results[key] = asyncio.get_running_loop().create_future()
+        future.set_result(value)
+
+    def _dispatch(self):
+        keys, self._pending = self._pending, []
+        task = asyncio.get_running_loop().create_task(self._run(keys))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, keys: List[Hashable]):
+        try:
+            async with self._lock:
+                found = await self._batch(self._db, keys)
+        except BaseException as e:
+            for key in keys:
+                future = self._results.pop(key)
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key in keys:
+            future = self._results[key]
+            if not future.done():
+                future.set_result(found.get(key))
+
+
+def _prime_hospitals(db, rows):
+    # Hospitals arrive joined onto doctors and patients; no need to ask again.
+    hospitals = loaders(db).hospitals
+    for row in rows:
+        if row.hospital is not None:
+            hospitals.prime(row.hospital_id, row.hospital)
+
+
+async def _doctors(db, ids):
+    result = await db.execute(
+        select(Doctor).options(joinedload(Doctor.hospital)).where(Doctor.id.in_(ids)))
+    doctors = result.scalars().all()
+    _prime_hospitals(db, doctors)
+    return {d.id: d for d in doctors}
+
+
+async def _patients(db, ids):
+    result = await db.execute(
+        select(Patient)
+        .options(joinedload(Patient.hospital), joinedload(Patient.doctor))
+        .where(Patient.id.in_(ids)))
+    patients = result.scalars().all()
+    _prime_hospitals(db, patients)
+    return {p.id: p for p in patients}
+
+
+async def _hospitals(db, ids):
+    result = await db.execute(select(Hospital).where(Hospital.id.in_(ids)))
+    return {h.id: h for h in result.scalars()}
+
+
+async def _latest_metrics(db, patient_ids):
+    if len(patient_ids) == 1:
+        # For one patient its newest few readings are cheaper than ranking a month of them.
+        return {patient_ids[0]: await latest_metric_values(db, patient_ids[0])}
+    latest = await latest_values_for_patients(db, patient_ids)
+    # Patients without readings have no latest values rather than no answer.
+    return {pid: latest.get(pid, {}) for pid in patient_ids}
+
+
+class Loaders:
+    def __init__(self, db):
+        # One batch at a time on the session; in-flight batches are kept referenced.
+        self.lock = asyncio.Lock()
+        self.tasks: Set[asyncio.Task] = set()
+        self.doctors = self._loader(db, _doctors)
+        self.patients = self._loader(db, _patients)
+        self.hospitals = self._loader(db, _hospitals)
+        # patient id -> {metric_type: latest value}
+        self.latest_metrics = self._loader(db, _latest_metrics)
+
+    def _loader(self, db, batch: Batch) -> Loader:
+        return Loader(db, batch, self.lock, self.tasks)
+
+
+def loaders(db) -> Loaders:
+    """The session's loaders, created on first use."""
+    found = db.info.get("loaders")
+    if found is None:
+        found = db.info["loaders"] = Loaders(db)
+    return found
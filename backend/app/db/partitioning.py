@@ -0,0 +1,331 @@
+"""
+Time partitioning for health_metrics.
+
+Postgres: health_metrics is created as a declarative RANGE-partitioned table
+on "timestamp" with one partition per calendar month (health_metrics_pYYYYMM)
+plus a DEFAULT partition. Future months are created ahead of time by the
+scheduled `maintain_partitions` job, the planner prunes partitions for range
+predicates on its own, and old data is removed by dropping whole partitions.
+
+SQLite (the local fallback) has no native partitioning. With
+SQLITE_METRIC_PARTITIONS enabled, readings are routed into per-month tables
+with the same names and schema; reads union only the months overlapping the
+requested range, plus the original health_metrics table for rows written
+before routing was switched on. Each month's ids start at YYYYMM * 10**10 so
+ids stay unique across tables and ascend with time.
+"""
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import (
+    Column, Integer, MetaData, SmallInteger, Table, and_, insert, select, text, union_all,
+)
+
+from app.core.config import settings
+from app.db import session as db_session
+from app.db.utils import as_utc
+from app.models.health_metrics import HealthMetric
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PREFIX = "health_metrics_p"
+DEFAULT_PARTITION = "health_metrics_default"
+SQLITE_ID_STRIDE = 10 ** 10
+_REGISTRY_TTL_SECONDS = 30.0
+
+
+@dataclass(frozen=True)
+class MetricPartition:
+    name: str
+    lower: datetime
+    upper: datetime
+
+
+def month_start(ts: datetime) -> datetime:
+    ts = as_utc(ts)
+    return datetime(ts.year, ts.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month: datetime, n: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + n
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month: datetime) -> str:
+    return f"{PARTITION_PREFIX}{month.year:04d}{month.month:02d}"
+
+
+def partition_for_name(name: str) -> Optional[MetricPartition]:
+    suffix = name[len(PARTITION_PREFIX):]
+    if not name.startswith(PARTITION_PREFIX) or len(suffix) != 6 or not suffix.isdigit():
+        return None
+    lower = datetime(int(suffix[:4]), int(suffix[4:]), 1, tzinfo=timezone.utc)
+    return MetricPartition(name, lower, add_months(lower, 1))
+
+
+def months_between(start: datetime, end: datetime) -> List[datetime]:
+    """Month starts of every month overlapping [start, end)."""
+    months, month = [], month_start(start)
+    end = as_utc(end)
+    while month < end:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def _dialect_name(executor) -> str:
+    dialect = getattr(executor, "dialect", None) or executor.bind.dialect
+    return dialect.name
+
+
+# ---------------------------------------------------------------------------
+# Postgres
+# ---------------------------------------------------------------------------
+
+def _pg_partition_ddl(month: datetime) -> str:
+    return (
+        f'CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF health_metrics '
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+
+
+def create_initial_partitions(connection, now: Optional[datetime] = None):
+    """after_create hook: DEFAULT partition plus last month through the lookahead window."""
+    current = month_start(now or datetime.now(timezone.utc))
+    connection.exec_driver_sql(
+        f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF health_metrics DEFAULT")
+    for n in range(-1, settings.METRIC_PARTITION_MONTHS_AHEAD + 1):
+        connection.exec_driver_sql(_pg_partition_ddl(add_months(current, n)))
+
+
+async def _pg_is_partitioned(conn) -> bool:
+    result = await conn.execute(text(
+        "SELECT relkind FROM pg_class WHERE relname = 'health_metrics'"))
+    return result.scalar() == "p"
+
+
+async def _pg_partitions(conn) -> List[MetricPartition]:
+    result = await conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = 'health_metrics'"))
+    parts = [partition_for_name(name) for name in result.scalars()]
+    return sorted((p for p in parts if p), key=lambda p: p.lower)
+
+
+# ---------------------------------------------------------------------------
+# SQLite routing
+# ---------------------------------------------------------------------------
+
+# Partition tables live outside Base.metadata so create_all/drop_all never
+# touch them; the stubs let the copied foreign keys resolve.
+_partition_metadata = MetaData()
+Table("patients", _partition_metadata, Column("id", Integer, primary_key=True))
+Table("metric_types", _partition_metadata, Column("id", SmallInteger, primary_key=True))
+
+_known_periods: Dict[str, set] = {}
+_registry_loaded_at: Dict[str, float] = {}
+
+
+def sqlite_routing_enabled(executor) -> bool:
+    return settings.SQLITE_METRIC_PARTITIONS and _dialect_name(executor) == "sqlite"
+
+
+def partition_table(name: str) -> Table:
+    """Table object for one month's partition, a copy of health_metrics' schema."""
+    table = _partition_metadata.tables.get(name)
+    if table is None:
+        table = HealthMetric.__table__.to_metadata(_partition_metadata, name=name)
+        table.dialect_options["sqlite"]["autoincrement"] = True
+        for index in table.indexes:
+            # Index names are database-wide in SQLite
+            if index.name and not index.name.startswith(f"ix_{name}"):
+                index.name = index.name.replace("health_metrics", name, 1)
+    return table
+
+
+async def _sqlite_periods(executor) -> set:
+    key = str(db_session.engine.url)
+    loaded = _registry_loaded_at.get(key, 0.0)
+    if time.monotonic() - loaded > _REGISTRY_TTL_SECONDS:
+        result = await executor.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE :prefix"),
+            {"prefix": f"{PARTITION_PREFIX}%"})
+        _known_periods[key] = {n for n in result.scalars() if partition_for_name(n)}
+        _registry_loaded_at[key] = time.monotonic()
+    return _known_periods.setdefault(key, set())
+
+
+async def ensure_sqlite_periods(months: Iterable[datetime]):
+    """
+    Creates missing month tables in their own committed transaction, so a
+    rollback of the caller's ingestion transaction can't leave the registry
+    pointing at a table that doesn't exist.
+    """
+    key = str(db_session.engine.url)
+    known = _known_periods.setdefault(key, set())
+    missing = [m for m in months if partition_name(m) not in known]
+    if not missing:
+        return
+    async with db_session.engine.begin() as conn:
+        for month in missing:
+            name = partition_name(month)
+            table = partition_table(name)
+            await conn.run_sync(lambda c, t=table: t.create(c, checkfirst=True))
+            # Seed AUTOINCREMENT so this month's ids live in their own range.
+            await conn.execute(text(
+                "INSERT INTO sqlite_sequence (name, seq) SELECT :name, :seq "
+                "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = :name)"),
+                {"name": name, "seq": (month.year * 100 + month.month) * SQLITE_ID_STRIDE})
+    known.update(partition_name(m) for m in missing)
+
+
+# ---------------------------------------------------------------------------
+# Routing API used by the read, write and retention paths
+# ---------------------------------------------------------------------------
+
+async def metric_tables(executor, start: Optional[datetime] = None,
+                        end: Optional[datetime] = None) -> List[Table]:
+    """
+    Physical tables holding readings in [start, end). Postgres and
+    unpartitioned SQLite use the single health_metrics table (Postgres prunes
+    partitions itself); routed SQLite returns only the overlapping months.
+    """
+    base = HealthMetric.__table__
+    if not sqlite_routing_enabled(executor):
+        return [base]
+    tables = [base]
+    for name in sorted(await _sqlite_periods(executor)):
+        part = partition_for_name(name)
+        if start is not None and part.upper <= as_utc(start):
+            continue
+        if end is not None and part.lower >= as_utc(end):
+            continue
+        tables.append(partition_table(name))
+    return tables
+
+
+def metrics_from(tables: Sequence[Table], start: Optional[datetime] = None,
+                 end: Optional[datetime] = None,
+                 where: Optional[Callable[[Table], list]] = None, name: str = "metrics"):
+    """
+    FROM clause with health_metrics' columns over `tables`. The time range and
+    `where(table)` criteria are pushed into every branch so each table is
+    filtered through its own indexes before the union.
+    """
+    branches = []
+    for table in tables:
+        criteria = list(where(table)) if where else []
+        if start is not None:
+            criteria.append(table.c.timestamp >= as_utc(start))
+        if end is not None:
+            criteria.append(table.c.timestamp < as_utc(end))
+        # The type is stored as metric_type_id; the union exposes the name.
+        query = select(table.c.id, table.c.patient_id, table.c.metric_type.label("metric_type"),
+                       table.c.value, table.c.timestamp)
+        if criteria:
+            query = query.where(and_(*criteria))
+        branches.append(query)
+    if len(branches) == 1:
+        return branches[0].subquery(name)
+    return union_all(*branches).subquery(name)
+
+
+async def metrics_source(executor, start: Optional[datetime] = None,
+                         end: Optional[datetime] = None,
+                         where: Optional[Callable[[Table], list]] = None):
+    return metrics_from(await metric_tables(executor, start, end), start, end, where)
+
+
+async def insert_metric_rows(db, rows: List[dict]) -> list:
+    """
+    Inserts reading dicts (patient_id, metric_type, value, timestamp) into the
+    right table(s) and returns the stored rows in input order.
+    """
+    if not rows:
+        return []
+    base = HealthMetric.__table__
+    if not sqlite_routing_enabled(db):
+        result = await db.execute(
+            insert(base).returning(*base.c, sort_by_parameter_order=True), rows)
+        return result.all()
+
+    by_month: Dict[datetime, List[int]] = {}
+    for i, row in enumerate(rows):
+        by_month.setdefault(month_start(row["timestamp"]), []).append(i)
+    await ensure_sqlite_periods(by_month)
+
+    stored = [None] * len(rows)
+    for month, positions in by_month.items():
+        table = partition_table(partition_name(month))
+        result = await db.execute(
+            insert(table).returning(*table.c, sort_by_parameter_order=True),
+            [rows[i] for i in positions])
+        for i, row in zip(positions, result.all()):
+            stored[i] = row
+    return stored
+
+
+async def list_partitions(conn) -> List[MetricPartition]:
+    """Monthly partitions currently present (empty when the table isn't partitioned)."""
+    if _dialect_name(conn) == "postgresql":
+        return await _pg_partitions(conn) if await _pg_is_partitioned(conn) else []
+    if sqlite_routing_enabled(conn):
+        return sorted((partition_for_name(n) for n in await _sqlite_periods(conn)),
+                      key=lambda p: p.lower)
+    return []
+
+
+async def drop_partition(conn, partition: MetricPartition):
+    """Removes a whole month at once instead of DELETE-ing its rows."""
+    if _dialect_name(conn) == "postgresql":
+        await conn.execute(text(
+            f"ALTER TABLE health_metrics DETACH PARTITION {partition.name}"))
+        await conn.execute(text(f"DROP TABLE {partition.name}"))
+    else:
+        await conn.execute(text(f"DROP TABLE IF EXISTS {partition.name}"))
+        await conn.execute(text("DELETE FROM sqlite_sequence WHERE name = :name"),
+                           {"name": partition.name})
+        _known_periods.get(str(db_session.engine.url), set()).discard(partition.name)
+    logger.info("Dropped health_metrics partition %s", partition.name)
+
+
+async def ensure_future_partitions(now: Optional[datetime] = None,
+                                   months_ahead: Optional[int] = None) -> List[str]:
+    """Creates partitions for the current month and the lookahead window."""
+    months_ahead = settings.METRIC_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+    current = month_start(now or datetime.now(timezone.utc))
+    months = [add_months(current, n) for n in range(months_ahead + 1)]
+
+    engine = db_session.engine
+    if engine.dialect.name == "sqlite":
+        if not settings.SQLITE_METRIC_PARTITIONS:
+            return []
+        async with engine.connect() as conn:
+            known = set(await _sqlite_periods(conn))
+        await ensure_sqlite_periods(months)
+        return [partition_name(m) for m in months if partition_name(m) not in known]
+
+    if engine.dialect.name != "postgresql":
+        return []
+    async with engine.begin() as conn:
+        if not await _pg_is_partitioned(conn):
+            return []
+        existing = {p.name for p in await _pg_partitions(conn)}
+        created = []
+        for month in months:
+            if partition_name(month) not in existing:
+                await conn.execute(text(_pg_partition_ddl(month)))
+                created.append(partition_name(month))
+    if created:
+        logger.info("Created health_metrics partitions %s", ", ".join(created))
+    return created
+
+
+async def maintain_partitions():
+    """Scheduled job keeping the lookahead window of partitions in place."""
+    await ensure_future_partitions()
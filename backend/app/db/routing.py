@@ -0,0 +1,207 @@
+"""
+Read-replica routing.
+
+Sessions are RoutingSessions. One handed out by get_read_db is marked
+read-only, and its first read picks a replica for the transaction:
+replicas are taken in turn, skipping any whose last measured lag is over
+REPLICA_MAX_LAG_SECONDS or that could not be reached. With none left, or
+none configured, reads stay on the primary. Flushes and INSERT / UPDATE /
+DELETE statements always go to the primary, and once a session has
+written, so do its reads.
+
+Read-your-own-writes: a client (role, id) that wrote in the last
+READ_YOUR_WRITES_SECONDS reads from the primary. Writes are noted when a
+session with a client commits, and from the events writes publish
+(readings, profile and appointment changes), so a write through another
+worker or the device WebSocket counts too.
+
+Replicas must have the primary's schema and dialect: statements are
+compiled for the primary. For local testing a replica can be any second
+database, such as a copy of the SQLite file; lag is only measured on
+Postgres standbys and is taken as 0 elsewhere.
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional, Sequence
+
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import UpdateBase
+
+from app.core.config import settings
+from app.core.telemetry import DB_READ_ROUTES, REPLICA_LAG
+from app.services.events import (
+    APPOINTMENT_CHANGED, METRIC_INGESTED, PROFILE_UPDATED, event_bus,
+)
+
+logger = logging.getLogger(__name__)
+
+# Postgres standbys; 0 when caught up (or when pointed at a primary)
+_PG_LAG = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery()"
+    " OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+    " ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END")
+
+
+class Replica:
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self.name = engine.url.render_as_string(hide_password=True)
+        self.lag = 0.0  # seconds; inf while unreachable
+
+
+class ReplicaSet:
+    def __init__(self, engines: Sequence[AsyncEngine], max_lag: float):
+        self.replicas = [Replica(engine) for engine in engines]
+        self.max_lag = max_lag
+        self._next = 0
+
+    @classmethod
+    def from_urls(cls, urls: Sequence[str], max_lag: float) -> "ReplicaSet":
+        return cls([create_async_engine(url, echo=settings.SQLALCHEMY_ECHO) for url in urls],
+                   max_lag)
+
+    def __len__(self) -> int:
+        return len(self.replicas)
+
+    def choose(self) -> Optional[AsyncEngine]:
+        """The next replica within the lag bound, round-robin; None if there is none."""
+        count = len(self.replicas)
+        for step in range(count):
+            replica = self.replicas[(self._next + step) % count]
+            if replica.lag <= self.max_lag:
+                self._next = (self._next + step + 1) % count
+                return replica.engine
+        return None
+
+    async def check_lag(self):
+        for replica in self.replicas:
+            try:
+                async with asyncio.timeout(5):
+                    async with replica.engine.connect() as conn:
+                        lag = 0.0
+                        if conn.dialect.name == "postgresql":
+                            lag = float((await conn.execute(_PG_LAG)).scalar() or 0.0)
+            except Exception as e:
+                if replica.lag != math.inf:
+                    logger.warning("Replica %s unreachable, reading from others: %s",
+                                   replica.name, e)
+                lag = math.inf
+            if math.isfinite(lag) and lag > self.max_lag >= replica.lag:
+                logger.warning("Replica %s is %.1fs behind; skipping it", replica.name, lag)
+            replica.lag = lag
+            REPLICA_LAG.labels(replica.name).set(lag)
+
+    async def dispose(self):
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+
+class RecentWriters:
+    """Clients that wrote in the last `window` seconds, as expiry times in an LRU dict."""
+
+    def __init__(self, window: float, max_clients: int):
+        self.window = window
+        self.max_clients = max_clients
+        self._until: "OrderedDict[Hashable, float]" = OrderedDict()
+
+    def __contains__(self, client) -> bool:
+        until = self._until.get(client)
+        return until is not None and until > time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._until)
+
+    def add(self, client: Hashable):
+        now = time.monotonic()
+        self._until[client] = now + self.window
+        self._until.move_to_end(client)
+        while self._until:
+            oldest, until = next(iter(self._until.items()))
+            if until > now and len(self._until) <= self.max_clients:
+                break
+            del self._until[oldest]
+
+    def clear(self):
+        self._until.clear()
+
+
+replicas = ReplicaSet.from_urls(settings.SQLALCHEMY_REPLICA_URIS, settings.REPLICA_MAX_LAG_SECONDS)
+recent_writers = RecentWriters(settings.READ_YOUR_WRITES_SECONDS,
+                               settings.READ_YOUR_WRITES_MAX_CLIENTS)
+
+
+class RoutingSession(Session):
+    """
+    Session.info keys: "read_only" (set by get_read_db), "client" (set at
+    authentication), and per transaction "replica" (the engine chosen, or
+    None for the primary) and "wrote".
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        info = self.info
+        if isinstance(clause, UpdateBase) or self._flushing:
+            info["wrote"] = True
+        elif info.get("read_only") and not info.get("wrote"):
+            if "replica" not in info:
+                info["replica"] = read_engine(info.get("client"))
+            if info["replica"] is not None:
+                return info["replica"].sync_engine
+        return super().get_bind(mapper=mapper, clause=clause, **kw)
+
+
+def read_engine(client=None) -> Optional[AsyncEngine]:
+    """
+    The replica `client`'s reads should go to, or None for the primary.
+    Also used directly for reads outside a session, such as streamed exports.
+    """
+    if not replicas.replicas:
+        return None
+    if client is not None and client in recent_writers:
+        DB_READ_ROUTES.labels("pinned").inc()
+        return None
+    engine = replicas.choose()
+    DB_READ_ROUTES.labels("replica" if engine is not None else "no_replica").inc()
+    return engine
+
+
+def inherit_routing(session, parent):
+    """Reads in `session` are routed like those of `parent` (both AsyncSessions)."""
+    for key in ("read_only", "client"):
+        if key in parent.info:
+            session.info[key] = parent.info[key]
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _after_commit(session):
+    info = session.info
+    if info.pop("wrote", False) and info.get("client") is not None:
+        recent_writers.add(info["client"])
+    info.pop("replica", None)
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("wrote", None)
+    session.info.pop("replica", None)
+
+
+def _on_ingested(event):
+    recent_writers.add(("patient", event.data["patient_id"]))
+
+
+def _on_profile(event):
+    recent_writers.add((event.data["kind"], event.data["id"]))
+
+
+def _on_appointment(event):
+    recent_writers.add(("doctor", event.data["doctor_id"]))
+
+
+event_bus.subscribe(METRIC_INGESTED, _on_ingested)
+event_bus.subscribe(PROFILE_UPDATED, _on_profile)
+event_bus.subscribe(APPOINTMENT_CHANGED, _on_appointment)
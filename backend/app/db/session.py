@@ -1,9 +1,11 @@
 import asyncio
 import logging
+from fastapi import Depends
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.core.config import settings
+from app.db.routing import RoutingSession
 from sqlalchemy.exc import SQLAlchemyError
 
 logger = logging.getLogger(__name__)
@@ -14,10 +16,12 @@ SQLALCHEMY_DATABASE_URL = settings.database_url
 # We'll use a single engine instance.
 # We don't try to connect here because create_async_engine is lazy.
 # The actual connection check happens in get_db.
-engine = create_async_engine(SQLALCHEMY_DATABASE_URL, echo=True)
+engine = create_async_engine(
+    SQLALCHEMY_DATABASE_URL, echo=settings.SQLALCHEMY_ECHO)
 
+# Read-only sessions send their reads to a replica; see app/db/routing.py
 SessionLocal = sessionmaker(
-    engine, class_=AsyncSession, expire_on_commit=False)
+    engine, class_=AsyncSession, sync_session_class=RoutingSession, expire_on_commit=False)
 Base = declarative_base()
 
 
@@ -40,11 +44,12 @@ async def get_db():
                 f"Postgres connection failed: {e}. Falling back to SQLite.")
             print("Falling back to SQLite...")
             sqlite_url = "sqlite+aiosqlite:///./sql_app.db"
-            engine = create_async_engine(sqlite_url, echo=True, connect_args={
+            engine = create_async_engine(sqlite_url, echo=settings.SQLALCHEMY_ECHO, connect_args={
                                          "check_same_thread": False})
             # CRITICAL: Update SessionLocal to use the new engine
             SessionLocal = sessionmaker(
-                engine, class_=AsyncSession, expire_on_commit=False)
+                engine, class_=AsyncSession, sync_session_class=RoutingSession,
+                expire_on_commit=False)
 
             # Ensure tables are created in the fallback database
             from app.db.base import Base
@@ -66,3 +71,13 @@ async def get_db():
             raise e
         finally:
             await session.close()
+
+
+async def get_read_db(db: AsyncSession = Depends(get_db)) -> AsyncSession:
+    """
+    The request's session (the same one as get_db's), for endpoints that
+    only read: its reads may be served by a replica. Declare it before the
+    auth dependencies so their lookups are routed too.
+    """
+    db.info["read_only"] = True
+    return db
@@ -0,0 +1,33 @@
+"""
+Helpers for values and statements that differ between the databases we run on.
+
+SQLite hands DateTime(timezone=True) columns back naive, Postgres as aware
+datetimes in the session's zone; as_utc and to_epoch treat naive values as
+UTC and convert the rest. insert_for picks the dialect's INSERT, which has
+ON CONFLICT support on both Postgres and SQLite.
+"""
+from datetime import datetime, timezone
+from typing import Optional, Union
+
+
+def as_utc(ts: Optional[datetime]) -> Optional[datetime]:
+    """`ts` as an aware UTC datetime; naive values are taken to be UTC already."""
+    if ts is None:
+        return None
+    return ts.replace(tzinfo=timezone.utc) if ts.tzinfo is None else ts.astimezone(timezone.utc)
+
+
+def to_epoch(ts: Union[datetime, str]) -> float:
+    """Seconds since the epoch of a datetime or ISO 8601 string, naive meaning UTC."""
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts)
+    return as_utc(ts).timestamp()
+
+
+def insert_for(db, table):
+    """insert(table) for the dialect of the database session `db` is bound to."""
+    if db.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, DateTime, Float, Integer, String
+from app.db.session import Base
+
+
+class AnomalyDetectorState(Base):
+    """Checkpointed detector state of one (patient, metric) series (app/services/anomaly.py)."""
+    __tablename__ = "anomaly_detector_states"
+
+    patient_id = Column(Integer, primary_key=True)
+    metric_type = Column(String, primary_key=True)
+    mean = Column(Float, nullable=False)  # EWMA baseline
+    variance = Column(Float, nullable=False)  # EW variance around it
+    cusum_pos = Column(Float, nullable=False)
+    cusum_neg = Column(Float, nullable=False)
+    readings = Column(Integer, nullable=False)
+    last_reading_at = Column(DateTime(timezone=True), nullable=False)
+    alerted_at = Column(DateTime(timezone=True), nullable=True)
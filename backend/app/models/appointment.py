@@ -1,19 +1,43 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Date
+from sqlalchemy import Column, DateTime, Integer, String, ForeignKey, Index, event, text
 from sqlalchemy.orm import relationship
 from app.db.session import Base
 
 
 class Appointment(Base):
     __tablename__ = "appointments"
+    __table_args__ = (
+        # Overlap checks and availability are range scans on this index.
+        Index("ix_appointments_doctor_start", "doctor_id", "start_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     doctor_id = Column(Integer, ForeignKey("doctors.id"), nullable=False)
     patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False)
     date = Column(String, nullable=False)  # ISO format YYYY-MM-DD
     time = Column(String, nullable=False)  # HH:MM
+    # Typed [start_at, end_at) in UTC; date and time above are kept for display
+    start_at = Column(DateTime(timezone=True))
+    end_at = Column(DateTime(timezone=True))
     reason = Column(String, nullable=False)
     # Scheduled, Completed, Cancelled
     status = Column(String, default="Scheduled")
 
     doctor = relationship("Doctor", back_populates="appointments")
     patient = relationship("Patient", back_populates="appointments")
+
+
+# Postgres refuses overlapping bookings itself, which settles races between
+# two concurrent bookings that both passed the overlap check.
+NO_OVERLAP_CONSTRAINT = "appointments_no_overlap"
+NO_OVERLAP_DDL = (
+    f"ALTER TABLE appointments ADD CONSTRAINT {NO_OVERLAP_CONSTRAINT} "
+    "EXCLUDE USING gist (doctor_id WITH =, tstzrange(start_at, end_at) WITH &&) "
+    "WHERE (status <> 'Cancelled' AND start_at IS NOT NULL)"
+)
+
+
+@event.listens_for(Appointment.__table__, "after_create")
+def _create_overlap_constraint(target, connection, **kw):
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+        connection.execute(text(NO_OVERLAP_DDL))
@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, Float, String, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy.orm import relationship
+from app.db.session import Base
+
+
+class HealthMetricRollup(Base):
+    """Aggregated readings kept after raw health_metrics rows age out."""
+    __tablename__ = "health_metric_rollups"
+    __table_args__ = (
+        UniqueConstraint("patient_id", "metric_type", "bucket_start", "bucket_seconds",
+                         name="uq_health_metric_rollups_bucket"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False)
+    metric_type = Column(String, nullable=False)
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+    bucket_seconds = Column(Integer, nullable=False)  # e.g. 3600 for hourly
+    count = Column(Integer, nullable=False)
+    value_sum = Column(Float, nullable=False)
+    value_min = Column(Float, nullable=False)
+    value_max = Column(Float, nullable=False)
+
+    patient = relationship("Patient", backref="metric_rollups")
@@ -1,17 +1,45 @@
-from sqlalchemy import Column, Integer, Float, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, Float, DateTime, ForeignKey, Index, event
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import relationship
+from sqlalchemy.schema import CreateTable
 from sqlalchemy.sql import func
 from app.db.session import Base
+from app.models.metric_type import MetricTypeCode
 
 
 class HealthMetric(Base):
     __tablename__ = "health_metrics"
+    __table_args__ = (
+        Index("ix_health_metrics_patient_timestamp", "patient_id", "timestamp"),
+        # Monthly RANGE partitions on Postgres, see app/db/partitioning.py
+        {"postgresql_partition_by": 'RANGE ("timestamp")'},
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     patient_id = Column(Integer, ForeignKey("patients.id"))
-    # heart_rate, glucose, temperature, etc.
-    metric_type = Column(String, index=True)
+    # heart_rate, glucose, temperature, etc., stored as a metric_types code
+    metric_type = Column("metric_type_id", MetricTypeCode, ForeignKey("metric_types.id"),
+                         key="metric_type", index=True)
     value = Column(Float)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
 
     patient = relationship("Patient", back_populates="health_metrics")
+
+
+@compiles(CreateTable, "postgresql")
+def _create_partitioned_table(element, compiler, **kw):
+    # Postgres requires the partition key in every unique constraint of a
+    # partitioned table, so the primary key becomes (id, timestamp) there.
+    # The ORM keeps treating `id` alone as the identity; it is still unique
+    # because it comes from a single sequence.
+    ddl = compiler.visit_create_table(element, **kw)
+    if element.element.name == HealthMetric.__tablename__:
+        ddl = ddl.replace("PRIMARY KEY (id)", 'PRIMARY KEY (id, "timestamp")')
+    return ddl
+
+
+@event.listens_for(HealthMetric.__table__, "after_create")
+def _create_initial_partitions(target, connection, **kw):
+    if connection.dialect.name == "postgresql":
+        from app.db.partitioning import create_initial_partitions
+        create_initial_partitions(connection)
@@ -0,0 +1,12 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from app.db.session import Base
+
+
+class IngestionKey(Base):
+    """Idempotency keys of recently ingested readings; the primary key rejects repeats."""
+    __tablename__ = "ingestion_keys"
+
+    patient_id = Column(Integer, primary_key=True)
+    key = Column(String(128), primary_key=True)
+    metric_id = Column(Integer, nullable=True)  # the reading the key first stored
+    created_at = Column(DateTime(timezone=True), nullable=False, index=True)
@@ -0,0 +1,14 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON
+from app.db.session import Base
+
+
+class JobCheckpoint(Base):
+    """Where a resumable background job got to, so a restart picks up from there."""
+    __tablename__ = "job_checkpoints"
+
+    name = Column(String, primary_key=True)
+    state = Column(String, nullable=False)  # running, done, failed
+    position = Column(Integer, nullable=False, default=0)  # last key fully processed
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), nullable=True)
+    details = Column(JSON, nullable=True)
@@ -0,0 +1,95 @@
+"""
+Dictionary of metric types.
+
+health_metrics stores a reading's type as a SMALLINT code into metric_types
+instead of repeating the name on every row and in its index. The
+MetricTypeCode column type translates through the in-process registry, so
+queries, inserts and results keep using names. The built-in types have
+fixed codes and are known before the table is read; any others are loaded
+by app.services.metric_types.
+"""
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import Column, SmallInteger, String, event, insert
+from sqlalchemy.types import TypeDecorator
+
+from app.db.session import Base
+
+# Code n + 1 for the type at position n, seeded when the table is created.
+# Codes are stored in every reading: only append to this tuple.
+BUILTIN_METRIC_TYPES = (
+    "heart_rate", "glucose", "temperature", "blood_pressure_sys",
+    "blood_pressure_dia", "stress_level", "spo2", "respiratory_rate",
+)
+MAX_METRIC_TYPE_LENGTH = 64
+
+
+class MetricType(Base):
+    __tablename__ = "metric_types"
+
+    id = Column(SmallInteger, primary_key=True, autoincrement=False)
+    name = Column(String(MAX_METRIC_TYPE_LENGTH), unique=True, nullable=False)
+
+
+class UnknownMetricType(ValueError):
+    pass
+
+
+class MetricTypeRegistry:
+    """Name <-> code mapping of the metric types this process knows about."""
+
+    def __init__(self, names: Iterable[str] = ()):
+        self._codes: Dict[str, int] = {}
+        self._names: Dict[int, str] = {}
+        self.update((n + 1, name) for n, name in enumerate(names))
+
+    def __contains__(self, name) -> bool:
+        return name in self._codes
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def update(self, rows: Iterable[Tuple[int, str]]):
+        for code, name in rows:
+            self._codes[name] = code
+            self._names[code] = name
+
+    def code(self, name: str) -> int:
+        try:
+            return self._codes[name]
+        except KeyError:
+            raise UnknownMetricType(f"Unknown metric type {name!r}") from None
+
+    def name(self, code: int) -> str:
+        try:
+            return self._names[code]
+        except KeyError:
+            raise UnknownMetricType(f"Unknown metric type code {code}") from None
+
+    def names(self) -> Tuple[str, ...]:
+        return tuple(self._names[code] for code in sorted(self._names))
+
+    def next_code(self) -> int:
+        return max(self._names, default=0) + 1
+
+
+metric_types = MetricTypeRegistry(BUILTIN_METRIC_TYPES)
+
+
+class MetricTypeCode(TypeDecorator):
+    """A metric type name in Python, its metric_types code in the database."""
+
+    impl = SmallInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else metric_types.code(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else metric_types.name(value)
+
+
+@event.listens_for(MetricType.__table__, "after_create")
+def _seed_builtin_types(target, connection, **kw):
+    connection.execute(insert(target), [
+        {"id": n + 1, "name": name} for n, name in enumerate(BUILTIN_METRIC_TYPES)])
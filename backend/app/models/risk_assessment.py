@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.session import Base
@@ -6,6 +6,11 @@ from app.db.session import Base
 
 class RiskAssessment(Base):
     __tablename__ = "risk_assessments"
+    __table_args__ = (
+        # Latest assessment per condition, and a patient's risk history
+        Index("ix_risk_assessments_patient_disease_date",
+              "patient_id", "disease_type", "assessment_date"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     patient_id = Column(Integer, ForeignKey("patients.id"))
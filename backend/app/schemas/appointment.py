@@ -1,6 +1,9 @@
-from pydantic import BaseModel
+from datetime import datetime, timedelta, timezone
+from pydantic import BaseModel, model_validator
 from typing import Optional
 
+from app.core.config import settings
+
 
 class AppointmentBase(BaseModel):
     patient_id: int
@@ -8,10 +11,39 @@ class AppointmentBase(BaseModel):
     time: str
     reason: str
     status: str = "Scheduled"
+    start_at: Optional[datetime] = None
+    end_at: Optional[datetime] = None
 
 
 class AppointmentCreate(AppointmentBase):
-    pass
+    # Either start_at (end_at defaults to APPOINTMENT_DEFAULT_MINUTES later)
+    # or, as older clients send, date "YYYY-MM-DD" and time "HH:MM" in UTC.
+    date: Optional[str] = None
+    time: Optional[str] = None
+
+    @model_validator(mode="after")
+    def _typed_times(self):
+        if self.start_at is None:
+            if not self.date or not self.time:
+                raise ValueError("start_at, or date and time, is required")
+            try:
+                self.start_at = datetime.strptime(f"{self.date} {self.time}", "%Y-%m-%d %H:%M")
+            except ValueError:
+                raise ValueError("date must be YYYY-MM-DD and time HH:MM") from None
+        if self.start_at.tzinfo is None:
+            self.start_at = self.start_at.replace(tzinfo=timezone.utc)
+        self.start_at = self.start_at.astimezone(timezone.utc)
+        if self.end_at is None:
+            self.end_at = self.start_at + timedelta(minutes=settings.APPOINTMENT_DEFAULT_MINUTES)
+        elif self.end_at.tzinfo is None:
+            self.end_at = self.end_at.replace(tzinfo=timezone.utc)
+        if self.end_at <= self.start_at:
+            raise ValueError("end_at must be after start_at")
+        if self.end_at - self.start_at > timedelta(minutes=settings.APPOINTMENT_MAX_MINUTES):
+            raise ValueError(f"Appointments last at most {settings.APPOINTMENT_MAX_MINUTES} minutes")
+        self.date = self.start_at.date().isoformat()
+        self.time = self.start_at.strftime("%H:%M")
+        return self
 
 
 class Appointment(AppointmentBase):
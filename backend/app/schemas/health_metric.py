@@ -1,7 +1,9 @@
 from typing import Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 from datetime import datetime
 
+from app.models.metric_type import metric_types
+
 
 class HealthMetricBase(BaseModel):
     patient_id: Optional[int] = None
@@ -11,7 +13,16 @@ class HealthMetricBase(BaseModel):
 
 
 class HealthMetricCreate(HealthMetricBase):
-    pass
+    # Either makes retries safe: a reading whose key was already stored is dropped.
+    idempotency_key: Optional[str] = Field(None, max_length=100)
+    sequence: Optional[int] = None  # the device's own counter, scoped by X-Device-Id
+
+    @field_validator("metric_type")
+    @classmethod
+    def _known_type(cls, value: str) -> str:
+        if value not in metric_types:
+            raise ValueError(f"Unknown metric type {value!r}")
+        return value
 
 
 class HealthMetric(HealthMetricBase):
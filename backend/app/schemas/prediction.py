@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from datetime import datetime
+from typing import Dict, List, Optional
 
 
 class HealthMetrics(BaseModel):
@@ -26,6 +27,8 @@ class RiskPrediction(BaseModel):
     confidence: Optional[float] = None
     key_indicators: Optional[List[str]] = None
     status_text: Optional[str] = None
+    model: Optional[str] = None  # model version, or "heuristic"
+    stale_inputs: Optional[List[str]] = None
 
 
 class Recommendations(BaseModel):
@@ -33,10 +36,24 @@ class Recommendations(BaseModel):
     short_term: List[Optional[str]]
 
 
+class MetricQuality(BaseModel):
+    received: int
+    expected: Optional[float] = None
+    coverage: Optional[float] = None
+    continuity: float
+    longest_gap_seconds: float
+    seconds_since_last: float
+    stale: bool
+
+
 class DataQuality(BaseModel):
     monitoring_coverage: float
-    lab_accuracy: float
-    manual_entry: float
+    continuity: float
+    fresh_inputs: float
+    longest_gap_seconds: Optional[float] = None
+    stale_metrics: List[str]
+    window_hours: int
+    metrics: Dict[str, MetricQuality]
 
 
 class HealthAnalysisResponse(BaseModel):
@@ -46,5 +63,18 @@ class HealthAnalysisResponse(BaseModel):
     summary: str
     comorbidities: List[Optional[str]]
     recommendations: Recommendations
-    data_quality: DataQuality
+    features: Optional[dict] = None
+    data_quality: Optional[DataQuality] = None  # only for a patient's own readings
     user_id: Optional[str] = None
+
+
+class RiskAssessment(BaseModel):
+    id: int
+    disease_type: str
+    risk_score: float
+    risk_level: str
+    assessment_date: Optional[datetime] = None
+    notes: Optional[str] = None
+
+    class Config:
+        from_attributes = True
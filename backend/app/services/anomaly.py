@@ -0,0 +1,360 @@
+"""
+Streaming anomaly detection on incoming readings.
+
+Every (patient, metric) series in ANOMALY_METRICS has two detectors with
+O(1) state, updated as readings arrive on the event bus:
+
+* an EWMA baseline and variance, giving each reading a z-score against
+  what came before it, which catches sudden spikes and drops;
+* a two-sided CUSUM of those z-scores (slack k = ANOMALY_CUSUM_SLACK),
+  which catches smaller shifts that persist over several readings.
+
+Both only alert once a series has ANOMALY_WARMUP_READINGS behind it. An
+outlier only moves the baseline as far as a reading at the z threshold
+would, so one spike doesn't mask the next. An anomalous reading is
+stored in health_alerts and published as ALERT_RAISED, which feeds the
+live dashboards; a series alerts at most once per
+ANOMALY_ALERT_COOLDOWN_SECONDS.
+
+Every worker keeps the state of every series, since every worker sees
+every reading. The worker that ingested a reading runs it through its
+detectors inside the ingesting transaction (raise_alerts), so the alert
+row commits with the reading; the others catch up from METRIC_INGESTED. The state sits in one NumPy array per field indexed by a slot per
+series (about 50 bytes, plus ~100 for the index entry), so a million
+series take roughly 150 MB.
+
+State is checkpointed to anomaly_detector_states (changed series only)
+and restored at startup, so a restart doesn't go through a new warm-up.
+Readings arriving late, behind a series' newest, are skipped.
+"""
+import logging
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.telemetry import ANOMALIES_DETECTED, ANOMALY_SERIES
+from app.db import session as db_session
+from app.db.utils import as_utc, insert_for, to_epoch
+from app.models.anomaly_state import AnomalyDetectorState
+from app.models.health_alert import HealthAlert
+from app.models.job_checkpoint import JobCheckpoint
+from app.services.events import ALERT_RAISED, METRIC_INGESTED, event_bus, publish_on_commit
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = "anomaly_detectors"
+# Rows per checkpoint upsert or restore fetch
+_CHUNK = 1000
+_FIELDS = (("mean", "f8"), ("var", "f8"), ("cusum_pos", "f4"), ("cusum_neg", "f4"),
+           ("count", "u4"), ("last_time", "f8"), ("alerted_at", "f8"), ("dirty", "?"),
+           ("keys", "i8"))
+
+
+class DetectorArrays:
+    """
+    Detector state for many series in parallel arrays, one slot per
+    series. A series' key is patient_id * len(metrics) + its metric's index.
+    Slots of dropped series are reused; the arrays double as they fill, up
+    to max_series, past which new series go untracked.
+    """
+
+    def __init__(self, metrics: Dict[str, float], max_series: int, capacity: int = 1024):
+        self.metric_types = list(metrics)
+        self.min_std = [float(metrics[m]) for m in self.metric_types]
+        self._codes = {m: i for i, m in enumerate(self.metric_types)}
+        self.max_series = max_series
+        self.initial_capacity = min(capacity, max_series)
+        self.capacity = 0  # arrays are allocated with the first series
+        self._slots: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._used = 0  # slots ever handed out
+        self.untracked = 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _allocate(self, capacity: int):
+        # numpy is only imported once a reading arrives, not at API startup.
+        import numpy as np
+
+        for name, dtype in _FIELDS:
+            grown = np.zeros(capacity, dtype=dtype)
+            if self.capacity:
+                grown[:self.capacity] = getattr(self, name)
+            setattr(self, name, grown)
+        self.capacity = capacity
+
+    def key(self, patient_id: int, metric_type: str) -> Optional[int]:
+        code = self._codes.get(metric_type)
+        return None if code is None else patient_id * len(self.metric_types) + code
+
+    def series(self, key: int) -> Tuple[int, str]:
+        patient_id, code = divmod(key, len(self.metric_types))
+        return patient_id, self.metric_types[code]
+
+    def slot(self, key: int, create: bool = True) -> Optional[int]:
+        slot = self._slots.get(key)
+        if slot is not None or not create:
+            return slot
+        if self._free:
+            slot = self._free.pop()
+        elif self._used < self.capacity:
+            slot, self._used = self._used, self._used + 1
+        elif self.capacity < self.max_series:
+            self._allocate(min(max(self.capacity * 2, self.initial_capacity), self.max_series))
+            slot, self._used = self._used, self._used + 1
+        else:
+            self.untracked += 1
+            return None
+        self._slots[key] = slot
+        self.keys[slot] = key
+        self.count[slot] = 0
+        self.cusum_pos[slot] = self.cusum_neg[slot] = 0.0
+        self.alerted_at[slot] = -math.inf
+        return slot
+
+    def drop_idle(self, before: float) -> int:
+        idle = [key for key, slot in self._slots.items() if self.last_time[slot] < before]
+        for key in idle:
+            slot = self._slots.pop(key)
+            self.dirty[slot] = False
+            self._free.append(slot)
+        return len(idle)
+
+    def dirty_slots(self) -> List[int]:
+        return [slot for slot in self._slots.values() if self.dirty[slot]]
+
+    def mark_clean(self, slots: Optional[Iterable[int]] = None):
+        if not self.capacity:
+            return
+        if slots is None:
+            self.dirty[:] = False
+        else:
+            for slot in slots:
+                self.dirty[slot] = False
+
+    def clear(self):
+        self._slots.clear()
+        self._free.clear()
+        self._used = 0
+        self.untracked = 0
+        self.mark_clean()
+
+    def update(self, key: int, value: float, epoch: float) -> Optional[Tuple[float, List[str]]]:
+        """
+        Feeds one reading to its series' detectors. Returns the reading's
+        z-score and the detectors that fired, or None when none did.
+        """
+        slot = self.slot(key)
+        if slot is None:
+            return None
+        n = int(self.count[slot])
+        if n and epoch < self.last_time[slot]:
+            return None
+        self.dirty[slot] = True
+        self.last_time[slot] = epoch
+        self.count[slot] = n + 1
+        if n == 0:
+            self.mean[slot], self.var[slot] = value, 0.0
+            return None
+
+        mean, var = float(self.mean[slot]), float(self.var[slot])
+        std = max(math.sqrt(var), self.min_std[key % len(self.metric_types)])
+        z = (value - mean) / std
+        limit = settings.ANOMALY_Z_THRESHOLD
+        clipped = min(max(z, -limit), limit)
+        fired = []
+        if n >= settings.ANOMALY_WARMUP_READINGS:
+            if abs(z) > limit:
+                fired.append("zscore")
+            slack, cusum_limit = settings.ANOMALY_CUSUM_SLACK, settings.ANOMALY_CUSUM_LIMIT
+            pos = max(0.0, float(self.cusum_pos[slot]) + clipped - slack)
+            neg = max(0.0, float(self.cusum_neg[slot]) - clipped - slack)
+            if pos > cusum_limit:
+                fired.append("cusum_up")
+                pos = 0.0
+            if neg > cusum_limit:
+                fired.append("cusum_down")
+                neg = 0.0
+            self.cusum_pos[slot], self.cusum_neg[slot] = pos, neg
+            # Outliers pull the baseline no further than the threshold would.
+            value = mean + clipped * std
+
+        # Plain averaging until 1/n drops below alpha, so the baseline settles fast.
+        alpha = max(settings.ANOMALY_EWMA_ALPHA, 1.0 / (n + 1))
+        diff = value - mean
+        self.mean[slot] = mean + alpha * diff
+        self.var[slot] = (1 - alpha) * (var + alpha * diff * diff)
+
+        if not fired or epoch - self.alerted_at[slot] < settings.ANOMALY_ALERT_COOLDOWN_SECONDS:
+            return None
+        self.alerted_at[slot] = epoch
+        return z, fired
+
+
+detectors = DetectorArrays(settings.ANOMALY_METRICS, settings.ANOMALY_MAX_SERIES)
+ANOMALY_SERIES.set_function(lambda: len(detectors))
+
+
+def detect(patient_id: int, readings: Iterable[dict]) -> List[dict]:
+    """Runs readings (as in METRIC_INGESTED) through the detectors; returns the alerts."""
+    alerts = []
+    for r in readings:
+        key = detectors.key(patient_id, r["metric_type"])
+        if key is None or r["value"] is None:
+            continue
+        slot = detectors.slot(key, create=False)
+        baseline = float(detectors.mean[slot]) if slot is not None else None
+        result = detectors.update(key, float(r["value"]), to_epoch(r["timestamp"]))
+        if result is None:
+            continue
+        z, fired = result
+        for detector in fired:
+            ANOMALIES_DETECTED.labels(r["metric_type"], detector).inc()
+        alerts.append({
+            "patient_id": patient_id, "kind": "anomaly", "metric_type": r["metric_type"],
+            "value": r["value"], "timestamp": r["timestamp"], "reading_id": r.get("id"),
+            "baseline": round(baseline, 2), "z_score": round(z, 2), "detectors": fired,
+        })
+    return alerts
+
+
+def _message(alert: dict) -> str:
+    direction = "above" if alert["z_score"] > 0 else "below"
+    return (f"{alert['metric_type']} reading {alert['value']} is {abs(alert['z_score'])} "
+            f"standard deviations {direction} its baseline of {alert['baseline']} "
+            f"({', '.join(alert['detectors'])})")
+
+
+async def raise_alerts(db, patient_id: int, readings: Iterable[dict]) -> List[dict]:
+    """
+    Detection for readings `db` is storing: adds a health_alerts row per
+    alert to the transaction and publishes it as ALERT_RAISED (with its
+    alert_id) once `db` commits. Returns the alerts.
+    """
+    if not settings.ANOMALY_DETECTION_ENABLED:
+        return []
+    alerts = detect(patient_id, readings)
+    if not alerts:
+        return alerts
+    rows = [HealthAlert(patient_id=patient_id, alert_type=f"{a['metric_type']} anomaly",
+                        severity="Warning", message=_message(a)) for a in alerts]
+    db.add_all(rows)
+    await db.flush()
+    for alert, row in zip(alerts, rows):
+        alert["alert_id"] = row.id
+        publish_on_commit(db, ALERT_RAISED, alert)
+    return alerts
+
+
+def _on_ingested(event):
+    # The ingesting worker already ran these readings through raise_alerts.
+    if not settings.ANOMALY_DETECTION_ENABLED or event.origin == event_bus.origin:
+        return
+    detect(event.data["patient_id"], event.data["readings"])
+
+
+event_bus.subscribe(METRIC_INGESTED, _on_ingested)
+
+
+# -- checkpoints -----------------------------------------------------------
+
+def _time(epoch: float) -> Optional[datetime]:
+    return datetime.fromtimestamp(epoch, timezone.utc) if math.isfinite(epoch) else None
+
+
+def _upsert(db, rows: List[dict]):
+    stmt = insert_for(db, AnomalyDetectorState).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=["patient_id", "metric_type"],
+        set_={c: stmt.excluded[c] for c in (
+            "mean", "variance", "cusum_pos", "cusum_neg", "readings",
+            "last_reading_at", "alerted_at")})
+
+
+def _state_row(slot: int) -> dict:
+    patient_id, metric_type = detectors.series(int(detectors.keys[slot]))
+    return {
+        "patient_id": patient_id, "metric_type": metric_type,
+        "mean": float(detectors.mean[slot]), "variance": float(detectors.var[slot]),
+        "cusum_pos": float(detectors.cusum_pos[slot]),
+        "cusum_neg": float(detectors.cusum_neg[slot]),
+        "readings": int(detectors.count[slot]),
+        "last_reading_at": _time(float(detectors.last_time[slot])),
+        "alerted_at": _time(float(detectors.alerted_at[slot])),
+    }
+
+
+async def checkpoint_detectors(now: Optional[datetime] = None) -> int:
+    """Writes the series changed since the last checkpoint; returns how many."""
+    now = now or datetime.now(timezone.utc)
+    dropped = detectors.drop_idle((now - timedelta(days=settings.ANOMALY_IDLE_DAYS)).timestamp())
+    async with db_session.SessionLocal() as db:
+        checkpoint = await db.get(JobCheckpoint, CHECKPOINT_NAME)
+        recent = now - timedelta(seconds=settings.ANOMALY_CHECKPOINT_INTERVAL_SECONDS / 2)
+        if checkpoint is not None and checkpoint.updated_at \
+                and as_utc(checkpoint.updated_at) > recent \
+                and (checkpoint.details or {}).get("origin") != event_bus.origin:
+            # Another worker, which saw the same readings, has just written them.
+            detectors.mark_clean()
+            return 0
+
+        # Taken before any await, so readings that arrive during the writes
+        # leave their series dirty for the next checkpoint.
+        slots = detectors.dirty_slots()
+        rows = [_state_row(slot) for slot in slots]
+        detectors.mark_clean(slots)
+        try:
+            for start in range(0, len(rows), _CHUNK):
+                await db.execute(_upsert(db, rows[start:start + _CHUNK]))
+            await db.merge(JobCheckpoint(
+                name=CHECKPOINT_NAME, state="done", position=len(detectors),
+                started_at=checkpoint.started_at if checkpoint else now, updated_at=now,
+                details={"origin": event_bus.origin, "written": len(rows),
+                         "series": len(detectors), "dropped_idle": dropped,
+                         "untracked": detectors.untracked}))
+            await db.commit()
+        except Exception:
+            for slot in slots:
+                detectors.dirty[slot] = True
+            raise
+    if slots:
+        logger.info("Checkpointed %d anomaly detector series", len(slots))
+    return len(slots)
+
+
+async def restore_detectors(now: Optional[datetime] = None) -> int:
+    """
+    Loads checkpointed state for series this process hasn't seen a reading
+    of yet; returns how many were restored.
+    """
+    now = now or datetime.now(timezone.utc)
+    idle_before = (now - timedelta(days=settings.ANOMALY_IDLE_DAYS)).timestamp()
+    restored = 0
+    async with db_session.SessionLocal() as db:
+        result = await db.stream(
+            select(AnomalyDetectorState.__table__)
+            .where(AnomalyDetectorState.metric_type.in_(detectors.metric_types))
+            .execution_options(yield_per=_CHUNK))
+        async for rows in result.partitions():
+            for row in rows:
+                key = detectors.key(row.patient_id, row.metric_type)
+                last_time = as_utc(row.last_reading_at).timestamp()
+                if last_time < idle_before or detectors.slot(key, create=False) is not None:
+                    continue
+                slot = detectors.slot(key)
+                if slot is None:
+                    return restored
+                detectors.mean[slot], detectors.var[slot] = row.mean, row.variance
+                detectors.cusum_pos[slot], detectors.cusum_neg[slot] = row.cusum_pos, row.cusum_neg
+                detectors.count[slot] = row.readings
+                detectors.last_time[slot] = last_time
+                if row.alerted_at is not None:
+                    detectors.alerted_at[slot] = as_utc(row.alerted_at).timestamp()
+                restored += 1
+    if restored:
+        logger.info("Restored %d anomaly detector series", restored)
+    return restored
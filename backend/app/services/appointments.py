@@ -0,0 +1,192 @@
+"""
+Appointment scheduling: overlap checks for bookings and free-slot lookups.
+
+Appointments are half-open [start_at, end_at) intervals, and none lasts
+longer than APPOINTMENT_MAX_MINUTES, so anything overlapping a window
+starts less than that before the window does. Both the booking check and
+the availability load are therefore bounded range scans on the
+(doctor_id, start_at) index, however long the doctor's history is.
+
+Availability is answered from an in-memory IntervalIndex of each doctor's
+schedule from yesterday through APPOINTMENT_CACHE_DAYS ahead, loaded with
+one query and dropped whenever APPOINTMENT_CHANGED names the doctor, so
+bookings made through any worker are seen everywhere. Ranges beyond that
+horizon get a one-off index, again from a single query.
+"""
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import or_, select
+
+from app.core.config import settings
+from app.db.utils import as_utc
+from app.models.appointment import Appointment
+from app.services.events import APPOINTMENT_CHANGED, event_bus
+
+CANCELLED = "Cancelled"
+
+Interval = Tuple[datetime, datetime, int]  # (start, end, appointment id)
+
+
+class IntervalIndex:
+    """
+    Intervals sorted by start, plus the longest one's length: whatever
+    overlaps [start, end) starts in (start - longest, end), which two
+    bisections find, so a lookup is O(log n + k).
+    """
+
+    def __init__(self, intervals: Iterable[Interval] = ()):
+        self._starts: List[datetime] = []
+        self._intervals: List[Interval] = []
+        self._longest = timedelta(0)
+        for interval in intervals:
+            self.add(*interval)
+
+    def __len__(self) -> int:
+        return len(self._intervals)
+
+    def add(self, start: datetime, end: datetime, item: int):
+        pos = bisect_right(self._starts, start)
+        self._starts.insert(pos, start)
+        self._intervals.insert(pos, (start, end, item))
+        self._longest = max(self._longest, end - start)
+
+    def overlapping(self, start: datetime, end: datetime) -> List[Interval]:
+        lo = bisect_right(self._starts, start - self._longest)
+        hi = bisect_left(self._starts, end)
+        return [interval for interval in self._intervals[lo:hi] if interval[1] > start]
+
+    def free_slots(self, start: datetime, end: datetime,
+                   slot: timedelta) -> List[Tuple[datetime, datetime]]:
+        """Back-to-back free slots of length `slot` in [start, end); a busy stretch restarts them at its end."""
+        slots = []
+        t = start
+        while t + slot <= end:
+            busy = self.overlapping(t, t + slot)
+            if busy:
+                t = max(interval[1] for interval in busy)
+            else:
+                slots.append((t, t + slot))
+                t += slot
+        return slots
+
+
+def _active():
+    return or_(Appointment.status.is_(None), Appointment.status != CANCELLED)
+
+
+def _overlapping(doctor_id: int, start: datetime, end: datetime):
+    longest = timedelta(minutes=settings.APPOINTMENT_MAX_MINUTES)
+    return (
+        select(Appointment.start_at, Appointment.end_at, Appointment.id)
+        .where(Appointment.doctor_id == doctor_id)
+        .where(Appointment.start_at > start - longest)
+        .where(Appointment.start_at < end)
+        .where(Appointment.end_at > start)
+        .where(_active())
+    )
+
+
+async def find_conflict(db, doctor_id: int, start: datetime, end: datetime,
+                        exclude_id: Optional[int] = None) -> Optional[Interval]:
+    """An active appointment of the doctor's overlapping [start, end), if any."""
+    query = _overlapping(doctor_id, start, end)
+    if exclude_id is not None:
+        query = query.where(Appointment.id != exclude_id)
+    row = (await db.execute(query.limit(1))).first()
+    if row is None:
+        return None
+    return as_utc(row.start_at), as_utc(row.end_at), row.id
+
+
+async def load_schedule(db, doctor_id: int, start: datetime, end: datetime) -> IntervalIndex:
+    result = await db.execute(_overlapping(doctor_id, start, end))
+    return IntervalIndex((as_utc(s), as_utc(e), i) for s, e, i in result.all())
+
+
+class ScheduleCache:
+    """Per-doctor IntervalIndex over the near-term horizon, least recently used evicted."""
+
+    def __init__(self, max_doctors: int):
+        self.max_doctors = max_doctors
+        # doctor_id -> (horizon start, horizon end, index)
+        self._schedules: "OrderedDict[int, Tuple[datetime, datetime, IntervalIndex]]" = OrderedDict()
+        self._invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._schedules)
+
+    @staticmethod
+    def horizon(now: datetime) -> Tuple[datetime, datetime]:
+        today = datetime.combine(as_utc(now).date(), time(), tzinfo=timezone.utc)
+        return today - timedelta(days=1), today + timedelta(days=settings.APPOINTMENT_CACHE_DAYS)
+
+    async def schedule(self, db, doctor_id: int, start: datetime, end: datetime,
+                       now: Optional[datetime] = None) -> IntervalIndex:
+        lower, upper = self.horizon(now or datetime.now(timezone.utc))
+        if start < lower or end > upper:
+            return await load_schedule(db, doctor_id, start, end)
+        cached = self._schedules.get(doctor_id)
+        if cached is not None and cached[0] == lower:
+            self._schedules.move_to_end(doctor_id)
+            return cached[2]
+        invalidations = self._invalidations
+        index = await load_schedule(db, doctor_id, lower, upper)
+        # A booking committed while loading may be missing; don't keep it.
+        if invalidations == self._invalidations:
+            self._schedules[doctor_id] = (lower, upper, index)
+            self._schedules.move_to_end(doctor_id)
+            while len(self._schedules) > self.max_doctors:
+                self._schedules.popitem(last=False)
+        return index
+
+    def invalidate(self, doctor_id: Optional[int] = None):
+        self._invalidations += 1
+        if doctor_id is None:
+            self._schedules.clear()
+        else:
+            self._schedules.pop(doctor_id, None)
+
+
+schedule_cache = ScheduleCache(settings.APPOINTMENT_CACHE_MAX_DOCTORS)
+
+event_bus.subscribe(APPOINTMENT_CHANGED, lambda e: schedule_cache.invalidate(e.data["doctor_id"]))
+event_bus.on_reconnect(schedule_cache.invalidate)
+
+
+def clinic_hours(first: date, last: date) -> List[Tuple[datetime, datetime]]:
+    """Each day's [opening, closing) from `first` to `last` inclusive."""
+    days = []
+    day = first
+    while day <= last:
+        midnight = datetime.combine(day, time(), tzinfo=timezone.utc)
+        days.append((midnight + timedelta(hours=settings.CLINIC_DAY_START_HOUR),
+                     midnight + timedelta(hours=settings.CLINIC_DAY_END_HOUR)))
+        day += timedelta(days=1)
+    return days
+
+
+async def free_slots(db, doctor_id: int, first: date, last: date, slot: timedelta,
+                     now: Optional[datetime] = None) -> List[Tuple[datetime, datetime]]:
+    """Free slots in clinic hours from `first` to `last`, none starting in the past."""
+    now = as_utc(now or datetime.now(timezone.utc))
+    days = clinic_hours(first, last)
+    if not days:
+        return []
+    schedule = await schedule_cache.schedule(db, doctor_id, days[0][0], days[-1][1], now)
+    slots = []
+    for opening, closing in days:
+        if closing <= now:
+            continue
+        slots.extend(schedule.free_slots(_next_slot(opening, now, slot), closing, slot))
+    return slots
+
+
+def _next_slot(opening: datetime, now: datetime, slot: timedelta) -> datetime:
+    """The first slot boundary (counting from opening) not before `now`."""
+    if now <= opening:
+        return opening
+    steps = -(-(now - opening) // slot)
+    return opening + steps * slot
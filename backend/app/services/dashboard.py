@@ -0,0 +1,128 @@
+"""
+The doctor dashboard in one request.
+
+The dashboard used to call /doctors/me, /stats, /patients and
+/appointments (and predictions per patient) separately, each paying for
+the token decode, the doctor lookup and the connection probe again. Here
+the doctor comes from the auth dependency's loader, with its hospital, and
+each section is one set-based query (risks add a single query for the
+page's latest vitals and one vectorised scoring pass), and sections run
+concurrently on their own sessions where the driver allows it. On SQLite
+they share the request's session, one after another, as concurrent
+connections would only queue on its lock.
+"""
+import asyncio
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload
+
+from app.db import session as db_session
+from app.db.loaders import loaders
+from app.db.routing import inherit_routing
+from app.models.appointment import Appointment
+from app.models.doctor import Doctor
+from app.models.patient import Patient
+from app.schemas.appointment import Appointment as AppointmentSchema
+from app.schemas.doctor import Doctor as DoctorSchema
+from app.schemas.patient import Patient as PatientSchema
+from app.services.features import feature_store
+from app.services.model_runtime import model_runtime
+from app.services.risk_batch import DEFAULT_PROFILE
+
+FIELDS = ("doctor", "stats", "patients", "appointments", "risks")
+
+Section = Callable[[object], Awaitable[dict]]
+
+
+async def _stats(db, doctor_id: int, today: str) -> dict:
+    total_patients = (select(func.count(Patient.id))
+                      .where(Patient.doctor_id == doctor_id).scalar_subquery())
+    today_appointments = (select(func.count(Appointment.id))
+                          .where(Appointment.doctor_id == doctor_id)
+                          .where(Appointment.date == today).scalar_subquery())
+    row = (await db.execute(select(total_patients, today_appointments))).one()
+    # Same shape as /doctors/stats
+    return {"stats": {
+        "total_patients": row[0],
+        "today_appointments": row[1],
+        "pending_actions": 2,
+        "new_patients": row[0],
+    }}
+
+
+async def _patients(db, doctor_id: int, limit: int, with_patients: bool,
+                    with_risks: bool) -> dict:
+    result = await db.execute(
+        select(Patient).options(joinedload(Patient.hospital))
+        .where(Patient.doctor_id == doctor_id)
+        .order_by(Patient.id).limit(limit))
+    patients = result.scalars().all()
+    out = {}
+    if with_patients:
+        for p in patients:
+            if p.hospital:
+                p.hospital_name = p.hospital.name
+        out["patients"] = [PatientSchema.model_validate(p) for p in patients]
+    if with_risks:
+        out["risks"] = await _risks(db, [p.id for p in patients])
+    return out
+
+
+async def _risks(db, patient_ids: List[int]) -> Dict[int, list]:
+    """Current risk per condition for the page's patients, scored as a batch."""
+    now = datetime.now(timezone.utc)
+    vitals = dict(zip(patient_ids, await loaders(db).latest_metrics.load_many(patient_ids)))
+    scored = [pid for pid in patient_ids if vitals[pid]]
+    results = await model_runtime.score_many(
+        [vitals[pid] for pid in scored], DEFAULT_PROFILE,
+        [feature_store.features(pid, now) for pid in scored])
+    return {
+        pid: [{"condition": c, "score": s, "risk_level": level} for c, s, level in conditions]
+        for pid, conditions in zip(scored, results)
+    }
+
+
+async def _appointments(db, doctor_id: int, today: str, limit: int) -> dict:
+    result = await db.execute(
+        select(Appointment).options(joinedload(Appointment.patient))
+        .where(Appointment.doctor_id == doctor_id)
+        .where(Appointment.date >= today)
+        .order_by(Appointment.date, Appointment.time, Appointment.id)
+        .limit(limit))
+    appointments = result.scalars().all()
+    for a in appointments:
+        a.patient_name = a.patient.full_name
+    return {"appointments": [AppointmentSchema.model_validate(a) for a in appointments]}
+
+
+async def _run_sections(db, sections: List[Section]) -> List[dict]:
+    if db_session.engine.dialect.name == "sqlite" or len(sections) < 2:
+        return [await section(db) for section in sections]
+
+    async def run(section: Section) -> dict:
+        async with db_session.SessionLocal() as session:
+            inherit_routing(session, db)
+            return await section(session)
+    return await asyncio.gather(*(run(section) for section in sections))
+
+
+async def doctor_dashboard(db, doctor: Doctor, fields: Iterable[str],
+                           patient_limit: int, appointment_limit: int) -> dict:
+    """The requested sections for `doctor`, as loaded by the auth dependency."""
+    fields = set(fields)
+    today = datetime.now(timezone.utc).date().isoformat()
+    sections: List[Section] = []
+    if "stats" in fields:
+        sections.append(lambda s: _stats(s, doctor.id, today))
+    if fields & {"patients", "risks"}:
+        sections.append(lambda s: _patients(s, doctor.id, patient_limit,
+                                            "patients" in fields, "risks" in fields))
+    if "appointments" in fields:
+        sections.append(lambda s: _appointments(s, doctor.id, today, appointment_limit))
+
+    out = {"doctor": DoctorSchema.model_validate(doctor)} if "doctor" in fields else {}
+    for part in await _run_sections(db, sections):
+        out.update(part)
+    return out
@@ -0,0 +1,237 @@
+"""
+Data quality from reading cadence.
+
+Each (patient, metric type) keeps hourly reading counts and the longest
+gap between consecutive readings in each hour, in small ring arrays over
+the last DATA_QUALITY_WINDOW_HOURS, plus the time of its latest reading.
+Ingestion bumps the counters in O(1), and a patient's coverage, gaps and
+stale metrics are read off them without touching stored history:
+
+- expected readings: window time since tracking began (at most the window)
+  over the metric's expected interval, for metrics that have one;
+- coverage: received over expected, capped at 100%;
+- continuity: the share of those hours with at least one reading;
+- longest gap: the longest between two readings, or since the latest;
+- stale: no reading for DATA_QUALITY_STALE_INTERVALS expected intervals
+  (FEATURE_STALE_SECONDS for metrics without one).
+
+Like the feature windows, counters are fed from the event bus, and a
+patient not seen since this process started is warmed once from the last
+window of storage.
+"""
+import zlib
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from app.core.config import settings
+from app.db.utils import to_epoch
+from app.services.events import METRIC_INGESTED, event_bus
+from app.services.vitals import metric_history
+
+_MAX_COUNT = 65535  # counts are unsigned shorts
+
+
+class MetricCadence:
+    """Hourly reading counts and in-hour longest gaps of one metric, as ring arrays."""
+
+    __slots__ = ("counts", "gaps", "hour", "last_time")
+
+    def __init__(self, hours: int):
+        self.counts = array("H", bytes(2 * hours))
+        self.gaps = array("f", bytes(4 * hours))
+        self.hour: Optional[int] = None  # newest hour with a bucket
+        self.last_time: Optional[float] = None
+
+    def add(self, epoch: float):
+        hours = len(self.counts)
+        hour = int(epoch // 3600)
+        if self.hour is None:
+            self.hour = hour
+        elif hour > self.hour:
+            for h in range(max(self.hour + 1, hour - hours + 1), hour + 1):
+                self.counts[h % hours] = 0
+                self.gaps[h % hours] = 0.0
+            self.hour = hour
+        elif hour <= self.hour - hours:
+            return  # older than the window
+        bucket = hour % hours
+        self.counts[bucket] = min(self.counts[bucket] + 1, _MAX_COUNT)
+        if self.last_time is None or epoch >= self.last_time:
+            if self.last_time is not None:
+                self.gaps[bucket] = max(self.gaps[bucket], epoch - self.last_time)
+            self.last_time = epoch
+
+    def stats(self, now: float, since: float, interval: Optional[float],
+              stale_after: float) -> Dict[str, Any]:
+        hours = len(self.counts)
+        now_hour = int(now // 3600)
+        first_hour = max(int(since // 3600), now_hour - hours + 1)
+        received = active_hours = 0
+        longest_gap = 0.0
+        # Buckets still holding their hour: within the window and not yet reused
+        for h in range(max(first_hour, self.hour - hours + 1), min(now_hour, self.hour) + 1):
+            count = self.counts[h % hours]
+            received += count
+            active_hours += count > 0
+            longest_gap = max(longest_gap, float(self.gaps[h % hours]))
+        # The gap still open since the latest reading counts too.
+        seconds_since_last = max(now - self.last_time, 0.0)
+        longest_gap = max(longest_gap, min(seconds_since_last, now - since))
+
+        stats = {
+            "received": received,
+            "expected": None,
+            "coverage": None,
+            "continuity": round(100.0 * active_hours / (now_hour - first_hour + 1), 1),
+            "longest_gap_seconds": round(longest_gap, 1),
+            "seconds_since_last": round(seconds_since_last, 1),
+            "stale": seconds_since_last > stale_after,
+        }
+        if interval:
+            expected = max((now - since) / interval, 1.0)
+            stats["expected"] = round(expected, 1)
+            stats["coverage"] = round(100.0 * min(received / expected, 1.0), 1)
+        return stats
+
+
+class PatientCadence:
+    __slots__ = ("tracked_since", "metrics")
+
+    def __init__(self, tracked_since: float):
+        self.tracked_since = tracked_since
+        self.metrics: Dict[str, MetricCadence] = {}
+
+
+class CadenceStore:
+    """Per-patient cadence counters, least recently used patients evicted past `max_patients`."""
+
+    def __init__(self, window_hours: int, max_patients: int):
+        self.window_hours = window_hours
+        self.max_patients = max_patients
+        self._patients: "OrderedDict[int, PatientCadence]" = OrderedDict()
+
+    def __contains__(self, patient_id: int) -> bool:
+        return patient_id in self._patients
+
+    def _patient(self, patient_id: int, since: float) -> PatientCadence:
+        patient = self._patients.get(patient_id)
+        if patient is None:
+            patient = self._patients[patient_id] = PatientCadence(since)
+            if len(self._patients) > self.max_patients:
+                self._patients.popitem(last=False)
+        else:
+            self._patients.move_to_end(patient_id)
+            patient.tracked_since = min(patient.tracked_since, since)
+        return patient
+
+    def add_readings(self, patient_id: int, readings: Iterable[Tuple[str, object]],
+                     since: Optional[float] = None):
+        """
+        Counts (metric_type, timestamp) readings. `since` is when the
+        patient's readings started being counted, by default the first
+        reading's time.
+        """
+        patient = None
+        for metric_type, ts in readings:
+            epoch = to_epoch(ts)
+            if patient is None:
+                patient = self._patient(patient_id, since if since is not None else epoch)
+            cadence = patient.metrics.get(metric_type)
+            if cadence is None:
+                cadence = patient.metrics[metric_type] = MetricCadence(self.window_hours)
+            cadence.add(epoch)
+
+    def quality(self, patient_id: int, now: Optional[datetime] = None) -> Dict[str, Any]:
+        now_epoch = to_epoch(now or datetime.now(timezone.utc))
+        window_start = now_epoch - self.window_hours * 3600
+        patient = self._patients.get(patient_id)
+        metrics = {}
+        if patient is not None:
+            since = min(max(patient.tracked_since, window_start), now_epoch)
+            for metric_type, cadence in sorted(patient.metrics.items()):
+                interval = settings.DATA_QUALITY_EXPECTED_INTERVAL_SECONDS.get(metric_type)
+                stale_after = (interval * settings.DATA_QUALITY_STALE_INTERVALS if interval
+                               else settings.FEATURE_STALE_SECONDS)
+                metrics[metric_type] = cadence.stats(now_epoch, since, interval, stale_after)
+        return summarize(metrics, self.window_hours)
+
+    async def warm(self, db, patient_id: int, now: Optional[datetime] = None):
+        """Counts the last window of a patient's history unless their readings are already streaming in."""
+        if patient_id in self._patients:
+            return
+        now = now or datetime.now(timezone.utc)
+        start = now - timedelta(hours=self.window_hours)
+        limit = settings.DATA_QUALITY_WARM_MAX_ROWS
+        rows = await metric_history(db, patient_id, start=start, limit=limit)
+        if patient_id in self._patients:
+            return
+        # Cut short by the limit, only the span loaded is known.
+        since = to_epoch(rows[-1].timestamp) if len(rows) == limit else start.timestamp()
+        self.add_readings(patient_id, [(r.metric_type, r.timestamp) for r in reversed(rows)],
+                          since=since)
+        if patient_id not in self._patients:
+            # Nothing in the window: tracked from now on, so silence counts against coverage.
+            self._patient(patient_id, since)
+
+    def clear(self):
+        self._patients.clear()
+
+
+def summarize(metrics: Dict[str, Dict[str, Any]], window_hours: int) -> Dict[str, Any]:
+    """A patient's data_quality block from their per-metric stats."""
+    expected = [m for m in metrics.values() if m["coverage"] is not None]
+    stale = [name for name, m in metrics.items() if m["stale"]]
+
+    def mean(values):
+        values = list(values)
+        return round(sum(values) / len(values), 1) if values else 0.0
+
+    return {
+        "monitoring_coverage": mean(m["coverage"] for m in expected),
+        "continuity": mean(m["continuity"] for m in metrics.values()),
+        "fresh_inputs": mean(0.0 if m["stale"] else 100.0 for m in metrics.values()),
+        "longest_gap_seconds": max((m["longest_gap_seconds"] for m in metrics.values()),
+                                   default=None),
+        "stale_metrics": stale,
+        "window_hours": window_hours,
+        "metrics": metrics,
+    }
+
+
+def quality_version(quality: Dict[str, Any]) -> str:
+    """
+    A coarse fingerprint of a data_quality block, for ETags on responses
+    that carry it: per metric, whether it is stale, its count, coverage and
+    continuity to 10% and its gaps to the hour. Between readings the block
+    drifts every second, so only a change of bucket counts as a new version.
+    """
+    def bucket(value, size):
+        return "" if value is None else str(int(value // size))
+
+    parts = [
+        ":".join((name, "s" if m["stale"] else "", str(m["received"]),
+                  bucket(m["coverage"], 10), bucket(m["continuity"], 10),
+                  bucket(m["longest_gap_seconds"], 3600),
+                  bucket(m["seconds_since_last"], 3600)))
+        for name, m in sorted(quality["metrics"].items())
+    ]
+    return f"{zlib.crc32(';'.join(parts).encode()):08x}"
+
+
+cadence_store = CadenceStore(settings.DATA_QUALITY_WINDOW_HOURS,
+                             settings.DATA_QUALITY_MAX_PATIENTS)
+
+
+def _on_ingested(event):
+    cadence_store.add_readings(event.data["patient_id"], [
+        (r["metric_type"], r["timestamp"]) for r in event.data["readings"]])
+
+
+event_bus.subscribe(METRIC_INGESTED, _on_ingested)
+
+
+async def patient_data_quality(db, patient_id: int) -> Dict[str, Any]:
+    await cadence_store.warm(db, patient_id)
+    return cadence_store.quality(patient_id)
@@ -0,0 +1,298 @@
+"""
+Device ingestion over a WebSocket (/patients/metrics/ingest).
+
+A device authenticates once when the socket opens and then streams frames.
+Every frame carries the sequence number of its first reading; the readings
+in it take consecutive numbers. The server buffers readings, writes them
+in batches and acks cumulatively with the highest sequence number it has
+committed. Each connection starts with a greeting holding the last ack for
+that device, so after a reconnect the device resends only what follows it;
+readings at or below the ack are skipped if they arrive again.
+
+Frame encodings, chosen with ?encoding= when connecting:
+
+    json     {"seq": 41, "r": [["heart_rate", 72.0], ["spo2", 98.0, 1700000000.5]]}
+    msgpack  the same object, msgpack-encoded in a binary frame
+    binary   struct "<QH" (first seq, count) followed by `count` "<Bd"
+             pairs of (index into METRIC_CODES, value)
+
+In json and msgpack a reading may add the device's own time of measurement
+as Unix seconds; readings without one, and all binary readings, are
+stamped when they are stored.
+
+Acks and the greeting use the connection's encoding: {"ack": 41} for json
+and msgpack, struct "<Q" for binary.
+
+Acks are kept per process, so with several workers a device that lands on
+another worker after reconnecting gets a greeting of 0 and resends its
+unacked readings.
+"""
+import asyncio
+import json
+import logging
+import math
+import struct
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from app.core.config import settings
+from app.core.telemetry import WEBSOCKETS
+from app.db import session as db_session
+from app.models.metric_type import BUILTIN_METRIC_TYPES, MAX_METRIC_TYPE_LENGTH, metric_types
+from app.services.ingestion import Reading as IngestReading, store_values
+from app.services.rate_limit import admit
+
+logger = logging.getLogger(__name__)
+
+ENCODINGS = ("json", "msgpack", "binary")
+
+# Stable wire codes for the binary encoding, in the order of the (append-only)
+# built-in metric types.
+METRIC_CODES = BUILTIN_METRIC_TYPES
+
+_HEADER = struct.Struct("<QH")
+_READING = struct.Struct("<Bd")
+_ACK = struct.Struct("<Q")
+
+Reading = Tuple  # (metric_type, value[, unix_seconds])
+
+
+class FrameError(ValueError):
+    pass
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError as e:
+        raise FrameError("msgpack encoding needs the msgpack package") from e
+    return msgpack
+
+
+def _check_readings(raw) -> List[Reading]:
+    if not isinstance(raw, list):
+        raise FrameError("'r' must be a list of [metric_type, value] pairs")
+    readings = []
+    for item in raw:
+        try:
+            metric_type, value, *ts = item
+            value = float(value)
+            ts = [float(t) for t in ts]
+        except (TypeError, ValueError):
+            raise FrameError(f"Bad reading {item!r}") from None
+        if not isinstance(metric_type, str) or not 0 < len(metric_type) <= MAX_METRIC_TYPE_LENGTH:
+            raise FrameError(f"Bad metric type {metric_type!r}")
+        if metric_type not in metric_types:
+            raise FrameError(f"Unknown metric type {metric_type!r}")
+        if not math.isfinite(value):
+            raise FrameError(f"Non-finite value for {metric_type}")
+        if len(ts) > 1 or (ts and not 0 <= ts[0] < 1e11):
+            raise FrameError(f"Bad timestamp in {item!r}")
+        readings.append((metric_type, value, *ts))
+    return readings
+
+
+def decode_frame(encoding: str, data) -> Tuple[int, List[Reading]]:
+    """Returns (first sequence number, readings) for one frame."""
+    if encoding == "binary":
+        if not isinstance(data, (bytes, bytearray)) or len(data) < _HEADER.size:
+            raise FrameError("Binary frame too short")
+        seq, count = _HEADER.unpack_from(data)
+        if seq < 1:
+            raise FrameError("Frame needs a positive sequence number")
+        if len(data) != _HEADER.size + count * _READING.size:
+            raise FrameError("Binary frame length does not match its count")
+        readings = []
+        for code, value in _READING.iter_unpack(memoryview(data)[_HEADER.size:]):
+            if code >= len(METRIC_CODES):
+                raise FrameError(f"Unknown metric code {code}")
+            if not math.isfinite(value):
+                raise FrameError("Non-finite value")
+            readings.append((METRIC_CODES[code], value))
+        return seq, readings
+
+    try:
+        if encoding == "msgpack":
+            frame = _msgpack().unpackb(data)
+        else:
+            frame = json.loads(data)
+    except FrameError:
+        raise
+    except Exception as e:
+        raise FrameError(f"Undecodable {encoding} frame") from e
+    if not isinstance(frame, dict) or not isinstance(frame.get("seq"), int) or frame["seq"] < 1:
+        raise FrameError("Frame needs a positive integer 'seq'")
+    return frame["seq"], _check_readings(frame.get("r"))
+
+
+def encode_frame(encoding: str, seq: int, readings: List[Reading]):
+    """Client-side counterpart of decode_frame (used by simulate_device.py and tests)."""
+    if encoding == "binary":
+        return _HEADER.pack(seq, len(readings)) + b"".join(
+            _READING.pack(METRIC_CODES.index(r[0]), r[1]) for r in readings)
+    frame = {"seq": seq, "r": [list(r) for r in readings]}
+    if encoding == "msgpack":
+        return _msgpack().packb(frame)
+    return json.dumps(frame, separators=(",", ":"))
+
+
+def encode_ack(encoding: str, seq: int):
+    if encoding == "binary":
+        return _ACK.pack(seq)
+    if encoding == "msgpack":
+        return _msgpack().packb({"ack": seq})
+    return json.dumps({"ack": seq})
+
+
+def decode_ack(encoding: str, data) -> int:
+    if encoding == "binary":
+        return _ACK.unpack(data)[0]
+    if encoding == "msgpack":
+        return _msgpack().unpackb(data)["ack"]
+    return json.loads(data)["ack"]
+
+
+def _device_time(unix_seconds: float) -> datetime:
+    return datetime.fromtimestamp(unix_seconds, tz=timezone.utc)
+
+
+# Last committed sequence number per (patient_id, device), least recently
+# used first. Bounded so abandoned device ids don't accumulate forever.
+_acks: "OrderedDict[Tuple[int, str], int]" = OrderedDict()
+MAX_TRACKED_DEVICES = 100_000
+
+
+def last_ack(patient_id: int, device: str) -> int:
+    key = (patient_id, device)
+    if key in _acks:
+        _acks.move_to_end(key)
+    return _acks.get(key, 0)
+
+
+def record_ack(patient_id: int, device: str, seq: int):
+    key = (patient_id, device)
+    _acks[key] = seq
+    _acks.move_to_end(key)
+    while len(_acks) > MAX_TRACKED_DEVICES:
+        _acks.popitem(last=False)
+
+
+class IngestStream:
+    """State of one open device socket."""
+
+    def __init__(self, websocket: WebSocket, patient_id: int, device: str, encoding: str):
+        self.websocket = websocket
+        self.patient_id = patient_id
+        self.device = device
+        self.encoding = encoding
+        self.acked = last_ack(patient_id, device)
+        self.received = self.acked
+        # With no ack on record (a new device, or one whose ack this process
+        # never saw) the first frame sets where the sequence resumes.
+        self.synced = self.acked > 0
+        self.buffer: List[IngestReading] = []
+        self.flush_at: Optional[float] = None
+
+    async def _send(self, message):
+        if isinstance(message, str):
+            await self.websocket.send_text(message)
+        else:
+            await self.websocket.send_bytes(message)
+
+    def accept(self, seq: int, readings: List[Reading]) -> int:
+        """
+        Buffers the readings numbered after what was already received; returns
+        how many. A frame starting past the next expected number is dropped
+        whole: acking past the gap would tell the device to forget readings
+        that never arrived.
+        """
+        if not self.synced:
+            self.received, self.synced = seq - 1, True
+        if seq > self.received + 1:
+            return 0
+        skip = max(0, self.received + 1 - seq)
+        fresh = readings[skip:]
+        if fresh:
+            # Sequence numbers double as idempotency keys, so a resend after
+            # a restart (when the ack state above is gone) isn't stored twice.
+            first = seq + skip
+            self.buffer.extend(
+                IngestReading(r[0], r[1], f"{self.device}#{first + i}",
+                              _device_time(r[2]) if len(r) > 2 else None)
+                for i, r in enumerate(fresh))
+            self.received = seq + len(readings) - 1
+            if self.flush_at is None:
+                self.flush_at = (asyncio.get_running_loop().time()
+                                 + settings.INGEST_WS_FLUSH_MS / 1000)
+        return len(fresh)
+
+    async def flush(self, send_ack: bool = True):
+        if self.buffer:
+            # Readings over the device's limit are acked but not stored; the
+            # device shouldn't resend them.
+            admitted, _ = admit(self.patient_id, self.device, self.buffer, "websocket")
+            if admitted:
+                async with db_session.SessionLocal() as db:
+                    await store_values(db, self.patient_id, admitted, source="websocket")
+                    await db.commit()
+            self.buffer = []
+            self.acked = self.received
+            record_ack(self.patient_id, self.device, self.acked)
+        self.flush_at = None
+        if send_ack:
+            await self._send(encode_ack(self.encoding, self.acked))
+
+    async def _receive(self):
+        if self.flush_at is None:
+            return await self.websocket.receive()
+        timeout = self.flush_at - asyncio.get_running_loop().time()
+        if timeout <= 0:
+            return None
+        try:
+            return await asyncio.wait_for(self.websocket.receive(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def run(self):
+        connections = WEBSOCKETS.labels("ingest")
+        connections.inc()
+        try:
+            await self._run()
+        finally:
+            connections.dec()
+
+    async def _run(self):
+        await self._send(encode_ack(self.encoding, self.acked))
+        try:
+            while True:
+                message = await self._receive()
+                if message is None:
+                    await self.flush()
+                    continue
+                if message["type"] == "websocket.disconnect":
+                    break
+                data = message.get("bytes") if self.encoding != "json" else message.get("text")
+                if data is None:
+                    raise FrameError(f"Expected {self.encoding} frames")
+                seq, readings = decode_frame(self.encoding, data)
+                if len(readings) > settings.INGEST_WS_MAX_FRAME_READINGS:
+                    raise FrameError(
+                        f"At most {settings.INGEST_WS_MAX_FRAME_READINGS} readings per frame")
+                gap = self.synced and seq > self.received + 1
+                self.accept(seq, readings)
+                if gap:
+                    # Ack the last contiguous number so the device resends from there.
+                    await self.flush()
+                elif len(self.buffer) >= settings.INGEST_WS_BATCH_SIZE:
+                    await self.flush()
+        except FrameError as e:
+            await self.flush()
+            await self.websocket.close(code=1007, reason=str(e)[:120])
+            return
+        except WebSocketDisconnect:
+            pass
+        # The device is gone; commit what it sent so its next greeting covers it.
+        await self.flush(send_ack=False)
@@ -0,0 +1,382 @@
+"""
+Event bus connecting the API processes.
+
+Caches and live streams need to hear about writes made by other uvicorn
+workers. Everything that changes shared state publishes an event here;
+subscribers get events from their own process synchronously, and from other
+processes through the configured backend:
+
+    memory  single process only (the default)
+    unix    worker processes on one host; the first worker to take the lock
+            file hosts a small hub on a Unix socket and relays frames
+            between the others
+    redis   any number of hosts, via PUBLISH/SUBSCRIBE on a Redis-protocol
+            server (spoken directly, no client library needed)
+
+Delivery across processes is best effort. When a backend (re)connects it
+runs the `on_reconnect` hooks, so caches can drop anything they might have
+missed an invalidation for while disconnected.
+"""
+import asyncio
+import json
+import logging
+import os
+import struct
+import uuid
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+from sqlalchemy import event as orm_event
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+METRIC_INGESTED = "metric-ingested"    # {"patient_id", "readings": [...]}
+METRICS_PURGED = "metrics-purged"      # {"rows": n}
+PROFILE_UPDATED = "profile-updated"    # {"kind": "patient" | "doctor", "id"}
+ALERT_RAISED = "alert-raised"          # {"patient_id", ...}
+REFERENCE_UPDATED = "reference-updated"  # {"table": "hospitals"}
+APPOINTMENT_CHANGED = "appointment-changed"  # {"doctor_id"}
+
+
+@dataclass
+class Event:
+    topic: str
+    data: dict
+    origin: str
+
+    def encode(self) -> bytes:
+        return json.dumps({"t": self.topic, "d": self.data, "o": self.origin},
+                          separators=(",", ":"), default=str).encode()
+
+    @classmethod
+    def decode(cls, raw: bytes) -> "Event":
+        obj = json.loads(raw)
+        return cls(obj["t"], obj["d"], obj["o"])
+
+
+Handler = Callable[[Event], None]
+
+
+class EventBus:
+    """In-process bus; the base for the cross-process backends."""
+
+    def __init__(self):
+        self.origin = uuid.uuid4().hex
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._reconnect_hooks: List[Callable[[], None]] = []
+
+    def subscribe(self, topic: str, handler: Handler) -> Callable[[], None]:
+        """Handlers must be quick and non-blocking; returns an unsubscribe function."""
+        handlers = self._handlers.setdefault(topic, [])
+        handlers.append(handler)
+
+        def unsubscribe():
+            if handler in handlers:
+                handlers.remove(handler)
+        return unsubscribe
+
+    def on_reconnect(self, hook: Callable[[], None]):
+        self._reconnect_hooks.append(hook)
+
+    def publish(self, topic: str, data: dict):
+        event = Event(topic, data, self.origin)
+        self._deliver(event)
+        self._transmit(event)
+
+    def _deliver(self, event: Event):
+        for handler in list(self._handlers.get(event.topic, ())):
+            try:
+                handler(event)
+            except Exception:
+                logger.exception("Event handler for %s failed", event.topic)
+
+    def _reconnected(self):
+        for hook in self._reconnect_hooks:
+            try:
+                hook()
+            except Exception:
+                logger.exception("Event bus reconnect hook failed")
+
+    def _transmit(self, event: Event):
+        pass
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class _ForwardingBus(EventBus):
+    """Shared outbox and reconnect loop of the cross-process backends."""
+
+    RECONNECT_DELAY = 0.5
+
+    def __init__(self):
+        super().__init__()
+        self._outbox: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.connected = asyncio.Event()
+
+    def _transmit(self, event: Event):
+        if self._outbox is not None and self.connected.is_set():
+            self._outbox.put_nowait(event.encode())
+
+    def _remote(self, raw: bytes):
+        event = Event.decode(raw)
+        if event.origin != self.origin:
+            self._deliver(event)
+
+    async def start(self):
+        self._outbox = asyncio.Queue()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.connected.clear()
+
+    async def _loop(self):
+        while True:
+            try:
+                await self._session()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Event bus connection lost: %s", e)
+            self.connected.clear()
+            await asyncio.sleep(self.RECONNECT_DELAY)
+
+    async def _session(self):
+        raise NotImplementedError
+
+    def _connected(self):
+        # Drop anything queued for a connection that no longer exists.
+        while not self._outbox.empty():
+            self._outbox.get_nowait()
+        self.connected.set()
+        self._reconnected()
+
+
+# ---------------------------------------------------------------------------
+# Unix socket hub
+# ---------------------------------------------------------------------------
+
+_LENGTH = struct.Struct(">I")
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> bytes:
+    (size,) = _LENGTH.unpack(await reader.readexactly(_LENGTH.size))
+    return await reader.readexactly(size)
+
+
+def _frame(raw: bytes) -> bytes:
+    return _LENGTH.pack(len(raw)) + raw
+
+
+class UnixSocketBus(_ForwardingBus):
+    """
+    Same-host fan-out. Whichever process holds `<path>.lock` serves the
+    socket and relays every frame to the other connections; the rest are
+    clients. If the hub process exits, a client takes the lock over.
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._lock_fd: Optional[int] = None
+        self._peers: List[asyncio.StreamWriter] = []
+
+    async def stop(self):
+        await super().stop()
+        self._release_hub()
+
+    async def _session(self):
+        try:
+            reader, writer = await asyncio.open_unix_connection(self.path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            if self._take_hub_lock():
+                await self._serve()
+            return
+        await self._client(reader, writer)
+
+    def _take_hub_lock(self) -> bool:
+        import fcntl
+
+        fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    def _release_hub(self):
+        if self._lock_fd is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    async def _client(self, reader, writer):
+        self._connected()
+        sender = asyncio.create_task(self._send_outbox(writer))
+        try:
+            while True:
+                self._remote(await _read_frame(reader))
+        except asyncio.IncompleteReadError:
+            pass
+        finally:
+            sender.cancel()
+            writer.close()
+
+    async def _send_outbox(self, writer):
+        while True:
+            writer.write(_frame(await self._outbox.get()))
+            await writer.drain()
+
+    async def _serve(self):
+        # Only the lock holder may replace a stale socket file.
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        server = await asyncio.start_unix_server(self._handle_peer, path=self.path)
+        logger.info("Event bus hub listening on %s", self.path)
+        self._connected()
+        try:
+            async with server:
+                while True:
+                    raw = _frame(await self._outbox.get())
+                    self._broadcast(raw, exclude=None)
+        finally:
+            for peer in self._peers:
+                peer.close()
+            self._peers.clear()
+            self._release_hub()
+
+    def _broadcast(self, framed: bytes, exclude):
+        for peer in list(self._peers):
+            if peer is not exclude:
+                peer.write(framed)
+
+    async def _handle_peer(self, reader, writer):
+        self._peers.append(writer)
+        try:
+            while True:
+                raw = await _read_frame(reader)
+                self._broadcast(_frame(raw), exclude=writer)
+                self._remote(raw)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if writer in self._peers:
+                self._peers.remove(writer)
+            writer.close()
+
+
+# ---------------------------------------------------------------------------
+# Redis protocol
+# ---------------------------------------------------------------------------
+
+def encode_command(*args) -> bytes:
+    out = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(out)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    """Reads one RESP2 reply; errors come back as RuntimeError."""
+    line = (await reader.readuntil(b"\r\n"))[:-2]
+    kind, rest = line[:1], line[1:]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        raise RuntimeError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        size = int(rest)
+        if size < 0:
+            return None
+        return (await reader.readexactly(size + 2))[:-2]
+    if kind == b"*":
+        size = int(rest)
+        return None if size < 0 else [await read_reply(reader) for _ in range(size)]
+    raise RuntimeError(f"Unexpected RESP reply {line[:20]!r}")
+
+
+class RedisBus(_ForwardingBus):
+    """PUBLISH/SUBSCRIBE on one channel; one connection for each direction."""
+
+    def __init__(self, url: str, channel: str):
+        super().__init__()
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.channel = channel
+
+    async def _open(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            writer.write(encode_command("AUTH", self.password))
+            await read_reply(reader)
+        return reader, writer
+
+    async def _session(self):
+        sub_reader, sub_writer = await self._open()
+        pub_reader, pub_writer = await self._open()
+        try:
+            sub_writer.write(encode_command("SUBSCRIBE", self.channel))
+            await read_reply(sub_reader)  # subscribe confirmation
+            self._connected()
+            sender = asyncio.create_task(self._publish_outbox(pub_reader, pub_writer))
+            try:
+                while True:
+                    reply = await read_reply(sub_reader)
+                    if isinstance(reply, list) and reply and reply[0] == b"message":
+                        self._remote(reply[2])
+            finally:
+                sender.cancel()
+        finally:
+            sub_writer.close()
+            pub_writer.close()
+
+    async def _publish_outbox(self, reader, writer):
+        while True:
+            writer.write(encode_command("PUBLISH", self.channel, await self._outbox.get()))
+            await writer.drain()
+            await read_reply(reader)
+
+
+def create_bus(backend: str) -> EventBus:
+    if backend == "unix":
+        return UnixSocketBus(settings.EVENT_BUS_SOCKET)
+    if backend == "redis":
+        return RedisBus(settings.EVENT_BUS_REDIS_URL, settings.EVENT_BUS_CHANNEL)
+    if backend != "memory":
+        raise ValueError(f"Unknown EVENT_BUS_BACKEND {backend!r}")
+    return EventBus()
+
+
+event_bus = create_bus(settings.EVENT_BUS_BACKEND)
+
+
+def publish_on_commit(db, topic: str, data: dict):
+    """
+    Publishes once `db` commits. Publishing earlier would let a concurrent
+    reader pair a fresh cache tag with data that isn't visible yet.
+    """
+    orm_event.listen(db.sync_session, "after_commit",
+                     lambda session: event_bus.publish(topic, data), once=True)
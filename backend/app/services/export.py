@@ -0,0 +1,287 @@
+import csv
+import gzip
+import io
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+
+from app.db import session as db_session
+from app.db.partitioning import metric_tables, metrics_from
+from app.db.utils import as_utc
+from app.models.health_metrics import HealthMetric
+from app.models.patient import Patient
+
+EXPORT_COLUMNS = ("id", "patient_id", "metric_type", "value", "timestamp")
+EXPORT_FORMATS = ("csv", "ndjson", "parquet")
+DEFAULT_CHUNK_SIZE = 5000
+MAX_CHUNK_SIZE = 50000
+
+# csv/ndjson are gzip-compressed as a sequence of gzip members; parquet
+# compresses its column chunks internally.
+STREAM_COMPRESSIONS = ("none", "gzip")
+PARQUET_COMPRESSIONS = ("none", "snappy", "gzip", "zstd")
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class ExportError(ValueError):
+    """Raised for an invalid export request (bad format, scope or options)."""
+
+
+@dataclass(frozen=True)
+class ExportScope:
+    """Which patients an export covers. Exactly one field is set."""
+    patient_id: Optional[int] = None
+    doctor_id: Optional[int] = None
+    hospital_id: Optional[int] = None
+
+    def __post_init__(self):
+        given = [v for v in (self.patient_id, self.doctor_id, self.hospital_id)
+                 if v is not None]
+        if len(given) != 1:
+            raise ExportError(
+                "Exactly one of patient, doctor or hospital must be given")
+
+    @property
+    def label(self) -> str:
+        if self.patient_id is not None:
+            return f"patient-{self.patient_id}"
+        if self.doctor_id is not None:
+            return f"doctor-{self.doctor_id}"
+        return f"hospital-{self.hospital_id}"
+
+
+def build_export_query(
+    scope: ExportScope,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    after_id: Optional[int] = None,
+    tables: Optional[Sequence] = None,
+):
+    """
+    Keyset-ordered SELECT over health_metrics for a scope and time range.
+    Rows come back in id order so `after_id` can resume an interrupted export.
+    `tables` are the partition tables to read (see app.db.partitioning).
+    """
+    if scope.patient_id is not None:
+        def scope_filter(t):
+            return [t.c.patient_id == scope.patient_id]
+    elif scope.doctor_id is not None:
+        def scope_filter(t):
+            return [t.c.patient_id.in_(
+                select(Patient.id).where(Patient.doctor_id == scope.doctor_id))]
+    else:
+        def scope_filter(t):
+            return [t.c.patient_id.in_(
+                select(Patient.id).where(Patient.hospital_id == scope.hospital_id))]
+
+    def criteria(t):
+        found = scope_filter(t)
+        if after_id is not None:
+            found.append(t.c.id > after_id)
+        return found
+
+    src = metrics_from(tables or [HealthMetric.__table__], as_utc(start), as_utc(end),
+                       where=criteria)
+    return select(src).order_by(src.c.id)
+
+
+async def iter_metric_chunks(conn, query, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Reads `query` through a server-side cursor, yielding lists of at most
+    `chunk_size` rows so memory stays bounded regardless of result size.
+    """
+    result = await conn.stream(query.execution_options(yield_per=chunk_size))
+    async for partition in result.partitions(chunk_size):
+        yield partition
+
+
+def _iso(ts: Optional[datetime]) -> Optional[str]:
+    ts = as_utc(ts)
+    return ts.isoformat() if ts is not None else None
+
+
+class CsvEncoder:
+    def header(self) -> bytes:
+        return (",".join(EXPORT_COLUMNS) + "\n").encode()
+
+    def encode(self, rows: Sequence) -> bytes:
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator="\n")
+        for r in rows:
+            writer.writerow((r.id, r.patient_id, r.metric_type, r.value,
+                             _iso(r.timestamp)))
+        return buf.getvalue().encode()
+
+    def footer(self) -> bytes:
+        return b""
+
+
+class NdjsonEncoder:
+    def header(self) -> bytes:
+        return b""
+
+    def encode(self, rows: Sequence) -> bytes:
+        return "".join(
+            json.dumps({
+                "id": r.id,
+                "patient_id": r.patient_id,
+                "metric_type": r.metric_type,
+                "value": r.value,
+                "timestamp": _iso(r.timestamp),
+            }, separators=(",", ":")) + "\n"
+            for r in rows
+        ).encode()
+
+    def footer(self) -> bytes:
+        return b""
+
+
+class _DrainableSink(io.RawIOBase):
+    """File-like sink handed to the Parquet writer; bytes are drained per row group."""
+
+    def __init__(self):
+        self._buf = bytearray()
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buf += data
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> bytes:
+        data = bytes(self._buf)
+        self._buf.clear()
+        return data
+
+
+class ParquetEncoder:
+    """Writes one Parquet row group per chunk; only the current chunk is held in memory."""
+
+    def __init__(self, compression: str = "snappy"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._schema = pa.schema([
+            ("id", pa.int64()),
+            ("patient_id", pa.int64()),
+            ("metric_type", pa.string()),
+            ("value", pa.float64()),
+            ("timestamp", pa.timestamp("us", tz="UTC")),
+        ])
+        self._sink = _DrainableSink()
+        self._writer = pq.ParquetWriter(
+            self._sink, self._schema,
+            compression=None if compression == "none" else compression)
+
+    def header(self) -> bytes:
+        return self._sink.drain()
+
+    def encode(self, rows: Sequence) -> bytes:
+        table = self._pa.Table.from_pydict({
+            "id": [r.id for r in rows],
+            "patient_id": [r.patient_id for r in rows],
+            "metric_type": [r.metric_type for r in rows],
+            "value": [r.value for r in rows],
+            "timestamp": [as_utc(r.timestamp) for r in rows],
+        }, schema=self._schema)
+        self._writer.write_table(table)
+        return self._sink.drain()
+
+    def footer(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+def make_encoder(fmt: str, compression: str = "none"):
+    if fmt == "csv":
+        return CsvEncoder()
+    if fmt == "ndjson":
+        return NdjsonEncoder()
+    if fmt == "parquet":
+        return ParquetEncoder(compression)
+    raise ExportError(f"Unsupported export format: {fmt}")
+
+
+def validate_options(fmt: str, compression: str, chunk_size: int):
+    if fmt not in EXPORT_FORMATS:
+        raise ExportError(
+            f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    allowed = PARQUET_COMPRESSIONS if fmt == "parquet" else STREAM_COMPRESSIONS
+    if compression not in allowed:
+        raise ExportError(
+            f"compression for {fmt} must be one of {', '.join(allowed)}")
+    if not 1 <= chunk_size <= MAX_CHUNK_SIZE:
+        raise ExportError(f"chunk_size must be between 1 and {MAX_CHUNK_SIZE}")
+
+
+def export_filename(scope: ExportScope, fmt: str, compression: str) -> str:
+    name = f"vitals-{scope.label}.{fmt}"
+    if fmt != "parquet" and compression == "gzip":
+        name += ".gz"
+    return name
+
+
+async def iter_export(
+    scope: ExportScope,
+    fmt: str = "csv",
+    compression: str = "none",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    after_id: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    include_header: bool = True,
+    engine=None,
+) -> AsyncIterator[Tuple[bytes, Optional[int]]]:
+    """
+    Yields `(data, last_id)` pieces of the encoded export, one per chunk of
+    rows; `last_id` is None for header/footer pieces. Rows are read through
+    `engine` (a replica, say), or the primary by default.
+
+    Gzip output is written as one gzip member per chunk (concatenated members
+    are a valid gzip file), so a consumer that stops mid-way can truncate to the
+    last complete chunk and resume with `after_id`.
+    """
+    validate_options(fmt, compression, chunk_size)
+    encoder = make_encoder(fmt, compression)
+    gzip_stream = fmt != "parquet" and compression == "gzip"
+
+    def _out(data: bytes) -> bytes:
+        if gzip_stream and data:
+            return gzip.compress(data, compresslevel=6)
+        return data
+
+    head = encoder.header()
+    if head and (include_header or fmt == "parquet"):
+        yield _out(head), None
+
+    async with (engine or db_session.engine).connect() as conn:
+        tables = await metric_tables(conn, start, end)
+        query = build_export_query(scope, start, end, after_id, tables)
+        async for rows in iter_metric_chunks(conn, query, chunk_size):
+            yield _out(encoder.encode(rows)), rows[-1].id
+
+    tail = encoder.footer()
+    if tail:
+        yield _out(tail), None
+
+
+async def stream_export(scope: ExportScope, **options) -> AsyncIterator[bytes]:
+    """Byte stream of `iter_export`, suitable for a StreamingResponse body."""
+    async for data, _ in iter_export(scope, **options):
+        if data:
+            yield data
@@ -0,0 +1,229 @@
+"""
+Windowed trend features for risk scoring.
+
+Each (patient, metric type) keeps a fixed-size NumPy ring buffer of its
+recent readings together with running sums, so adding a reading costs O(1)
+however large the window is: the rolling mean, variance and least-squares
+slope are read straight off the sums. For heart rate the buffer also keeps
+squared successive differences of the RR intervals (60000 / bpm) between
+samples no more than HRV_MAX_GAP_SECONDS apart, which gives RMSSD, a real
+HRV measure, once enough closely spaced samples have arrived.
+
+Windows are fed from the event bus, so readings ingested by any worker
+reach every worker's store; a patient that has not streamed since this
+process started is warmed from storage on first use. Late readings are
+pushed as they come (the sums don't depend on order) unless they are older
+than the window's newest by more than FEATURE_STALE_SECONDS.
+"""
+import math
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+from app.core.config import settings
+from app.db.utils import to_epoch
+from app.services.events import METRIC_INGESTED, event_bus
+from app.services.vitals import metric_history
+
+HRV_MAX_GAP_SECONDS = 5.0
+HRV_MIN_INTERVALS = 8
+# Fewer readings than this give no slope or variability
+MIN_TREND_READINGS = 3
+
+
+class MetricWindow:
+    """
+    Last `size` readings of one metric with O(1) rolling statistics; with
+    `rr` (heart rate) also the squared successive RR-interval differences.
+    """
+
+    __slots__ = ("size", "times", "values", "head", "count", "origin", "pushes",
+                 "s_t", "s_v", "s_tt", "s_tv", "s_vv", "last_time", "last_value",
+                 "rr_sq", "rr_head", "rr_count", "rr_sum", "last_rr")
+
+    def __init__(self, size: int, rr: bool = False):
+        # numpy is only imported once a reading arrives, not at API startup.
+        import numpy as np
+
+        self.size = size
+        # Times are hours since `origin`, which is moved up now and then to
+        # keep the sums well conditioned.
+        self.times = np.zeros(size)
+        self.values = np.zeros(size)
+        self.head = 0
+        self.count = 0
+        self.origin: Optional[float] = None
+        self.pushes = 0
+        self.s_t = self.s_v = self.s_tt = self.s_tv = self.s_vv = 0.0
+        self.last_time: Optional[float] = None
+        self.last_value: Optional[float] = None
+        # Only heart rate windows carry the RR buffer.
+        self.rr_sq = np.zeros(size) if rr else None
+        self.rr_head = 0
+        self.rr_count = 0
+        self.rr_sum = 0.0
+        self.last_rr: Optional[float] = None
+
+    def push(self, epoch: float, value: float):
+        if self.origin is None:
+            self.origin = epoch
+        t = (epoch - self.origin) / 3600.0
+        if self.count == self.size:
+            old_t, old_v = self.times[self.head], self.values[self.head]
+            self.s_t -= old_t
+            self.s_v -= old_v
+            self.s_tt -= old_t * old_t
+            self.s_tv -= old_t * old_v
+            self.s_vv -= old_v * old_v
+        else:
+            self.count += 1
+        self.times[self.head] = t
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.size
+        self.s_t += t
+        self.s_v += value
+        self.s_tt += t * t
+        self.s_tv += t * value
+        self.s_vv += value * value
+
+        if self.rr_sq is not None and value > 0:
+            self._push_rr(epoch, 60000.0 / value)
+        if self.last_time is None or epoch >= self.last_time:
+            self.last_time, self.last_value = epoch, value
+
+        self.pushes += 1
+        if self.pushes % self.size == 0:
+            self._resum()
+
+    def _push_rr(self, epoch: float, rr_ms: float):
+        # Only successive samples close together say anything about beat-to-beat variation.
+        if self.last_rr is not None and self.last_time is not None \
+                and 0 < epoch - self.last_time <= HRV_MAX_GAP_SECONDS:
+            sq = (rr_ms - self.last_rr) ** 2
+            if self.rr_count == self.size:
+                self.rr_sum -= self.rr_sq[self.rr_head]
+            else:
+                self.rr_count += 1
+            self.rr_sq[self.rr_head] = sq
+            self.rr_sum += sq
+            self.rr_head = (self.rr_head + 1) % self.size
+        if self.last_time is None or epoch >= self.last_time:
+            self.last_rr = rr_ms
+
+    def _resum(self):
+        """Recomputes the sums from the buffer (O(size) once per `size` pushes)."""
+        n = self.count
+        times, values = self.times[:n], self.values[:n]
+        shift = float(times.min())
+        times -= shift
+        self.origin += shift * 3600.0
+        self.s_t = float(times.sum())
+        self.s_v = float(values.sum())
+        self.s_tt = float(times @ times)
+        self.s_tv = float(times @ values)
+        self.s_vv = float(values @ values)
+        if self.rr_sq is not None:
+            self.rr_sum = float(self.rr_sq[:self.rr_count].sum())
+
+    def snapshot(self, now: float) -> dict:
+        n = self.count
+        mean = self.s_v / n
+        features = {
+            "count": n,
+            "last": self.last_value,
+            "mean": round(mean, 2),
+            "std": None,
+            "slope_per_hour": None,
+            "seconds_since_last": round(max(now - self.last_time, 0.0), 1),
+        }
+        if n >= MIN_TREND_READINGS:
+            features["std"] = round(math.sqrt(max(self.s_vv / n - mean * mean, 0.0)), 2)
+            denominator = n * self.s_tt - self.s_t * self.s_t
+            # Readings (nearly) at one instant have no meaningful slope.
+            if denominator > 1e-12 * max(n * self.s_tt, 1e-12):
+                features["slope_per_hour"] = round(
+                    (n * self.s_tv - self.s_t * self.s_v) / denominator, 3)
+        if self.rr_count >= HRV_MIN_INTERVALS:
+            features["hrv_rmssd"] = round(math.sqrt(self.rr_sum / self.rr_count), 1)
+        return features
+
+
+class FeatureStore:
+    """Per-patient metric windows, least recently used patients evicted past `max_patients`."""
+
+    def __init__(self, window: int, max_patients: int):
+        self.window = window
+        self.max_patients = max_patients
+        self._patients: "OrderedDict[int, Dict[str, MetricWindow]]" = OrderedDict()
+
+    def __contains__(self, patient_id: int) -> bool:
+        return patient_id in self._patients
+
+    def _windows(self, patient_id: int) -> Dict[str, MetricWindow]:
+        windows = self._patients.get(patient_id)
+        if windows is None:
+            windows = self._patients[patient_id] = {}
+            if len(self._patients) > self.max_patients:
+                self._patients.popitem(last=False)
+        else:
+            self._patients.move_to_end(patient_id)
+        return windows
+
+    def add_readings(self, patient_id: int, readings: Iterable[Tuple[str, float, object]]):
+        """Adds (metric_type, value, timestamp) readings, oldest first."""
+        windows = self._windows(patient_id)
+        for metric_type, value, ts in readings:
+            if value is None:
+                continue
+            epoch = to_epoch(ts)
+            window = windows.get(metric_type)
+            if window is None:
+                window = windows[metric_type] = MetricWindow(
+                    self.window, rr=metric_type == "heart_rate")
+            elif epoch < window.last_time - settings.FEATURE_STALE_SECONDS:
+                # A backfilled reading from long ago says nothing about the
+                # current trend and would push recent readings out of the ring.
+                continue
+            window.push(epoch, float(value))
+
+    def features(self, patient_id: int, now: Optional[datetime] = None) -> Dict[str, dict]:
+        windows = self._patients.get(patient_id)
+        if not windows:
+            return {}
+        now_epoch = to_epoch(now or datetime.now(timezone.utc))
+        out = {}
+        for metric_type, window in windows.items():
+            snapshot = window.snapshot(now_epoch)
+            snapshot["stale"] = snapshot["seconds_since_last"] > settings.FEATURE_STALE_SECONDS
+            out[metric_type] = snapshot
+        return out
+
+    async def warm(self, db, patient_id: int):
+        """Loads a patient's recent history unless their readings are already streaming in."""
+        if patient_id in self._patients:
+            return
+        rows = await metric_history(db, patient_id, limit=self.window * 8)
+        if patient_id in self._patients:
+            # Live readings arrived while loading; don't interleave older ones after them.
+            return
+        self.add_readings(patient_id, [
+            (r.metric_type, r.value, r.timestamp) for r in reversed(rows)])
+
+    def clear(self):
+        self._patients.clear()
+
+
+feature_store = FeatureStore(settings.FEATURE_WINDOW_SIZE, settings.FEATURE_MAX_PATIENTS)
+
+
+def _on_ingested(event):
+    feature_store.add_readings(event.data["patient_id"], [
+        (r["metric_type"], r["value"], r["timestamp"]) for r in event.data["readings"]])
+
+
+event_bus.subscribe(METRIC_INGESTED, _on_ingested)
+
+
+async def patient_features(db, patient_id: int) -> Dict[str, dict]:
+    await feature_store.warm(db, patient_id)
+    return feature_store.features(patient_id)
@@ -0,0 +1,162 @@
+"""
+Duplicate suppression for retried readings.
+
+A reading may carry an idempotency key: the client's own
+`idempotency_key`, or its device sequence number as "<device>#<sequence>".
+Each key is stored at most once per patient:
+
+1. Every worker remembers the keys committed in about the last
+   IDEMPOTENCY_MEMORY_SECONDS, by any worker (they arrive with
+   METRIC_INGESTED), and drops repeats without touching the database.
+2. The remaining keys of a batch are inserted into ingestion_keys in one
+   INSERT ... ON CONFLICT DO NOTHING; the primary key turns away repeats
+   the memory missed, such as those from before a restart, and settles
+   races between concurrent retries.
+
+Rows in ingestion_keys expire after IDEMPOTENCY_WINDOW_SECONDS, after
+which a very late retry is stored again.
+"""
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import delete, select, update
+
+from app.core.config import settings
+from app.core.telemetry import INGEST_DUPLICATES
+from app.db import session as db_session
+from app.db.partitioning import metrics_source
+from app.db.utils import insert_for
+from app.models.ingestion_key import IngestionKey
+from app.services.events import METRIC_INGESTED, event_bus
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT; keeps Postgres well under its bind parameter limit
+_CLAIM_CHUNK = 1000
+
+
+class RecentKeys:
+    """
+    Keys seen in roughly the last `window` seconds, as hashes in two
+    generations: new keys go to the current one, and every window / 2 (or
+    when it holds max_keys / 2) it becomes the previous one and the old
+    previous one is forgotten. Membership is a set lookup in each.
+    """
+
+    def __init__(self, window: float, max_keys: int):
+        self.window = window
+        self.max_keys = max_keys
+        self._current: Set[int] = set()
+        self._previous: Set[int] = set()
+        self._rotated_at = time.monotonic()
+
+    def __contains__(self, item) -> bool:
+        h = hash(item)
+        return h in self._current or h in self._previous
+
+    def __len__(self) -> int:
+        return len(self._current) + len(self._previous)
+
+    def add(self, item):
+        now = time.monotonic()
+        if now - self._rotated_at >= self.window:
+            self._previous, self._current = set(), set()
+            self._rotated_at = now
+        elif now - self._rotated_at >= self.window / 2 or len(self._current) >= self.max_keys / 2:
+            self._previous, self._current = self._current, set()
+            self._rotated_at = now
+        self._current.add(hash(item))
+
+    def clear(self):
+        self._current.clear()
+        self._previous.clear()
+
+
+recent_keys = RecentKeys(settings.IDEMPOTENCY_MEMORY_SECONDS, settings.IDEMPOTENCY_MEMORY_MAX_KEYS)
+
+
+def _on_ingested(event):
+    keys = event.data.get("keys")
+    if keys:
+        patient_id = event.data["patient_id"]
+        for key in keys:
+            if key is not None:
+                recent_keys.add((patient_id, key))
+
+
+event_bus.subscribe(METRIC_INGESTED, _on_ingested)
+
+
+async def claim_keys(db, patient_id: int, keys: Iterable[str], now: datetime) -> Set[str]:
+    """Records the keys in this transaction; returns those not already recorded."""
+    keys = list(keys)
+    claimed: Set[str] = set()
+    for start in range(0, len(keys), _CLAIM_CHUNK):
+        rows = [{"patient_id": patient_id, "key": key, "created_at": now}
+                for key in keys[start:start + _CLAIM_CHUNK]]
+        result = await db.execute(
+            insert_for(db, IngestionKey).values(rows).on_conflict_do_nothing().returning(IngestionKey.key))
+        claimed.update(result.scalars())
+    return claimed
+
+
+async def drop_repeats(db, patient_id: int, readings: Sequence, source: str,
+                       now: datetime) -> List:
+    """
+    The readings (with a `key` attribute) whose keys are new, in order.
+    Unkeyed readings always pass; a key repeated within the batch keeps
+    its first reading.
+    """
+    fresh, keys = [], set()
+    in_memory = 0
+    for reading in readings:
+        key = reading.key
+        if key is None:
+            fresh.append(reading)
+        elif key in keys or (patient_id, key) in recent_keys:
+            in_memory += 1
+        else:
+            keys.add(key)
+            fresh.append(reading)
+    if in_memory:
+        INGEST_DUPLICATES.labels(source, "memory").inc(in_memory)
+    if not keys:
+        return fresh
+    claimed = await claim_keys(db, patient_id, keys, now)
+    if len(claimed) < len(keys):
+        INGEST_DUPLICATES.labels(source, "database").inc(len(keys) - len(claimed))
+        fresh = [r for r in fresh if r.key is None or r.key in claimed]
+    return fresh
+
+
+async def record_metric_ids(db, patient_id: int, pairs: Sequence[Tuple[str, int]]):
+    """Links claimed keys to the rows they stored, for answering retries."""
+    await db.execute(update(IngestionKey), [
+        {"patient_id": patient_id, "key": key, "metric_id": metric_id}
+        for key, metric_id in pairs])
+
+
+async def original_reading(db, patient_id: int, key: str):
+    """The stored row a key refers to, if it is still on record."""
+    result = await db.execute(
+        select(IngestionKey.metric_id)
+        .where(IngestionKey.patient_id == patient_id, IngestionKey.key == key))
+    metric_id = result.scalar()
+    if metric_id is None:
+        return None
+    metrics = await metrics_source(db)
+    result = await db.execute(select(metrics).where(metrics.c.id == metric_id))
+    return result.first()
+
+
+async def purge_ingestion_keys(now: Optional[datetime] = None) -> int:
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(
+        seconds=settings.IDEMPOTENCY_WINDOW_SECONDS)
+    async with db_session.SessionLocal() as db:
+        result = await db.execute(delete(IngestionKey).where(IngestionKey.created_at < cutoff))
+        await db.commit()
+    if result.rowcount:
+        logger.info("Purged %d expired ingestion keys", result.rowcount)
+    return result.rowcount
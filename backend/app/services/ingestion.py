@@ -0,0 +1,135 @@
+"""
+The write path shared by the REST endpoints and the device WebSocket.
+
+Readings are stored under the device's own timestamp when it has one.
+Device clocks drift and reset, so a timestamp up to
+INGEST_MAX_CLOCK_SKEW_SECONDS ahead of the server is pulled back to the
+time of receipt, and one further ahead or more than INGEST_MAX_BACKFILL_DAYS
+old is taken for a clock fault and replaced by it.
+
+Readings uploaded after a connectivity gap arrive late and out of order.
+They go to the raw partition for their own time, and one already past its
+metric type's retention is added to the hourly rollup it belongs to
+instead of being stored raw only to be expired on the next retention run.
+The incremental readers are fine with late arrivals: latest values are
+read by timestamp, and feature windows only move "last" forward.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.telemetry import INGEST_BATCH_SIZE, INGEST_TIMESTAMPS, INGESTED_READINGS
+from app.db.partitioning import insert_metric_rows
+from app.db.utils import as_utc
+from app.models.metric_type import UnknownMetricType, metric_types
+from app.schemas.health_metric import HealthMetricCreate
+from app.services.anomaly import raise_alerts
+from app.services.events import METRIC_INGESTED, publish_on_commit
+from app.services.idempotency import drop_repeats, record_metric_ids
+from app.services.retention import add_to_rollups, retention_days
+
+
+class Reading(NamedTuple):
+    metric_type: str
+    value: float
+    key: Optional[str] = None  # idempotency key, see app.services.idempotency
+    timestamp: Optional[datetime] = None  # device time; naive means UTC
+
+
+class IngestResult(NamedTuple):
+    stored: List  # raw rows, with ids and timestamps, in input order
+    rolled_up: int  # late readings added straight to rollups
+
+
+def reading_key(device: str, metric: HealthMetricCreate) -> Optional[str]:
+    if metric.idempotency_key is not None:
+        return metric.idempotency_key
+    if metric.sequence is not None:
+        return f"{device}#{metric.sequence}"
+    return None
+
+
+def reading_time(ts: Optional[datetime], now: datetime) -> Tuple[datetime, Optional[str]]:
+    """
+    The timestamp to store a reading under, and how it was adjusted
+    ("clamped", "replaced" or None).
+    """
+    if ts is None:
+        return now, None
+    ts = as_utc(ts)
+    if ts > now:
+        if ts - now <= timedelta(seconds=settings.INGEST_MAX_CLOCK_SKEW_SECONDS):
+            return now, "clamped"
+        return now, "replaced"
+    if now - ts > timedelta(days=settings.INGEST_MAX_BACKFILL_DAYS):
+        return now, "replaced"
+    return ts, None
+
+
+async def store_values(db, patient_id: int, values: Sequence[tuple],
+                       source: str = "rest") -> IngestResult:
+    """
+    Persists (metric_type, value[, key[, timestamp]]) readings. Readings
+    whose key was already stored are left out. `source` names the ingestion
+    path in the telemetry. Raises UnknownMetricType for a type missing from
+    the metric_types dictionary.
+    """
+    unknown = {v[0] for v in values if v[0] not in metric_types}
+    if unknown:
+        raise UnknownMetricType(f"Unknown metric types {sorted(unknown)}")
+    now = datetime.now(timezone.utc)
+    readings = await drop_repeats(db, patient_id, [Reading(*v) for v in values], source, now)
+    if not readings:
+        return IngestResult([], 0)
+
+    raw, raw_keys = [], []
+    expired: Dict[str, list] = {}
+    adjusted: Dict[str, int] = {}
+    for r in readings:
+        ts, adjustment = reading_time(r.timestamp, now)
+        if adjustment:
+            adjusted[adjustment] = adjusted.get(adjustment, 0) + 1
+        if now - ts > timedelta(days=retention_days(r.metric_type)):
+            expired.setdefault(r.metric_type, []).append((patient_id, r.value, ts))
+            continue
+        raw.append({"patient_id": patient_id, "metric_type": r.metric_type,
+                    "value": r.value, "timestamp": ts})
+        raw_keys.append(r.key)
+
+    stored = await insert_metric_rows(db, raw)
+    keyed = [(key, row.id) for key, row in zip(raw_keys, stored) if key is not None]
+    if keyed:
+        await record_metric_ids(db, patient_id, keyed)
+    for metric_type, rows in expired.items():
+        await add_to_rollups(db, metric_type, rows)
+    rolled_up = sum(len(rows) for rows in expired.values())
+    if rolled_up:
+        adjusted["rolled_up"] = rolled_up
+    for outcome, n in adjusted.items():
+        INGEST_TIMESTAMPS.labels(source, outcome).inc(n)
+    INGESTED_READINGS.labels(source).inc(len(readings))
+    INGEST_BATCH_SIZE.labels(source).observe(len(readings))
+
+    event = {
+        "patient_id": patient_id,
+        "readings": [
+            {"id": r.id, "metric_type": r.metric_type, "value": r.value,
+             "timestamp": r.timestamp.isoformat()}
+            for r in stored
+        ],
+    }
+    keys = [r.key for r in readings if r.key is not None]
+    if keys:
+        event["keys"] = keys
+    if stored or keys:
+        publish_on_commit(db, METRIC_INGESTED, event)
+    if stored:
+        await raise_alerts(db, patient_id, event["readings"])
+    return IngestResult(stored, rolled_up)
+
+
+async def store_readings(db, patient_id: int, readings: Sequence[HealthMetricCreate],
+                         device: str = "default") -> IngestResult:
+    return await store_values(db, patient_id, [
+        Reading(r.metric_type, r.value, reading_key(device, r), r.timestamp)
+        for r in readings])
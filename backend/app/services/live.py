@@ -0,0 +1,78 @@
+"""
+Live per-patient feeds for dashboards, fed from the event bus so a reading
+ingested by any worker reaches sockets held by every worker.
+"""
+import asyncio
+from contextlib import contextmanager
+from typing import Dict, Set
+
+from app.core.config import settings
+from app.core.telemetry import WEBSOCKETS
+from app.services.events import ALERT_RAISED, METRIC_INGESTED, Event, EventBus, event_bus
+
+LIVE_TOPICS = (METRIC_INGESTED, ALERT_RAISED)
+
+
+class LiveFeeds:
+    """
+    One bus subscription per topic for all sockets, indexed by patient, so
+    an event costs a dict lookup rather than a pass over every open socket.
+    """
+
+    def __init__(self, bus: EventBus):
+        self._feeds: Dict[int, Set[asyncio.Queue]] = {}
+        self.dropped = 0
+        for topic in LIVE_TOPICS:
+            bus.subscribe(topic, self._on_event)
+
+    def _on_event(self, event: Event):
+        for queue in self._feeds.get(event.data.get("patient_id"), ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # A slow consumer loses events rather than stalling the bus.
+                self.dropped += 1
+
+    @contextmanager
+    def feed(self, patient_id: int):
+        queue = asyncio.Queue(maxsize=settings.LIVE_FEED_QUEUE_SIZE)
+        self._feeds.setdefault(patient_id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            feeds = self._feeds.get(patient_id)
+            if feeds is not None:
+                feeds.discard(queue)
+                if not feeds:
+                    del self._feeds[patient_id]
+
+    @property
+    def subscribers(self) -> int:
+        return sum(len(queues) for queues in self._feeds.values())
+
+
+live_feeds = LiveFeeds(event_bus)
+WEBSOCKETS.labels("live").set_function(lambda: live_feeds.subscribers)
+
+
+async def relay_feed(websocket, patient_id: int):
+    """Sends the patient's events to `websocket` until the client goes away."""
+    with live_feeds.feed(patient_id) as queue:
+        receiver = asyncio.create_task(websocket.receive())
+        try:
+            while True:
+                getter = asyncio.create_task(queue.get())
+                done, _ = await asyncio.wait(
+                    {getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    event = getter.result()
+                    await websocket.send_json({"type": event.topic, **event.data})
+                else:
+                    getter.cancel()
+                if receiver in done:
+                    if receiver.result()["type"] == "websocket.disconnect":
+                        return
+                    # Clients have nothing to say on this socket; ignore it.
+                    receiver = asyncio.create_task(websocket.receive())
+        finally:
+            receiver.cancel()
@@ -0,0 +1,98 @@
+"""
+Loading and extending the metric type dictionary (app/models/metric_type.py).
+
+Each process knows the built-in types from the start and loads the rest of
+metric_types at startup, after adding any EXTRA_METRIC_TYPES missing from
+it. Readings of a type not in the dictionary are rejected. Types added by
+one process reach the others in a REFERENCE_UPDATED event carrying their
+codes, and the whole table is reloaded after the event bus reconnects.
+"""
+import asyncio
+import logging
+from typing import Dict, Iterable
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.db import session as db_session
+from app.models.metric_type import MAX_METRIC_TYPE_LENGTH, MetricType, metric_types
+from app.services.events import REFERENCE_UPDATED, event_bus, publish_on_commit
+
+logger = logging.getLogger(__name__)
+
+
+async def load_metric_types(db) -> int:
+    """Adds every row of metric_types to the registry; returns how many there are."""
+    rows = (await db.execute(select(MetricType.id, MetricType.name))).all()
+    metric_types.update((row.id, row.name) for row in rows)
+    return len(rows)
+
+
+async def register_metric_types(db, names: Iterable[str]) -> Dict[str, int]:
+    """
+    Adds the types in `names` that metric_types doesn't have yet, with the
+    next free codes, and returns {name: code} for them. The registry, here
+    and in the other processes, only learns them once `db` commits: if
+    another worker took a code first the insert fails and nothing is kept.
+    """
+    await load_metric_types(db)
+    added: Dict[str, int] = {}
+    for name in dict.fromkeys(names):
+        if name in metric_types or name in added:
+            continue
+        if not name or len(name) > MAX_METRIC_TYPE_LENGTH:
+            raise ValueError(f"Bad metric type {name!r}")
+        code = max(metric_types.next_code(), max(added.values(), default=0) + 1)
+        await db.execute(insert(MetricType), [{"id": code, "name": name}])
+        added[name] = code
+    if added:
+        # Delivered to this process's registry too (_on_reference_updated)
+        publish_on_commit(db, REFERENCE_UPDATED, {
+            "table": "metric_types", "rows": [[code, name] for name, code in added.items()]})
+    return added
+
+
+async def sync_metric_types():
+    """Startup: registers EXTRA_METRIC_TYPES and loads the dictionary."""
+    for attempt in range(3):
+        try:
+            async with db_session.SessionLocal() as db:
+                added = await register_metric_types(db, settings.EXTRA_METRIC_TYPES)
+                await db.commit()
+            if added:
+                logger.info("Added metric types %s", ", ".join(added))
+            return
+        except IntegrityError:
+            # Another worker took the same code first; its rows are loaded on retry.
+            continue
+        except Exception as e:
+            logger.error("Could not load metric types, only the built-in ones are known: %s", e)
+            return
+
+
+def _on_reference_updated(event):
+    if event.data.get("table") == "metric_types":
+        metric_types.update((code, name) for code, name in event.data.get("rows", ()))
+
+
+_reloads = set()
+
+
+async def _load():
+    try:
+        async with db_session.SessionLocal() as db:
+            await load_metric_types(db)
+    except Exception as e:
+        logger.warning("Could not reload metric types: %s", e)
+
+
+def _reload():
+    # Events missed while disconnected may have carried new types.
+    task = asyncio.get_running_loop().create_task(_load())
+    _reloads.add(task)
+    task.add_done_callback(_reloads.discard)
+
+
+event_bus.subscribe(REFERENCE_UPDATED, _on_reference_updated)
+event_bus.on_reconnect(_reload)
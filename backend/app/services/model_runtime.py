@@ -0,0 +1,348 @@
+"""
+Runtime for trained per-condition risk models.
+
+Models are scikit-learn classifiers serialised with joblib under MODEL_DIR:
+
+    models/<condition slug>/<version>.joblib    e.g. models/diabetes/v3.joblib
+    models/<condition slug>/CURRENT             optional, names the version to serve
+
+Without a CURRENT file the highest version is served. Each artifact is a
+dict with the fitted "model", the feature "columns" it was trained on and
+optionally "thresholds" for the risk levels (see train_models.py). They
+are unpickled on load, so MODEL_DIR must only be writable by deployers.
+
+Models are loaded on first use (or in the background after startup with
+MODEL_PRELOAD), never while the app is importing or starting, since
+unpickling pulls in scikit-learn. `reload()` then runs on a timer; it only
+reloads files whose version or mtime changed, and a model that fails to
+load leaves the previous one serving. Conditions without a model keep the heuristics in
+app.services.prediction.
+
+Concurrent callers are micro-batched: rows queue for at most
+MODEL_BATCH_MAX_WAIT_MS (or until MODEL_BATCH_MAX_SIZE are waiting) and
+go to the model as one predict_proba call on a worker thread.
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.telemetry import PREDICTION_SECONDS
+from app.services.prediction import (
+    RISK_CONDITIONS, conditions_needed, predict_multi_disease_risk, score_risks_batch,
+)
+
+logger = logging.getLogger(__name__)
+
+CONDITION_SLUGS = {
+    "Diabetes": "diabetes",
+    "Hypertension": "hypertension",
+    "Cardiac Arrhythmia": "arrhythmia",
+    "Respiratory Breakdown": "respiratory",
+    "Stress Disorder": "stress",
+    "Cholesterol": "cholesterol",
+}
+
+# Inputs a model may be trained on, with the defaults the heuristics assume
+FEATURE_DEFAULTS = {
+    "heart_rate": 72.0, "glucose": 95.0, "spo2": 98.0, "respiratory_rate": 16.0,
+    "blood_pressure_sys": 120.0, "blood_pressure_dia": 80.0, "stress_level": 25.0,
+    "temperature": 98.6, "age": 45.0, "bmi": 24.5, "smoking": 0.0, "hrv": None,
+}
+DEFAULT_THRESHOLDS = {"Critical": 85.0, "High": 70.0, "Moderate": 40.0}
+
+
+def feature_row(metrics: Dict[str, float], profile: Optional[Dict[str, Any]],
+                features: Optional[Dict[str, dict]], columns: Sequence[str]) -> List[float]:
+    profile = profile or {}
+    values = {**FEATURE_DEFAULTS, **metrics}
+    values["age"] = float(profile.get("age", values["age"]))
+    values["bmi"] = float(profile.get("bmi", values["bmi"]))
+    values["smoking"] = 1.0 if profile.get("smoking_history") else 0.0
+    heart = (features or {}).get("heart_rate") or {}
+    hrv = heart.get("hrv_rmssd") if not heart.get("stale") else None
+    # Same stand-in as the heuristics when there is no measured HRV
+    values["hrv"] = hrv if hrv is not None else 40 - values["stress_level"] / 4
+    return [float(values[c]) for c in columns]
+
+
+def _version_key(version: str):
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", version)]
+
+
+@dataclass
+class LoadedModel:
+    condition: str
+    version: str
+    path: str
+    mtime: float
+    estimator: Any
+    columns: Tuple[str, ...]
+    thresholds: Dict[str, float]
+    loaded_at: str = field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    batches: int = 0
+    rows: int = 0
+
+    def __post_init__(self):
+        self._positive = list(self.estimator.classes_).index(1)
+
+    def level(self, score: float) -> str:
+        for name in ("Critical", "High", "Moderate"):
+            if name in self.thresholds and score > self.thresholds[name]:
+                return name
+        return "Low"
+
+    def score_rows(self, rows: List[List[float]]) -> List[Tuple[float, str, str]]:
+        """Runs on a worker thread: one predict_proba call for the whole batch."""
+        import numpy as np
+
+        probabilities = self.estimator.predict_proba(np.asarray(rows, dtype=float))
+        self.batches += 1
+        self.rows += len(rows)
+        out = []
+        for p in probabilities[:, self._positive]:
+            score = round(float(p) * 100, 1)
+            out.append((score, self.level(score), self.version))
+        return out
+
+
+class MicroBatcher:
+    """Collects concurrent requests for one model into batched calls."""
+
+    def __init__(self, model: LoadedModel, executor: ThreadPoolExecutor):
+        self.model = model
+        self.executor = executor
+        self._pending: List[Tuple[List[float], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def submit(self, row: List[float]) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((row, future))
+        if len(self._pending) >= settings.MODEL_BATCH_MAX_SIZE:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(settings.MODEL_BATCH_MAX_WAIT_MS / 1000, self._flush)
+        return future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            results = await loop.run_in_executor(
+                self.executor, self.model.score_rows, [row for row, _ in batch])
+            PREDICTION_SECONDS.labels("model_batch").observe(time.perf_counter() - started)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+
+class ModelRuntime:
+    def __init__(self, model_dir: str):
+        self.model_dir = model_dir
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._models: Dict[str, LoadedModel] = {}
+        self._batchers: Dict[str, MicroBatcher] = {}
+        self.fingerprint = "heuristic"
+        self.errors: Dict[str, str] = {}
+        self._loaded = False
+        self._loading: Optional[asyncio.Future] = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=settings.MODEL_THREADS, thread_name_prefix="model")
+        return self._executor
+
+    # -- loading -----------------------------------------------------------
+
+    def _select(self, slug: str) -> Optional[Tuple[str, str]]:
+        directory = os.path.join(self.model_dir, slug)
+        if not os.path.isdir(directory):
+            return None
+        versions = [name[:-len(".joblib")] for name in os.listdir(directory)
+                    if name.endswith(".joblib")]
+        if not versions:
+            return None
+        current = os.path.join(directory, "CURRENT")
+        if os.path.exists(current):
+            with open(current) as f:
+                version = f.read().strip()
+        else:
+            version = max(versions, key=_version_key)
+        return version, os.path.join(directory, version + ".joblib")
+
+    @staticmethod
+    def _load(condition: str, version: str, path: str) -> LoadedModel:
+        import joblib
+
+        mtime = os.path.getmtime(path)
+        artifact = joblib.load(path)
+        return LoadedModel(
+            condition=condition, version=version, path=path, mtime=mtime,
+            estimator=artifact["model"], columns=tuple(artifact["columns"]),
+            thresholds=artifact.get("thresholds", DEFAULT_THRESHOLDS))
+
+    async def reload(self) -> Dict[str, str]:
+        """Picks up new, changed or removed artifacts; returns what changed per condition."""
+        loop = asyncio.get_running_loop()
+        changes = {}
+        for condition, slug in CONDITION_SLUGS.items():
+            selected = self._select(slug)
+            current = self._models.get(condition)
+            if selected is None:
+                if current is not None:
+                    del self._models[condition]
+                    self._batchers.pop(condition, None)
+                    changes[condition] = "heuristic"
+                continue
+            version, path = selected
+            try:
+                if current is not None and current.path == path \
+                        and current.mtime == os.path.getmtime(path):
+                    continue
+                model = await loop.run_in_executor(
+                    self.executor, self._load, condition, version, path)
+                unknown = set(model.columns) - set(FEATURE_DEFAULTS)
+                if unknown:
+                    raise ValueError(f"unknown feature columns {sorted(unknown)}")
+            except Exception as e:
+                self.errors[condition] = f"{version}: {e}"
+                logger.exception("Could not load %s model %s", condition, path)
+                continue
+            self.errors.pop(condition, None)
+            # Batches already queued finish on the model they were queued for.
+            self._models[condition] = model
+            self._batchers[condition] = MicroBatcher(model, self.executor)
+            changes[condition] = version
+        if changes:
+            self.fingerprint = self._fingerprint()
+            logger.info("Risk models reloaded: %s", changes)
+        self._loaded = True
+        return changes
+
+    async def ensure_loaded(self):
+        """The first load, shared by every caller that arrives while it runs."""
+        if self._loaded:
+            return
+        if self._loading is None or self._loading.get_loop() is not asyncio.get_running_loop():
+            self._loading = asyncio.ensure_future(self.reload())
+        await self._loading
+
+    def _fingerprint(self) -> str:
+        if not self._models:
+            return "heuristic"
+        served = ";".join(f"{c}={m.version}@{m.mtime}" for c, m in sorted(self._models.items()))
+        return f"{zlib.crc32(served.encode()):08x}"
+
+    def status(self) -> List[dict]:
+        out = []
+        for condition in RISK_CONDITIONS:
+            model = self._models.get(condition)
+            entry = {"condition": condition, "model": model.version if model else "heuristic"}
+            if model:
+                entry.update(loaded_at=model.loaded_at, batches=model.batches, rows=model.rows,
+                             mean_batch_size=round(model.rows / model.batches, 1)
+                             if model.batches else None)
+            if condition in self.errors:
+                entry["error"] = self.errors[condition]
+            out.append(entry)
+        return out
+
+    # -- inference ---------------------------------------------------------
+
+    async def model_scores(self, metrics: Dict[str, float], profile: Optional[dict] = None,
+                           features: Optional[Dict[str, dict]] = None,
+                           conditions: Optional[Sequence[str]] = None) -> Dict[str, tuple]:
+        """
+        (score, level, version) from every loaded model, or those of
+        `conditions`, batched with concurrent callers.
+        """
+        await self.ensure_loaded()
+        if not self._models:
+            return {}
+        futures = {
+            condition: self._batchers[condition].submit(
+                feature_row(metrics, profile, features, model.columns))
+            for condition, model in self._models.items()
+            if conditions is None or condition in conditions
+        }
+        results = await asyncio.gather(*futures.values(), return_exceptions=True)
+        scores = {}
+        for condition, result in zip(futures, results):
+            if isinstance(result, Exception):
+                # One broken model shouldn't take the endpoint down with it.
+                logger.error("%s model failed, using heuristic: %s", condition, result)
+                continue
+            scores[condition] = result
+        return scores
+
+    async def predict(self, metrics: Dict[str, float], profile: Optional[dict] = None,
+                      features: Optional[Dict[str, dict]] = None,
+                      conditions: Optional[Sequence[str]] = None,
+                      outputs: Optional[Sequence[str]] = None,
+                      data_quality: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        predict_multi_disease_risk with trained models where they are loaded;
+        only the models the selected conditions and outputs need are run.
+        """
+        started = time.perf_counter()
+        needed = conditions_needed(conditions, outputs)
+        scores = await self.model_scores(metrics, profile, features, needed)
+        prediction = predict_multi_disease_risk(metrics, profile, features, scores,
+                                                conditions, outputs, data_quality)
+        PREDICTION_SECONDS.labels("request").observe(time.perf_counter() - started)
+        return prediction
+
+    async def score_many(self, metrics_list: List[Dict[str, float]], profile: Optional[dict] = None,
+                         features_list: Optional[List[Dict[str, dict]]] = None) -> List[List[tuple]]:
+        """
+        score_risks_batch for batch jobs, which already have their batch: one
+        predict_proba call per model for all rows, bypassing the micro-batcher.
+        """
+        await self.ensure_loaded()
+        started = time.perf_counter()
+        results = score_risks_batch(metrics_list, profile, features_list)
+        if self._models and metrics_list:
+            await self._apply_models(results, metrics_list, profile, features_list)
+        PREDICTION_SECONDS.labels("batch").observe(time.perf_counter() - started)
+        return results
+
+    async def _apply_models(self, results, metrics_list, profile, features_list):
+        features_list = features_list or [None] * len(metrics_list)
+        loop = asyncio.get_running_loop()
+        for condition, model in list(self._models.items()):
+            index = RISK_CONDITIONS.index(condition)
+            rows = [feature_row(m, profile, f, model.columns)
+                    for m, f in zip(metrics_list, features_list)]
+            try:
+                scored = await loop.run_in_executor(self.executor, model.score_rows, rows)
+            except Exception:
+                logger.exception("%s model failed on a batch, using heuristic", condition)
+                continue
+            for row, (score, level, _) in zip(results, scored):
+                row[index] = (condition, score, level)
+
+
+model_runtime = ModelRuntime(settings.MODEL_DIR)
@@ -1,154 +1,383 @@
-from typing import Dict, Any, List
+"""
+Multi-disease risk engine.
+
+Each condition is a ConditionScorer in CONDITIONS: the telemetry it reads,
+a heuristic score and risk level, and the narrative fields shown with it.
+predict_multi_disease_risk scores only the conditions asked for, plus any
+the requested outputs (comorbidities, recommendations) depend on, and
+intermediates several scorers share, such as HRV, are worked out once per
+call in Inputs. Scores are written with Inputs' clip/where/level, so the
+same scorers run over a whole batch of patients at once on the numpy
+columns of BatchInputs (score_risks_batch).
+"""
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 import random
 from datetime import datetime, timedelta
 
+# Share of a prediction's confidence lost when all the telemetry it reads is stale
+STALE_CONFIDENCE_PENALTY = 0.5
 
-def predict_multi_disease_risk(metrics: Dict[str, float], patient_data: Dict[str, Any] = None) -> Dict[str, Any]:
-    """
-    Advanced Multi-Disease AI Prediction Engine.
-    Forecasts risks for 6 major conditions based on telemetry trends and profile data.
-    """
-    # Baseline telemetry
-    hr = metrics.get("heart_rate", 72)
-    glucose = metrics.get("glucose", 95)
-    spo2 = metrics.get("spo2", 98)
-    rr = metrics.get("respiratory_rate", 16)
-    bp_sys = metrics.get("blood_pressure_sys", 120)
-    bp_dia = metrics.get("blood_pressure_dia", 80)
-    stress = metrics.get("stress_level", 25)
-    temp = metrics.get("temperature", 98.6)
-
-    # Static data or defaults
-    age = patient_data.get("age", 45) if patient_data else 45
-    bmi = patient_data.get("bmi", 24.5) if patient_data else 24.5
-    smoking = patient_data.get(
-        "smoking_history", False) if patient_data else False
+# Assumed for metrics the patient has no reading of
+METRIC_DEFAULTS = {
+    "heart_rate": 72, "glucose": 95, "spo2": 98, "respiratory_rate": 16,
+    "blood_pressure_sys": 120, "blood_pressure_dia": 80, "stress_level": 25,
+    "temperature": 98.6,
+}
 
-    predictions = []
 
-    # 1. Diabetes Risk Prediction (Gradient Boosting heuristic)
-    diabetes_score = (glucose - 80) * 0.8 + (bmi - 20) * 1.5 + (age / 10)
-    if glucose > 180:
-        diabetes_score += 30
-    diabetes_score = min(max(diabetes_score, 5), 98)
-    predictions.append({
-        "condition": "Diabetes",
-        "risk_level": "Critical" if diabetes_score > 85 else "High" if diabetes_score > 70 else "Moderate" if diabetes_score > 40 else "Low",
-        "score": round(diabetes_score, 1),
-        "trend": "rising" if glucose > 110 else "stable",
-        "time_to_event": "6-8 months" if diabetes_score > 70 else "2+ years",
-        "confidence": 92,
+def _fresh(features: Dict[str, dict], metric: str) -> Dict[str, Any]:
+    window = features.get(metric) if features else None
+    return window if window and not window.get("stale") else {}
+
+
+def _trend(features: Dict[str, dict], metric: str, tolerance: float, default: str,
+           up: str = "rising", down: str = "improving") -> str:
+    """Trend from the metric's windowed slope (per hour), or `default` without one."""
+    slope = _fresh(features, metric).get("slope_per_hour")
+    if slope is None:
+        return default
+    if slope > tolerance:
+        return up
+    if slope < -tolerance:
+        return down
+    return "stable"
+
+
+def _hrv(features: Dict[str, dict]):
+    """RMSSD from recent heart-rate samples, when they were dense enough to measure it."""
+    return _fresh(features, "heart_rate").get("hrv_rmssd")
+
+
+def _override(model_scores: Dict[str, tuple], condition: str, score: float, level: str):
+    """A trained model's (score, level, version) for `condition`, else the heuristic's."""
+    if model_scores and condition in model_scores:
+        return model_scores[condition]
+    return score, level, "heuristic"
+
+
+class Inputs:
+    """One call's inputs, with the intermediates scorers share computed on first use."""
+
+    def __init__(self, metrics: Dict[str, float], patient_data: Optional[Dict[str, Any]],
+                 features: Optional[Dict[str, dict]]):
+        self.metrics = metrics
+        self.features = features
+        profile = patient_data or {}
+        self.age = profile.get("age", 45)
+        self.bmi = profile.get("bmi", 24.5)
+        self.smoking = profile.get("smoking_history", False)
+
+    def __getitem__(self, metric: str) -> float:
+        return self.metrics.get(metric, METRIC_DEFAULTS[metric])
+
+    @cached_property
+    def hrv(self) -> Optional[float]:
+        return _hrv(self.features)
+
+    @cached_property
+    def hr_var(self) -> float:
+        # Simplified HRV from stress without a measured one
+        return self.hrv if self.hrv is not None else 40 - (self["stress_level"] / 4)
+
+    @cached_property
+    def ldl_est(self) -> float:
+        # BMI and age stand in for the lipid panels we rarely have
+        return 100 + (self.bmi - 20) * 3 + (self.age / 5)
+
+    # Branching a score can use and still run on BatchInputs' columns
+    @staticmethod
+    def clip(value, low: float, high: float):
+        return min(max(value, low), high)
+
+    @staticmethod
+    def where(condition, if_true, if_false):
+        return if_true if condition else if_false
+
+    @staticmethod
+    def level(*rules: Tuple[Any, str], default: str = "Low"):
+        """The label of the first (condition, label) rule that holds."""
+        for condition, label in rules:
+            if condition:
+                return label
+        return default
+
+
+class BatchInputs(Inputs):
+    """Inputs of many patients sharing one profile: metrics are numpy columns."""
+
+    def __init__(self, metrics_list: List[Dict[str, float]],
+                 patient_data: Optional[Dict[str, Any]],
+                 features_list: Optional[List[Dict[str, dict]]]):
+        import numpy as np
+
+        super().__init__({}, patient_data, None)
+        self.np = np
+        self.metrics_list = metrics_list
+        self.features_list = features_list or [None] * len(metrics_list)
+        self._columns: Dict[str, Any] = {}
+
+    def __getitem__(self, metric: str):
+        if metric not in self._columns:
+            default = METRIC_DEFAULTS[metric]
+            self._columns[metric] = self.np.array(
+                [m.get(metric, default) for m in self.metrics_list], dtype=float)
+        return self._columns[metric]
+
+    @cached_property
+    def hrv(self):
+        # NaN where there was no measured HRV
+        return self.np.array([_hrv(f) if f else None for f in self.features_list], dtype=float)
+
+    @cached_property
+    def hr_var(self):
+        return self.np.where(self.np.isnan(self.hrv), 40 - (self["stress_level"] / 4), self.hrv)
+
+    def clip(self, value, low: float, high: float):
+        return self.np.clip(value, low, high)
+
+    def where(self, condition, if_true, if_false):
+        return self.np.where(condition, if_true, if_false)
+
+    def level(self, *rules: Tuple[Any, str], default: str = "Low"):
+        return self.np.select([c for c, _ in rules], [label for _, label in rules], default)
+
+
+@dataclass(frozen=True)
+class ConditionScorer:
+    condition: str
+    metrics: Tuple[str, ...]  # telemetry read; age, BMI and smoking come from the profile
+    confidence: int
+    # heuristic (score, risk_level), per patient on Inputs or per batch on BatchInputs
+    score: Callable[[Inputs], Tuple[Any, Any]]
+    # trend, time_to_event, key_indicators and status_text for the final score
+    describe: Callable[[Inputs, float], Dict[str, Any]]
+
+
+CONDITIONS: Dict[str, ConditionScorer] = {}
+
+
+def register(scorer: ConditionScorer) -> ConditionScorer:
+    CONDITIONS[scorer.condition] = scorer
+    return scorer
+
+
+# 1. Diabetes (Gradient Boosting heuristic)
+def _diabetes(x: Inputs):
+    glucose = x["glucose"]
+    score = (glucose - 80) * 0.8 + (x.bmi - 20) * 1.5 + (x.age / 10)
+    score = x.clip(score + x.where(glucose > 180, 30, 0), 5, 98)
+    return score, x.level((score > 85, "Critical"), (score > 70, "High"), (score > 40, "Moderate"))
+
+
+def _diabetes_details(x: Inputs, score: float):
+    glucose = x["glucose"]
+    return {
+        "trend": _trend(x.features, "glucose", 2.0, "rising" if glucose > 110 else "stable"),
+        "time_to_event": "6-8 months" if score > 70 else "2+ years",
         "key_indicators": [
             f"Glucose: {glucose} mg/dL",
             f"HbA1c: {round(4 + (glucose/30), 1)}% (est)",
-            f"BMI: {bmi}"
+            f"BMI: {x.bmi}"
         ],
         "status_text": "PREDIABETIC TREND" if 100 < glucose < 126 else "HYPERGLYCEMIC" if glucose >= 126 else "OPTIMAL"
-    })
-
-    # 2. Hypertension Risk Prediction
-    hyper_score = (bp_sys - 100) * 0.6 + (bp_dia - 60) * 0.8 + (stress * 0.2)
-    hyper_score = min(max(hyper_score, 10), 95)
-    predictions.append({
-        "condition": "Hypertension",
-        "risk_level": "Critical" if bp_sys > 160 else "High" if bp_sys > 140 else "Moderate" if bp_sys > 130 else "Low",
-        "score": round(hyper_score, 1),
-        "trend": "rising" if stress > 60 else "stable",
-        "time_to_event": "12-18 months" if hyper_score > 60 else "Stable",
-        "confidence": 85,
+    }
+
+
+# 2. Hypertension
+def _hypertension(x: Inputs):
+    bp_sys = x["blood_pressure_sys"]
+    score = (bp_sys - 100) * 0.6 + (x["blood_pressure_dia"] - 60) * 0.8 + (x["stress_level"] * 0.2)
+    score = x.clip(score, 10, 95)
+    return score, x.level((bp_sys > 160, "Critical"), (bp_sys > 140, "High"),
+                          (bp_sys > 130, "Moderate"))
+
+
+def _hypertension_details(x: Inputs, score: float):
+    bp_sys, bp_dia, stress = x["blood_pressure_sys"], x["blood_pressure_dia"], x["stress_level"]
+    return {
+        "trend": _trend(x.features, "blood_pressure_sys", 1.0, "rising" if stress > 60 else "stable"),
+        "time_to_event": "12-18 months" if score > 60 else "Stable",
         "key_indicators": [
             f"BP: {int(bp_sys)}/{int(bp_dia)} mmHg",
             f"Stress Impact: {round(stress * 0.1, 1)} mmHg",
-            f"HR: {hr} bpm"
+            f"HR: {x['heart_rate']} bpm"
         ],
         "status_text": "STAGE 1 HYPERTENSION" if 130 <= bp_sys < 140 or 80 <= bp_dia < 90 else "STAGE 2" if bp_sys >= 140 else "NORMAL"
-    })
-
-    # 3. Cardiac Arrhythmia Risk Prediction (LSTM/CNN heuristic)
-    hr_var = 40 - (stress / 4)  # Simplified HRV
-    arr_score = abs(hr - 72) * 0.5 + (40 - hr_var) * 1.2
-    if hr > 110 or hr < 50:
-        arr_score += 25
-    arr_score = min(max(arr_score, 5), 92)
-    predictions.append({
-        "condition": "Cardiac Arrhythmia",
-        "risk_level": "High" if arr_score > 75 else "Moderate" if arr_score > 40 else "Low",
-        "score": round(arr_score, 1),
+    }
+
+
+# 3. Cardiac Arrhythmia (LSTM/CNN heuristic)
+def _arrhythmia(x: Inputs):
+    hr = x["heart_rate"]
+    score = abs(hr - 72) * 0.5 + (40 - x.hr_var) * 1.2
+    score = x.clip(score + x.where((hr > 110) | (hr < 50), 25, 0), 5, 92)
+    return score, x.level((score > 75, "High"), (score > 40, "Moderate"))
+
+
+def _arrhythmia_details(x: Inputs, score: float):
+    hr_var = x.hr_var
+    return {
         "trend": "improving" if hr_var > 30 else "stable",
         "time_to_event": "Monitoring",
-        "confidence": 76,
         "key_indicators": [
-            f"HRV: {round(hr_var, 1)} ms",
-            f"Current HR: {hr} bpm",
+            f"HRV{' (RMSSD)' if x.hrv is not None else ''}: {round(hr_var, 1)} ms",
+            f"Current HR: {x['heart_rate']} bpm",
             f"Rhythm stability: {88 if hr_var > 25 else 60}%"
         ],
-        "status_text": "OCCASIONAL PALPITATIONS" if arr_score > 40 else "SINUS RHYTHM"
-    })
-
-    # 4. Respiratory Breakdown Risk Prediction
-    resp_score = (100 - spo2) * 5 + (rr - 16) * 2
-    if smoking:
-        resp_score += 15
-    resp_score = min(max(resp_score, 5), 90)
-    predictions.append({
-        "condition": "Respiratory Breakdown",
-        "risk_level": "Critical" if spo2 < 92 else "High" if spo2 < 94 else "Moderate" if rr > 20 else "Low",
-        "score": round(resp_score, 1),
-        "trend": "worsening" if rr > 18 else "stable",
-        "time_to_event": "3-6 months" if resp_score > 70 else "Low risk",
-        "confidence": 88,
+        "status_text": "OCCASIONAL PALPITATIONS" if score > 40 else "SINUS RHYTHM"
+    }
+
+
+# 4. Respiratory Breakdown
+def _respiratory(x: Inputs):
+    spo2, rr = x["spo2"], x["respiratory_rate"]
+    score = (100 - spo2) * 5 + (rr - 16) * 2
+    if x.smoking:
+        score += 15
+    score = x.clip(score, 5, 90)
+    return score, x.level((spo2 < 92, "Critical"), (spo2 < 94, "High"), (rr > 20, "Moderate"))
+
+
+def _respiratory_details(x: Inputs, score: float):
+    spo2, rr = x["spo2"], x["respiratory_rate"]
+    return {
+        "trend": _trend(x.features, "spo2", 0.5, "worsening" if rr > 18 else "stable",
+                        up="improving", down="worsening"),
+        "time_to_event": "3-6 months" if score > 70 else "Low risk",
         "key_indicators": [
             f"SpO2: {spo2}%",
             f"RR: {rr}/min",
             f"Desaturation factor: {round((100-spo2)*1.5, 1)}"
         ],
         "status_text": "CHRONIC HYPOXIA TREND" if spo2 < 94 else "ADEQUATE VENTILATION"
-    })
-
-    # 5. Stress Disorder Risk Prediction
-    # High stress + high HR + low HRV
-    stress_score = stress * 0.7 + (hr - 60) * 0.3 + (40 - hr_var) * 0.5
-    stress_score = min(max(stress_score, 10), 96)
-    predictions.append({
-        "condition": "Stress Disorder",
-        "risk_level": "High" if stress_score > 80 else "Moderate" if stress_score > 50 else "Low",
-        "score": round(stress_score, 1),
-        "trend": "worsening" if stress > 70 else "stable",
-        "time_to_event": "Burnout risk: 6m" if stress_score > 70 else "N/A",
-        "confidence": 82,
+    }
+
+
+# 5. Stress Disorder: high stress + high HR + low HRV
+def _stress(x: Inputs):
+    score = x["stress_level"] * 0.7 + (x["heart_rate"] - 60) * 0.3 + (40 - x.hr_var) * 0.5
+    score = x.clip(score, 10, 96)
+    return score, x.level((score > 80, "High"), (score > 50, "Moderate"))
+
+
+def _stress_details(x: Inputs, score: float):
+    stress = x["stress_level"]
+    return {
+        "trend": _trend(x.features, "stress_level", 2.0, "worsening" if stress > 70 else "stable",
+                        up="worsening"),
+        "time_to_event": "Burnout risk: 6m" if score > 70 else "N/A",
         "key_indicators": [
-            f"HRV: {round(hr_var, 1)} ms",
+            f"HRV: {round(x.hr_var, 1)} ms",
             f"Sympathetic Load: {stress}%",
-            f"Resting HR: {hr} bpm"
+            f"Resting HR: {x['heart_rate']} bpm"
         ],
-        "status_text": "CHRONIC STRESS PATTERN" if stress_score > 60 else "BALANCED"
-    })
-
-    # 6. Cholesterol Risk Prediction (Stochastic heuristic)
-    # Using BMI and Age as proxies since we might not have real-time lipid panels
-    ldl_est = 100 + (bmi - 20) * 3 + (age / 5)
-    chol_score = (ldl_est - 70) * 0.4 + (bmi - 20) * 1.0
-    chol_score = min(max(chol_score, 10), 85)
-    predictions.append({
-        "condition": "Cholesterol",
-        "risk_level": "High" if ldl_est > 160 else "Moderate" if ldl_est > 130 else "Low",
-        "score": round(chol_score, 1),
-        "trend": "improving" if bmi < 25 else "stable",
-        "time_to_event": "Normalization: 4m" if bmi < 24 else "Ongoing",
-        "confidence": 72,
+        "status_text": "CHRONIC STRESS PATTERN" if score > 60 else "BALANCED"
+    }
+
+
+# 6. Cholesterol (Stochastic heuristic)
+def _cholesterol(x: Inputs):
+    ldl_est = x.ldl_est
+    score = (ldl_est - 70) * 0.4 + (x.bmi - 20) * 1.0
+    score = x.clip(score, 10, 85)
+    return score, x.level((ldl_est > 160, "High"), (ldl_est > 130, "Moderate"))
+
+
+def _cholesterol_details(x: Inputs, score: float):
+    return {
+        "trend": "improving" if x.bmi < 25 else "stable",
+        "time_to_event": "Normalization: 4m" if x.bmi < 24 else "Ongoing",
         "key_indicators": [
-            f"Est. LDL: {round(ldl_est, 1)} mg/dL",
-            f"BMI factor: {round(bmi-20, 1)}",
-            f"Age factor: {round(age/10, 1)}"
+            f"Est. LDL: {round(x.ldl_est, 1)} mg/dL",
+            f"BMI factor: {round(x.bmi-20, 1)}",
+            f"Age factor: {round(x.age/10, 1)}"
         ],
-        "status_text": "BORDERLINE DYSLIPIDEMIA" if ldl_est > 130 else "OPTIMAL LIPIDS"
-    })
+        "status_text": "BORDERLINE DYSLIPIDEMIA" if x.ldl_est > 130 else "OPTIMAL LIPIDS"
+    }
+
+
+register(ConditionScorer("Diabetes", ("glucose",), 92, _diabetes, _diabetes_details))
+register(ConditionScorer("Hypertension",
+                         ("blood_pressure_sys", "blood_pressure_dia", "stress_level", "heart_rate"),
+                         85, _hypertension, _hypertension_details))
+register(ConditionScorer("Cardiac Arrhythmia", ("heart_rate", "stress_level"), 76,
+                         _arrhythmia, _arrhythmia_details))
+register(ConditionScorer("Respiratory Breakdown", ("spo2", "respiratory_rate"), 88,
+                         _respiratory, _respiratory_details))
+register(ConditionScorer("Stress Disorder", ("stress_level", "heart_rate"), 82,
+                         _stress, _stress_details))
+register(ConditionScorer("Cholesterol", (), 72, _cholesterol, _cholesterol_details))
+
+RISK_CONDITIONS = tuple(CONDITIONS)
+
+# Parts of the analysis besides "predictions", which is always returned
+OUTPUTS = ("overall_status", "timeline", "summary", "comorbidities", "recommendations",
+           "features", "data_quality")
+# Conditions an output reads the scores of, whether or not they were asked for
+OUTPUT_CONDITIONS = {
+    "comorbidities": ("Diabetes", "Hypertension", "Stress Disorder"),
+    "recommendations": ("Diabetes", "Respiratory Breakdown", "Cardiac Arrhythmia"),
+}
+
+
+def conditions_needed(conditions: Optional[Iterable[str]] = None,
+                      outputs: Optional[Iterable[str]] = None) -> Tuple[str, ...]:
+    """
+    The conditions to score for `conditions` and `outputs` (None meaning
+    all of them), in RISK_CONDITIONS order. Raises ValueError on unknown names.
+    """
+    wanted = set(RISK_CONDITIONS if conditions is None else conditions)
+    unknown = wanted - set(RISK_CONDITIONS)
+    outputs = OUTPUTS if outputs is None else tuple(outputs)
+    unknown |= set(outputs) - set(OUTPUTS)
+    if unknown:
+        raise ValueError(f"unknown conditions or outputs: {sorted(unknown)}")
+    for output in outputs:
+        wanted.update(OUTPUT_CONDITIONS.get(output, ()))
+    return tuple(c for c in RISK_CONDITIONS if c in wanted)
+
+
+def required_metrics(conditions: Optional[Iterable[str]] = None) -> Tuple[str, ...]:
+    """Telemetry the given conditions (default all) are scored from."""
+    names = RISK_CONDITIONS if conditions is None else conditions
+    return tuple(sorted({m for c in names for m in CONDITIONS[c].metrics}))
+
+
+def _stale_inputs(scorer: ConditionScorer, data_quality: Dict[str, Any]) -> List[str]:
+    """The scorer's metrics that are stale, or were not reported at all, in `data_quality`."""
+    tracked = data_quality.get("metrics", {})
+    stale = set(data_quality.get("stale_metrics", ()))
+    return [m for m in scorer.metrics if m in stale or m not in tracked]
+
+
+def _prediction(scorer: ConditionScorer, x: Inputs, model_scores: Dict[str, tuple],
+                data_quality: Optional[Dict[str, Any]] = None):
+    score, level, model = _override(model_scores, scorer.condition, *scorer.score(x))
+    details = scorer.describe(x, score)
+    confidence, stale = scorer.confidence, []
+    if data_quality is not None and scorer.metrics:
+        stale = _stale_inputs(scorer, data_quality)
+        confidence = round(confidence * (
+            1 - STALE_CONFIDENCE_PENALTY * len(stale) / len(scorer.metrics)))
+    prediction = {
+        "condition": scorer.condition,
+        "risk_level": level,
+        "score": round(score, 1),
+        "model": model,
+        "trend": details["trend"],
+        "time_to_event": details["time_to_event"],
+        "confidence": confidence,
+        "key_indicators": details["key_indicators"],
+        "status_text": details["status_text"],
+    }
+    if stale:
+        prediction["stale_inputs"] = stale
+    return score, prediction
 
-    # Overall Summary
-    high_risks = [p["condition"]
-                  for p in predictions if p["risk_level"] in ["High", "Critical"]]
 
-    # Generate Timeline Data
+def _timeline(predictions: List[dict]) -> List[dict]:
     timeline = []
     for i in range(12):
         month_label = (datetime.now() + timedelta(days=30*i)).strftime("%b")
@@ -158,31 +387,96 @@ def predict_multi_disease_risk(metrics: Dict[str, float], patient_data: Dict[str
             month_data[p["condition"]] = min(
                 max(p["score"] + random.uniform(-5, 5), 0), 100)
         timeline.append(month_data)
+    return timeline
 
-    return {
-        "overall_status": "Critical" if any(p["risk_level"] == "Critical" for p in predictions) else "Warning" if high_risks else "Stable",
-        "predictions": predictions,
-        "timeline": timeline,
-        "summary": f"Detected {len(high_risks)} elevated risk factors: {', '.join(high_risks)}." if high_risks else "Patient maintains optimal clinical stability across all predicted metrics.",
-        "comorbidities": [
+
+def predict_multi_disease_risk(metrics: Dict[str, float], patient_data: Dict[str, Any] = None,
+                               features: Dict[str, dict] = None,
+                               model_scores: Dict[str, tuple] = None,
+                               conditions: Optional[Iterable[str]] = None,
+                               outputs: Optional[Iterable[str]] = None,
+                               data_quality: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Advanced Multi-Disease AI Prediction Engine.
+    Forecasts risks for 6 major conditions based on telemetry trends and profile data.
+    `features` are windowed per-metric statistics (see app.services.features);
+    without them trends fall back to thresholds on the latest values.
+    `model_scores` maps conditions to (score, risk_level, model_version) from
+    trained models (see app.services.model_runtime), replacing the heuristic.
+    `conditions` and `outputs` (default all) pick the predictions and the
+    parts of the analysis (see OUTPUTS) to compute and return.
+    `data_quality` is the patient's reading cadence (see app.services.data_quality);
+    predictions whose inputs are stale or missing in it lose up to
+    STALE_CONFIDENCE_PENALTY of their confidence and list them as stale_inputs.
+    """
+    outputs = OUTPUTS if outputs is None else tuple(outputs)
+    selected = set(RISK_CONDITIONS if conditions is None else conditions)
+    x = Inputs(metrics, patient_data, features)
+
+    scores: Dict[str, float] = {}
+    predictions = []
+    for condition in conditions_needed(selected, outputs):
+        scores[condition], prediction = _prediction(CONDITIONS[condition], x, model_scores,
+                                                    data_quality)
+        if condition in selected:
+            predictions.append(prediction)
+
+    result: Dict[str, Any] = {}
+    high_risks = [p["condition"]
+                  for p in predictions if p["risk_level"] in ["High", "Critical"]]
+    if "overall_status" in outputs:
+        result["overall_status"] = "Critical" if any(p["risk_level"] == "Critical" for p in predictions) else "Warning" if high_risks else "Stable"
+    result["predictions"] = predictions
+    if "timeline" in outputs:
+        result["timeline"] = _timeline(predictions)
+    if "summary" in outputs:
+        result["summary"] = f"Detected {len(high_risks)} elevated risk factors: {', '.join(high_risks)}." if high_risks else "Patient maintains optimal clinical stability across all predicted metrics."
+    if "comorbidities" in outputs:
+        result["comorbidities"] = [
             "DIABETES + HYPERTENSION + STRESS" if (
-                diabetes_score > 60 and hyper_score > 60 and stress_score > 50) else None
-        ],
-        "recommendations": {
+                scores["Diabetes"] > 60 and scores["Hypertension"] > 60
+                and scores["Stress Disorder"] > 50) else None
+        ]
+    if "recommendations" in outputs:
+        result["recommendations"] = {
             "immediate": [
                 "Schedule HbA1c and Lipid profile",
-                "Order Spirometry/PFT for respiratory assessment" if spo2 < 94 else None,
-                "24-hour Holter monitoring" if arr_score > 50 else None
+                "Order Spirometry/PFT for respiratory assessment" if x["spo2"] < 94 else None,
+                "24-hour Holter monitoring" if scores["Cardiac Arrhythmia"] > 50 else None
             ],
             "short_term": [
-                "Refer to Endocrinologist" if diabetes_score > 70 else None,
-                "Refer to Pulmonologist" if resp_score > 70 else None,
+                "Refer to Endocrinologist" if scores["Diabetes"] > 70 else None,
+                "Refer to Pulmonologist" if scores["Respiratory Breakdown"] > 70 else None,
                 "Nutritional counseling: Low sodium/Low GI diet"
             ]
-        },
-        "data_quality": {
-            "monitoring_coverage": 85,
-            "lab_accuracy": 40,
-            "manual_entry": 60
         }
-    }
+    if "features" in outputs:
+        result["features"] = features or {}
+    if "data_quality" in outputs:
+        result["data_quality"] = data_quality
+    return result
+
+
+def score_risks_batch(metrics_list: List[Dict[str, float]],
+                      patient_data: Dict[str, Any] = None,
+                      features_list: List[Dict[str, dict]] = None) -> List[List[tuple]]:
+    """
+    Scores and risk levels only, for many patients at once. Runs every
+    scorer in CONDITIONS once over numpy columns of the whole batch, without
+    the narrative fields and timeline the UI needs.
+    `features_list` optionally carries each patient's windowed features.
+    Returns, per input, [(condition, score, risk_level), ...] in RISK_CONDITIONS order.
+    """
+    if not metrics_list:
+        return []
+    x = BatchInputs(metrics_list, patient_data, features_list)
+    np, shape = x.np, (len(metrics_list),)
+
+    columns = []
+    for condition, scorer in CONDITIONS.items():
+        score, level = scorer.score(x)
+        # Profile-only scores come back as one value for the whole batch
+        scores = np.broadcast_to(score, shape).tolist()
+        levels = np.broadcast_to(level, shape).tolist()
+        columns.append([(condition, round(s, 1), l) for s, l in zip(scores, levels)])
+    return [list(row) for row in zip(*columns)]
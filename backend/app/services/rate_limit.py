@@ -0,0 +1,109 @@
+"""
+Per-device ingestion limits.
+
+Each (patient, device, metric type) has a token bucket: `rate` readings a
+second on average with bursts of up to `burst`. Buckets are kept in GCRA
+form, as the single time at which the bucket will be full again, so a
+bucket is one float in an LRU dict. A bucket that has refilled is the
+same as no bucket at all, so full buckets are evicted from the idle end
+as traffic passes, and the dict only holds devices that sent recently.
+
+Over its limit, a device's batch is thinned to what fits, evenly spaced
+so the trend survives; a request left with nothing to store is refused
+with the time until the next reading would be accepted.
+"""
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.telemetry import INGEST_RATE_LIMITED, RATE_LIMIT_BUCKETS
+
+
+class TokenBuckets:
+    def __init__(self, max_buckets: int):
+        self.max_buckets = max_buckets
+        # key -> when the bucket is full again (monotonic seconds)
+        self._full_at: "OrderedDict[Hashable, float]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._full_at)
+
+    def take(self, key: Hashable, wanted: int, rate: float, burst: int,
+             now: float) -> Tuple[int, float]:
+        """
+        Takes up to `wanted` tokens; returns how many were granted and, when
+        none were, the seconds until one will be.
+        """
+        interval = 1.0 / rate
+        full_at = max(self._full_at.get(key, now), now)
+        available = int((burst * interval - (full_at - now)) / interval + 1e-9)
+        granted = max(min(wanted, available), 0)
+        if granted:
+            self._full_at[key] = full_at + granted * interval
+            self._full_at.move_to_end(key)
+        self._evict(now)
+        retry_after = 0.0 if granted else full_at - burst * interval + interval - now
+        return granted, retry_after
+
+    def _evict(self, now: float):
+        buckets = self._full_at
+        while buckets:
+            key, full_at = next(iter(buckets.items()))
+            if full_at > now and len(buckets) <= self.max_buckets:
+                break
+            # Refilled (or past the cap, where forgetting a bucket only errs lenient)
+            del buckets[key]
+
+    def clear(self):
+        self._full_at.clear()
+
+
+def limit_for(metric_type: str) -> Tuple[float, int]:
+    rate, burst = settings.INGEST_RATE_LIMITS.get(
+        metric_type, (settings.INGEST_RATE_PER_SECOND, settings.INGEST_RATE_BURST))
+    return float(rate), int(burst)
+
+
+def _spread(count: int, keep: int) -> List[int]:
+    """`keep` evenly spaced positions out of `count`."""
+    return [int((j + 0.5) * count / keep) for j in range(keep)]
+
+
+buckets = TokenBuckets(settings.INGEST_RATE_MAX_BUCKETS)
+RATE_LIMIT_BUCKETS.set_function(lambda: len(buckets))
+
+
+def admit(patient_id: int, device: str, readings: Sequence[tuple],
+          source: str) -> Tuple[List[tuple], float]:
+    """
+    The readings (metric_type first) that fit the device's limits, in their
+    original order, and when nothing fits, the seconds to wait before retrying.
+    """
+    if not settings.INGEST_RATE_LIMIT_ENABLED or not readings:
+        return list(readings), 0.0
+    now = time.monotonic()
+    positions: Dict[str, List[int]] = {}
+    for i, reading in enumerate(readings):
+        positions.setdefault(reading[0], []).append(i)
+
+    kept: List[int] = []
+    retry_after = None
+    for metric_type, indexes in positions.items():
+        rate, burst = limit_for(metric_type)
+        granted, wait = buckets.take((patient_id, device, metric_type), len(indexes),
+                                     rate, burst, now)
+        if granted == len(indexes):
+            kept.extend(indexes)
+            continue
+        if granted:
+            kept.extend(indexes[p] for p in _spread(len(indexes), granted))
+        else:
+            retry_after = wait if retry_after is None else min(retry_after, wait)
+
+    dropped = len(readings) - len(kept)
+    if not dropped:
+        return list(readings), 0.0
+    INGEST_RATE_LIMITED.labels(source, "sampled" if kept else "rejected").inc(dropped)
+    kept.sort()
+    return [readings[i] for i in kept], 0.0 if kept else retry_after
@@ -0,0 +1,65 @@
+"""
+Process-level caches for small reference tables that every signup or login
+page asks for but that almost never change.
+"""
+import asyncio
+import json
+import time
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.db import session as db_session
+from app.models.hospital import Hospital
+from app.schemas.hospital import Hospital as HospitalSchema
+from app.services.events import REFERENCE_UPDATED, event_bus
+
+
+class ReferenceCache:
+    """
+    Holds the JSON-encoded result of `loader` for `ttl` seconds. `generation`
+    only moves when a reload returns something different, so ETags built
+    from it survive expiry as long as the data itself is unchanged.
+    """
+
+    def __init__(self, loader: Callable[[], Awaitable[Any]], ttl: Callable[[], float]):
+        self._loader = loader
+        self._ttl = ttl
+        self._value: Any = None
+        self._body = b""
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self.generation = 0
+
+    def _fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self._ttl()
+
+    async def get(self) -> Tuple[bytes, int]:
+        if not self._fresh():
+            async with self._lock:
+                if not self._fresh():
+                    value = await self._loader()
+                    if value != self._value:
+                        self._value = value
+                        self._body = json.dumps(value, separators=(",", ":")).encode()
+                        self.generation += 1
+                    self._loaded_at = time.monotonic()
+        return self._body, self.generation
+
+    def invalidate(self):
+        self._loaded_at = None
+
+
+async def _load_hospitals() -> list:
+    async with db_session.SessionLocal() as db:
+        result = await db.execute(select(Hospital).order_by(Hospital.id))
+        return [HospitalSchema.model_validate(h).model_dump() for h in result.scalars()]
+
+
+hospitals_cache = ReferenceCache(
+    _load_hospitals, lambda: settings.REFERENCE_CACHE_TTL_SECONDS)
+
+event_bus.subscribe(REFERENCE_UPDATED, lambda e: hospitals_cache.invalidate()
+                    if e.data.get("table") == "hospitals" else None)
+event_bus.on_reconnect(hospitals_cache.invalidate)
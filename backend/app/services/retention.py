@@ -0,0 +1,293 @@
+import asyncio
+import logging
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete, select, text, tuple_
+
+from app.core.config import settings
+from app.db import session as db_session
+from app.db.partitioning import (
+    MetricPartition, drop_partition, list_partitions, metric_tables, partition_table,
+)
+from app.db.utils import as_utc
+from app.models.health_metric_rollup import HealthMetricRollup
+from app.services.events import METRICS_PURGED, event_bus
+from app.services.scheduler import BackgroundRun
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RetentionProgress:
+    dry_run: bool
+    started_at: str = field(
+        default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    finished_at: Optional[str] = None
+    state: str = "running"  # running, done, failed
+    current_metric_type: Optional[str] = None
+    batches: int = 0
+    rows_expired: int = 0
+    rows_deleted: int = 0
+    buckets_written: int = 0
+    partitions_expired: list = field(default_factory=list)
+    by_metric_type: Dict[str, int] = field(default_factory=dict)
+    maintenance: Optional[str] = None
+    error: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def retention_days(metric_type: str) -> int:
+    return settings.METRIC_RETENTION_DAYS.get(
+        metric_type, settings.METRIC_RETENTION_DEFAULT_DAYS)
+
+
+def bucket_start(ts: datetime, bucket_seconds: int) -> datetime:
+    epoch = int(as_utc(ts).timestamp())
+    return datetime.fromtimestamp(epoch - epoch % bucket_seconds, tz=timezone.utc)
+
+
+def rollup_rows(rows, bucket_seconds: int) -> Dict[Tuple[int, datetime], list]:
+    """Aggregates (patient_id, value, timestamp) rows into [count, sum, min, max] per bucket."""
+    buckets: Dict[Tuple[int, datetime], list] = {}
+    for patient_id, value, ts in rows:
+        key = (patient_id, bucket_start(ts, bucket_seconds))
+        agg = buckets.get(key)
+        if agg is None:
+            buckets[key] = [1, value, value, value]
+        else:
+            agg[0] += 1
+            agg[1] += value
+            agg[2] = min(agg[2], value)
+            agg[3] = max(agg[3], value)
+    return buckets
+
+
+async def _merge_rollups(db, metric_type: str, bucket_seconds: int,
+                         buckets: Dict[Tuple[int, datetime], list]) -> int:
+    """Adds `buckets` into health_metric_rollups, merging with buckets already stored."""
+    existing = await db.execute(
+        select(HealthMetricRollup)
+        .where(HealthMetricRollup.metric_type == metric_type)
+        .where(HealthMetricRollup.bucket_seconds == bucket_seconds)
+        .where(tuple_(HealthMetricRollup.patient_id, HealthMetricRollup.bucket_start)
+               .in_(list(buckets)))
+    )
+    for rollup in existing.scalars():
+        agg = buckets.pop((rollup.patient_id, as_utc(rollup.bucket_start)), None)
+        if agg is None:
+            continue
+        rollup.count += agg[0]
+        rollup.value_sum += agg[1]
+        rollup.value_min = min(rollup.value_min, agg[2])
+        rollup.value_max = max(rollup.value_max, agg[3])
+
+    db.add_all([
+        HealthMetricRollup(
+            patient_id=patient_id, metric_type=metric_type,
+            bucket_start=start, bucket_seconds=bucket_seconds,
+            count=agg[0], value_sum=agg[1], value_min=agg[2], value_max=agg[3])
+        for (patient_id, start), agg in buckets.items()
+    ])
+    return len(buckets)
+
+
+async def add_to_rollups(db, metric_type: str, rows) -> int:
+    """
+    Folds (patient_id, value, timestamp) readings into their historical
+    buckets, for late readings whose raw rows would already have expired.
+    """
+    bucket_seconds = settings.METRIC_ROLLUP_BUCKET_SECONDS
+    return await _merge_rollups(db, metric_type, bucket_seconds,
+                                rollup_rows(rows, bucket_seconds))
+
+
+def _count_expired(progress: RetentionProgress, metric_type: str, n: int):
+    progress.batches += 1
+    progress.rows_expired += n
+    progress.by_metric_type[metric_type] = progress.by_metric_type.get(metric_type, 0) + n
+
+
+async def _expire_metric_type(metric_type: str, cutoff: datetime, progress: RetentionProgress,
+                              batch_size: int, bucket_seconds: int):
+    """
+    Rolls up and deletes raw rows older than `cutoff` in id-ordered batches.
+    Each batch is its own short transaction so row locks are never held for
+    long and ingestion can interleave between batches.
+    """
+    async with db_session.SessionLocal() as db:
+        tables = await metric_tables(db, None, cutoff)
+    for table in tables:
+        last_id = 0
+        while True:
+            async with db_session.SessionLocal() as db:
+                result = await db.execute(
+                    select(table.c.id, table.c.patient_id, table.c.value, table.c.timestamp)
+                    .where(table.c.metric_type == metric_type)
+                    .where(table.c.timestamp < cutoff)
+                    .where(table.c.id > last_id)
+                    .order_by(table.c.id)
+                    .limit(batch_size)
+                )
+                rows = result.all()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                _count_expired(progress, metric_type, len(rows))
+
+                if not progress.dry_run:
+                    buckets = rollup_rows(
+                        [(r.patient_id, r.value, r.timestamp) for r in rows
+                         if r.value is not None], bucket_seconds)
+                    progress.buckets_written += await _merge_rollups(
+                        db, metric_type, bucket_seconds, buckets)
+                    await db.execute(
+                        delete(table).where(table.c.id.in_([r.id for r in rows])))
+                    await db.commit()
+                    progress.rows_deleted += len(rows)
+            # Let request handlers run between batches.
+            await asyncio.sleep(0)
+
+
+async def _expire_partition(partition: MetricPartition, progress: RetentionProgress,
+                            batch_size: int, bucket_seconds: int):
+    """
+    Rolls up a month that is past every metric type's retention and drops it
+    whole. Like _expire_metric_type, each batch merges its rollups and deletes
+    its rows in one short transaction, so a failed run never rolls a row up
+    twice; the emptied table is dropped once the last batch has committed.
+    """
+    progress.partitions_expired.append(partition.name)
+    if progress.dry_run:
+        # The per-type scan that follows still counts these rows.
+        return
+    table = partition_table(partition.name)
+    while True:
+        async with db_session.SessionLocal() as db:
+            result = await db.execute(
+                select(table.c.id, table.c.patient_id, table.c.metric_type,
+                       table.c.value, table.c.timestamp)
+                .order_by(table.c.id)
+                .limit(batch_size)
+            )
+            rows = result.all()
+            if not rows:
+                break
+            by_type: Dict[str, list] = {}
+            for r in rows:
+                by_type.setdefault(r.metric_type, []).append(r)
+            for metric_type, type_rows in by_type.items():
+                if metric_type is None:
+                    continue
+                _count_expired(progress, metric_type, len(type_rows))
+                buckets = rollup_rows(
+                    [(r.patient_id, r.value, r.timestamp) for r in type_rows
+                     if r.value is not None], bucket_seconds)
+                if buckets:
+                    progress.buckets_written += await _merge_rollups(
+                        db, metric_type, bucket_seconds, buckets)
+            await db.execute(delete(table).where(table.c.id.in_([r.id for r in rows])))
+            await db.commit()
+            progress.rows_deleted += len(rows)
+        # Let request handlers run between batches.
+        await asyncio.sleep(0)
+
+    async with db_session.SessionLocal() as db:
+        await drop_partition(db, partition)
+        await db.commit()
+
+
+async def _maintain_storage(progress: RetentionProgress):
+    """VACUUM/ANALYZE after a purge, in the form each backend wants."""
+    engine = db_session.engine
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        if engine.dialect.name == "postgresql":
+            # Plain VACUUM marks dead tuples reusable without an exclusive lock.
+            await conn.execute(text("VACUUM (ANALYZE) health_metrics"))
+            await conn.execute(text("ANALYZE health_metric_rollups"))
+            progress.maintenance = "vacuum_analyze"
+        elif engine.dialect.name == "sqlite":
+            await conn.execute(text("ANALYZE"))
+            # VACUUM rewrites the whole file under an exclusive lock, so only
+            # do it once a large share of the file is free pages.
+            free = (await conn.execute(text("PRAGMA freelist_count"))).scalar()
+            total = (await conn.execute(text("PRAGMA page_count"))).scalar()
+            if total and free / total > 0.25:
+                await conn.execute(text("VACUUM"))
+                progress.maintenance = "analyze_vacuum"
+            else:
+                progress.maintenance = "analyze"
+
+
+async def run_retention(dry_run: bool = False, now: Optional[datetime] = None,
+                        batch_size: Optional[int] = None,
+                        progress: Optional[RetentionProgress] = None) -> RetentionProgress:
+    """
+    Applies the per-metric-type retention policy to raw health_metrics.
+    With `dry_run` nothing is written; the progress report shows what would expire.
+    """
+    now = now or datetime.now(timezone.utc)
+    batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+    bucket_seconds = settings.METRIC_ROLLUP_BUCKET_SECONDS
+    progress = progress or RetentionProgress(dry_run=dry_run)
+
+    try:
+        all_days = [settings.METRIC_RETENTION_DEFAULT_DAYS, *settings.METRIC_RETENTION_DAYS.values()]
+        oldest_cutoff = now - timedelta(days=min(all_days))
+        # Whole months past the longest retention are dropped, not deleted row by row.
+        drop_before = now - timedelta(days=max(all_days))
+        async with db_session.SessionLocal() as db:
+            partitions = [p for p in await list_partitions(db) if p.upper <= drop_before]
+        for partition in partitions:
+            await _expire_partition(partition, progress, batch_size, bucket_seconds)
+
+        metric_types = set()
+        async with db_session.SessionLocal() as db:
+            for table in await metric_tables(db, None, oldest_cutoff):
+                result = await db.execute(
+                    select(table.c.metric_type).distinct()
+                    .where(table.c.timestamp < oldest_cutoff)
+                )
+                metric_types.update(t for t in result.scalars() if t is not None)
+        metric_types = sorted(metric_types)
+
+        for metric_type in metric_types:
+            progress.current_metric_type = metric_type
+            cutoff = now - timedelta(days=retention_days(metric_type))
+            await _expire_metric_type(metric_type, cutoff, progress,
+                                      batch_size, bucket_seconds)
+        progress.current_metric_type = None
+
+        if progress.rows_deleted:
+            event_bus.publish(METRICS_PURGED, {"rows": progress.rows_deleted})
+            await _maintain_storage(progress)
+        progress.state = "done"
+    except Exception as e:
+        progress.state = "failed"
+        progress.error = str(e)
+        logger.exception("Retention run failed")
+    finally:
+        progress.finished_at = datetime.now(timezone.utc).isoformat()
+        logger.info("Retention run %s: %s", progress.state, progress.as_dict())
+    return progress
+
+
+_runs = BackgroundRun("retention")
+
+
+def retention_status() -> Optional[dict]:
+    return _runs.status()
+
+
+def start_retention_run(dry_run: bool = False) -> RetentionProgress:
+    """Starts a run in the background; raises RuntimeError if one is already running."""
+    return _runs.start(RetentionProgress(dry_run=dry_run),
+                       lambda progress: run_retention(dry_run=dry_run, progress=progress))
+
+
+async def scheduled_retention():
+    await _runs.run_scheduled(start_retention_run)
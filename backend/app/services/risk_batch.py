@@ -0,0 +1,292 @@
+"""
+Scheduled batch risk scoring.
+
+Walks every patient in id order, CHUNK patients at a time: one query for
+the chunk's latest vitals, one vectorised scoring pass, one query for the
+previous assessments and one bulk insert. A risk_assessments row is only
+written when a condition's score moved by more than
+RISK_SCORE_CHANGE_THRESHOLD or its risk level changed, so the table is a
+compact risk history dashboards can read instead of scoring on every view.
+
+Progress is checkpointed in job_checkpoints after every chunk. A run that
+dies part way is resumed from the checkpoint by the next run; re-scoring a
+chunk is harmless because unchanged scores write nothing. The checkpoint
+row doubles as a lease: every worker schedules the job, and only the one
+whose conditional write marks the row "running" goes ahead.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.db import session as db_session
+from app.models.job_checkpoint import JobCheckpoint
+from app.models.patient import Patient
+from app.models.risk_assessment import RiskAssessment
+from app.services.events import ALERT_RAISED, publish_on_commit
+from app.services.features import feature_store
+from app.services.model_runtime import model_runtime
+from app.services.scheduler import BackgroundRun
+from app.services.vitals import latest_values_for_patients
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = "risk_assessment"
+# Same stand-in profile the prediction endpoints use until patients carry one
+DEFAULT_PROFILE = {"age": 52, "bmi": 28.4}
+LEVEL_RANK = {"Low": 0, "Moderate": 1, "High": 2, "Critical": 3}
+
+
+@dataclass
+class RiskRunProgress:
+    started_at: str = field(
+        default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    finished_at: Optional[str] = None
+    state: str = "running"  # running, done, failed, skipped
+    resumed_from: int = 0
+    position: int = 0  # highest patient id whose chunk is committed
+    chunks: int = 0
+    patients_scored: int = 0
+    patients_without_vitals: int = 0
+    assessments_written: int = 0
+    assessments_unchanged: int = 0
+    alerts_raised: int = 0
+    slowest_chunk_seconds: float = 0.0
+    elapsed_seconds: float = 0.0
+    patients_per_second: float = 0.0
+    error: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def assessment_changed(previous: Optional[Tuple[float, str]], score: float, level: str,
+                       threshold: float) -> bool:
+    if previous is None:
+        return True
+    prev_score, prev_level = previous
+    return prev_level != level or abs(score - prev_score) > threshold
+
+
+async def _previous_assessments(db, patient_ids: List[int]) -> Dict[Tuple[int, str], Tuple[float, str]]:
+    """Latest (score, level) per (patient, condition), in one query."""
+    rank = func.row_number().over(
+        partition_by=(RiskAssessment.patient_id, RiskAssessment.disease_type),
+        order_by=(RiskAssessment.assessment_date.desc(), RiskAssessment.id.desc()),
+    ).label("rank")
+    ranked = (
+        select(RiskAssessment.patient_id, RiskAssessment.disease_type,
+               RiskAssessment.risk_score, RiskAssessment.risk_level, rank)
+        .where(RiskAssessment.patient_id.in_(patient_ids))
+        .subquery()
+    )
+    result = await db.execute(
+        select(ranked.c.patient_id, ranked.c.disease_type,
+               ranked.c.risk_score, ranked.c.risk_level)
+        .where(ranked.c.rank == 1)
+    )
+    return {(r.patient_id, r.disease_type): (r.risk_score, r.risk_level) for r in result}
+
+
+async def _assess_chunk(patient_ids: List[int], now: datetime, threshold: float,
+                        progress: RiskRunProgress):
+    started = time.perf_counter()
+    async with db_session.SessionLocal() as db:
+        vitals = await latest_values_for_patients(db, patient_ids, now)
+        scored = [pid for pid in patient_ids if pid in vitals]
+        # Trend features only for patients already in memory; warming every
+        # patient from storage would cost a query each.
+        results = await model_runtime.score_many(
+            [vitals[pid] for pid in scored], DEFAULT_PROFILE,
+            [feature_store.features(pid, now) for pid in scored])
+        previous = await _previous_assessments(db, scored) if scored else {}
+
+        rows = []
+        unchanged = 0
+        for patient_id, conditions in zip(scored, results):
+            for condition, score, level in conditions:
+                prev = previous.get((patient_id, condition))
+                if not assessment_changed(prev, score, level, threshold):
+                    unchanged += 1
+                    continue
+                rows.append({
+                    "patient_id": patient_id, "disease_type": condition,
+                    "risk_score": score, "risk_level": level,
+                    "assessment_date": now, "notes": "batch",
+                })
+                # Escalations into High/Critical go to live dashboards; a
+                # patient's first assessment is a baseline, not an alert.
+                if prev is not None and LEVEL_RANK.get(level, 0) >= LEVEL_RANK["High"] \
+                        and LEVEL_RANK.get(level, 0) > LEVEL_RANK.get(prev[1], 0):
+                    publish_on_commit(db, ALERT_RAISED, {
+                        "patient_id": patient_id, "condition": condition,
+                        "risk_level": level, "previous_level": prev[1], "score": score,
+                    })
+                    progress.alerts_raised += 1
+        if rows:
+            await db.execute(insert(RiskAssessment), rows)
+        await db.commit()
+
+    progress.chunks += 1
+    progress.patients_scored += len(scored)
+    progress.patients_without_vitals += len(patient_ids) - len(scored)
+    progress.assessments_written += len(rows)
+    progress.assessments_unchanged += unchanged
+    progress.slowest_chunk_seconds = max(
+        progress.slowest_chunk_seconds, round(time.perf_counter() - started, 3))
+
+
+async def _save_checkpoint(state: str, progress: RiskRunProgress, now: datetime):
+    async with db_session.SessionLocal() as db:
+        await db.merge(JobCheckpoint(
+            name=CHECKPOINT_NAME, state=state, position=progress.position,
+            started_at=datetime.fromisoformat(progress.started_at),
+            updated_at=now, details=progress.as_dict()))
+        await db.commit()
+
+
+async def _claim_lease(progress: RiskRunProgress, now: datetime, resume: bool) -> bool:
+    """
+    Marks the checkpoint "running" unless another worker's run holds it and
+    checkpointed within RISK_JOB_LEASE_SECONDS. The check and the write are
+    one statement, so of two workers starting together only one gets it.
+    """
+    cutoff = now - timedelta(seconds=settings.RISK_JOB_LEASE_SECONDS)
+    async with db_session.SessionLocal() as db:
+        checkpoint = await db.get(JobCheckpoint, CHECKPOINT_NAME)
+        position = progress.position
+        if resume and checkpoint is not None and checkpoint.state in ("running", "failed"):
+            position = checkpoint.position
+        values = {
+            "state": "running", "position": position,
+            "started_at": datetime.fromisoformat(progress.started_at), "updated_at": now,
+            "details": dict(progress.as_dict(), resumed_from=position, position=position),
+        }
+        if checkpoint is None:
+            db.add(JobCheckpoint(name=CHECKPOINT_NAME, **values))
+            try:
+                await db.commit()
+            except IntegrityError:
+                return False  # another worker created it first
+        else:
+            result = await db.execute(
+                update(JobCheckpoint)
+                .where(JobCheckpoint.name == CHECKPOINT_NAME)
+                .where(or_(JobCheckpoint.state != "running",
+                           JobCheckpoint.updated_at.is_(None),
+                           JobCheckpoint.updated_at < cutoff))
+                .values(**values)
+                .execution_options(synchronize_session=False))
+            await db.commit()
+            if result.rowcount != 1:
+                return False
+    progress.resumed_from = progress.position = position
+    return True
+
+
+def _concurrency() -> int:
+    # SQLite has a single writer; concurrent chunk transactions would only
+    # trade places on the lock (or fail with "database is locked").
+    if db_session.engine.dialect.name == "sqlite":
+        return 1
+    return max(1, settings.RISK_JOB_CONCURRENCY)
+
+
+async def run_risk_assessment(now: Optional[datetime] = None, resume: bool = True,
+                              chunk_size: Optional[int] = None,
+                              progress: Optional[RiskRunProgress] = None) -> RiskRunProgress:
+    """
+    Scores every patient and records changed risks. With `resume`, a run
+    that was interrupted continues after the last committed chunk.
+    """
+    now = now or datetime.now(timezone.utc)
+    chunk_size = chunk_size or settings.RISK_JOB_CHUNK_SIZE
+    threshold = settings.RISK_SCORE_CHANGE_THRESHOLD
+    progress = progress or RiskRunProgress()
+    clock = time.perf_counter()
+    in_flight: Deque[Tuple[int, asyncio.Task]] = deque()
+
+    async def advance(wait: bool):
+        # The checkpoint only moves past chunks that committed, in order, so
+        # a resumed run never skips a chunk that was still in flight.
+        moved = False
+        while in_flight and (wait or in_flight[0][1].done()):
+            last_id, task = in_flight[0]
+            await task
+            in_flight.popleft()
+            progress.position = last_id
+            moved = True
+        if moved:
+            await _save_checkpoint("running", progress, datetime.now(timezone.utc))
+
+    try:
+        if not await _claim_lease(progress, now, resume):
+            # Another worker's run is still checkpointing.
+            progress.state = "skipped"
+            return progress
+
+        slots = asyncio.Semaphore(_concurrency())
+        cursor = progress.position
+        while True:
+            async with db_session.SessionLocal() as db:
+                result = await db.execute(
+                    select(Patient.id).where(Patient.id > cursor)
+                    .order_by(Patient.id).limit(chunk_size))
+                patient_ids = list(result.scalars())
+            if not patient_ids:
+                break
+            cursor = patient_ids[-1]
+
+            await slots.acquire()
+            task = asyncio.create_task(_assess_chunk(patient_ids, now, threshold, progress))
+            task.add_done_callback(lambda _: slots.release())
+            in_flight.append((cursor, task))
+            await advance(wait=False)
+        await advance(wait=True)
+
+        progress.state = "done"
+        await _save_checkpoint("done", progress, datetime.now(timezone.utc))
+    except Exception as e:
+        for _, task in in_flight:
+            task.cancel()
+        await asyncio.gather(*(task for _, task in in_flight), return_exceptions=True)
+        progress.state = "failed"
+        progress.error = str(e)
+        logger.exception("Risk assessment run failed")
+        try:
+            await _save_checkpoint("failed", progress, datetime.now(timezone.utc))
+        except Exception:
+            logger.exception("Could not record the failed risk assessment run")
+    finally:
+        progress.elapsed_seconds = round(time.perf_counter() - clock, 3)
+        if progress.elapsed_seconds:
+            progress.patients_per_second = round(
+                (progress.patients_scored + progress.patients_without_vitals)
+                / progress.elapsed_seconds, 1)
+        progress.finished_at = datetime.now(timezone.utc).isoformat()
+        logger.info("Risk assessment run %s: %s", progress.state, progress.as_dict())
+    return progress
+
+
+_runs = BackgroundRun("risk assessment")
+
+
+def risk_run_status() -> Optional[dict]:
+    return _runs.status()
+
+
+def start_risk_run(resume: bool = True) -> RiskRunProgress:
+    """Starts a run in the background; raises RuntimeError if one is already running."""
+    return _runs.start(RiskRunProgress(),
+                       lambda progress: run_risk_assessment(resume=resume, progress=progress))
+
+
+async def scheduled_risk_assessment():
+    await _runs.run_scheduled(start_risk_run)
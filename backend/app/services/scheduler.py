@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PeriodicJob:
+    name: str
+    interval_seconds: float
+    func: Callable[[], Awaitable]
+    initial_delay: float = 0.0
+
+
+class Scheduler:
+    """
+    Runs registered coroutines on a fixed interval inside the API process.
+    A slow run delays the next one instead of overlapping with it.
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, PeriodicJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def add_job(self, name: str, interval_seconds: float, func: Callable[[], Awaitable],
+                initial_delay: Optional[float] = None):
+        if interval_seconds <= 0:
+            return
+        self._jobs[name] = PeriodicJob(
+            name, interval_seconds, func,
+            interval_seconds if initial_delay is None else initial_delay)
+
+    def start(self):
+        for name, job in self._jobs.items():
+            if name not in self._tasks or self._tasks[name].done():
+                self._tasks[name] = asyncio.create_task(self._loop(job))
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _loop(self, job: PeriodicJob):
+        await asyncio.sleep(job.initial_delay)
+        while True:
+            try:
+                await job.func()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Scheduled job %s failed", job.name)
+            await asyncio.sleep(job.interval_seconds)
+
+
+class BackgroundRun:
+    """
+    The latest run of a long job started from an admin endpoint or the
+    scheduler, and its progress object for the status endpoint. At most one
+    run is in flight per process.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.task: Optional[asyncio.Task] = None
+        self.progress: Optional[Any] = None
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def status(self) -> Optional[dict]:
+        return self.progress.as_dict() if self.progress else None
+
+    def start(self, progress, run: Callable[[Any], Awaitable]):
+        """Starts `run(progress)` in the background; raises RuntimeError if a run is in progress."""
+        if self.running:
+            raise RuntimeError(f"A {self.name} run is already in progress")
+        self.progress = progress
+        self.task = asyncio.create_task(run(progress))
+        return progress
+
+    async def run_scheduled(self, start: Callable[[], Any]):
+        """Scheduler entry point: calls `start` and waits for the run it started."""
+        try:
+            start()
+        except RuntimeError:
+            logger.info("Skipping scheduled %s; previous run still in progress", self.name)
+            return
+        await self.task
+
+
+scheduler = Scheduler()
@@ -0,0 +1,78 @@
+"""
+Version stamps behind the conditional GETs on read endpoints.
+
+Counters per (kind, key) are bumped by events on the bus, so a write in any
+worker moves them everywhere. ETags combine a counter with BOOT_EPOCH so a
+restarted process, whose counters start again at zero, never matches a tag
+handed out before the restart. Metric tags also carry the id of the newest
+stored reading, which moves even if an event was lost.
+
+Last-Modified for metrics is the newest reading's time, or when this
+process last saw readings arrive for the patient if that is later: a late
+reading with an old device timestamp changes the history without moving
+its newest time.
+"""
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from app.services.events import (
+    METRIC_INGESTED, METRICS_PURGED, PROFILE_UPDATED, event_bus,
+)
+from app.services.vitals import metric_history
+
+BOOT_EPOCH = f"{time.time_ns():x}"
+
+METRICS = "metrics"          # per patient: readings ingested
+METRIC_PURGE = "metric_purge"  # global: retention removed raw readings
+PROFILE = "profile"          # per patient: profile fields
+DOCTOR = "doctor"            # per doctor: profile fields shown to their patients
+BUS = "bus"                  # global: bus reconnects, after which events may be missing
+
+_counters: Dict[Tuple[str, int], int] = {}
+_ingested_at: Dict[int, datetime] = {}
+
+
+def version(kind: str, key: int = 0) -> int:
+    return _counters.get((kind, key), 0)
+
+
+def bump(kind: str, key: int = 0) -> int:
+    value = _counters.get((kind, key), 0) + 1
+    _counters[(kind, key)] = value
+    return value
+
+
+def weak_etag(*parts) -> str:
+    return 'W/"' + "-".join([BOOT_EPOCH, str(version(BUS)), *(str(p) for p in parts)]) + '"'
+
+
+async def metrics_validators(db, patient_id: int, *extra) -> Tuple[str, Optional[datetime]]:
+    """
+    ETag and Last-Modified for anything derived from a patient's readings;
+    `extra` parts cover other inputs, such as the models behind a prediction.
+    """
+    newest = await metric_history(db, patient_id, limit=1)
+    latest_id = newest[0].id if newest else 0
+    latest_ts = newest[0].timestamp if newest else None
+    if latest_ts is not None and latest_ts.tzinfo is None:
+        latest_ts = latest_ts.replace(tzinfo=timezone.utc)
+    ingested_at = _ingested_at.get(patient_id)
+    if ingested_at is not None and (latest_ts is None or ingested_at > latest_ts):
+        latest_ts = ingested_at
+    etag = weak_etag(METRICS, version(METRICS, patient_id), version(METRIC_PURGE), latest_id,
+                     *extra)
+    return etag, latest_ts
+
+
+def _on_ingested(event):
+    patient_id = event.data["patient_id"]
+    bump(METRICS, patient_id)
+    _ingested_at[patient_id] = datetime.now(timezone.utc)
+
+
+event_bus.subscribe(METRIC_INGESTED, _on_ingested)
+event_bus.subscribe(METRICS_PURGED, lambda e: bump(METRIC_PURGE))
+event_bus.subscribe(PROFILE_UPDATED, lambda e: bump(
+    DOCTOR if e.data["kind"] == "doctor" else PROFILE, e.data["id"]))
+event_bus.on_reconnect(lambda: bump(BUS))
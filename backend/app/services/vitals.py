@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import func, select
+
+from app.core.config import settings
+from app.db.partitioning import metrics_source
+
+# Readings scanned to find the latest value of each metric type
+LATEST_WINDOW_ROWS = 20
+
+
+async def metric_history(db, patient_id: int, start: Optional[datetime] = None,
+                         end: Optional[datetime] = None,
+                         limit: Optional[int] = None) -> List:
+    """A patient's readings, newest first, pruned to the partitions overlapping [start, end)."""
+    src = await metrics_source(
+        db, start, end, where=lambda t: [t.c.patient_id == patient_id])
+    query = select(src).order_by(src.c.timestamp.desc(), src.c.id.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    result = await db.execute(query)
+    return result.all()
+
+
+async def latest_metric_values(db, patient_id: int,
+                               now: Optional[datetime] = None) -> Dict[str, float]:
+    """
+    Latest value per metric type from the patient's most recent readings.
+    Looks at the recent partitions first and only falls back to the full
+    history for patients with no recent data.
+    """
+    now = now or datetime.now(timezone.utc)
+    since = now - timedelta(days=settings.LATEST_METRICS_LOOKBACK_DAYS)
+    rows = await metric_history(db, patient_id, start=since, limit=LATEST_WINDOW_ROWS)
+    if not rows:
+        rows = await metric_history(db, patient_id, limit=LATEST_WINDOW_ROWS)
+
+    latest = {}
+    for m in rows:
+        if m.metric_type not in latest and m.value is not None:
+            latest[m.metric_type] = float(m.value)
+    return latest
+
+
+async def _latest_per_type(db, patient_ids: Sequence[int], start: Optional[datetime]):
+    src = await metrics_source(
+        db, start, None,
+        where=lambda t: [t.c.patient_id.in_(patient_ids), t.c.value.is_not(None)])
+    rank = func.row_number().over(
+        partition_by=(src.c.patient_id, src.c.metric_type),
+        order_by=(src.c.timestamp.desc(), src.c.id.desc()),
+    ).label("rank")
+    ranked = select(src.c.patient_id, src.c.metric_type, src.c.value, rank).subquery()
+    result = await db.execute(
+        select(ranked.c.patient_id, ranked.c.metric_type, ranked.c.value)
+        .where(ranked.c.rank == 1)
+    )
+    return result.all()
+
+
+async def latest_values_for_patients(db, patient_ids: Sequence[int],
+                                     now: Optional[datetime] = None) -> Dict[int, Dict[str, float]]:
+    """
+    Latest value per metric type for many patients in one query, for batch
+    jobs. Like latest_metric_values, only patients with no recent readings
+    cost a second pass over the full history.
+    """
+    now = now or datetime.now(timezone.utc)
+    since = now - timedelta(days=settings.LATEST_METRICS_LOOKBACK_DAYS)
+    latest: Dict[int, Dict[str, float]] = {}
+    if not patient_ids:
+        return latest
+    for patient_id, metric_type, value in await _latest_per_type(db, patient_ids, since):
+        latest.setdefault(patient_id, {})[metric_type] = float(value)
+    missing = [pid for pid in patient_ids if pid not in latest]
+    if missing:
+        for patient_id, metric_type, value in await _latest_per_type(db, missing, None):
+            latest.setdefault(patient_id, {})[metric_type] = float(value)
+    return latest
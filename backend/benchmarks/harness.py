@@ -0,0 +1,352 @@
+"""
+Benchmark harness for the prediction engine and the hot API routes.
+
+Seeds a throwaway SQLite database, drives routes through an in-process ASGI
+client and compares timings against a stored baseline. The database URL has
+to be in the environment before `app` is imported, so go through
+`python -m benchmarks.run`, which sets it up.
+"""
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from sqlalchemy import insert
+
+SIZES = {
+    "small": {"patients": 50, "metrics_per_patient": 40},
+    "medium": {"patients": 500, "metrics_per_patient": 200},
+    "large": {"patients": 5000, "metrics_per_patient": 400},
+}
+
+METRIC_RANGES = {
+    "heart_rate": (55, 120),
+    "glucose": (70, 220),
+    "spo2": (88, 100),
+    "respiratory_rate": (10, 26),
+    "blood_pressure_sys": (100, 175),
+    "blood_pressure_dia": (60, 110),
+    "stress_level": (5, 90),
+    "temperature": (97.0, 101.5),
+}
+
+
+@dataclass
+class Dataset:
+    patients: int
+    metrics_per_patient: int
+    doctor_id: int = 1
+    patient_ids: List[int] = field(default_factory=list)
+    clinical_ids: List[str] = field(default_factory=list)
+    doctor_token: str = ""
+    patient_tokens: List[str] = field(default_factory=list)
+
+    def describe(self) -> dict:
+        return {"patients": self.patients, "metrics_per_patient": self.metrics_per_patient}
+
+
+def random_metrics(rng: random.Random) -> Dict[str, float]:
+    return {k: round(rng.uniform(lo, hi), 1) for k, (lo, hi) in METRIC_RANGES.items()}
+
+
+async def seed(patients: int, metrics_per_patient: int, rng: random.Random) -> Dataset:
+    """Creates a fresh schema and bulk-loads one hospital, one doctor and the patient panel."""
+    from app.core.security import create_access_token
+    from app.db import session as db_session
+    from app.db.base import Base
+    from app.models.doctor import Doctor
+    from app.models.health_metrics import HealthMetric
+    from app.models.hospital import Hospital
+    from app.models.patient import Patient
+
+    async with db_session.engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+        await conn.execute(insert(Hospital), [{
+            "id": 1, "name": "Bench General", "address": "1 Bench Rd",
+            "contact_number": "555-0100", "hosp_code": "BNCH",
+        }])
+        await conn.execute(insert(Doctor), [{
+            "id": 1, "full_name": "Dr. Bench", "email": "bench@doctor.com",
+            "hashed_password": "!", "qualification": "MD", "role": "General",
+            "hospital_id": 1, "emergency_contact": "555-0101",
+            "consultation_timings": "09:00 AM - 05:00 PM",
+        }])
+
+        dataset = Dataset(patients, metrics_per_patient)
+        patient_rows = []
+        for i in range(1, patients + 1):
+            clinical_id = f"BNCH-PID-{1000 + i}"
+            dataset.patient_ids.append(i)
+            dataset.clinical_ids.append(clinical_id)
+            patient_rows.append({
+                "id": i, "patient_id": clinical_id,
+                "full_name": f"Bench Patient {i:05d}",
+                "dob": "!", "gender": rng.choice(["Male", "Female"]),
+                "contact_number": "555-0000", "address": "Bench St",
+                "emergency_contact": "555-0001", "doctor_id": 1, "hospital_id": 1,
+            })
+        await conn.execute(insert(Patient), patient_rows)
+
+        now = datetime.now(timezone.utc)
+        metric_types = list(METRIC_RANGES)
+        batch = []
+        for pid in dataset.patient_ids:
+            for j in range(metrics_per_patient):
+                metric_type = metric_types[j % len(metric_types)]
+                lo, hi = METRIC_RANGES[metric_type]
+                batch.append({
+                    "patient_id": pid, "metric_type": metric_type,
+                    "value": round(rng.uniform(lo, hi), 1),
+                    "timestamp": now - timedelta(minutes=5 * (metrics_per_patient - j)),
+                })
+                if len(batch) >= 10000:
+                    await conn.execute(insert(HealthMetric), batch)
+                    batch = []
+        if batch:
+            await conn.execute(insert(HealthMetric), batch)
+
+    dataset.doctor_token = create_access_token({"sub": "1", "role": "doctor"})
+    dataset.patient_tokens = [
+        create_access_token({"sub": str(pid), "role": "patient"})
+        for pid in dataset.patient_ids[:20]
+    ]
+    return dataset
+
+
+def summarise(samples: List[float], items_per_op: int = 1) -> dict:
+    samples = sorted(samples)
+    n = len(samples)
+    mean = statistics.fmean(samples)
+    return {
+        "iterations": n,
+        "items_per_op": items_per_op,
+        "mean_us": round(mean * 1e6, 1),
+        "p50_us": round(samples[n // 2] * 1e6, 1),
+        "p95_us": round(samples[min(n - 1, int(n * 0.95))] * 1e6, 1),
+        "ops_per_s": round(1 / mean, 1) if mean else 0.0,
+        "items_per_s": round(items_per_op / mean, 1) if mean else 0.0,
+    }
+
+
+async def time_async(fn: Callable[[], Awaitable], iterations: int, warmup: int,
+                     items_per_op: int = 1) -> dict:
+    for _ in range(warmup):
+        await fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - start)
+    return summarise(samples, items_per_op)
+
+
+def time_sync(fn: Callable[[], object], iterations: int, warmup: int,
+              items_per_op: int = 1) -> dict:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarise(samples, items_per_op)
+
+
+def _expect_ok(response: httpx.Response, status: int = 200):
+    if response.status_code != status:
+        raise RuntimeError(
+            f"{response.request.method} {response.request.url} -> "
+            f"{response.status_code}: {response.text[:200]}")
+
+
+async def run_benchmarks(dataset: Dataset, iterations: int, warmup: int,
+                         only: Optional[List[str]] = None,
+                         seed_value: int = 1234) -> Dict[str, dict]:
+    from app.api.v1.predictions import _get_patient_latest_metrics
+    from app.db import session as db_session
+    from app.services.features import FeatureStore
+    from app.services.prediction import predict_multi_disease_risk, score_risks_batch
+    from main import app
+
+    rng = random.Random(seed_value)
+    profile = {"age": 52, "bmi": 28.4}
+    batch_inputs = [random_metrics(rng) for _ in range(100)]
+    doctor_headers = {"Authorization": f"Bearer {dataset.doctor_token}"}
+
+    def patient_headers():
+        return {"Authorization": f"Bearer {rng.choice(dataset.patient_tokens)}"}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def get(url, headers):
+            _expect_ok(await client.get(url, headers=headers))
+
+        async def post(url, payload, headers):
+            _expect_ok(await client.post(url, json=payload, headers=headers))
+
+        etags = {}
+
+        async def revalidate(url, headers):
+            # Conditional GET with the ETag from a first plain GET of `url`
+            if url not in etags:
+                first = await client.get(url, headers=headers)
+                _expect_ok(first)
+                etags[url] = first.headers["etag"]
+            _expect_ok(await client.get(
+                url, headers={**headers, "If-None-Match": etags[url]}), 304)
+
+        async def latest_vitals():
+            async with db_session.SessionLocal() as db:
+                await _get_patient_latest_metrics(db, rng.choice(dataset.patient_ids))
+
+        def predict_batch():
+            for metrics in batch_inputs:
+                predict_multi_disease_risk(metrics, profile)
+
+        runtime = []
+
+        async def model_runtime_with_models():
+            # Trained once, on first use, so other benchmarks don't pay for it
+            if not runtime:
+                from app.services.model_runtime import ModelRuntime
+                from train_models import train
+
+                model_dir = tempfile.mkdtemp(prefix="biosense-models-")
+                with contextlib.redirect_stdout(io.StringIO()):
+                    train(model_dir, "bench", samples=1500, seed=seed_value)
+                runtime.append(ModelRuntime(model_dir))
+                await runtime[0].reload()
+            return runtime[0]
+
+        async def model_requests(concurrency):
+            models = await model_runtime_with_models()
+            await asyncio.gather(*(
+                models.predict(rng.choice(batch_inputs), profile) for _ in range(concurrency)))
+
+        features = FeatureStore(window=120, max_patients=1000)
+        stream_clock = [datetime.now(timezone.utc)]
+
+        def feature_updates():
+            # One second of a 100-reading/s heart-rate stream for one patient
+            readings = []
+            for _ in range(100):
+                stream_clock[0] += timedelta(milliseconds=10)
+                readings.append(("heart_rate", rng.uniform(55, 95), stream_clock[0]))
+            features.add_readings(1, readings)
+
+        # Read-path benchmarks first; ingestion grows the tables.
+        benches = [
+            ("predict_scalar", "sync", lambda: predict_multi_disease_risk(
+                batch_inputs[0], profile), 1),
+            ("predict_batch_100", "sync", predict_batch, len(batch_inputs)),
+            ("score_batch_100", "sync", lambda: score_risks_batch(
+                batch_inputs, profile), len(batch_inputs)),
+            ("feature_update_100", "sync", feature_updates, 100),
+            # Per-request latency through the model runtime alone, and with
+            # 32 concurrent callers sharing micro-batches.
+            ("model_predict_1", "async", lambda: model_requests(1), 1),
+            ("model_predict_32", "async", lambda: model_requests(32), 32),
+            ("latest_vitals", "async", latest_vitals, 1),
+            ("patient_search", "async", lambda: get(
+                f"/api/v1/doctors/patients?search=Patient%20{rng.randint(1, dataset.patients):05d}",
+                doctor_headers), 1),
+            ("predictions_all", "async", lambda: get(
+                f"/api/v1/predictions/patient/{rng.choice(dataset.clinical_ids)}/all",
+                doctor_headers), 1),
+            ("predictions_diabetes", "async", lambda: get(
+                f"/api/v1/predictions/patient/{rng.choice(dataset.clinical_ids)}/diabetes",
+                doctor_headers), 1),
+            ("patient_predictions", "async", lambda: get(
+                "/api/v1/patients/predictions", patient_headers()), 1),
+            ("predictions_all_304", "async", lambda: revalidate(
+                f"/api/v1/predictions/patient/{rng.choice(dataset.clinical_ids)}/all",
+                doctor_headers), 1),
+            ("hospitals_304", "async", lambda: revalidate(
+                "/api/v1/hospitals/", {}), 1),
+            ("ingest_single", "async", lambda: post(
+                "/api/v1/patients/metrics",
+                {"metric_type": "heart_rate", "value": rng.uniform(55, 120)},
+                patient_headers()), 1),
+            ("ingest_bulk_100", "async", lambda: post(
+                "/api/v1/patients/metrics/bulk",
+                [{"metric_type": "glucose", "value": rng.uniform(70, 220)}
+                 for _ in range(100)],
+                patient_headers()), 100),
+        ]
+
+        results = {}
+        for name, kind, fn, items in benches:
+            if only and name not in only:
+                continue
+            # get_db prints on every request; keep the report readable.
+            with contextlib.redirect_stdout(io.StringIO()):
+                if kind == "sync":
+                    results[name] = time_sync(fn, iterations, warmup, items)
+                else:
+                    results[name] = await time_async(fn, iterations, warmup, items)
+            print(f"{name:<24} p50 {results[name]['p50_us']:>10.1f}us  "
+                  f"p95 {results[name]['p95_us']:>10.1f}us  "
+                  f"{results[name]['items_per_s']:>10.1f} items/s")
+    return results
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sqlite": sqlite3.sqlite_version,
+    }
+
+
+def load_baseline(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path: str, dataset: Dataset, results: Dict[str, dict]):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "environment": environment(),
+            "dataset": dataset.describe(),
+            "results": results,
+        }, f, indent=2, sort_keys=True)
+
+
+def compare(results: Dict[str, dict], baseline: dict, threshold: float) -> List[dict]:
+    """
+    Benchmarks whose median got slower than `baseline` by more than
+    `threshold` (0.25 = 25%). Medians are compared because they are far less
+    noisy than means on a shared machine.
+    """
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base or not base["p50_us"]:
+            continue
+        ratio = current["p50_us"] / base["p50_us"]
+        if ratio > 1 + threshold:
+            regressions.append({
+                "name": name,
+                "baseline_p50_us": base["p50_us"],
+                "current_p50_us": current["p50_us"],
+                "ratio": round(ratio, 2),
+            })
+    return regressions
@@ -0,0 +1,106 @@
+"""
+Run the benchmark suite against a throwaway SQLite database.
+
+    python -m benchmarks.run --size small
+    python -m benchmarks.run --size medium --save-baseline
+    python -m benchmarks.run --size medium --threshold 0.2   # exit 1 on regression
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def parse_args(argv=None):
+    from benchmarks.harness import SIZES
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", choices=sorted(SIZES), default="small")
+    parser.add_argument("--patients", type=int,
+                        help="Override the number of seeded patients")
+    parser.add_argument("--metrics-per-patient", type=int,
+                        help="Override the readings seeded per patient")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--only", help="Comma-separated benchmark names")
+    parser.add_argument("--db", choices=("file", "memory"), default="file",
+                        help="Temp-file or shared in-memory SQLite")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Store this run as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Relative p50 slowdown that counts as a regression")
+    parser.add_argument("--json", help="Also write this run's results to a file")
+    parser.add_argument("--seed", type=int, default=1234)
+    return parser.parse_args(argv)
+
+
+def _configure_database(kind: str) -> str:
+    if kind == "memory":
+        url = "sqlite+aiosqlite:///file:biosense_bench?mode=memory&cache=shared&uri=true"
+    else:
+        path = os.path.join(tempfile.mkdtemp(prefix="biosense-bench-"), "bench.db")
+        url = f"sqlite+aiosqlite:///{path}"
+    # Must happen before anything imports app.core.config
+    os.environ["SQLALCHEMY_DATABASE_URI"] = url
+    os.environ["SQLALCHEMY_ECHO"] = "false"
+    return url
+
+
+async def _main(args) -> int:
+    from benchmarks import harness
+
+    preset = harness.SIZES[args.size]
+    patients = args.patients or preset["patients"]
+    per_patient = args.metrics_per_patient or preset["metrics_per_patient"]
+    only = [n.strip() for n in args.only.split(",")] if args.only else None
+
+    from app.db import session as db_session
+    # Keeps a shared in-memory database alive for the whole run.
+    async with db_session.engine.connect():
+        print(f"Seeding {patients} patients x {per_patient} readings...")
+        dataset = await harness.seed(patients, per_patient, random.Random(args.seed))
+        results = await harness.run_benchmarks(
+            dataset, args.iterations, args.warmup, only, args.seed)
+    await db_session.engine.dispose()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"dataset": dataset.describe(), "results": results}, f, indent=2)
+
+    if args.save_baseline:
+        harness.save_baseline(args.baseline, dataset, results)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    baseline = harness.load_baseline(args.baseline)
+    if baseline is None:
+        print("No baseline found; run with --save-baseline to create one.")
+        return 0
+    if baseline.get("dataset") != dataset.describe():
+        print(f"Warning: baseline was recorded with dataset {baseline.get('dataset')}, "
+              f"this run used {dataset.describe()}")
+
+    regressions = harness.compare(results, baseline, args.threshold)
+    for r in regressions:
+        print(f"REGRESSION {r['name']}: p50 {r['baseline_p50_us']}us -> "
+              f"{r['current_p50_us']}us ({r['ratio']}x)")
+    if regressions:
+        return 1
+    print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    _configure_database(args.db)
+    return asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
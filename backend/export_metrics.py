@@ -0,0 +1,126 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from datetime import datetime
+
+import app.db.base  # noqa: F401  registers every model with the mapper
+from app.services.export import (
+    DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, ExportError, ExportScope, iter_export,
+)
+
+# Typically run as:
+#   python export_metrics.py --doctor-id 3 --format parquet -o panel.parquet
+#   python export_metrics.py --patient-id 7 --format csv --compression gzip \
+#       -o vitals.csv.gz --resume
+
+
+def _checkpoint_path(output: str) -> str:
+    return output + ".offset"
+
+
+def _load_checkpoint(output: str):
+    path = _checkpoint_path(output)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_checkpoint(output: str, last_id: int, size: int):
+    path = _checkpoint_path(output)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"last_id": last_id, "bytes": size}, f)
+    os.replace(tmp, path)
+
+
+async def run_export(args) -> int:
+    scope = ExportScope(
+        patient_id=args.patient_id,
+        doctor_id=args.doctor_id,
+        hospital_id=args.hospital_id,
+    )
+
+    # A Parquet file is unreadable until its footer is written, so only the
+    # row-oriented formats checkpoint. Parquet can still be split manually
+    # with --after-id into separate files.
+    resumable = args.format != "parquet"
+    if args.resume and not resumable:
+        raise ExportError(
+            "Parquet exports can't be resumed; use --after-id with a new output file")
+
+    after_id = args.after_id
+    mode = "wb"
+    checkpoint = _load_checkpoint(args.output) if args.resume else None
+    if checkpoint:
+        # Drop any partially written chunk past the last checkpoint.
+        with open(args.output, "r+b") as f:
+            f.truncate(checkpoint["bytes"])
+        mode = "ab"
+        after_id = checkpoint["last_id"]
+        print(f"Resuming after id {after_id}")
+
+    with open(args.output, mode) as out:
+        async for data, last_id in iter_export(
+            scope,
+            fmt=args.format,
+            compression=args.compression,
+            start=args.start,
+            end=args.end,
+            after_id=after_id,
+            chunk_size=args.chunk_size,
+            include_header=mode == "wb",
+        ):
+            out.write(data)
+            if last_id is None:
+                continue
+            out.flush()
+            os.fsync(out.fileno())
+            if resumable:
+                _save_checkpoint(args.output, last_id, out.tell())
+            print(f"Exported up to id {last_id}", file=sys.stderr)
+
+    if os.path.exists(_checkpoint_path(args.output)):
+        os.remove(_checkpoint_path(args.output))
+    print(f"Export written to {args.output}")
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Stream health_metrics to CSV, NDJSON or Parquet.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--patient-id", type=int)
+    target.add_argument("--doctor-id", type=int,
+                        help="Export every patient on this doctor's panel")
+    target.add_argument("--hospital-id", type=int)
+    parser.add_argument("--start", type=datetime.fromisoformat,
+                        help="Inclusive ISO-8601 lower bound")
+    parser.add_argument("--end", type=datetime.fromisoformat,
+                        help="Exclusive ISO-8601 upper bound")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--compression", default=None,
+                        help="none|gzip for csv/ndjson; none|snappy|gzip|zstd for parquet")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--after-id", type=int,
+                        help="Only export rows with an id greater than this")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue from the <output>.offset checkpoint")
+    parser.add_argument("-o", "--output", required=True)
+    args = parser.parse_args(argv)
+    if args.compression is None:
+        args.compression = "snappy" if args.format == "parquet" else "none"
+    return args
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(asyncio.run(run_export(parse_args())))
+    except ExportError as e:
+        print(f"Error: {e}")
+        sys.exit(2)
+    except KeyboardInterrupt:
+        print("\nExport interrupted; re-run with --resume to continue.")
+        sys.exit(130)
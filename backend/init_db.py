@@ -5,10 +5,15 @@ from app.models.patient import Patient
 from app.models.doctor import Doctor
 from app.models.hospital import Hospital
 from app.models.appointment import Appointment
+from app.models.metric_type import MetricType
 from app.models.health_metrics import HealthMetric
+from app.models.health_metric_rollup import HealthMetricRollup
 from app.models.risk_assessment import RiskAssessment
 from app.models.health_alert import HealthAlert
+from app.models.anomaly_state import AnomalyDetectorState
 from app.models.health_baseline import HealthBaseline
+from app.models.job_checkpoint import JobCheckpoint
+from app.models.ingestion_key import IngestionKey
 
 
 async def init_db():
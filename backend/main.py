@@ -1,8 +1,67 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.v1.api import api_router
+from app.api.deps import token_is_admin
+from app.core.config import settings
+from app.core.profiling import ProfilingMiddleware, profile_store
+from app.core.telemetry import TelemetryMiddleware, monitor_event_loop, observe_pool, registry
+from app.db import session as db_session
+from app.db.partitioning import maintain_partitions
+from app.db.routing import replicas
+from app.services.anomaly import checkpoint_detectors, restore_detectors
+from app.services.events import event_bus
+from app.services.idempotency import purge_ingestion_keys
+from app.services.metric_types import sync_metric_types
+from app.services.model_runtime import model_runtime
+from app.services.retention import scheduled_retention
+from app.services.risk_batch import scheduled_risk_assessment
+from app.services.scheduler import scheduler
 
-app = FastAPI(title="BioSense Live API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    scheduler.add_job("retention", settings.RETENTION_INTERVAL_SECONDS,
+                      scheduled_retention)
+    scheduler.add_job("partitions", settings.PARTITION_MAINTENANCE_INTERVAL_SECONDS,
+                      maintain_partitions, initial_delay=0)
+    scheduler.add_job("risk_assessment", settings.RISK_JOB_INTERVAL_SECONDS,
+                      scheduled_risk_assessment)
+    scheduler.add_job("models", settings.MODEL_RELOAD_INTERVAL_SECONDS, model_runtime.reload)
+    scheduler.add_job("ingestion_keys", settings.IDEMPOTENCY_PURGE_INTERVAL_SECONDS,
+                      purge_ingestion_keys)
+    if len(replicas):
+        scheduler.add_job("replica_lag", settings.REPLICA_LAG_CHECK_INTERVAL_SECONDS,
+                          replicas.check_lag, initial_delay=0)
+    scheduler.add_job("anomaly_checkpoint", settings.ANOMALY_CHECKPOINT_INTERVAL_SECONDS,
+                      checkpoint_detectors)
+    # Until loaded, only the built-in metric types are accepted.
+    metric_types = asyncio.create_task(sync_metric_types())
+    preload = None
+    if settings.MODEL_PRELOAD:
+        # Serving starts straight away; early predictions wait for the load.
+        preload = asyncio.create_task(model_runtime.ensure_loaded())
+    restore = None
+    if settings.ANOMALY_DETECTION_ENABLED:
+        # Detector state from the last checkpoint, so alerts don't wait out a warm-up
+        restore = asyncio.create_task(restore_detectors())
+    loop_monitor = None
+    if settings.TELEMETRY_LOOP_LAG_INTERVAL_SECONDS > 0:
+        loop_monitor = asyncio.create_task(
+            monitor_event_loop(settings.TELEMETRY_LOOP_LAG_INTERVAL_SECONDS))
+    await event_bus.start()
+    scheduler.start()
+    yield
+    for task in (metric_types, preload, restore, loop_monitor):
+        if task is not None:
+            task.cancel()
+    await scheduler.stop()
+    await event_bus.stop()
+    await replicas.dispose()
+
+
+app = FastAPI(title="BioSense Live API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -11,6 +70,13 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware, authorize=token_is_admin, store=profile_store,
+                       sample_rate=settings.PROFILE_SAMPLE_RATE,
+                       interval_ms=settings.PROFILE_INTERVAL_MS)
+# Added last so it is outermost and times everything, CORS included.
+app.add_middleware(TelemetryMiddleware)
+observe_pool(lambda: db_session.engine.pool)
 
 app.include_router(api_router, prefix="/api/v1")
 
@@ -18,3 +84,8 @@ app.include_router(api_router, prefix="/api/v1")
 @app.get("/")
 async def root():
     return {"message": "Welcome to BioSense Live API"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,102 @@
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import DateTime, inspect, select, text, update
+
+import app.db.base  # noqa: F401  registers every model with the mapper
+from app.core.config import settings
+from app.db import session as db_session
+from app.models.appointment import NO_OVERLAP_CONSTRAINT, NO_OVERLAP_DDL, Appointment
+
+# Brings an appointments table created before start_at/end_at existed up to
+# date: adds the columns and their index, fills them in from the date and
+# time strings, and on Postgres adds the no-overlap constraint.
+
+
+async def _add_columns(conn):
+    columns = await conn.run_sync(
+        lambda c: {col["name"] for col in inspect(c).get_columns("appointments")})
+    column_type = DateTime(timezone=True).compile(dialect=conn.dialect)
+    for name in ("start_at", "end_at"):
+        if name not in columns:
+            await conn.execute(text(f"ALTER TABLE appointments ADD COLUMN {name} {column_type}"))
+            print(f"Added appointments.{name}")
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_appointments_doctor_start "
+        "ON appointments (doctor_id, start_at)"))
+
+
+def _parse(day: str, at: str):
+    try:
+        return datetime.strptime(f"{day} {at}", "%Y-%m-%d %H:%M").replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return None
+
+
+async def _backfill(batch_size: int, minutes: int):
+    filled = unparsed = 0
+    last_id = 0
+    length = timedelta(minutes=minutes)
+    while True:
+        async with db_session.SessionLocal() as db:
+            rows = (await db.execute(
+                select(Appointment.id, Appointment.date, Appointment.time)
+                .where(Appointment.start_at.is_(None))
+                .where(Appointment.id > last_id)
+                .order_by(Appointment.id)
+                .limit(batch_size)
+            )).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            updates = []
+            for row in rows:
+                start = _parse(row.date, row.time)
+                if start is None:
+                    unparsed += 1
+                else:
+                    updates.append({"id": row.id, "start_at": start, "end_at": start + length})
+            if updates:
+                await db.execute(update(Appointment), updates)
+                await db.commit()
+            filled += len(updates)
+    print(f"Filled in {filled} appointments; {unparsed} have unparseable date/time "
+          "and are ignored by overlap checks")
+
+
+async def _add_constraint(conn):
+    exists = (await conn.execute(
+        text("SELECT 1 FROM pg_constraint WHERE conname = :name"),
+        {"name": NO_OVERLAP_CONSTRAINT})).scalar()
+    if exists:
+        return
+    await conn.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+    await conn.execute(text(NO_OVERLAP_DDL))
+    print(f"Added {NO_OVERLAP_CONSTRAINT}")
+
+
+async def main(batch_size: int, minutes: int):
+    async with db_session.engine.begin() as conn:
+        await _add_columns(conn)
+    await _backfill(batch_size, minutes)
+    if db_session.engine.dialect.name == "postgresql":
+        try:
+            async with db_session.engine.begin() as conn:
+                await _add_constraint(conn)
+        except Exception as e:
+            # Existing double bookings have to be resolved by hand first.
+            print(f"Could not add {NO_OVERLAP_CONSTRAINT}: {e}")
+            return 1
+    await db_session.engine.dispose()
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Add and backfill typed start/end times on appointments.")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--minutes", type=int, default=settings.APPOINTMENT_DEFAULT_MINUTES,
+                        help="Length given to existing appointments")
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(main(args.batch_size, args.minutes)))
@@ -0,0 +1,174 @@
+import argparse
+import asyncio
+
+from sqlalchemy import column, inspect, select, table, text, update
+
+import app.db.base  # noqa: F401  registers every model with the mapper
+from app.db import session as db_session
+from app.db.partitioning import list_partitions
+from app.models.metric_type import MAX_METRIC_TYPE_LENGTH, MetricType, metric_types
+from app.services.metric_types import register_metric_types
+
+# Moves health_metrics from metric type names to metric_types codes while
+# the API keeps running:
+#
+#   1. creates metric_types (seeded with the built-in types) and adds the
+#      nullable metric_type_id column and its index;
+#   2. fills in metric_type_id in batches in id order, one commit per batch,
+#      adding types missing from the dictionary as they turn up;
+#   3. with --drop-names, once every named row has its code, drops the old
+#      metric_type column and its index.
+#
+# Run it (without --drop-names) before deploying the code that reads codes,
+# then again afterwards for rows the old code wrote in between, then with
+# --drop-names. On Postgres the index is built CONCURRENTLY partition by
+# partition; the backfill leaves dead tuples for VACUUM (or the retention job)
+# to clear. On SQLite every routed month table is migrated the same way.
+
+OLD_COLUMN = "metric_type"
+NEW_COLUMN = "metric_type_id"
+
+
+async def _tables(conn) -> list:
+    names = ["health_metrics"]
+    if conn.dialect.name == "sqlite":
+        names += [p.name for p in await list_partitions(conn)]
+    return names
+
+
+async def _columns(conn, name: str) -> set:
+    return await conn.run_sync(
+        lambda c: {col["name"] for col in inspect(c).get_columns(name)})
+
+
+async def _pg_children(conn) -> list:
+    result = await conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = 'health_metrics' ORDER BY c.relname"))
+    return list(result.scalars())
+
+
+async def _add_column(conn, name: str):
+    if NEW_COLUMN not in await _columns(conn, name):
+        await conn.execute(text(
+            f"ALTER TABLE {name} ADD COLUMN {NEW_COLUMN} SMALLINT REFERENCES metric_types (id)"))
+        print(f"Added {name}.{NEW_COLUMN}")
+
+
+async def _add_index():
+    engine = db_session.engine
+    if engine.dialect.name != "postgresql":
+        async with engine.begin() as conn:
+            for name in await _tables(conn):
+                await conn.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{name}_{NEW_COLUMN} ON {name} ({NEW_COLUMN})"))
+        return
+    # An index on a partitioned table can't be built CONCURRENTLY, so the
+    # parent's index is created empty and each partition's attached to it.
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        children = await _pg_children(conn)
+        parent = f"ix_health_metrics_{NEW_COLUMN}"
+        if not children:
+            await conn.execute(text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {parent} ON health_metrics ({NEW_COLUMN})"))
+            return
+        await conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {parent} ON ONLY health_metrics ({NEW_COLUMN})"))
+        for child in children:
+            index = f"ix_{child}_{NEW_COLUMN}"
+            await conn.execute(text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index} ON {child} ({NEW_COLUMN})"))
+            await conn.execute(text(f"ALTER INDEX {parent} ATTACH PARTITION {index}"))
+        print(f"Indexed {NEW_COLUMN} on {len(children)} partitions")
+
+
+async def _backfill(name: str, batch_size: int, start_id: int, pause: float) -> int:
+    t = table(name, column("id"), column(OLD_COLUMN), column(NEW_COLUMN))
+    filled = skipped = 0
+    last_id = start_id
+    while True:
+        async with db_session.SessionLocal() as db:
+            rows = (await db.execute(
+                select(t.c.id, t.c.metric_type)
+                .where(t.c.id > last_id)
+                .where(t.c.metric_type_id.is_(None))
+                .where(t.c.metric_type.is_not(None))
+                .order_by(t.c.id)
+                .limit(batch_size)
+            )).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            names = {r.metric_type for r in rows if 0 < len(r.metric_type) <= MAX_METRIC_TYPE_LENGTH}
+            added = await register_metric_types(db, names)
+            if added:
+                print(f"Added metric types {', '.join(added)}")
+            by_code = {}
+            for row in rows:
+                if row.metric_type in names:
+                    code = added.get(row.metric_type) or metric_types.code(row.metric_type)
+                    by_code.setdefault(code, []).append(row.id)
+                else:
+                    skipped += 1
+            for code, ids in by_code.items():
+                await db.execute(update(t).where(t.c.id.in_(ids)).values(metric_type_id=code))
+            await db.commit()
+        filled += len(rows)
+        print(f"{name}: filled in {filled} rows, up to id {last_id}")
+        if pause:
+            await asyncio.sleep(pause)
+    if skipped:
+        print(f"{name}: {skipped} rows have names too long for metric_types and stay uncoded")
+    return filled
+
+
+async def _drop_names(conn, name: str) -> bool:
+    t = table(name, column(OLD_COLUMN), column(NEW_COLUMN))
+    uncoded = (await conn.execute(
+        select(t.c.metric_type).where(t.c.metric_type_id.is_(None))
+        .where(t.c.metric_type.is_not(None)).limit(1))).first()
+    if uncoded is not None:
+        print(f"{name} still has rows without a code; run the backfill again first")
+        return False
+    await conn.execute(text(f"DROP INDEX IF EXISTS ix_{name}_{OLD_COLUMN}"))
+    await conn.execute(text(f"ALTER TABLE {name} DROP COLUMN {OLD_COLUMN}"))
+    print(f"Dropped {name}.{OLD_COLUMN}")
+    return True
+
+
+async def main(batch_size: int, start_id: int, pause: float, drop_names: bool) -> int:
+    async with db_session.engine.begin() as conn:
+        await conn.run_sync(lambda c: MetricType.__table__.create(c, checkfirst=True))
+        names = await _tables(conn)
+        for name in names:
+            await _add_column(conn, name)
+        legacy = [n for n in names if OLD_COLUMN in await _columns(conn, n)]
+    await _add_index()
+    for name in legacy:
+        await _backfill(name, batch_size, start_id, pause)
+    status = 0
+    if drop_names:
+        for name in legacy:
+            async with db_session.engine.begin() as conn:
+                if not await _drop_names(conn, name):
+                    status = 1
+    await db_session.engine.dispose()
+    return status
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Store health_metrics metric types as metric_types codes.")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--start-id", type=int, default=0,
+                        help="Resume the backfill after this id")
+    parser.add_argument("--pause", type=float, default=0.0,
+                        help="Seconds to wait between batches")
+    parser.add_argument("--drop-names", action="store_true",
+                        help="Drop the old metric_type column once every row has a code")
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(main(args.batch_size, args.start_id, args.pause,
+                                      args.drop_names)))
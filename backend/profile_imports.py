@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+from app.core.config import settings
+
+# Reports where `import main` spends its time, in a fresh interpreter:
+#   python profile_imports.py [--top 25] [--json out.json] [--budget-ms 2500]
+#
+# Heavy optional packages should not show up here at all; they are
+# imported on first use. HEAVY_MODULES lists the ones checked.
+
+HEAVY_MODULES = ("numpy", "pandas", "sklearn", "scipy", "joblib", "pyarrow",
+                 "cryptography.fernet", "msgpack")
+
+# What `import main` costs with none of the app's own code, for comparison.
+BASELINE_IMPORT = "fastapi, sqlalchemy.ext.asyncio, pydantic_settings"
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+
+def measure_import(module: str = "main", importtime: bool = False) -> Tuple[dict, str]:
+    """Imports `module` in a new interpreter; returns its timing report and -X importtime output."""
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", _PROBE.format(module=module)]
+    result = subprocess.run(command, capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def parse_importtime(output: str) -> List[dict]:
+    """Rows of `-X importtime` output: module, nesting depth, self and cumulative ms."""
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append({
+            "module": name.strip(),
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+        })
+    return rows
+
+
+def by_package(rows: List[dict]) -> Dict[str, float]:
+    """Self time summed per top-level package, slowest first."""
+    totals: Dict[str, float] = {}
+    for row in rows:
+        package = row["module"].split(".")[0]
+        totals[package] = totals.get(package, 0.0) + row["self_ms"]
+    return dict(sorted(totals.items(), key=lambda kv: -kv[1]))
+
+
+def main(top: int, json_path: str, budget_ms: int) -> int:
+    timing, _ = measure_import()
+    _, importtime = measure_import(importtime=True)
+    rows = parse_importtime(importtime)
+    heavy = [m for m in HEAVY_MODULES if m in timing["modules"]]
+    wall_ms = round(timing["seconds"] * 1000, 1)
+
+    baseline_ms = round(measure_import(BASELINE_IMPORT)[0]["seconds"] * 1000, 1)
+
+    print(f"import main: {wall_ms} ms (budget {budget_ms} ms), "
+          f"{len(timing['modules'])} modules loaded")
+    print(f"import {BASELINE_IMPORT}: {baseline_ms} ms")
+    print("\nSlowest packages (self time, under -X importtime):")
+    for package, ms in list(by_package(rows).items())[:top]:
+        print(f"  {ms:>9.1f} ms  {package}")
+    print("\nSlowest app modules (cumulative):")
+    app_rows = sorted((r for r in rows if r["module"].split(".")[0] in ("app", "main")),
+                      key=lambda r: -r["cumulative_ms"])
+    for row in app_rows[:top]:
+        print(f"  {row['cumulative_ms']:>9.1f} ms  {row['module']}")
+    if heavy:
+        print(f"\nHeavy modules imported at startup: {', '.join(heavy)}")
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump({"wall_ms": wall_ms, "budget_ms": budget_ms, "baseline_ms": baseline_ms,
+                       "heavy": heavy,
+                       "packages": by_package(rows), "modules": rows}, f, indent=2)
+    return 0 if wall_ms <= budget_ms and not heavy else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile the API's import time per module.")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--json", help="Also write the full report to a file")
+    parser.add_argument("--budget-ms", type=int, default=settings.STARTUP_IMPORT_BUDGET_MS)
+    args = parser.parse_args()
+    raise SystemExit(main(args.top, args.json, args.budget_ms))
@@ -0,0 +1,30 @@
+import argparse
+import asyncio
+import json
+
+import app.db.base  # noqa: F401  registers every model with the mapper
+from app.services.retention import RetentionProgress, run_retention
+
+# Typically run from cron as: python run_retention.py [--dry-run]
+
+
+async def main(dry_run: bool, batch_size: int):
+    progress = RetentionProgress(dry_run=dry_run)
+    task = asyncio.create_task(
+        run_retention(dry_run=dry_run, batch_size=batch_size, progress=progress))
+    while not task.done():
+        await asyncio.sleep(2)
+        print(f"[{progress.current_metric_type or '-'}] batches {progress.batches} "
+              f"expired {progress.rows_expired} deleted {progress.rows_deleted}")
+    print(json.dumps((await task).as_dict(), indent=2))
+    return 0 if progress.state == "done" else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Roll up and purge raw health_metrics past their retention.")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Report what would expire without changing anything")
+    parser.add_argument("--batch-size", type=int, default=None)
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(main(args.dry_run, args.batch_size)))
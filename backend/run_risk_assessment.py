@@ -0,0 +1,30 @@
+import argparse
+import asyncio
+import json
+
+import app.db.base  # noqa: F401  registers every model with the mapper
+from app.services.risk_batch import RiskRunProgress, run_risk_assessment
+
+# Typically run from cron as: python run_risk_assessment.py [--restart]
+
+
+async def main(resume: bool, chunk_size: int):
+    progress = RiskRunProgress()
+    task = asyncio.create_task(
+        run_risk_assessment(resume=resume, chunk_size=chunk_size, progress=progress))
+    while not task.done():
+        await asyncio.sleep(2)
+        print(f"[patient {progress.position}] chunks {progress.chunks} "
+              f"scored {progress.patients_scored} written {progress.assessments_written}")
+    print(json.dumps((await task).as_dict(), indent=2))
+    return 0 if progress.state in ("done", "skipped") else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Score every patient and record changed risks in risk_assessments.")
+    parser.add_argument("--restart", action="store_true",
+                        help="Start from the first patient instead of the last checkpoint")
+    parser.add_argument("--chunk-size", type=int, default=None)
+    args = parser.parse_args()
+    raise SystemExit(asyncio.run(main(not args.restart, args.chunk_size)))
@@ -1,12 +1,35 @@
+import argparse
 import asyncio
+import json
+import math
 import random
 import httpx
 import sys
+import time
+from collections import deque
 from datetime import datetime
+from urllib.parse import quote
 
 # Configure base URL - Use 127.0.0.1 instead of localhost for better compatibility
 BASE_URL = "http://127.0.0.1:8000/api/v1"
 
+METRIC_RANGES = {
+    "heart_rate": (60, 100),
+    "glucose": (80, 140),
+    "temperature": (97.5, 99.5),
+    "blood_pressure_sys": (110, 130),
+    "blood_pressure_dia": (70, 90),
+    "stress_level": (10, 50),
+    "spo2": (95, 100),
+}
+
+
+def random_reading(metric_type: str = None) -> dict:
+    if metric_type is None:
+        metric_type = random.choice(list(METRIC_RANGES))
+    low, high = METRIC_RANGES[metric_type]
+    return {"metric_type": metric_type, "value": round(random.uniform(low, high), 1)}
+
 
 async def simulate_data(patient_label: str, token: str):
     print(f"Starting simulation for Patient: {patient_label}...")
@@ -31,33 +54,13 @@ async def simulate_data(patient_label: str, token: str):
             print(f"Initial connection check failed: {e}")
 
         while True:
-            # Generate random metrics
-            metrics = [
-                {"type": "heart_rate", "value": round(
-                    random.uniform(60, 100), 1)},
-                {"type": "glucose", "value": round(
-                    random.uniform(80, 140), 1)},
-                {"type": "temperature", "value": round(
-                    random.uniform(97.5, 99.5), 1)},
-                {"type": "blood_pressure_sys", "value": round(
-                    random.uniform(110, 130), 1)},
-                {"type": "blood_pressure_dia", "value": round(
-                    random.uniform(70, 90), 1)},
-                {"type": "stress_level", "value": round(
-                    random.uniform(10, 50), 1)},
-                {"type": "spo2", "value": round(
-                    random.uniform(95, 100), 1)},
-            ]
-
             # Select 1-2 random metrics to send per interval
-            to_send = random.sample(metrics, k=random.randint(1, 2))
+            to_send = random.sample(
+                list(METRIC_RANGES), k=random.randint(1, 2))
 
-            for m in to_send:
+            for metric_type in to_send:
+                payload = random_reading(metric_type)
                 try:
-                    payload = {
-                        "metric_type": m["type"],
-                        "value": m["value"]
-                    }
                     response = await client.post(
                         f"{BASE_URL}/patients/metrics",
                         json=payload,
@@ -65,13 +68,13 @@ async def simulate_data(patient_label: str, token: str):
                     )
                     if response.status_code == 200:
                         print(
-                            f"[{datetime.now().strftime('%H:%M:%S')}] Sent {m['type']}: {m['value']}")
+                            f"[{datetime.now().strftime('%H:%M:%S')}] Sent {metric_type}: {payload['value']}")
                     elif response.status_code == 401:
                         print("Error: Unauthorized. Token might be expired.")
                         return
                     else:
                         print(
-                            f"Failed to send {m['type']}: {response.status_code} - {response.text}")
+                            f"Failed to send {metric_type}: {response.status_code} - {response.text}")
                 except httpx.HTTPError as e:
                     print(f"HTTP error sending data: {e}")
                 except Exception as e:
@@ -79,10 +82,484 @@ async def simulate_data(patient_label: str, token: str):
 
             await asyncio.sleep(5)  # Send data every 5 seconds
 
+
+# ---------------------------------------------------------------------------
+# Load generation
+# ---------------------------------------------------------------------------
+
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram (~2% relative error) with constant memory,
+    so millions of samples can be recorded during a long run.
+    """
+
+    GROWTH = 1.02
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+        self.sum_ms = 0.0
+        self.min_ms = math.inf
+        self.max_ms = 0.0
+        self._log_growth = math.log(self.GROWTH)
+
+    def record(self, ms: float):
+        ms = max(ms, 0.001)
+        idx = int(math.log(ms * 1000) / self._log_growth)
+        self.counts[idx] = self.counts.get(idx, 0) + 1
+        self.total += 1
+        self.sum_ms += ms
+        self.min_ms = min(self.min_ms, ms)
+        self.max_ms = max(self.max_ms, ms)
+
+    def _bucket_upper_ms(self, idx: int) -> float:
+        return self.GROWTH ** (idx + 1) / 1000
+
+    def percentile(self, p: float) -> float:
+        if not self.total:
+            return 0.0
+        rank = math.ceil(self.total * p / 100)
+        seen = 0
+        for idx in sorted(self.counts):
+            seen += self.counts[idx]
+            if seen >= rank:
+                return min(self._bucket_upper_ms(idx), self.max_ms)
+        return self.max_ms
+
+    def summary(self) -> dict:
+        return {
+            "count": self.total,
+            "mean": round(self.sum_ms / self.total, 3) if self.total else 0.0,
+            "min": round(self.min_ms, 3) if self.total else 0.0,
+            "p50": round(self.percentile(50), 3),
+            "p95": round(self.percentile(95), 3),
+            "p99": round(self.percentile(99), 3),
+            "max": round(self.max_ms, 3),
+        }
+
+    def buckets(self) -> list:
+        return [[round(self._bucket_upper_ms(i), 3), self.counts[i]]
+                for i in sorted(self.counts)]
+
+
+class RateProfile:
+    """
+    Target request rate over time. Specs:
+      constant:RATE
+      linear:START:END:SECONDS     ramp from START to END, then hold END
+      step:RATE@SECONDS,RATE@SECONDS,...
+    """
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, rest = spec.partition(":")
+        self.kind = kind
+        if kind == "constant":
+            self.rate = float(rest)
+        elif kind == "linear":
+            start, end, seconds = rest.split(":")
+            self.start, self.end, self.seconds = float(
+                start), float(end), float(seconds)
+        elif kind == "step":
+            steps = []
+            for part in rest.split(","):
+                rate, _, at = part.partition("@")
+                steps.append((float(at or 0), float(rate)))
+            self.steps = sorted(steps)
+        else:
+            raise ValueError(f"Unknown rate profile: {spec}")
+
+    def rate_at(self, t: float) -> float:
+        if self.kind == "constant":
+            return self.rate
+        if self.kind == "linear":
+            if t >= self.seconds:
+                return self.end
+            return self.start + (self.end - self.start) * t / self.seconds
+        rate = 0.0
+        for at, step_rate in self.steps:
+            if t >= at:
+                rate = step_rate
+        return rate
+
+
+class VirtualDevice:
+    __slots__ = ("label", "headers", "sequence", "stream")
+
+    def __init__(self, label: str, token: str):
+        self.label = label
+        # Rate limits are per device, so each virtual device says which it is.
+        self.headers = {"Authorization": f"Bearer {token}", "X-Device-Id": label}
+        self.sequence = 0
+        self.stream = None
+
+
+def load_devices(path: str, count: int) -> list:
+    """
+    Reads `token` or `label,token` lines and cycles through them to build
+    `count` virtual devices (several devices may share one patient token).
+    """
+    credentials = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            label, _, token = line.rpartition(",")
+            credentials.append((label or f"patient-{len(credentials) + 1}", token))
+    if not credentials:
+        raise ValueError(f"No tokens found in {path}")
+    count = count or len(credentials)
+    return [
+        VirtualDevice(f"{credentials[i % len(credentials)][0]}#{i}",
+                      credentials[i % len(credentials)][1])
+        for i in range(count)
+    ]
+
+
+class LoadStats:
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.by_status = {}
+        self.sent = 0
+        self.ok = 0
+        self.errors = 0
+        self.readings = 0
+        self.skipped = 0
+        self.timeline = []
+        self._window = [0, 0]
+
+    def record(self, status, latency_ms: float, readings: int):
+        self.sent += 1
+        self.by_status[str(status)] = self.by_status.get(str(status), 0) + 1
+        self.latency.record(latency_ms)
+        if status == 200:
+            self.ok += 1
+            self.readings += readings
+            self._window[0] += 1
+        else:
+            self.errors += 1
+            self._window[1] += 1
+
+    def tick(self, t: float, target_rate: float):
+        ok, errors = self._window
+        self.timeline.append({"t": round(t), "target_rps": round(target_rate, 1),
+                              "ok": ok, "errors": errors})
+        self._window = [0, 0]
+
+
+async def _post(client, device, mode: str, batch_size: int, stats: LoadStats,
+                scheduled_at: float):
+    batch = [random_reading() for _ in range(batch_size if mode == "bulk" else 1)]
+    # Sequence numbers let the server drop readings a retry sends twice.
+    for reading in batch:
+        device.sequence += 1
+        reading["sequence"] = device.sequence
+    if mode == "bulk":
+        url = f"{BASE_URL}/patients/metrics/bulk"
+        payload = batch
+    else:
+        url = f"{BASE_URL}/patients/metrics"
+        payload = batch[0]
+    readings = len(batch)
+    try:
+        response = await client.post(url, json=payload, headers=device.headers)
+        status = response.status_code
+    except httpx.HTTPError as e:
+        status = type(e).__name__
+    # Latency is measured from the scheduled send time so a saturated server
+    # can't hide queueing delay (coordinated omission).
+    stats.record(status, (time.perf_counter() - scheduled_at) * 1000, readings)
+
+
+class DeviceStream:
+    """
+    A device's ingestion WebSocket. Frames go out without waiting for the
+    previous one; each frame's latency is recorded when the cumulative ack
+    covering its last reading arrives.
+    """
+
+    def __init__(self, device, encoding: str, stats: LoadStats, release):
+        self.device = device
+        self.encoding = encoding
+        self.stats = stats
+        self.release = release
+        self.waiting = deque()  # (last seq, scheduled_at, readings)
+        self.ws = None
+        self.reader = None
+
+    async def open(self):
+        import websockets
+        from app.services.device_stream import decode_ack
+
+        url = (BASE_URL.replace("http", "ws", 1) + "/patients/metrics/ingest"
+               f"?encoding={self.encoding}&device={quote(self.device.label)}")
+        self.ws = await websockets.connect(url, additional_headers=self.device.headers)
+        # The greeting is the last ack the server holds for this device.
+        self.device.sequence = decode_ack(self.encoding, await self.ws.recv())
+        self.reader = asyncio.create_task(self._read_acks(decode_ack))
+
+    async def _read_acks(self, decode_ack):
+        try:
+            async for message in self.ws:
+                ack = decode_ack(self.encoding, message)
+                now = time.perf_counter()
+                while self.waiting and self.waiting[0][0] <= ack:
+                    _, scheduled_at, readings = self.waiting.popleft()
+                    self.stats.record(200, (now - scheduled_at) * 1000, readings)
+                    self.release()
+        except Exception as e:
+            self._fail(type(e).__name__)
+
+    def _fail(self, status: str):
+        while self.waiting:
+            _, scheduled_at, _ = self.waiting.popleft()
+            self.stats.record(status, (time.perf_counter() - scheduled_at) * 1000, 0)
+            self.release()
+
+    async def send(self, batch_size: int, scheduled_at: float):
+        from app.services.device_stream import encode_frame
+
+        readings = [tuple(random_reading().values()) for _ in range(batch_size)]
+        first = self.device.sequence + 1
+        self.device.sequence += len(readings)
+        self.waiting.append((self.device.sequence, scheduled_at, len(readings)))
+        try:
+            await self.ws.send(encode_frame(self.encoding, first, readings))
+        except Exception as e:
+            self._fail(type(e).__name__)
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+        if self.reader is not None:
+            await asyncio.gather(self.reader, return_exceptions=True)
+        self._fail("unacked")
+
+
+async def open_streams(devices, args, stats: LoadStats, release):
+    """Opens one socket per device up front, `--connections` at a time."""
+    gate = asyncio.Semaphore(args.connections)
+
+    async def _open(device):
+        async with gate:
+            stream = DeviceStream(device, args.encoding, stats, release)
+            try:
+                await stream.open()
+                device.stream = stream
+            except Exception as e:
+                stats.by_status[f"connect:{type(e).__name__}"] = \
+                    stats.by_status.get(f"connect:{type(e).__name__}", 0) + 1
+
+    await asyncio.gather(*(_open(d) for d in devices))
+    return sum(1 for d in devices if d.stream is not None)
+
+
+async def run_load(args) -> dict:
+    devices = load_devices(args.tokens, args.devices)
+    profile = RateProfile(args.rate)
+    stats = LoadStats()
+    limits = httpx.Limits(max_connections=args.connections,
+                          max_keepalive_connections=args.connections)
+    timeout = httpx.Timeout(args.timeout, connect=5.0)
+    in_flight = asyncio.Semaphore(args.max_in_flight)
+    pending = set()
+
+    async def _send(device, scheduled_at):
+        if args.mode == "stream":
+            # The slot is released when the frame is acked
+            if device.stream is None:
+                stats.record("no_connection", 0.0, 0)
+                in_flight.release()
+            else:
+                await device.stream.send(args.batch_size, scheduled_at)
+            return
+        try:
+            await _post(client, device, args.mode, args.batch_size, stats, scheduled_at)
+        finally:
+            in_flight.release()
+
+    if args.mode == "stream":
+        opened = await open_streams(devices, args, stats, in_flight.release)
+        print(f"Opened {opened}/{len(devices)} ingestion sockets ({args.encoding})")
+    print(f"Driving {len(devices)} virtual devices at {args.rate} for {args.duration}s "
+          f"({args.mode} mode)")
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        next_tick = 1.0
+        owed = 0.0
+        last = start
+        cursor = 0
+        while True:
+            now = time.perf_counter()
+            elapsed = now - start
+            if elapsed >= args.duration:
+                break
+            rate = profile.rate_at(elapsed)
+            owed += rate * (now - last)
+            last = now
+            # Open-loop dispatch: requests are issued on schedule regardless of
+            # how quickly earlier ones complete.
+            while owed >= 1:
+                owed -= 1
+                if in_flight.locked():
+                    stats.skipped += 1
+                    continue
+                await in_flight.acquire()
+                device = devices[cursor % len(devices)]
+                cursor += 1
+                task = asyncio.create_task(_send(device, now))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if elapsed >= next_tick:
+                stats.tick(elapsed, rate)
+                if not args.quiet:
+                    print(f"[{int(elapsed):>4}s] target {rate:7.1f} rps | "
+                          f"ok {stats.ok} err {stats.errors} skipped {stats.skipped}")
+                next_tick += 1.0
+            await asyncio.sleep(0.005)
+        if pending:
+            await asyncio.wait(pending, timeout=args.timeout)
+        if args.mode == "stream":
+            # Give outstanding frames a chance to be acked before closing.
+            deadline = time.perf_counter() + args.timeout
+            while time.perf_counter() < deadline and any(
+                    d.stream and d.stream.waiting for d in devices):
+                await asyncio.sleep(0.01)
+            await asyncio.gather(*(d.stream.close() for d in devices if d.stream))
+        wall = time.perf_counter() - start
+
+    return build_report(args, stats, wall, len(devices))
+
+
+def build_report(args, stats: LoadStats, wall: float, device_count: int) -> dict:
+    return {
+        "build": args.build,
+        "generated_at": datetime.now().isoformat(),
+        "config": {
+            "base_url": BASE_URL,
+            "devices": device_count,
+            "rate_profile": args.rate,
+            "duration_s": args.duration,
+            "mode": args.mode,
+            "batch_size": args.batch_size if args.mode != "single" else 1,
+            "encoding": args.encoding if args.mode == "stream" else None,
+            "connections": args.connections,
+            "max_in_flight": args.max_in_flight,
+        },
+        "wall_time_s": round(wall, 3),
+        "requests": {
+            "sent": stats.sent,
+            "ok": stats.ok,
+            "errors": stats.errors,
+            "skipped": stats.skipped,
+            "error_rate": round(stats.errors / stats.sent, 5) if stats.sent else 0.0,
+            "by_status": stats.by_status,
+        },
+        "throughput": {
+            "requests_per_s": round(stats.ok / wall, 2) if wall else 0.0,
+            "readings_per_s": round(stats.readings / wall, 2) if wall else 0.0,
+        },
+        "latency_ms": stats.latency.summary(),
+        "latency_histogram_ms": stats.latency.buckets(),
+        "timeline": stats.timeline,
+    }
+
+
+def compare_reports(current: dict, baseline: dict, max_regression: float) -> list:
+    """Returns human-readable regressions of `current` against `baseline`."""
+    regressions = []
+    for key in ("p50", "p95", "p99"):
+        base, cur = baseline["latency_ms"][key], current["latency_ms"][key]
+        if base and cur > base * (1 + max_regression):
+            regressions.append(f"latency {key}: {base}ms -> {cur}ms")
+    base_tp = baseline["throughput"]["readings_per_s"]
+    cur_tp = current["throughput"]["readings_per_s"]
+    if base_tp and cur_tp < base_tp * (1 - max_regression):
+        regressions.append(f"throughput: {base_tp} -> {cur_tp} readings/s")
+    base_err = baseline["requests"]["error_rate"]
+    cur_err = current["requests"]["error_rate"]
+    if cur_err > base_err + max_regression / 10:
+        regressions.append(f"error rate: {base_err} -> {cur_err}")
+    return regressions
+
+
+def parse_load_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="simulate_device.py load",
+        description="Drive many virtual devices against the ingestion API.")
+    parser.add_argument("--tokens", required=True,
+                        help="File with one `token` or `label,token` per line")
+    parser.add_argument("--devices", type=int, default=0,
+                        help="Virtual devices to spawn (defaults to one per token)")
+    parser.add_argument("--rate", default="constant:50",
+                        help="constant:RPS | linear:START:END:SECONDS | step:RPS@S,...")
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--mode", choices=("single", "bulk", "stream"), default="single",
+                        help="POST per reading, bulk POSTs, or frames over the ingestion WebSocket")
+    parser.add_argument("--batch-size", type=int, default=10,
+                        help="Readings per request (bulk) or per frame (stream)")
+    parser.add_argument("--encoding", choices=("json", "msgpack", "binary"), default="json",
+                        help="Frame encoding in stream mode")
+    parser.add_argument("--connections", type=int, default=100,
+                        help="Size of the shared HTTP connection pool")
+    parser.add_argument("--max-in-flight", type=int, default=1000)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--build", default="local",
+                        help="Label stored in the report to identify the build under test")
+    parser.add_argument("--report", help="Write the JSON report to this file")
+    parser.add_argument("--compare", help="Baseline report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.1,
+                        help="Allowed relative regression before --compare fails")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--quiet", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main_load(argv) -> int:
+    global BASE_URL
+    args = parse_load_args(argv)
+    BASE_URL = args.base_url.rstrip("/")
+    report = asyncio.run(run_load(args))
+
+    text = json.dumps(report, indent=2)
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(text)
+        print(f"Report written to {args.report}")
+    lat = report["latency_ms"]
+    print(f"Sent {report['requests']['sent']} requests, "
+          f"{report['throughput']['readings_per_s']} readings/s, "
+          f"error rate {report['requests']['error_rate']:.2%}, "
+          f"p50 {lat['p50']}ms p95 {lat['p95']}ms p99 {lat['p99']}ms")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report, baseline, args.max_regression)
+        for r in regressions:
+            print(f"REGRESSION {r}")
+        if regressions:
+            return 1
+        print(f"No regressions against {baseline.get('build', args.compare)}")
+    return 0
+
+
 if __name__ == "__main__":
     # Typically run as: python simulate_device.py <patient_label> <token>
+    # or, for load testing:
+    #   python simulate_device.py load --tokens tokens.txt --devices 5000 \
+    #       --rate linear:10:2000:120 --duration 300 --mode bulk --report run.json
+    if len(sys.argv) > 1 and sys.argv[1] == "load":
+        try:
+            sys.exit(main_load(sys.argv[2:]))
+        except KeyboardInterrupt:
+            print("\nLoad test stopped.")
+            sys.exit(130)
+
     if len(sys.argv) < 3:
         print("Usage: python simulate_device.py <patient_label> <token>")
+        print("       python simulate_device.py load --tokens FILE [options]")
         sys.exit(1)
 
     p_label = sys.argv[1]
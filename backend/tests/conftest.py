@@ -0,0 +1,65 @@
+import asyncio
+import os
+import random
+import tempfile
+
+import pytest
+
+# Point the app at a throwaway SQLite file before anything imports
+# app.core.config; the default Postgres URL is never reachable in tests.
+os.environ.setdefault(
+    "SQLALCHEMY_DATABASE_URI",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(prefix='biosense-test-'), 'test.db')}",
+)
+os.environ.setdefault("SQLALCHEMY_ECHO", "false")
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "dataset(patients=1, metrics=0, seed=1): size of the `dataset` fixture")
+
+
+async def _disposing(coro):
+    from app.db import session as db_session
+
+    try:
+        return await coro
+    finally:
+        # Pooled connections belong to this event loop; the next test has its own.
+        await db_session.engine.dispose()
+
+
+@pytest.fixture
+def run():
+    """Runs a coroutine in a fresh event loop, closing the engine's connections after."""
+    return lambda coro: asyncio.run(_disposing(coro))
+
+
+@pytest.fixture
+def db(run):
+    """An empty schema, recreated for the test."""
+    import app.db.base  # noqa: F401  registers every model with the mapper
+    from app.db import session as db_session
+    from app.db.base import Base
+
+    async def _reset():
+        async with db_session.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+
+    run(_reset())
+    return db_session
+
+
+@pytest.fixture
+def dataset(request, run):
+    """
+    A fresh schema holding the benchmark harness's hospital, doctor and
+    patient panel. Sized with @pytest.mark.dataset(patients=, metrics=, seed=).
+    """
+    from benchmarks.harness import seed
+
+    marker = request.node.get_closest_marker("dataset")
+    size = marker.kwargs if marker else {}
+    return run(seed(size.get("patients", 1), size.get("metrics", 0),
+                    random.Random(size.get("seed", 1))))
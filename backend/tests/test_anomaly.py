@@ -0,0 +1,134 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, select
+
+from app.core.config import settings
+from app.db import session as db_session
+from app.models.anomaly_state import AnomalyDetectorState
+from app.models.health_alert import HealthAlert
+from app.services import anomaly
+from app.services.anomaly import DetectorArrays
+from app.services.events import ALERT_RAISED, METRIC_INGESTED, Event, event_bus
+from app.services.ingestion import store_values
+
+START = datetime(2026, 5, 1, tzinfo=timezone.utc)
+
+
+def _feed(arrays, key, values, start=0):
+    return [arrays.update(key, v, START.timestamp() + 60 * (start + i))
+            for i, v in enumerate(values)]
+
+
+def test_zscore_catches_spikes_and_cusum_catches_shifts():
+    rng = random.Random(4)
+    arrays = DetectorArrays({"heart_rate": 2.0, "spo2": 1.0}, max_series=10, capacity=1)
+    heart, spo2 = arrays.key(1, "heart_rate"), arrays.key(1, "spo2")
+
+    baseline = [72 + rng.gauss(0, 2) for _ in range(60)]
+    assert not any(_feed(arrays, heart, baseline))
+    z, fired = _feed(arrays, heart, [140.0], start=60)[0]
+    assert fired == ["zscore"] and z > 10
+    # The spike barely moved the baseline, and the cooldown holds back a repeat.
+    assert abs(arrays.mean[arrays.slot(heart)] - 72) < 2
+    assert _feed(arrays, heart, [140.0], start=61) == [None]
+
+    # A drop of 2.5 sd is under the z threshold but adds up in the CUSUM.
+    results = _feed(arrays, spo2, [98 + rng.gauss(0, 0.3) for _ in range(40)]
+                    + [95.5] * 10)
+    fired = [r[1] for r in results if r]
+    assert fired and fired[0] == ["cusum_down"]
+    assert len(arrays) == 2 and arrays.capacity == 2
+
+
+def test_late_readings_unknown_metrics_and_capacity():
+    arrays = DetectorArrays({"heart_rate": 2.0}, max_series=2, capacity=1)
+    assert arrays.key(1, "steps") is None
+    key = arrays.key(1, "heart_rate")
+    _feed(arrays, key, [70.0, 71.0], start=10)
+    _feed(arrays, key, [500.0], start=0)  # older than the newest: skipped
+    assert arrays.count[arrays.slot(key)] == 2
+
+    for patient_id in (2, 3):
+        arrays.update(arrays.key(patient_id, "heart_rate"), 70.0, START.timestamp())
+    assert len(arrays) == 2 and arrays.untracked == 1
+    assert arrays.drop_idle(START.timestamp() + 1) == 1  # patient 2
+    arrays.update(arrays.key(3, "heart_rate"), 70.0, START.timestamp())
+    assert len(arrays) == 2 and arrays.capacity == 2
+
+
+@pytest.mark.dataset(seed=2)
+def test_alerts_are_stored_published_and_state_survives_a_restart(dataset, run, monkeypatch):
+    monkeypatch.setattr(settings, "ANOMALY_WARMUP_READINGS", 5)
+    anomaly.detectors.clear()
+    alerts = []
+    unsubscribe = event_bus.subscribe(ALERT_RAISED, lambda event: alerts.append(event.data))
+    # Recent enough to be stored as they are
+    start = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(minutes=30)
+
+    async def _run():
+        patient_id = dataset.patient_ids[0]
+        async with db_session.SessionLocal() as db:
+            await store_values(db, patient_id, [
+                ("spo2", 97.0 + (i % 2) * 0.5, None, start + timedelta(minutes=i))
+                for i in range(10)])
+            await db.commit()
+        assert alerts == []
+        async with db_session.SessionLocal() as db:
+            await store_values(db, patient_id, [("spo2", 84.0, None, start + timedelta(minutes=10))])
+            # Nothing goes out before the alert row commits with the reading
+            assert alerts == []
+            await db.commit()
+        async with db_session.SessionLocal() as db:
+            stored_alerts = (await db.execute(select(HealthAlert))).scalars().all()
+
+        now = start + timedelta(minutes=11)
+        assert await anomaly.checkpoint_detectors(now) == 1
+        assert await anomaly.checkpoint_detectors(now) == 0  # nothing changed since
+        async with db_session.SessionLocal() as db:
+            stored = await db.scalar(select(func.count()).select_from(AnomalyDetectorState))
+        key = anomaly.detectors.key(patient_id, "spo2")
+        before = float(anomaly.detectors.mean[anomaly.detectors.slot(key)])
+
+        anomaly.detectors.clear()
+        assert await anomaly.restore_detectors(now) == 1
+        return stored, stored_alerts, before, key
+
+    try:
+        stored, stored_alerts, before, key = run(_run())
+    finally:
+        unsubscribe()
+
+    assert stored == 1
+    assert len(alerts) == 1
+    alert = alerts[0]
+    assert alert["kind"] == "anomaly" and alert["metric_type"] == "spo2"
+    assert alert["detectors"] == ["zscore"] and alert["value"] == 84.0
+    assert [(a.id, a.patient_id, a.alert_type) for a in stored_alerts] == [
+        (alert["alert_id"], alert["patient_id"], "spo2 anomaly")]
+    assert "below its baseline" in stored_alerts[0].message
+    slot = anomaly.detectors.slot(key, create=False)
+    assert slot is not None and abs(anomaly.detectors.mean[slot] - before) < 1e-9
+    assert anomaly.detectors.count[slot] == 11
+    anomaly.detectors.clear()
+
+
+def test_other_workers_readings_only_update_the_detectors(monkeypatch):
+    monkeypatch.setattr(settings, "ANOMALY_WARMUP_READINGS", 5)
+    anomaly.detectors.clear()
+    alerts = []
+    unsubscribe = event_bus.subscribe(ALERT_RAISED, lambda event: alerts.append(event.data))
+    readings = [{"id": i, "metric_type": "spo2", "value": 97.0 + (i % 2) * 0.5,
+                 "timestamp": (START + timedelta(minutes=i)).isoformat()} for i in range(10)]
+    readings.append({"id": 10, "metric_type": "spo2", "value": 84.0,
+                     "timestamp": (START + timedelta(minutes=10)).isoformat()})
+    try:
+        anomaly._on_ingested(Event(METRIC_INGESTED, {"patient_id": 1, "readings": readings},
+                                   origin="another-worker"))
+    finally:
+        unsubscribe()
+    key = anomaly.detectors.key(1, "spo2")
+    assert anomaly.detectors.count[anomaly.detectors.slot(key)] == 11
+    assert alerts == []
+    anomaly.detectors.clear()
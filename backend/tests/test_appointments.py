@@ -0,0 +1,64 @@
+from datetime import date, datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+from app.services.appointments import IntervalIndex, schedule_cache
+
+T0 = datetime(2026, 3, 2, 9, tzinfo=timezone.utc)
+
+
+def _at(minutes: int) -> datetime:
+    return T0 + timedelta(minutes=minutes)
+
+
+def test_interval_index_overlaps_and_free_slots():
+    index = IntervalIndex([(_at(30), _at(60), 1), (_at(0), _at(240), 2), (_at(300), _at(330), 3)])
+    assert [i for _, _, i in index.overlapping(_at(200), _at(310))] == [2, 3]
+    # Touching intervals don't overlap.
+    assert index.overlapping(_at(240), _at(300)) == []
+    assert index.free_slots(_at(0), _at(360), timedelta(minutes=30)) == [
+        (_at(240), _at(270)), (_at(270), _at(300)), (_at(330), _at(360))]
+
+
+@pytest.mark.dataset(patients=2, seed=4)
+def test_booking_conflicts_and_availability(dataset, run):
+    from main import app
+
+    day = (datetime.now(timezone.utc) + timedelta(days=2)).date()
+    schedule_cache.invalidate()
+
+    async def _run():
+        headers = {"Authorization": f"Bearer {dataset.doctor_token}"}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            async def book(patient_id, **when):
+                return await client.post("/api/v1/doctors/appointments", headers=headers, json={
+                    "patient_id": patient_id, "reason": "Checkup", **when})
+
+            async def availability():
+                response = await client.get(
+                    f"/api/v1/doctors/availability?start={day}&slot_minutes=60", headers=headers)
+                return [s["start"][11:16] for s in response.json()["slots"]]
+
+            free_before = await availability()
+            first = await book(1, date=day.isoformat(), time="10:00")
+            overlapping = await book(2, start_at=f"{day}T10:15:00Z", end_at=f"{day}T11:00:00Z")
+            adjacent = await book(2, start_at=f"{day}T10:30:00Z", end_at=f"{day}T12:00:00Z")
+            free_after = await availability()
+            await client.patch(f"/api/v1/doctors/appointments/{first.json()['id']}?status=Cancelled",
+                               headers=headers)
+            rebooked = await book(2, date=day.isoformat(), time="10:00")
+            bad = await book(1, date=day.isoformat(), time="ten")
+
+        assert first.status_code == 200
+        assert first.json()["end_at"].startswith(f"{day}T10:30")
+        assert overlapping.status_code == 409
+        assert adjacent.status_code == 200
+        assert free_before == ["09:00", "10:00", "11:00", "12:00", "13:00", "14:00", "15:00", "16:00"]
+        # Slots resume as soon as a booking ends.
+        assert free_after == ["09:00", "12:00", "13:00", "14:00", "15:00", "16:00"]
+        assert rebooked.status_code == 200
+        assert bad.status_code == 422
+
+    run(_run())
@@ -0,0 +1,33 @@
+import pytest
+
+from benchmarks.harness import compare, run_benchmarks, summarise
+
+
+def test_summarise_reports_percentiles_and_throughput():
+    stats = summarise([0.001] * 90 + [0.01] * 10, items_per_op=10)
+    assert stats["iterations"] == 100
+    assert stats["p50_us"] == 1000.0
+    assert stats["p95_us"] == 10000.0
+    assert stats["items_per_s"] == round(10 / 0.0019, 1)
+
+
+def test_compare_flags_only_slowdowns_beyond_threshold():
+    baseline = {"results": {
+        "predict_scalar": {"p50_us": 100.0},
+        "latest_vitals": {"p50_us": 1000.0},
+    }}
+    results = {
+        "predict_scalar": {"p50_us": 120.0},
+        "latest_vitals": {"p50_us": 1500.0},
+        "new_bench": {"p50_us": 5.0},
+    }
+    regressions = compare(results, baseline, threshold=0.25)
+    assert [r["name"] for r in regressions] == ["latest_vitals"]
+    assert regressions[0]["ratio"] == 1.5
+
+
+@pytest.mark.dataset(patients=5, metrics=10)
+def test_suite_runs_end_to_end_on_sqlite(dataset, run):
+    results = run(run_benchmarks(dataset, iterations=2, warmup=0))
+    assert {"predict_scalar", "latest_vitals", "predictions_all",
+            "ingest_bulk_100"} <= set(results)
@@ -0,0 +1,44 @@
+import httpx
+import pytest
+
+from app.services.reference import hospitals_cache
+
+
+@pytest.mark.dataset(patients=2, metrics=3)
+def test_conditional_gets_short_circuit_until_data_changes(dataset, run):
+    from main import app
+
+    async def _run():
+        hospitals_cache.invalidate()
+        patient = {"Authorization": f"Bearer {dataset.patient_tokens[0]}"}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = await client.get("/api/v1/hospitals/")
+            assert first.status_code == 200 and first.json()[0]["hosp_code"] == "BNCH"
+            again = await client.get(
+                "/api/v1/hospitals/", headers={"If-None-Match": first.headers["etag"]})
+            assert again.status_code == 304 and again.content == b""
+
+            metrics = await client.get("/api/v1/patients/metrics", headers=patient)
+            assert len(metrics.json()) == 3
+            etag = metrics.headers["etag"]
+            assert etag.startswith('W/"')
+            cached = {**patient, "If-None-Match": etag}
+            assert (await client.get("/api/v1/patients/metrics", headers=cached)).status_code == 304
+            since = {**patient, "If-Modified-Since": metrics.headers["last-modified"]}
+            assert (await client.get("/api/v1/patients/metrics", headers=since)).status_code == 304
+
+            await client.post("/api/v1/patients/metrics", headers=patient,
+                              json={"metric_type": "heart_rate", "value": 80.0})
+            fresh = await client.get("/api/v1/patients/metrics", headers=cached)
+            assert fresh.status_code == 200 and len(fresh.json()) == 4
+            assert fresh.headers["etag"] != etag
+
+            me = await client.get("/api/v1/patients/me", headers=patient)
+            cached_me = {**patient, "If-None-Match": me.headers["etag"]}
+            assert (await client.get("/api/v1/patients/me", headers=cached_me)).status_code == 304
+            await client.patch("/api/v1/patients/me", headers=patient,
+                               json={"address": "2 New St"})
+            assert (await client.get("/api/v1/patients/me", headers=cached_me)).status_code == 200
+
+    run(_run())
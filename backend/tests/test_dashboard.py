@@ -0,0 +1,39 @@
+import httpx
+import pytest
+
+
+@pytest.mark.dataset(patients=3, metrics=16, seed=8)
+def test_dashboard_sections_and_field_selection(dataset, run):
+    from main import app
+
+    async def _run():
+        headers = {"Authorization": f"Bearer {dataset.doctor_token}"}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await client.post("/api/v1/doctors/appointments", headers=headers, json={
+                "patient_id": 2, "reason": "Review", "start_at": "2099-01-05T10:00:00Z"})
+            full = await client.get("/api/v1/doctors/dashboard?patient_limit=2", headers=headers)
+            stats = (await client.get("/api/v1/doctors/stats", headers=headers)).json()
+            some = await client.get("/api/v1/doctors/dashboard?fields=doctor,risks",
+                                    headers=headers)
+            unknown = await client.get("/api/v1/doctors/dashboard?fields=doctor,gossip",
+                                       headers=headers)
+            patient = await client.get(
+                "/api/v1/doctors/dashboard",
+                headers={"Authorization": f"Bearer {dataset.patient_tokens[0]}"})
+
+        body = full.json()
+        assert full.status_code == 200
+        assert set(body) == {"doctor", "stats", "patients", "appointments", "risks"}
+        assert body["doctor"]["hospital_name"] == "Bench General"
+        assert body["stats"] == stats
+        assert [p["id"] for p in body["patients"]] == [1, 2]
+        assert [a["patient_name"] for a in body["appointments"]] == ["Bench Patient 00002"]
+        assert sorted(body["risks"]) == ["1", "2"] and len(body["risks"]["1"]) == 6
+
+        assert set(some.json()) == {"doctor", "risks"}
+        assert sorted(some.json()["risks"]) == ["1", "2", "3"]
+        assert unknown.status_code == 422
+        assert patient.status_code == 403
+
+    run(_run())
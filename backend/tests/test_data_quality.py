@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+from app.services.data_quality import CadenceStore, cadence_store, quality_version
+from app.services.events import METRIC_INGESTED, event_bus
+from app.services.prediction import CONDITIONS, predict_multi_disease_risk
+
+START = datetime(2026, 5, 1, tzinfo=timezone.utc)
+
+
+def test_coverage_gaps_and_staleness_from_counters():
+    store = CadenceStore(window_hours=24, max_patients=10)
+    # Heart rate every minute for 10 hours with a 2 hour hole, then glucose once.
+    minutes = [m for m in range(600) if not 180 <= m < 300]
+    store.add_readings(1, [("heart_rate", START + timedelta(minutes=m)) for m in minutes])
+    store.add_readings(1, [("glucose", START + timedelta(minutes=30))])
+
+    quality = store.quality(1, now=START + timedelta(minutes=600))
+    heart = quality["metrics"]["heart_rate"]
+    assert heart["received"] == 480 and heart["expected"] == 600
+    assert heart["coverage"] == 80.0
+    assert heart["continuity"] == 72.7  # 8 of the 11 hours begun
+    assert heart["longest_gap_seconds"] == 121 * 60
+    assert not heart["stale"]
+    glucose = quality["metrics"]["glucose"]
+    assert glucose["stale"] and glucose["longest_gap_seconds"] == 570 * 60
+    assert quality["stale_metrics"] == ["glucose"]
+    assert quality["fresh_inputs"] == 50.0
+
+    # A day later only the window's counts are left, and every metric is stale.
+    later = store.quality(1, now=START + timedelta(hours=34))
+    assert later["metrics"]["heart_rate"]["received"] == 0
+    assert later["metrics"]["heart_rate"]["coverage"] == 0.0
+    assert later["stale_metrics"] == ["glucose", "heart_rate"]
+    assert store.quality(2, now=START)["metrics"] == {}
+
+
+def test_quality_version_moves_with_buckets_not_seconds():
+    store = CadenceStore(window_hours=24, max_patients=10)
+    store.add_readings(1, [("heart_rate", START + timedelta(minutes=m)) for m in range(60)])
+
+    first = store.quality(1, now=START + timedelta(minutes=60, seconds=30))
+    second = store.quality(1, now=START + timedelta(minutes=61))
+    # The block drifted, but not out of any bucket
+    assert first["metrics"]["heart_rate"] != second["metrics"]["heart_rate"]
+    assert quality_version(first) == quality_version(second)
+
+    later = store.quality(1, now=START + timedelta(hours=5))
+    assert later["stale_metrics"] == ["heart_rate"]
+    assert quality_version(later) != quality_version(first)
+
+
+def test_stale_inputs_lower_confidence():
+    metrics = {"heart_rate": 80, "glucose": 110, "spo2": 97}
+    quality = {"stale_metrics": ["glucose"], "metrics": {
+        "glucose": {}, "heart_rate": {}, "spo2": {}, "respiratory_rate": {}}}
+    plain = predict_multi_disease_risk(metrics, {"age": 50, "bmi": 25}, outputs=[])
+    scored = predict_multi_disease_risk(metrics, {"age": 50, "bmi": 25}, outputs=["data_quality"],
+                                        data_quality=quality)
+    by_condition = {p["condition"]: p for p in scored["predictions"]}
+    assert [p["score"] for p in plain["predictions"]] == [p["score"] for p in scored["predictions"]]
+    assert scored["data_quality"] is quality
+
+    diabetes = by_condition["Diabetes"]
+    assert diabetes["confidence"] == round(CONDITIONS["Diabetes"].confidence * 0.5)
+    assert diabetes["stale_inputs"] == ["glucose"]
+    respiratory = by_condition["Respiratory Breakdown"]
+    assert respiratory["confidence"] == CONDITIONS["Respiratory Breakdown"].confidence
+    assert "stale_inputs" not in respiratory
+    # Stress level was never reported: half of Stress Disorder's inputs are missing
+    assert by_condition["Stress Disorder"]["stale_inputs"] == ["stress_level"]
+    assert by_condition["Cholesterol"]["confidence"] == CONDITIONS["Cholesterol"].confidence
+
+
+@pytest.mark.dataset(seed=5)
+def test_prediction_endpoint_serves_data_quality(dataset, run):
+    from main import app
+
+    async def _run():
+        patient_id = dataset.patient_ids[0]
+        cadence_store.clear()
+        now = datetime.now(timezone.utc)
+        event_bus.publish(METRIC_INGESTED, {"patient_id": patient_id, "readings": [
+            {"id": i, "metric_type": "heart_rate", "value": 70.0,
+             "timestamp": (now - timedelta(minutes=30 - i)).isoformat()} for i in range(30)]})
+
+        headers = {"Authorization": f"Bearer {dataset.patient_tokens[0]}"}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/api/v1/patients/predictions", headers=headers)
+        cadence_store.clear()
+        return response.json()
+
+    body = run(_run())
+    quality = body["data_quality"]
+    assert list(quality["metrics"]) == ["heart_rate"]
+    assert quality["metrics"]["heart_rate"]["received"] == 30
+    assert 90 <= quality["monitoring_coverage"] <= 100
+    assert quality["stale_metrics"] == []
+    diabetes = next(p for p in body["predictions"] if p["condition"] == "Diabetes")
+    assert diabetes["stale_inputs"] == ["glucose"]
@@ -0,0 +1,92 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import func, select
+from starlette.websockets import WebSocketDisconnect
+
+from app.core.config import settings
+from app.db import session as db_session
+from app.models.health_metrics import HealthMetric
+from app.services import device_stream
+from app.services.device_stream import FrameError, decode_ack, decode_frame, encode_frame
+from app.services.idempotency import recent_keys
+
+READINGS = [("heart_rate", 72.0), ("spo2", 98.5)]
+
+
+@pytest.mark.parametrize("encoding", device_stream.ENCODINGS)
+def test_frames_round_trip(encoding):
+    assert decode_frame(encoding, encode_frame(encoding, 41, READINGS)) == (41, READINGS)
+    if encoding != "binary":
+        timed = [("heart_rate", 72.0, 1780000000.25)]
+        assert decode_frame(encoding, encode_frame(encoding, 1, timed)) == (1, timed)
+
+
+def test_bad_frames_are_rejected():
+    with pytest.raises(FrameError):
+        decode_frame("json", '{"r": [["heart_rate", 1]]}')
+    with pytest.raises(FrameError):
+        decode_frame("json", '{"seq": 1, "r": [["heart_rate", "NaN"]]}')
+    with pytest.raises(FrameError):
+        decode_frame("json", '{"seq": 1, "r": [["heart_rate", 1, 1e300]]}')
+    with pytest.raises(FrameError):
+        decode_frame("binary", encode_frame("binary", 1, READINGS)[:-1])
+    with pytest.raises(FrameError):
+        decode_frame("binary", encode_frame("binary", 0, READINGS))
+
+
+async def _stored():
+    async with db_session.SessionLocal() as db:
+        return (await db.execute(select(func.count()).select_from(HealthMetric))).scalar()
+
+
+def test_stream_acks_dedupes_and_resumes(dataset, monkeypatch):
+    from main import app
+
+    monkeypatch.setattr(settings, "INGEST_WS_BATCH_SIZE", 3)
+    monkeypatch.setattr(device_stream, "_acks", device_stream.OrderedDict())
+    # All database work stays on the TestClient's event loop
+    with TestClient(app) as client:
+        _exercise(client, dataset.patient_tokens[0])
+        client.portal.call(db_session.engine.dispose)
+
+
+def _exercise(client, token):
+    url = f"/api/v1/patients/metrics/ingest?token={token}&encoding=binary"
+    with client.websocket_connect(url) as ws:
+        assert decode_ack("binary", ws.receive_bytes()) == 0
+        ws.send_bytes(encode_frame("binary", 1, READINGS))
+        # seq 2 is resent alongside seq 3; only seq 3 is new, which fills the batch
+        ws.send_bytes(encode_frame("binary", 2, [READINGS[1], ("glucose", 101.0)]))
+        assert decode_ack("binary", ws.receive_bytes()) == 3
+    assert client.portal.call(_stored) == 3
+
+    with client.websocket_connect(url) as ws:
+        assert decode_ack("binary", ws.receive_bytes()) == 3
+        ws.send_bytes(encode_frame("binary", 3, [("glucose", 101.0), ("spo2", 97.0)]))
+        # Below the batch size, so committed once the flush interval passes
+        assert decode_ack("binary", ws.receive_bytes()) == 4
+    assert client.portal.call(_stored) == 4
+
+    # After a restart the ack state is gone; the stored keys still catch the resend.
+    device_stream._acks.clear()
+    recent_keys.clear()
+    with client.websocket_connect(url) as ws:
+        assert decode_ack("binary", ws.receive_bytes()) == 0
+        ws.send_bytes(encode_frame("binary", 3, [("glucose", 101.0), ("spo2", 97.0)]))
+        assert decode_ack("binary", ws.receive_bytes()) == 4
+    assert client.portal.call(_stored) == 4
+
+    # Readings 5-6 are lost in transit: 7 is dropped and the ack stays at 4
+    # until the device resends from 5.
+    with client.websocket_connect(url) as ws:
+        assert decode_ack("binary", ws.receive_bytes()) == 4
+        ws.send_bytes(encode_frame("binary", 7, [("spo2", 96.0)]))
+        assert decode_ack("binary", ws.receive_bytes()) == 4
+        ws.send_bytes(encode_frame("binary", 5, [("spo2", 96.5), ("spo2", 96.0), ("spo2", 95.5)]))
+        assert decode_ack("binary", ws.receive_bytes()) == 7
+    assert client.portal.call(_stored) == 7
+
+    with pytest.raises(WebSocketDisconnect) as exc:
+        with client.websocket_connect("/api/v1/patients/metrics/ingest?token=bogus") as ws:
+            ws.receive_text()
+    assert exc.value.code == 1008
@@ -0,0 +1,129 @@
+import asyncio
+import os
+import tempfile
+
+from fastapi.testclient import TestClient
+
+from app.db import session as db_session
+from app.services.events import (
+    EventBus, RedisBus, UnixSocketBus, encode_command, read_reply,
+)
+
+
+def _collect(bus, topic="t"):
+    seen = []
+    bus.subscribe(topic, lambda e: seen.append(e.data))
+    return seen
+
+
+async def _until(predicate, timeout=3.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_in_process_bus_delivers_synchronously():
+    bus = EventBus()
+    seen = _collect(bus)
+    unsubscribe = bus.subscribe("t", lambda e: 1 / 0)  # a failing handler is isolated
+    bus.publish("t", {"n": 1})
+    unsubscribe()
+    bus.publish("other", {"n": 2})
+    assert seen == [{"n": 1}]
+
+
+def test_unix_socket_hub_relays_and_fails_over():
+    path = os.path.join(tempfile.mkdtemp(), "bus.sock")
+
+    async def _run():
+        buses = [UnixSocketBus(path) for _ in range(3)]
+        for bus in buses:
+            bus.RECONNECT_DELAY = 0.01
+        seen = [_collect(bus) for bus in buses]
+        reconnects = []
+        buses[2].on_reconnect(lambda: reconnects.append(1))
+        for bus in buses:
+            await bus.start()
+            await _until(bus.connected.is_set)
+        # Let the clients finish connecting to the hub
+        await _until(lambda: len(buses[0]._peers) == 2)
+
+        buses[1].publish("t", {"from": 1})
+        await _until(lambda: len(seen[0]) == 1 and len(seen[2]) == 1)
+        assert seen[1] == [{"from": 1}]  # local delivery only, no echo
+
+        # The hub goes away; a client takes over and traffic resumes.
+        await buses[0].stop()
+        await _until(lambda: len(reconnects) == 2)
+        await _until(lambda: buses[1].connected.is_set() and buses[2].connected.is_set())
+        await asyncio.sleep(0.05)
+        buses[2].publish("t", {"from": 2})
+        await _until(lambda: {"from": 2} in seen[1])
+        for bus in buses[1:]:
+            await bus.stop()
+
+    asyncio.run(_run())
+
+
+async def _resp_stand_in():
+    """Just enough of a Redis server for SUBSCRIBE/PUBLISH."""
+    subscribers = {}
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                command = await read_reply(reader)
+                name = command[0].upper()
+                if name == b"SUBSCRIBE":
+                    subscribers.setdefault(command[1], []).append(writer)
+                    channel = command[1]
+                    writer.write(b"*3\r\n$9\r\nsubscribe\r\n$%d\r\n%s\r\n:1\r\n"
+                                 % (len(channel), channel))
+                elif name == b"PUBLISH":
+                    targets = subscribers.get(command[1], [])
+                    for target in targets:
+                        target.write(encode_command("message", command[1], command[2]))
+                    writer.write(b":%d\r\n" % len(targets))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+def test_redis_bus_against_stand_in():
+    async def _run():
+        server = await _resp_stand_in()
+        port = server.sockets[0].getsockname()[1]
+        a, b = (RedisBus(f"redis://127.0.0.1:{port}/0", "events") for _ in range(2))
+        seen_a, seen_b = _collect(a), _collect(b)
+        for bus in (a, b):
+            await bus.start()
+            await _until(bus.connected.is_set)
+        a.publish("t", {"x": 1})
+        b.publish("t", {"x": 2})
+        await _until(lambda: len(seen_a) == 2 and len(seen_b) == 2)
+        assert seen_a == [{"x": 1}, {"x": 2}] or seen_a == [{"x": 2}, {"x": 1}]
+        for bus in (a, b):
+            await bus.stop()
+        server.close()
+
+    asyncio.run(_run())
+
+
+def test_live_feed_pushes_ingested_readings(dataset):
+    from main import app
+
+    with TestClient(app) as client:
+        url = f"/api/v1/doctors/patients/1/live?token={dataset.doctor_token}"
+        with client.websocket_connect(url) as ws:
+            response = client.post(
+                "/api/v1/patients/metrics/bulk",
+                headers={"Authorization": f"Bearer {dataset.patient_tokens[0]}"},
+                json=[{"metric_type": "spo2", "value": 97.0}])
+            assert response.status_code == 200
+            message = ws.receive_json()
+        assert message["type"] == "metric-ingested"
+        assert message["patient_id"] == 1
+        assert [r["value"] for r in message["readings"]] == [97.0]
+        client.portal.call(db_session.engine.dispose)
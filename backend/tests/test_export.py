@@ -0,0 +1,72 @@
+import gzip
+import io
+import json
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import pytest
+
+import app.db.base  # noqa: F401
+
+from app.services.export import (
+    CsvEncoder, ExportError, ExportScope, NdjsonEncoder, build_export_query,
+    make_encoder, validate_options,
+)
+
+Row = namedtuple("Row", "id patient_id metric_type value timestamp")
+
+ROWS = [
+    Row(1, 7, "heart_rate", 71.0, datetime(2026, 1, 1, 8, 0)),
+    Row(2, 7, "spo2", 98.5, datetime(2026, 1, 1, 8, 5, tzinfo=timezone.utc)),
+]
+
+
+def test_csv_encoder_writes_header_and_utc_timestamps():
+    enc = CsvEncoder()
+    text = (enc.header() + enc.encode(ROWS)).decode()
+    lines = text.splitlines()
+    assert lines[0] == "id,patient_id,metric_type,value,timestamp"
+    assert lines[1] == "1,7,heart_rate,71.0,2026-01-01T08:00:00+00:00"
+
+
+def test_ndjson_encoder_one_object_per_line():
+    lines = NdjsonEncoder().encode(ROWS).decode().splitlines()
+    assert [json.loads(line)["metric_type"] for line in lines] == ["heart_rate", "spo2"]
+
+
+def test_parquet_encoder_writes_one_row_group_per_chunk():
+    pq = pytest.importorskip("pyarrow.parquet")
+    enc = make_encoder("parquet", "snappy")
+    data = enc.header() + enc.encode(ROWS[:1]) + enc.encode(ROWS[1:]) + enc.footer()
+    parquet = pq.ParquetFile(io.BytesIO(data))
+    assert parquet.num_row_groups == 2
+    assert parquet.read().column("id").to_pylist() == [1, 2]
+
+
+def test_gzip_members_concatenate():
+    enc = CsvEncoder()
+    data = gzip.compress(enc.header()) + gzip.compress(enc.encode(ROWS))
+    assert len(gzip.decompress(data).decode().splitlines()) == 3
+
+
+def test_validate_options_rejects_bad_combinations():
+    with pytest.raises(ExportError):
+        validate_options("xml", "none", 100)
+    with pytest.raises(ExportError):
+        validate_options("csv", "zstd", 100)
+    with pytest.raises(ExportError):
+        validate_options("csv", "gzip", 0)
+    validate_options("parquet", "zstd", 100)
+
+
+def test_scope_requires_exactly_one_target():
+    with pytest.raises(ExportError):
+        ExportScope()
+    with pytest.raises(ExportError):
+        ExportScope(patient_id=1, doctor_id=2)
+
+
+def test_export_query_is_keyset_ordered():
+    sql = str(build_export_query(ExportScope(doctor_id=3), after_id=10))
+    assert "health_metrics.id >" in sql
+    assert sql.rstrip().endswith("ORDER BY metrics.id")
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from app.services.events import METRIC_INGESTED, event_bus
+from app.services.features import FeatureStore, MetricWindow, feature_store
+from app.services.prediction import predict_multi_disease_risk
+
+T0 = datetime(2026, 3, 1, tzinfo=timezone.utc)
+
+
+def test_rolling_statistics_match_full_recompute():
+    rng = np.random.default_rng(5)
+    window = MetricWindow(32)
+    times = T0.timestamp() + np.cumsum(rng.uniform(30, 600, 500))
+    values = 100 + 0.01 * (times - times[0]) / 60 + rng.normal(0, 3, 500)
+    for i, (t, v) in enumerate(zip(times, values)):
+        window.push(float(t), float(v))
+        if i in (10, 31, 32, 95, 499):
+            recent_t = (times[max(0, i - 31):i + 1] - times[0]) / 3600
+            recent_v = values[max(0, i - 31):i + 1]
+            snap = window.snapshot(float(t))
+            assert snap["count"] == len(recent_v)
+            assert abs(snap["mean"] - recent_v.mean()) < 0.01
+            assert abs(snap["std"] - recent_v.std()) < 0.01
+            assert abs(snap["slope_per_hour"] - np.polyfit(recent_t, recent_v, 1)[0]) < 0.01
+
+
+def test_hrv_needs_closely_spaced_heart_rate_samples():
+    store = FeatureStore(window=64, max_patients=2)
+    dense = [("heart_rate", 60.0 if i % 2 else 62.0, T0 + timedelta(seconds=i)) for i in range(20)]
+    store.add_readings(1, dense)
+    rmssd = store.features(1, T0 + timedelta(seconds=20))["heart_rate"]["hrv_rmssd"]
+    assert abs(rmssd - (60000 / 60 - 60000 / 62)) < 0.1
+
+    sparse = [("heart_rate", 60.0 if i % 2 else 62.0, T0 + timedelta(minutes=i)) for i in range(20)]
+    store.add_readings(2, sparse)
+    assert "hrv_rmssd" not in store.features(2, T0)["heart_rate"]
+
+    store.add_readings(3, dense)  # evicts patient 1, the least recently used
+    assert 1 not in store and 2 in store
+
+    # Other metrics get no RR buffer, and no HRV even when closely spaced
+    store.add_readings(3, [("spo2", 97.0 + i % 2, T0 + timedelta(seconds=i)) for i in range(20)])
+    assert store._patients[3]["spo2"].rr_sq is None
+    assert "hrv_rmssd" not in store.features(3, T0 + timedelta(seconds=20))["spo2"]
+
+
+def test_features_feed_scoring():
+    features = {
+        "glucose": {"slope_per_hour": 5.0, "stale": False},
+        "spo2": {"slope_per_hour": -1.0, "stale": False},
+        "heart_rate": {"hrv_rmssd": 12.0, "stale": True},
+    }
+    result = predict_multi_disease_risk({"glucose": 95, "spo2": 97}, None, features)
+    by_condition = {p["condition"]: p for p in result["predictions"]}
+    assert by_condition["Diabetes"]["trend"] == "rising"
+    assert by_condition["Respiratory Breakdown"]["trend"] == "worsening"
+    # Stale windows are ignored, so HRV falls back to the estimate.
+    assert by_condition["Cardiac Arrhythmia"]["key_indicators"][0] == "HRV: 33.8 ms"
+
+    features["heart_rate"]["stale"] = False
+    result = predict_multi_disease_risk({"glucose": 95}, None, features)
+    arrhythmia = {p["condition"]: p for p in result["predictions"]}["Cardiac Arrhythmia"]
+    assert arrhythmia["key_indicators"][0] == "HRV (RMSSD): 12.0 ms"
+
+
+def test_ingested_events_update_the_store():
+    feature_store.clear()
+    event_bus.publish(METRIC_INGESTED, {"patient_id": 42, "readings": [
+        {"id": i, "metric_type": "glucose", "value": 90.0 + i,
+         "timestamp": (T0 + timedelta(hours=i)).isoformat()} for i in range(4)]})
+    glucose = feature_store.features(42, T0 + timedelta(hours=4))["glucose"]
+    assert glucose["count"] == 4 and glucose["slope_per_hour"] == 1.0
+    assert glucose["seconds_since_last"] == 3600.0
+    feature_store.clear()
@@ -0,0 +1,54 @@
+import httpx
+import pytest
+
+from app.services.idempotency import RecentKeys, recent_keys
+
+
+def test_recent_keys_forget_after_two_rotations():
+    keys = RecentKeys(window=3600, max_keys=4)
+    keys.add((1, "a"))
+    keys.add((1, "b"))
+    assert (1, "a") in keys and (1, "c") not in keys
+    # Size-triggered rotations: "a" and "b" survive one, not two.
+    keys.add((1, "c"))
+    assert (1, "a") in keys
+    keys.add((1, "d"))
+    keys.add((1, "e"))
+    assert (1, "a") not in keys and (1, "e") in keys
+
+
+@pytest.mark.dataset(seed=11)
+def test_retried_readings_are_stored_once(dataset, run):
+    from main import app
+
+    async def _run():
+        headers = {"Authorization": f"Bearer {dataset.patient_tokens[0]}",
+                   "X-Device-Id": "watch"}
+        reading = {"metric_type": "heart_rate", "value": 77.0, "idempotency_key": "r-1"}
+        batch = [{"metric_type": "spo2", "value": 97.0 + i, "sequence": i} for i in range(5)]
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = (await client.post("/api/v1/patients/metrics", headers=headers,
+                                       json=reading)).json()
+            retry = (await client.post("/api/v1/patients/metrics", headers=headers,
+                                       json=reading)).json()
+            bulk = (await client.post("/api/v1/patients/metrics/bulk", headers=headers,
+                                      json=batch[:3])).json()
+            # A restarted worker has no memory of the keys; the table does.
+            recent_keys.clear()
+            resent = (await client.post("/api/v1/patients/metrics/bulk", headers=headers,
+                                        json=batch + batch[:1])).json()
+            other = (await client.post("/api/v1/patients/metrics/bulk",
+                                       headers={**headers, "X-Device-Id": "ring"},
+                                       json=batch[:1])).json()
+            stored = (await client.get("/api/v1/patients/metrics?limit=100",
+                                       headers=headers)).json()
+
+        assert retry == first
+        assert bulk["inserted"] == 3
+        assert resent == {"inserted": 2, "rolled_up": 0, "dropped": 0, "duplicates": 4}
+        # Sequence numbers are per device.
+        assert other["inserted"] == 1
+        assert len(stored) == 1 + 5 + 1
+
+    run(_run())
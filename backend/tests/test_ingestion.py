@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.db import session as db_session
+from app.models.health_metric_rollup import HealthMetricRollup
+from app.services.ingestion import reading_time
+from app.services.vitals import latest_metric_values
+
+NOW = datetime(2026, 6, 1, 12, tzinfo=timezone.utc)
+
+
+def test_reading_time_bounds_device_clocks():
+    assert reading_time(None, NOW) == (NOW, None)
+    naive = datetime(2026, 6, 1, 11)
+    assert reading_time(naive, NOW) == (naive.replace(tzinfo=timezone.utc), None)
+    assert reading_time(NOW + timedelta(seconds=30), NOW) == (NOW, "clamped")
+    assert reading_time(NOW + timedelta(days=1), NOW) == (NOW, "replaced")
+    assert reading_time(datetime(1970, 1, 1, tzinfo=timezone.utc), NOW) == (NOW, "replaced")
+
+
+@pytest.mark.dataset(seed=3)
+def test_late_readings_keep_their_time(dataset, run, monkeypatch):
+    from main import app
+
+    monkeypatch.setitem(settings.METRIC_RETENTION_DAYS, "glucose", 30)
+
+    async def _run():
+        patient_id = dataset.patient_ids[0]
+        headers = {"Authorization": f"Bearer {dataset.patient_tokens[0]}"}
+        now = datetime.now(timezone.utc)
+        hour_ago = (now - timedelta(hours=1)).isoformat()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            await client.post("/api/v1/patients/metrics", headers=headers,
+                              json={"metric_type": "glucose", "value": 100.0})
+            # Buffered through a gap: older than the reading above.
+            late = await client.post("/api/v1/patients/metrics", headers=headers, json={
+                "metric_type": "glucose", "value": 180.0, "timestamp": hour_ago})
+            bulk = await client.post("/api/v1/patients/metrics/bulk", headers=headers, json=[
+                {"metric_type": "glucose", "value": 90.0 + i,
+                 "timestamp": (now - timedelta(days=45, minutes=i)).isoformat()}
+                for i in range(3)])
+            old = await client.post("/api/v1/patients/metrics", headers=headers, json={
+                "metric_type": "glucose", "value": 95.0,
+                "timestamp": (now - timedelta(days=60)).isoformat()})
+        async with db_session.SessionLocal() as db:
+            latest = await latest_metric_values(db, patient_id)
+            rollups = (await db.execute(
+                select(HealthMetricRollup).where(HealthMetricRollup.patient_id == patient_id)
+            )).scalars().all()
+
+        stored_at = datetime.fromisoformat(late.json()["timestamp"])
+        assert stored_at.replace(tzinfo=timezone.utc) == datetime.fromisoformat(hour_ago)
+        assert latest["glucose"] == 100.0
+        # Past glucose's 30-day retention, so straight into the hourly rollups.
+        assert bulk.json() == {"inserted": 0, "rolled_up": 3, "dropped": 0, "duplicates": 0}
+        assert old.status_code == 202
+        assert sum(r.count for r in rollups) == 4
+        assert min(r.value_min for r in rollups) == 90.0
+
+    run(_run())
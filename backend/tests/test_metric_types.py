@@ -0,0 +1,128 @@
+import httpx
+import pytest
+from sqlalchemy import insert, inspect, select, text
+
+import migrate_metric_types
+from app.db import session as db_session
+from app.models.health_metrics import HealthMetric
+from app.models.metric_type import BUILTIN_METRIC_TYPES, MetricType, MetricTypeRegistry, metric_types
+from app.services.device_stream import FrameError, decode_frame
+from app.services.vitals import metric_history
+
+
+def test_registry_and_column_round_trip(dataset, run):
+    registry = MetricTypeRegistry(BUILTIN_METRIC_TYPES)
+    assert registry.code("heart_rate") == 1 and registry.name(7) == "spo2"
+    assert registry.next_code() == len(BUILTIN_METRIC_TYPES) + 1
+    with pytest.raises(ValueError):
+        registry.code("mood")
+
+    async def _run():
+        async with db_session.engine.begin() as conn:
+            await conn.execute(insert(HealthMetric), [
+                {"patient_id": dataset.patient_ids[0], "metric_type": "glucose", "value": 99.0}])
+            stored = (await conn.execute(text(
+                "SELECT metric_type_id FROM health_metrics"))).scalar()
+            types = (await conn.execute(select(MetricType.name).order_by(MetricType.id))).scalars()
+            types = tuple(types)
+        async with db_session.SessionLocal() as db:
+            rows = await metric_history(db, dataset.patient_ids[0])
+        return stored, types, rows
+
+    stored, types, rows = run(_run())
+    assert stored == 2
+    assert types == BUILTIN_METRIC_TYPES
+    assert [r.metric_type for r in rows] == ["glucose"]
+
+
+@pytest.mark.dataset(seed=2)
+def test_unknown_types_are_rejected(dataset, run):
+    from main import app
+
+    with pytest.raises(FrameError):
+        decode_frame("json", '{"seq": 1, "r": [["mood", 3.0]]}')
+
+    async def _run():
+        headers = {"Authorization": f"Bearer {dataset.patient_tokens[0]}"}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            unknown = await client.post("/api/v1/patients/metrics", headers=headers,
+                                        json={"metric_type": "mood", "value": 3.0})
+            known = await client.post("/api/v1/patients/metrics", headers=headers,
+                                      json={"metric_type": "spo2", "value": 97.0})
+        return unknown, known
+
+    unknown, known = run(_run())
+    assert unknown.status_code == 422
+    assert known.status_code == 200 and known.json()["metric_type"] == "spo2"
+
+
+def test_migration_backfills_codes_and_drops_names(db, run):
+    async def _run():
+        # health_metrics as it was before metric_types existed
+        async with db_session.engine.begin() as conn:
+            await conn.execute(text("DROP TABLE health_metrics"))
+            await conn.execute(text("DROP TABLE metric_types"))
+            await conn.execute(text(
+                "CREATE TABLE health_metrics (id INTEGER PRIMARY KEY, patient_id INTEGER, "
+                "metric_type VARCHAR, value FLOAT, timestamp DATETIME)"))
+            await conn.execute(text(
+                "CREATE INDEX ix_health_metrics_metric_type ON health_metrics (metric_type)"))
+            await conn.execute(text(
+                "INSERT INTO health_metrics (patient_id, metric_type, value, timestamp) "
+                "VALUES (1, :type, 1.0, '2026-05-01 00:00:00')"),
+                [{"type": t} for t in ("heart_rate", "body_weight", "spo2", "heart_rate", "body_weight")])
+
+        assert await migrate_metric_types.main(2, 0, 0.0, drop_names=False) == 0
+        async with db_session.engine.connect() as conn:
+            coded = (await conn.execute(text(
+                "SELECT metric_type, metric_type_id FROM health_metrics ORDER BY id"))).all()
+        assert await migrate_metric_types.main(2, 0, 0.0, drop_names=True) == 0
+        async with db_session.engine.connect() as conn:
+            columns = await conn.run_sync(
+                lambda c: {col["name"] for col in inspect(c).get_columns("health_metrics")})
+        async with db_session.SessionLocal() as db:
+            rows = await metric_history(db, 1)
+        return coded, columns, rows
+
+    coded, columns, rows = run(_run())
+    weight = metric_types.code("body_weight")
+    assert weight == len(BUILTIN_METRIC_TYPES) + 1
+    assert [c for _, c in coded] == [1, weight, 7, 1, weight]
+    assert "metric_type" not in columns and "metric_type_id" in columns
+    assert sorted(r.metric_type for r in rows) == [
+        "body_weight", "body_weight", "heart_rate", "heart_rate", "spo2"]
+
+
+def test_a_code_lost_to_another_worker_is_not_kept(db, run, monkeypatch):
+    from sqlalchemy.exc import IntegrityError
+
+    from app.services import metric_types as service
+
+    async def stale_load(session):
+        # The dictionary was read before the other worker's commit
+        return len(metric_types)
+
+    # The registry is process-wide; what this test teaches it is undone after
+    monkeypatch.setattr(metric_types, "_codes", dict(metric_types._codes))
+    monkeypatch.setattr(metric_types, "_names", dict(metric_types._names))
+
+    async def _run():
+        code = metric_types.next_code()
+        async with db.SessionLocal() as theirs:
+            await theirs.execute(insert(MetricType), [{"id": code, "name": "sleep"}])
+            await theirs.commit()
+        with monkeypatch.context() as m:
+            m.setattr(service, "load_metric_types", stale_load)
+            async with db.SessionLocal() as mine:
+                with pytest.raises(IntegrityError):
+                    await service.register_metric_types(mine, ["steps"])
+        assert "steps" not in metric_types
+        async with db.SessionLocal() as retry:
+            added = await service.register_metric_types(retry, ["steps"])
+            await retry.commit()
+        return code, added
+
+    code, added = run(_run())
+    assert metric_types.name(code) == "sleep"
+    assert added == {"steps": code + 1} and metric_types.code("steps") == code + 1
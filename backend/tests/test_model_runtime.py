@@ -0,0 +1,55 @@
+import asyncio
+import os
+import tempfile
+
+from app.core.config import settings
+from app.services.model_runtime import ModelRuntime
+from app.services.prediction import score_risks_batch
+from train_models import train
+
+VITALS = {"glucose": 230.0, "heart_rate": 80.0, "blood_pressure_sys": 150.0}
+
+
+def test_micro_batching_hot_reload_and_fallback(monkeypatch):
+    monkeypatch.setattr(settings, "MODEL_BATCH_MAX_WAIT_MS", 20.0)
+    model_dir = tempfile.mkdtemp()
+    train(model_dir, "v1", samples=600, seed=1, conditions=["Diabetes"])
+    runtime = ModelRuntime(model_dir)
+
+    async def _run():
+        assert await runtime.reload() == {"Diabetes": "v1"}
+        assert await runtime.reload() == {}  # unchanged files are not reloaded
+
+        results = await asyncio.gather(*(runtime.predict(VITALS) for _ in range(25)))
+        by_condition = {p["condition"]: p for p in results[0]["predictions"]}
+        assert by_condition["Diabetes"]["model"] == "v1"
+        assert by_condition["Diabetes"]["risk_level"] in ("High", "Critical")
+        assert by_condition["Hypertension"]["model"] == "heuristic"
+        diabetes = runtime.status()[0]
+        assert (diabetes["batches"], diabetes["rows"]) == (1, 25)
+        # Only the models of the selected conditions run
+        only = await runtime.predict(VITALS, conditions=["Hypertension"], outputs=[])
+        assert [p["condition"] for p in only["predictions"]] == ["Hypertension"]
+        assert runtime.status()[0]["rows"] == 25
+
+        batch = await runtime.score_many([VITALS, {}])
+        heuristic = score_risks_batch([VITALS, {}])
+        assert [row[1:] for row in batch] == [row[1:] for row in heuristic]
+        assert batch[0][0] != heuristic[0][0]
+
+        # A newer version is picked up; a broken one leaves it serving.
+        fingerprint = runtime.fingerprint
+        train(model_dir, "v2", samples=600, seed=2, conditions=["Diabetes"])
+        assert await runtime.reload() == {"Diabetes": "v2"}
+        assert runtime.fingerprint != fingerprint
+        with open(os.path.join(model_dir, "diabetes", "v10.joblib"), "wb") as f:
+            f.write(b"not a model")
+        assert await runtime.reload() == {}
+        assert runtime.status()[0]["model"] == "v2" and "error" in runtime.status()[0]
+
+        # CURRENT pins a version explicitly.
+        with open(os.path.join(model_dir, "diabetes", "CURRENT"), "w") as f:
+            f.write("v1\n")
+        assert await runtime.reload() == {"Diabetes": "v1"}
+
+    asyncio.run(_run())
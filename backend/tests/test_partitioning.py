@@ -0,0 +1,157 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+
+import app.db.base  # noqa: F401
+from app.core.config import settings
+from app.db import partitioning
+from app.db import session as db_session
+from app.db.utils import as_utc, to_epoch
+from app.db.base import Base
+from app.models.health_metric_rollup import HealthMetricRollup
+from app.models.health_metrics import HealthMetric
+from app.services.retention import run_retention
+from app.services.vitals import latest_metric_values, metric_history
+
+JAN = datetime(2026, 1, 15, tzinfo=timezone.utc)
+FEB = datetime(2026, 2, 10, tzinfo=timezone.utc)
+
+
+def test_month_helpers():
+    dec = datetime(2025, 12, 1, tzinfo=timezone.utc)
+    assert partitioning.add_months(dec, 1) == datetime(2026, 1, 1, tzinfo=timezone.utc)
+    assert partitioning.partition_name(dec) == "health_metrics_p202512"
+    part = partitioning.partition_for_name("health_metrics_p202512")
+    assert (part.lower, part.upper) == (dec, datetime(2026, 1, 1, tzinfo=timezone.utc))
+    assert partitioning.partition_for_name("health_metrics_default") is None
+    assert len(partitioning.months_between(JAN, FEB)) == 2
+
+
+def test_time_helpers_normalise_to_utc():
+    local = datetime(2026, 1, 31, 20, tzinfo=timezone(timedelta(hours=-5)))
+    assert as_utc(local) == datetime(2026, 2, 1, 1, tzinfo=timezone.utc)
+    assert as_utc(local).tzinfo is timezone.utc
+    assert as_utc(datetime(2026, 2, 1, 1)) == as_utc(local) and as_utc(None) is None
+    assert to_epoch("2026-02-01T01:00:00") == to_epoch(local) == as_utc(local).timestamp()
+    # Month routing follows the UTC month, not the local one
+    assert partitioning.month_start(local) == datetime(2026, 2, 1, tzinfo=timezone.utc)
+
+
+def test_postgres_ddl_is_range_partitioned():
+    ddl = str(CreateTable(HealthMetric.__table__).compile(dialect=postgresql.dialect()))
+    assert 'PRIMARY KEY (id, "timestamp")' in ddl
+    assert 'PARTITION BY RANGE ("timestamp")' in ddl
+
+
+async def _reset():
+    async with db_session.engine.begin() as conn:
+        names = (await conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND name LIKE 'health_metrics_p%'"))).scalars().all()
+        for name in names:
+            await conn.execute(text(f"DROP TABLE {name}"))
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        # A reading written before routing was switched on
+        await conn.execute(insert(HealthMetric), [{
+            "patient_id": 1, "metric_type": "glucose", "value": 90.0,
+            "timestamp": JAN - timedelta(days=60)}])
+
+
+def _reading(ts, metric_type="heart_rate", value=70.0):
+    return {"patient_id": 1, "metric_type": metric_type, "value": value, "timestamp": ts}
+
+
+def test_sqlite_routing_and_retention(monkeypatch):
+    monkeypatch.setattr(settings, "SQLITE_METRIC_PARTITIONS", True)
+    monkeypatch.setattr(settings, "METRIC_RETENTION_DAYS", {})
+    monkeypatch.setattr(settings, "METRIC_RETENTION_DEFAULT_DAYS", 30)
+    monkeypatch.setattr(partitioning, "_known_periods", {})
+    monkeypatch.setattr(partitioning, "_registry_loaded_at", {})
+
+    async def _run():
+        await _reset()
+        async with db_session.SessionLocal() as db:
+            stored = await partitioning.insert_metric_rows(db, [
+                _reading(FEB, value=72.0), _reading(JAN, value=60.0),
+                _reading(JAN + timedelta(hours=1), value=64.0)])
+            await db.commit()
+        # Input order is preserved and each month has its own id range
+        assert [r.value for r in stored] == [72.0, 60.0, 64.0]
+        assert stored[0].id > 202602 * partitioning.SQLITE_ID_STRIDE
+        assert 202601 * partitioning.SQLITE_ID_STRIDE < stored[1].id < stored[0].id
+
+        async with db_session.SessionLocal() as db:
+            tables = await partitioning.metric_tables(db, FEB, FEB + timedelta(days=1))
+            assert [t.name for t in tables] == ["health_metrics", "health_metrics_p202602"]
+            history = await metric_history(db, 1)
+            assert [r.value for r in history] == [72.0, 64.0, 60.0, 90.0]
+            latest = await latest_metric_values(db, 1, now=FEB + timedelta(days=1))
+            assert latest == {"heart_rate": 72.0}
+
+        progress = await run_retention(now=datetime(2026, 3, 5, tzinfo=timezone.utc))
+        assert progress.state == "done"
+        assert progress.partitions_expired == ["health_metrics_p202601"]
+        # January dropped whole, the legacy row deleted, February kept
+        assert progress.rows_deleted == 3
+        async with db_session.SessionLocal() as db:
+            names = [p.name for p in await partitioning.list_partitions(db)]
+            assert names == ["health_metrics_p202602"]
+            assert [r.value for r in await metric_history(db, 1)] == [72.0]
+            rollups = (await db.execute(select(HealthMetricRollup))).scalars().all()
+        assert sorted((r.metric_type, r.count) for r in rollups) == [
+            ("glucose", 1), ("heart_rate", 1), ("heart_rate", 1)]
+
+    asyncio.run(_run())
+
+
+def test_partition_expiry_commits_per_batch(monkeypatch):
+    from app.services import retention
+
+    monkeypatch.setattr(settings, "SQLITE_METRIC_PARTITIONS", True)
+    monkeypatch.setattr(settings, "METRIC_RETENTION_DAYS", {})
+    monkeypatch.setattr(settings, "METRIC_RETENTION_DEFAULT_DAYS", 30)
+    monkeypatch.setattr(partitioning, "_known_periods", {})
+    monkeypatch.setattr(partitioning, "_registry_loaded_at", {})
+    now = datetime(2026, 3, 5, tzinfo=timezone.utc)
+
+    real_drop, drops = retention.drop_partition, []
+
+    async def drop_once_failing(db, partition):
+        drops.append(partition.name)
+        if len(drops) == 1:
+            raise RuntimeError("drop failed")
+        await real_drop(db, partition)
+
+    async def _run():
+        await _reset()
+        async with db_session.SessionLocal() as db:
+            await partitioning.insert_metric_rows(db, [
+                _reading(JAN + timedelta(minutes=m), value=60.0 + m) for m in range(3)])
+            await db.commit()
+
+        monkeypatch.setattr(retention, "drop_partition", drop_once_failing)
+        progress = await run_retention(now=now, batch_size=1)
+        assert progress.state == "failed"
+        # Every batch committed its rollups and deleted its rows before the drop
+        assert progress.rows_deleted == 3
+        async with db_session.SessionLocal() as db:
+            left = (await db.execute(text(
+                "SELECT count(*) FROM health_metrics_p202601"))).scalar()
+            rolled = (await db.execute(select(HealthMetricRollup.count))).scalars().all()
+        assert left == 0 and sum(rolled) == 3
+
+        progress = await run_retention(now=now, batch_size=1)
+        assert progress.state == "done"
+        async with db_session.SessionLocal() as db:
+            assert await partitioning.list_partitions(db) == []
+            rollups = (await db.execute(
+                select(HealthMetricRollup).where(HealthMetricRollup.metric_type == "heart_rate")
+            )).scalars().all()
+        # Rolled up once, not again by the rerun
+        assert [(r.count, r.value_min, r.value_max) for r in rollups] == [(3, 60.0, 62.0)]
+
+    asyncio.run(_run())
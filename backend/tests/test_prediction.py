@@ -1,4 +1,12 @@
-from app.services.prediction import predict_risk
+import pytest
+
+from app.services.prediction import predict_multi_disease_risk
+
+PROFILE = {"age": 30, "bmi": 22}
+
+
+def _by_condition(result):
+    return {p["condition"]: p for p in result["predictions"]}
 
 
 def test_predict_risk_healthy():
@@ -7,56 +15,113 @@ def test_predict_risk_healthy():
         "glucose": 90,
         "stress_level": 20
     }
-    result = predict_risk(metrics)
-    assert result["overall_status"] == "Healthy"
-    assert len(result["predictions"]) == 0
+    result = predict_multi_disease_risk(metrics, PROFILE)
+    assert result["overall_status"] == "Stable"
+    assert len(result["predictions"]) == 6
+    assert all(p["risk_level"] == "Low" for p in result["predictions"])
 
 
 def test_predict_risk_diabetes_high():
     metrics = {
         "heart_rate": 70,
-        "glucose": 130,
+        "glucose": 200,
         "stress_level": 20
     }
-    result = predict_risk(metrics)
-    assert result["overall_status"] == "Warning"
-    assert any(p["condition"] == "Diabetes" and p["risk_level"]
-               == "High" for p in result["predictions"])
+    result = predict_multi_disease_risk(metrics, PROFILE)
+    assert result["overall_status"] == "Critical"
+    assert _by_condition(result)["Diabetes"]["risk_level"] == "Critical"
+    assert "Diabetes" in result["summary"]
 
 
 def test_predict_risk_arrhythmia():
     metrics = {
-        "heart_rate": 110,
+        "heart_rate": 45,
         "glucose": 90,
         "stress_level": 20
     }
-    result = predict_risk(metrics)
+    result = predict_multi_disease_risk(metrics, PROFILE)
     assert result["overall_status"] == "Stable"
-    assert any(p["condition"] == "Arrhythmia" and p["risk_level"]
-               == "Moderate" for p in result["predictions"])
+    assert _by_condition(result)["Cardiac Arrhythmia"]["risk_level"] == "Moderate"
 
 
 def test_predict_risk_hypertension():
     metrics = {
-        "heart_rate": 70,
-        "glucose": 90,
-        "stress_level": 80
+        "blood_pressure_sys": 165,
+        "blood_pressure_dia": 100
     }
-    result = predict_risk(metrics)
-    assert result["overall_status"] == "Stable"
-    assert any(p["condition"] == "Hypertension" and p["risk_level"]
-               == "Moderate" for p in result["predictions"])
+    result = predict_multi_disease_risk(metrics, PROFILE)
+    assert result["overall_status"] == "Critical"
+    assert _by_condition(result)["Hypertension"]["risk_level"] == "Critical"
 
 
 def test_predict_risk_multiple():
     metrics = {
         "heart_rate": 45,
-        "glucose": 110,
-        "stress_level": 20
+        "glucose": 130,
+        "stress_level": 80
     }
-    result = predict_risk(metrics)
-    assert result["overall_status"] == "Stable"
-    assert len(result["predictions"]) == 2
-    conditions = [p["condition"] for p in result["predictions"]]
-    assert "Bradycardia" in conditions
-    assert "Diabetes" in conditions
+    result = predict_multi_disease_risk(metrics, PROFILE)
+    conditions = _by_condition(result)
+    assert conditions["Diabetes"]["risk_level"] == "Moderate"
+    assert conditions["Cardiac Arrhythmia"]["risk_level"] in ("Moderate", "High")
+    assert len(result["timeline"]) == 12
+
+
+def test_batch_scores_match_single_patient_engine():
+    import random
+    from app.services.prediction import score_risks_batch
+
+    rng = random.Random(7)
+    batch = [{
+        "heart_rate": rng.uniform(40, 130), "glucose": rng.uniform(60, 250),
+        "spo2": rng.uniform(88, 100), "respiratory_rate": rng.uniform(10, 26),
+        "blood_pressure_sys": rng.uniform(95, 180), "blood_pressure_dia": rng.uniform(55, 110),
+        "stress_level": rng.uniform(0, 100),
+    } for _ in range(200)] + [{}]
+    features = [{"heart_rate": {"hrv_rmssd": rng.uniform(5, 80), "stale": False}}
+                if i % 3 == 0 else {} for i in range(len(batch))]
+    for metrics, feats, scored in zip(batch, features,
+                                      score_risks_batch(batch, PROFILE, features)):
+        expected = [(p["condition"], p["score"], p["risk_level"]) for p in
+                    predict_multi_disease_risk(metrics, PROFILE, feats)["predictions"]]
+        assert scored == expected
+
+
+def test_selected_conditions_and_outputs_match_the_full_analysis(monkeypatch):
+    from app.services import prediction
+
+    metrics = {"heart_rate": 118, "glucose": 190, "spo2": 91, "blood_pressure_sys": 165,
+               "blood_pressure_dia": 100, "stress_level": 85}
+    features = {"heart_rate": {"hrv_rmssd": 12.0, "stale": False}}
+    full = predict_multi_disease_risk(metrics, PROFILE, features)
+
+    hrv_lookups = []
+    monkeypatch.setattr(prediction, "_hrv", lambda f: hrv_lookups.append(f) or 12.0)
+    one = predict_multi_disease_risk(metrics, PROFILE, features, conditions=["Diabetes"],
+                                     outputs=[])
+    assert one == {"predictions": [_by_condition(full)["Diabetes"]]}
+    assert hrv_lookups == []  # nothing asked for needs HRV
+
+    # Arrhythmia and stress share one HRV lookup; the recommendations need
+    # the respiratory score even though its prediction isn't returned.
+    some = predict_multi_disease_risk(
+        metrics, PROFILE, features, conditions=["Cardiac Arrhythmia", "Stress Disorder"],
+        outputs=["overall_status", "recommendations"])
+    assert len(hrv_lookups) == 1
+    assert set(some) == {"overall_status", "predictions", "recommendations"}
+    assert some["predictions"] == [_by_condition(full)[c]
+                                   for c in ("Cardiac Arrhythmia", "Stress Disorder")]
+    assert some["recommendations"] == full["recommendations"]
+    assert some["overall_status"] == "Warning"
+
+
+def test_condition_registry_declares_inputs():
+    from app.services.prediction import RISK_CONDITIONS, conditions_needed, required_metrics
+
+    assert len(RISK_CONDITIONS) == 6
+    assert required_metrics(["Diabetes", "Respiratory Breakdown"]) == (
+        "glucose", "respiratory_rate", "spo2")
+    assert conditions_needed(["Cholesterol"], ["comorbidities"]) == (
+        "Diabetes", "Hypertension", "Stress Disorder", "Cholesterol")
+    with pytest.raises(ValueError):
+        conditions_needed(["Gout"])
@@ -1,17 +1,22 @@
 import unittest
-from app.services.prediction import predict_risk
+from app.services.prediction import predict_multi_disease_risk
+
+PROFILE = {"age": 30, "bmi": 22}
 
 
 class TestPrediction(unittest.TestCase):
+    def _levels(self, result):
+        return {p["condition"]: p["risk_level"] for p in result["predictions"]}
+
     def test_predict_risk_healthy(self):
         metrics = {
             "heart_rate": 70,
             "glucose": 90,
             "stress_level": 20
         }
-        result = predict_risk(metrics)
-        self.assertEqual(result["overall_status"], "Healthy")
-        self.assertEqual(len(result["predictions"]), 0)
+        result = predict_multi_disease_risk(metrics, PROFILE)
+        self.assertEqual(result["overall_status"], "Stable")
+        self.assertEqual(len(result["predictions"]), 6)
 
     def test_predict_risk_diabetes_high(self):
         metrics = {
@@ -19,10 +24,9 @@ class TestPrediction(unittest.TestCase):
             "glucose": 130,
             "stress_level": 20
         }
-        result = predict_risk(metrics)
-        self.assertEqual(result["overall_status"], "Warning")
-        self.assertTrue(any(p["condition"] == "Diabetes" and p["risk_level"]
-                        == "High" for p in result["predictions"]))
+        result = predict_multi_disease_risk(metrics, PROFILE)
+        self.assertEqual(result["overall_status"], "Stable")
+        self.assertEqual(self._levels(result)["Diabetes"], "Moderate")
 
     def test_predict_risk_arrhythmia(self):
         metrics = {
@@ -30,23 +34,21 @@ class TestPrediction(unittest.TestCase):
             "glucose": 90,
             "stress_level": 20
         }
-        result = predict_risk(metrics)
-        # Prediction service: "overall_status": "Warning" if any(r["risk_level"] == "High" for r in risks) else "Stable"
-        # Arrhythmia with heart_rate 110 is Moderate risk (score 50), so status should be Stable
+        result = predict_multi_disease_risk(metrics, PROFILE)
+        # HR 110 sits just under the +25 tachycardia penalty, so the
+        # arrhythmia score stays Low and the overall status Stable
         self.assertEqual(result["overall_status"], "Stable")
-        self.assertTrue(any(p["condition"] == "Arrhythmia" and p["risk_level"]
-                        == "Moderate" for p in result["predictions"]))
+        self.assertEqual(self._levels(result)["Cardiac Arrhythmia"], "Low")
 
-    def test_predict_risk_hypertension(self):
+    def test_predict_risk_stress(self):
         metrics = {
             "heart_rate": 70,
             "glucose": 90,
             "stress_level": 80
         }
-        result = predict_risk(metrics)
+        result = predict_multi_disease_risk(metrics, PROFILE)
         self.assertEqual(result["overall_status"], "Stable")
-        self.assertTrue(any(p["condition"] == "Hypertension" and p["risk_level"]
-                        == "Moderate" for p in result["predictions"]))
+        self.assertEqual(self._levels(result)["Stress Disorder"], "Moderate")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,64 @@
+import tempfile
+
+import httpx
+import pytest
+from sqlalchemy import insert
+
+from app.core.profiling import ProfileStore, folded_text, profile_store
+from app.core.security import create_access_token
+from app.db import session as db_session
+from app.models.user import User
+
+
+def test_store_keeps_newest_profiles():
+    store = ProfileStore(tempfile.mkdtemp(prefix="biosense-profiles-"), max_files=2)
+    ids = []
+    for i in range(3):
+        ids.append(store.new_id())
+        store.save({"id": ids[-1], "path": f"/{i}", "stacks": {"a;b": 5}})
+    assert [p["path"] for p in store.list()] == ["/2", "/1"]
+    assert store.load(ids[0]) is None
+    assert folded_text(store.load(ids[2])) == "a;b 5\n"
+    assert store.load("../../etc/passwd") is None
+
+
+@pytest.mark.dataset(metrics=20, seed=5)
+def test_admin_can_profile_a_request(dataset, run):
+    from main import app
+
+    profile_store.directory = tempfile.mkdtemp(prefix="biosense-profiles-")
+
+    async def _run():
+        async with db_session.engine.begin() as conn:
+            await conn.execute(insert(User), [{
+                "id": 1, "full_name": "Admin", "email": "admin@example.com",
+                "hashed_password": "!", "role": "admin"}])
+        admin = {"Authorization": f"Bearer {create_access_token({'sub': '1', 'role': 'admin'})}"}
+        patient = {"Authorization": f"Bearer {dataset.patient_tokens[0]}"}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            plain = await client.get("/api/v1/patients/metrics", headers=patient)
+            assert "x-profile-id" not in plain.headers
+            # Patients can't ask for profiles; the request is served as usual.
+            refused = await client.get("/api/v1/patients/metrics",
+                                       headers={**patient, "X-Profile": "1"})
+            assert refused.status_code == 200 and "x-profile-id" not in refused.headers
+
+            profiled = await client.get("/api/v1/admin/stats", headers={**admin, "X-Profile": "1"})
+            assert profiled.status_code == 200
+            profile_id = profiled.headers["x-profile-id"]
+
+            listed = await client.get("/api/v1/admin/profiles", headers=admin)
+            assert [p["id"] for p in listed.json()] == [profile_id]
+            profile = (await client.get(f"/api/v1/admin/profiles/{profile_id}",
+                                        headers=admin)).json()
+            folded = await client.get(f"/api/v1/admin/profiles/{profile_id}?format=folded",
+                                      headers=admin)
+
+        assert profile["path"] == "/api/v1/admin/stats" and profile["status"] == 200
+        assert profile["trigger"] == "request" and profile["samples"] > 0
+        assert folded.headers["content-disposition"].endswith(f'{profile_id}.folded"')
+        # Samples land in the endpoint's own coroutine, awaiting or running.
+        assert any("get_system_stats" in stack for stack in profile["stacks"])
+
+    run(_run())
@@ -0,0 +1,111 @@
+import asyncio
+from contextlib import contextmanager
+
+import httpx
+import pytest
+from sqlalchemy import event
+
+from app.db import session as db_session
+from app.services.data_quality import cadence_store
+from app.services.features import feature_store
+
+# (method, path, as, body, statements). Every request starts with get_db's
+# SELECT 1 probe; the doctor or patient (with hospital, and a patient's
+# doctor) is then one query through the request's loaders, reused by the
+# handler. Feature windows and reading counters are cold, so predictions
+# include both warm-up reads.
+ROUTES = [
+    ("GET", "/api/v1/doctors/me", "doctor", None, 2),
+    ("PATCH", "/api/v1/doctors/me", "doctor", {"qualification": "MBBS"}, 3),
+    ("GET", "/api/v1/doctors/patients/1", "doctor", None, 3),
+    ("GET", "/api/v1/doctors/patients/1/metrics", "doctor", None, 5),
+    ("GET", "/api/v1/doctors/patients/1/risk-history", "doctor", None, 4),
+    # validators, data-quality warm-up, latest values, feature warm-up
+    ("GET", "/api/v1/doctors/patients/1/predictions", "doctor", None, 7),
+    # stats, patients, their latest values in one query, appointments
+    ("GET", "/api/v1/doctors/dashboard", "doctor", None, 6),
+    ("GET", "/api/v1/patients/me", "patient", None, 2),
+    ("PATCH", "/api/v1/patients/me", "patient", {"address": "2 Bench St"}, 3),
+    ("GET", "/api/v1/patients/predictions", "patient", None, 6),
+]
+
+pytestmark = pytest.mark.dataset(patients=3, metrics=16, seed=12)
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = db_session.engine.sync_engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.mark.parametrize("method,path,role,body,expected", ROUTES,
+                         ids=[f"{r[0]} {r[1]}" for r in ROUTES])
+def test_route_query_count(dataset, run, method, path, role, body, expected):
+    from main import app
+
+    token = dataset.doctor_token if role == "doctor" else dataset.patient_tokens[0]
+
+    async def _run():
+        feature_store.clear()
+        cadence_store.clear()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            with count_statements() as statements:
+                response = await client.request(
+                    method, path, json=body, headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200
+        assert len(statements) == expected, "\n".join(statements)
+
+    run(_run())
+
+
+def test_loader_coalesces_concurrent_lookups(dataset, run):
+    from app.db.loaders import loaders
+
+    async def _run():
+        async with db_session.SessionLocal() as db:
+            patients = loaders(db).patients
+            with count_statements() as statements:
+                found = await asyncio.gather(patients.load(1), patients.load(2),
+                                             patients.load(1), patients.load(999))
+                again = await patients.load(2)
+                hospital = await loaders(db).hospitals.load(1)
+        assert len(statements) == 1
+        assert [p and p.id for p in found] == [1, 2, 1, None]
+        assert again is found[1] and hospital is found[0].hospital
+
+    run(_run())
+
+
+def test_loaders_of_a_session_run_one_batch_at_a_time():
+    from app.db.loaders import Loader
+
+    batches, running = [], []
+
+    async def batch(db, keys):
+        running.append(keys)
+        assert len(running) == 1, "batches overlapped on the session"
+        await asyncio.sleep(0.01)
+        running.remove(keys)
+        batches.append(keys)
+        return {key: key * 10 for key in keys}
+
+    async def _run():
+        lock, tasks = asyncio.Lock(), set()
+        first, second = Loader(None, batch, lock, tasks), Loader(None, batch, lock, tasks)
+        found = await asyncio.gather(first.load(1), second.load(2), first.load(3))
+        return found, tasks
+
+    found, tasks = asyncio.run(_run())
+    assert found == [10, 20, 30]
+    assert batches == [[1, 3], [2]]
+    assert not tasks
@@ -0,0 +1,86 @@
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.core.telemetry import INGEST_RATE_LIMITED
+from app.services import rate_limit
+from app.services.rate_limit import TokenBuckets
+
+
+def test_buckets_refill_and_evict():
+    buckets = TokenBuckets(max_buckets=2)
+    assert buckets.take("a", 15, rate=2.0, burst=10, now=0.0) == (10, 0.0)
+    granted, retry_after = buckets.take("a", 1, rate=2.0, burst=10, now=0.0)
+    assert granted == 0 and abs(retry_after - 0.5) < 1e-9
+    assert buckets.take("a", 5, rate=2.0, burst=10, now=1.0)[0] == 2
+
+    buckets.take("b", 1, rate=2.0, burst=10, now=1.0)
+    buckets.take("c", 1, rate=2.0, burst=10, now=1.0)
+    assert len(buckets) == 2  # "a" went over the cap
+    # Once refilled, buckets are indistinguishable from new ones and are dropped.
+    buckets.take("d", 1, rate=2.0, burst=10, now=100.0)
+    assert len(buckets) == 1
+
+
+@pytest.mark.dataset(seed=9)
+def test_over_limit_batches_are_thinned_then_refused(dataset, run, monkeypatch):
+    from main import app
+
+    monkeypatch.setitem(settings.INGEST_RATE_LIMITS, "glucose", (0.001, 10))
+    rate_limit.buckets.clear()
+
+    async def _run():
+        headers = {"Authorization": f"Bearer {dataset.patient_tokens[0]}",
+                   "X-Device-Id": "meter-1"}
+        readings = [{"metric_type": "glucose", "value": 90.0 + i} for i in range(40)]
+        sampled_before = INGEST_RATE_LIMITED.labels("rest", "sampled").value
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            bulk = await client.post("/api/v1/patients/metrics/bulk", headers=headers,
+                                     json=readings + [{"metric_type": "spo2", "value": 97.0}])
+            refused = await client.post("/api/v1/patients/metrics", headers=headers,
+                                        json=readings[0])
+            other_device = await client.post("/api/v1/patients/metrics",
+                                             headers={**headers, "X-Device-Id": "meter-2"},
+                                             json=readings[0])
+            stored = (await client.get("/api/v1/patients/metrics?limit=100",
+                                       headers=headers)).json()
+
+        assert bulk.json() == {"inserted": 11, "rolled_up": 0, "dropped": 30, "duplicates": 0}
+        assert refused.status_code == 429 and int(refused.headers["retry-after"]) > 0
+        assert other_device.status_code == 200
+        glucose = sorted(r["value"] for r in stored if r["metric_type"] == "glucose")
+        # An even spread of the batch survives, plus meter-2's reading.
+        assert glucose == [90.0, 92.0, 96.0, 100.0, 104.0, 108.0, 112.0, 116.0, 120.0, 124.0, 128.0]
+        assert INGEST_RATE_LIMITED.labels("rest", "sampled").value == sampled_before + 30
+
+    run(_run())
+
+
+@pytest.mark.dataset(seed=9)
+def test_retries_of_stored_readings_spend_no_tokens(dataset, run, monkeypatch):
+    from main import app
+
+    monkeypatch.setitem(settings.INGEST_RATE_LIMITS, "glucose", (0.001, 1))
+    rate_limit.buckets.clear()
+
+    async def _run():
+        headers = {"Authorization": f"Bearer {dataset.patient_tokens[0]}",
+                   "X-Device-Id": "meter-1"}
+        reading = {"metric_type": "glucose", "value": 91.0, "idempotency_key": "retry-1"}
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first = await client.post("/api/v1/patients/metrics", headers=headers, json=reading)
+            retry = await client.post("/api/v1/patients/metrics", headers=headers, json=reading)
+            bulk_retry = await client.post("/api/v1/patients/metrics/bulk", headers=headers,
+                                           json=[reading])
+            new = await client.post("/api/v1/patients/metrics", headers=headers,
+                                    json={**reading, "idempotency_key": "retry-2"})
+
+        # The bucket's one token went on the first reading, yet retries are answered.
+        assert first.status_code == retry.status_code == 200
+        assert retry.json()["id"] == first.json()["id"]
+        assert bulk_retry.json() == {"inserted": 0, "rolled_up": 0, "dropped": 0, "duplicates": 1}
+        assert new.status_code == 429
+
+    run(_run())
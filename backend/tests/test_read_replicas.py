@@ -0,0 +1,79 @@
+import math
+import os
+import shutil
+import time
+
+import httpx
+import pytest
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.db import routing
+from app.db import session as db_session
+from app.db.routing import RecentWriters, ReplicaSet
+from app.models.health_metrics import HealthMetric
+
+
+def test_round_robin_skips_lagging_replicas():
+    engines = [create_async_engine(f"sqlite+aiosqlite:///replica-{i}.db") for i in range(3)]
+    replicas = ReplicaSet(engines, max_lag=5.0)
+    assert [replicas.choose() for _ in range(4)] == [engines[0], engines[1], engines[2], engines[0]]
+    replicas.replicas[1].lag = 30.0
+    replicas.replicas[2].lag = math.inf
+    assert [replicas.choose() for _ in range(2)] == [engines[0], engines[0]]
+    replicas.replicas[0].lag = 6.0
+    assert replicas.choose() is None
+
+
+def test_recent_writers_expire_and_are_capped():
+    writers = RecentWriters(window=0.05, max_clients=2)
+    for client in (("patient", 1), ("patient", 2), ("doctor", 1)):
+        writers.add(client)
+    assert ("patient", 1) not in writers and ("doctor", 1) in writers
+    assert len(writers) == 2
+    time.sleep(0.06)
+    assert ("doctor", 1) not in writers
+
+
+@pytest.mark.dataset(metrics=5, seed=3)
+def test_reads_go_to_the_replica_unless_the_client_just_wrote(dataset, run, monkeypatch, tmp_path):
+    from main import app
+
+    async def _run():
+        # A copy of the primary as it stands stands in for a replica
+        replica_path = os.path.join(tmp_path, "replica.db")
+        shutil.copy(db_session.engine.url.database, replica_path)
+        replica = create_async_engine(f"sqlite+aiosqlite:///{replica_path}")
+        monkeypatch.setattr(routing, "replicas", ReplicaSet([replica], max_lag=5.0))
+        routing.recent_writers.clear()
+
+        # Written to the primary only, and not by an API client
+        async with db_session.engine.begin() as conn:
+            await conn.execute(insert(HealthMetric), [{
+                "patient_id": dataset.patient_ids[0], "metric_type": "spo2", "value": 91.0}])
+
+        doctor = {"Authorization": f"Bearer {dataset.doctor_token}"}
+        patient = {"Authorization": f"Bearer {dataset.patient_tokens[0]}"}
+        doctor_url = f"/api/v1/doctors/patients/{dataset.patient_ids[0]}/metrics?limit=100"
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            before = (await client.get("/api/v1/patients/metrics?limit=100", headers=patient)).json()
+            export = await client.get("/api/v1/exports/metrics?scope=panel", headers=doctor)
+            posted = await client.post("/api/v1/patients/metrics", headers=patient,
+                                       json={"metric_type": "glucose", "value": 101.0})
+            own = (await client.get("/api/v1/patients/metrics?limit=100", headers=patient)).json()
+            others = (await client.get(doctor_url, headers=doctor)).json()
+            routing.replicas.replicas[0].lag = math.inf
+            fallback = (await client.get(doctor_url, headers=doctor)).json()
+        await replica.dispose()
+
+        assert len(before) == 5
+        assert len(export.text.strip().splitlines()) == 1 + 5
+        assert posted.status_code == 200
+        # The patient sees their own reading; the doctor reads the replica
+        # until it is found to be lagging.
+        assert len(own) == 7
+        assert len(others) == 5
+        assert len(fallback) == 7
+
+    run(_run())
@@ -0,0 +1,95 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, insert, select
+
+import app.db.base  # noqa: F401
+from app.core.config import settings
+from app.db import session as db_session
+from app.models.health_metric_rollup import HealthMetricRollup
+from app.models.health_metrics import HealthMetric
+from app.services.retention import bucket_start, rollup_rows, run_retention
+
+NOW = datetime(2026, 6, 1, tzinfo=timezone.utc)
+
+
+def test_rollup_rows_aggregates_per_patient_bucket():
+    t0 = datetime(2026, 1, 1, 10, 5, tzinfo=timezone.utc)
+    rows = [(1, 60.0, t0), (1, 80.0, t0 + timedelta(minutes=30)),
+            (1, 70.0, t0 + timedelta(hours=1)), (2, 50.0, t0)]
+    buckets = rollup_rows(rows, 3600)
+    assert buckets[(1, bucket_start(t0, 3600))] == [2, 140.0, 60.0, 80.0]
+    assert len(buckets) == 3
+
+
+async def _seed():
+    async with db_session.engine.begin() as conn:
+        rows = []
+        for days_old in (400, 100, 10):
+            for i in range(3):
+                ts = NOW - timedelta(days=days_old, minutes=i)
+                rows.append({"patient_id": 1, "metric_type": "heart_rate",
+                             "value": 60.0 + i, "timestamp": ts})
+                rows.append({"patient_id": 1, "metric_type": "glucose",
+                             "value": 100.0 + i, "timestamp": ts})
+        await conn.execute(insert(HealthMetric), rows)
+
+
+async def _counts():
+    async with db_session.SessionLocal() as db:
+        raw = await db.execute(
+            select(HealthMetric.metric_type, func.count()).group_by(HealthMetric.metric_type))
+        rollups = await db.execute(select(HealthMetricRollup))
+        return dict(raw.all()), rollups.scalars().all()
+
+
+def test_retention_rolls_up_then_deletes(db, run, monkeypatch):
+    monkeypatch.setattr(settings, "METRIC_RETENTION_DAYS", {"heart_rate": 30})
+    monkeypatch.setattr(settings, "METRIC_RETENTION_DEFAULT_DAYS", 365)
+
+    async def _run():
+        await _seed()
+        dry = await run_retention(dry_run=True, now=NOW, batch_size=2)
+        assert dry.state == "done"
+        assert dry.by_metric_type == {"glucose": 3, "heart_rate": 6}
+        assert (await _counts())[0] == {"glucose": 9, "heart_rate": 9}
+
+        progress = await run_retention(now=NOW, batch_size=2)
+        assert progress.state == "done"
+        assert progress.rows_deleted == 9
+        assert progress.maintenance in ("analyze", "analyze_vacuum")
+        raw, rollups = await _counts()
+        assert raw == {"glucose": 6, "heart_rate": 3}
+        heart = [r for r in rollups if r.metric_type == "heart_rate"]
+        assert sum(r.count for r in heart) == 6
+        assert sum(r.value_sum for r in heart) == 2 * (60 + 61 + 62)
+
+    run(_run())
+
+
+def test_background_run_allows_one_run_at_a_time():
+    from app.services.scheduler import BackgroundRun
+
+    async def _run():
+        runs = BackgroundRun("retention")
+        release = asyncio.Event()
+
+        async def job(progress):
+            await release.wait()
+            progress["state"] = "done"
+
+        class Progress(dict):
+            def as_dict(self):
+                return dict(self)
+
+        runs.start(Progress(state="running"), job)
+        with pytest.raises(RuntimeError):
+            runs.start(Progress(), job)
+        await runs.run_scheduled(lambda: runs.start(Progress(), job))  # skipped
+        assert runs.status() == {"state": "running"}
+        release.set()
+        await runs.task
+        assert runs.status() == {"state": "done"} and not runs.running
+
+    asyncio.run(_run())
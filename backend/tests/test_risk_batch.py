@@ -0,0 +1,63 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, insert, select
+
+import app.db.base  # noqa: F401
+from app.db import session as db_session
+from app.models.health_metrics import HealthMetric
+from app.models.job_checkpoint import JobCheckpoint
+from app.models.risk_assessment import RiskAssessment
+from app.services.risk_batch import CHECKPOINT_NAME, run_risk_assessment
+
+
+async def _assessments():
+    async with db_session.SessionLocal() as db:
+        return (await db.execute(select(func.count(RiskAssessment.id)))).scalar()
+
+
+async def _set_checkpoint(state, position, updated_at):
+    async with db_session.SessionLocal() as db:
+        await db.merge(JobCheckpoint(name=CHECKPOINT_NAME, state=state,
+                                     position=position, updated_at=updated_at))
+        await db.commit()
+
+
+@pytest.mark.dataset(patients=5, metrics=6, seed=3)
+def test_batch_job_writes_only_changes_and_resumes(dataset, run):
+    async def _run():
+        first = await run_risk_assessment(chunk_size=2)
+        assert first.state == "done" and first.chunks == 3
+        assert first.patients_scored == 5
+        assert first.assessments_written == 30 == await _assessments()
+
+        # Nothing moved: every condition is within the threshold.
+        again = await run_risk_assessment(chunk_size=2)
+        assert again.assessments_written == 0 and again.assessments_unchanged == 30
+
+        async with db_session.SessionLocal() as db:
+            await db.execute(insert(HealthMetric), [{
+                "patient_id": 2, "metric_type": "glucose", "value": 240.0,
+                "timestamp": datetime.now(timezone.utc)}])
+            await db.commit()
+        changed = await run_risk_assessment(chunk_size=2)
+        assert changed.assessments_written == 1
+        assert changed.alerts_raised == 1  # diabetes escalated to Critical
+
+        # A live run elsewhere holds the lease; a stale one is resumed.
+        now = datetime.now(timezone.utc)
+        await _set_checkpoint("running", 3, now)
+        assert (await run_risk_assessment(now=now)).state == "skipped"
+        await _set_checkpoint("done", 5, now)
+        # Two workers starting together: only one takes the lease.
+        runs = await asyncio.gather(run_risk_assessment(), run_risk_assessment())
+        assert sorted(r.state for r in runs) == ["done", "skipped"]
+        await _set_checkpoint("running", 3, now - timedelta(hours=1))
+        resumed = await run_risk_assessment(now=now, chunk_size=2)
+        assert resumed.resumed_from == 3 and resumed.patients_scored == 2
+        async with db_session.SessionLocal() as db:
+            checkpoint = await db.get(JobCheckpoint, CHECKPOINT_NAME)
+            assert (checkpoint.state, checkpoint.position) == ("done", 5)
+
+    run(_run())
@@ -0,0 +1,41 @@
+import pytest
+
+from simulate_device import LatencyHistogram, RateProfile, compare_reports
+
+
+def test_histogram_percentiles_within_bucket_error():
+    hist = LatencyHistogram()
+    for ms in range(1, 1001):
+        hist.record(float(ms))
+    summary = hist.summary()
+    assert summary["count"] == 1000
+    assert summary["p50"] == pytest.approx(500, rel=0.03)
+    assert summary["p99"] == pytest.approx(990, rel=0.03)
+    assert summary["max"] == 1000
+
+
+def test_rate_profiles():
+    assert RateProfile("constant:25").rate_at(100) == 25
+    ramp = RateProfile("linear:10:110:10")
+    assert ramp.rate_at(0) == 10
+    assert ramp.rate_at(5) == 60
+    assert ramp.rate_at(60) == 110
+    steps = RateProfile("step:10@0,50@30,100@60")
+    assert [steps.rate_at(t) for t in (0, 45, 90)] == [10, 50, 100]
+    with pytest.raises(ValueError):
+        RateProfile("sine:1")
+
+
+def _report(p99, readings_per_s, error_rate=0.0):
+    return {
+        "latency_ms": {"p50": 10, "p95": 20, "p99": p99},
+        "throughput": {"readings_per_s": readings_per_s},
+        "requests": {"error_rate": error_rate},
+    }
+
+
+def test_compare_reports_flags_regressions():
+    baseline = _report(p99=50, readings_per_s=1000)
+    assert compare_reports(_report(52, 990), baseline, 0.1) == []
+    regressions = compare_reports(_report(80, 700), baseline, 0.1)
+    assert len(regressions) == 2
@@ -0,0 +1,34 @@
+from app.core.config import settings
+from profile_imports import BASELINE_IMPORT, HEAVY_MODULES, measure_import, parse_importtime
+
+
+def test_import_main_loads_no_heavy_modules():
+    loaded = set(measure_import()[0]["modules"])
+    assert [m for m in HEAVY_MODULES if m in loaded] == []
+
+
+def _best_import_ms(module: str) -> float:
+    # Best of two fresh interpreters, to ride out a noisy neighbour
+    return min(measure_import(module)[0]["seconds"] for _ in range(2)) * 1000
+
+
+def test_import_main_stays_within_budget():
+    # Scaled by the frameworks' own import time on this machine, so a slow
+    # runner raises the bar instead of failing the suite.
+    baseline_ms = _best_import_ms(BASELINE_IMPORT)
+    budget_ms = max(settings.STARTUP_IMPORT_BUDGET_MS,
+                    settings.STARTUP_IMPORT_BASELINE_FACTOR * baseline_ms)
+    best_ms = _best_import_ms("main")
+    assert best_ms <= budget_ms, (
+        f"import main took {best_ms:.0f} ms against a {budget_ms:.0f} ms budget "
+        f"({baseline_ms:.0f} ms for {BASELINE_IMPORT}); run profile_imports.py to see where")
+
+
+def test_parse_importtime():
+    rows = parse_importtime(
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |     app.core\n"
+        "import time:      2000 |       2500 |   app.db.session\n")
+    assert rows[1] == {"module": "app.db.session", "depth": 1,
+                       "self_ms": 2.0, "cumulative_ms": 2.5}
+    assert rows[0]["depth"] == 2
@@ -0,0 +1,53 @@
+import httpx
+import pytest
+
+from app.core.telemetry import HTTP_LATENCY, INGESTED_READINGS, Registry
+
+
+def test_exposition_format():
+    registry = Registry()
+    hits = registry.counter("hits_total", "Hits.", ("path",))
+    size = registry.histogram("size", "Sizes.", buckets=(1, 10))
+    depth = registry.gauge("depth", "Depth.", callback=lambda: 3)
+    hits.labels('a"b').inc(2)
+    for value in (0.5, 1, 7, 50):
+        size.observe(value)
+
+    text = registry.render()
+    assert '# TYPE hits_total counter\nhits_total{path="a\\"b"} 2\n' in text
+    assert 'size_bucket{le="1"} 2\nsize_bucket{le="10"} 3\nsize_bucket{le="+Inf"} 4\n' in text
+    assert "size_sum 58.5\nsize_count 4\n" in text
+    assert "depth 3\n" in text
+    depth.set_function(lambda: 1 / 0)
+    assert "depth NaN\n" in registry.render()
+
+
+@pytest.mark.dataset(seed=3)
+def test_requests_and_ingestion_are_recorded(dataset, run):
+    from main import app
+
+    async def _run():
+        patient = {"Authorization": f"Bearer {dataset.patient_tokens[0]}"}
+        latency = HTTP_LATENCY.labels("POST", "/api/v1/patients/metrics")
+        before_requests, before_readings = latency.count, INGESTED_READINGS.labels("rest").value
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            for value in (70.0, 71.0):
+                response = await client.post("/api/v1/patients/metrics", headers=patient,
+                                             json={"metric_type": "heart_rate", "value": value})
+                assert response.status_code == 200
+            await client.get("/api/v1/doctors/patients/7/risk-history", headers=patient)
+            await client.get("/no-such-page")
+            scrape = await client.get("/metrics")
+
+        assert latency.count == before_requests + 2
+        assert INGESTED_READINGS.labels("rest").value == before_readings + 2
+        assert scrape.headers["content-type"].startswith("text/plain; version=0.0.4")
+        body = scrape.text
+        assert ('biosense_http_requests_total{method="POST",route="/api/v1/patients/metrics",'
+                'status="2xx"}') in body
+        assert 'route="/api/v1/doctors/patients/{patient_id}/risk-history",status="4xx"} 1' in body
+        assert 'route="unmatched",status="4xx"} ' in body
+        assert 'biosense_db_pool_connections{state="checked_out"} ' in body
+
+    run(_run())
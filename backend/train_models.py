@@ -0,0 +1,78 @@
+import argparse
+import os
+import random
+from datetime import datetime, timezone
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.model_runtime import CONDITION_SLUGS, DEFAULT_THRESHOLDS, feature_row
+from app.services.prediction import RISK_CONDITIONS, score_risks_batch
+
+# Trains one classifier per condition and writes it where the API's model
+# runtime picks it up on its next reload:
+#   python train_models.py [--version v2] [--samples 20000]
+#
+# Until labelled outcomes are available the targets are the heuristic
+# engine's own High/Critical calls on synthetic vitals, with some label
+# noise, so the models reproduce the heuristics smoothly rather than
+# improving on them. Swap `synthetic_dataset` for real data to do better.
+
+COLUMNS = ("heart_rate", "glucose", "spo2", "respiratory_rate", "blood_pressure_sys",
+           "blood_pressure_dia", "stress_level", "age", "bmi", "smoking", "hrv")
+RANGES = {
+    "heart_rate": (45, 130), "glucose": (65, 240), "spo2": (86, 100),
+    "respiratory_rate": (10, 28), "blood_pressure_sys": (95, 180),
+    "blood_pressure_dia": (55, 115), "stress_level": (0, 100),
+}
+
+
+def synthetic_dataset(samples: int, rng: random.Random, noise: float = 0.05):
+    metrics = [{k: rng.uniform(lo, hi) for k, (lo, hi) in RANGES.items()} for _ in range(samples)]
+    profiles = [{"age": rng.uniform(20, 85), "bmi": rng.uniform(18, 40),
+                 "smoking_history": rng.random() < 0.2} for _ in range(samples)]
+    labels = {condition: [] for condition in RISK_CONDITIONS}
+    for m, profile in zip(metrics, profiles):
+        for condition, _, level in score_risks_batch([m], profile)[0]:
+            positive = level in ("High", "Critical")
+            labels[condition].append(int(positive != (rng.random() < noise)))
+    X = np.array([feature_row(m, p, None, COLUMNS) for m, p in zip(metrics, profiles)])
+    return X, {c: np.array(y) for c, y in labels.items()}
+
+
+def train(out_dir: str, version: str, samples: int, seed: int, conditions=None):
+    import joblib
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import PolynomialFeatures, StandardScaler
+
+    X, labels = synthetic_dataset(samples, random.Random(seed))
+    written = []
+    for condition in conditions or RISK_CONDITIONS:
+        y = labels[condition]
+        if y.min() == y.max():
+            print(f"{condition}: only one class in the data, skipped")
+            continue
+        model = make_pipeline(StandardScaler(), PolynomialFeatures(2),
+                              LogisticRegression(max_iter=2000))
+        model.fit(X, y)
+        directory = os.path.join(out_dir, CONDITION_SLUGS[condition])
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{version}.joblib")
+        joblib.dump({
+            "model": model, "columns": COLUMNS, "thresholds": DEFAULT_THRESHOLDS,
+            "trained_at": datetime.now(timezone.utc).isoformat(), "samples": samples,
+        }, path)
+        print(f"{condition}: train accuracy {model.score(X, y):.3f} -> {path}")
+        written.append(path)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train per-condition risk models.")
+    parser.add_argument("--out", default=settings.MODEL_DIR)
+    parser.add_argument("--version", default=datetime.now(timezone.utc).strftime("v%Y%m%d%H%M%S"))
+    parser.add_argument("--samples", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    train(args.out, args.version, args.samples, args.seed)
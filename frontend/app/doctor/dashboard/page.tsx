@@ -32,65 +32,36 @@ export default function DoctorDashboard() {
     const [doctor, setDoctor] = useState<Doctor | null>(null);
     const [patients, setPatients] = useState<Patient[]>([]);
 
-    const fetchDoctor = useCallback(async (token: string) => {
+    // One request for everything on this page; the refresh skips the doctor's profile.
+    const fetchDashboard = useCallback(async (fields: string) => {
+        const token = localStorage.getItem("token");
         try {
-            const res = await fetch(`${process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000/api/v1'}/doctors/me`, {
+            const res = await fetch(`${process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000/api/v1'}/doctors/dashboard?fields=${fields}&patient_limit=10`, {
                 headers: { "Authorization": `Bearer ${token}` }
             });
-            if (res.ok) setDoctor(await res.json());
-        } catch (err) {
-            console.error("Error fetching doctor:", err);
-        }
-    }, []);
-
-    const fetchStats = useCallback(async () => {
-        const token = localStorage.getItem("token");
-        try {
-            const [patRes, appRes, statsRes] = await Promise.all([
-                fetch(`${process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000/api/v1'}/doctors/patients?limit=10`, {
-                    headers: { "Authorization": `Bearer ${token}` }
-                }),
-                fetch(`${process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000/api/v1'}/doctors/appointments`, {
-                    headers: { "Authorization": `Bearer ${token}` }
-                }),
-                fetch(`${process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'}/api/v1/doctors/stats`, {
-                    headers: { "Authorization": `Bearer ${token}` }
-                })
-            ]);
-
-            if (patRes.ok) {
-                const patientsList = await patRes.json();
-                setPatients(patientsList);
-            }
-            if (statsRes.ok) {
-                const statsData = await statsRes.json();
+            if (!res.ok) return;
+            const data = await res.json();
+            if (data.doctor) setDoctor(data.doctor);
+            if (data.patients) setPatients(data.patients);
+            if (data.stats) {
                 setStats({
-                    totalPatients: statsData.total_patients,
-                    newPatients: statsData.new_patients,
-                    todayAppointments: statsData.today_appointments,
-                    pendingActions: statsData.pending_actions
+                    totalPatients: data.stats.total_patients,
+                    newPatients: data.stats.new_patients,
+                    todayAppointments: data.stats.today_appointments,
+                    pendingActions: data.stats.pending_actions
                 });
-            } else if (appRes.ok) {
-                // Fallback for appointments if stats fails
-                const apps = await appRes.json();
-                setStats(prev => ({ ...prev, todayAppointments: apps.length }));
             }
         } catch (err) {
-            console.error("Error fetching stats:", err);
+            console.error("Error fetching dashboard:", err);
         }
     }, []);
 
 
     useEffect(() => {
-        const loadData = async () => {
-            await fetchStats();
-            const token = localStorage.getItem("token");
-            if (token) await fetchDoctor(token);
-        };
-        loadData();
-        const interval = setInterval(fetchStats, 10000);
+        fetchDashboard("doctor,stats,patients");
+        const interval = setInterval(() => fetchDashboard("stats,patients"), 10000);
         return () => clearInterval(interval);
-    }, [fetchStats, fetchDoctor]);
+    }, [fetchDashboard]);
 
     return (
         <div className="space-y-10 animate-fade-in">
@@ -50,8 +50,10 @@ interface PredictionSummary {
     };
     data_quality: {
         monitoring_coverage: number;
-        lab_accuracy: number;
-        manual_entry: number;
+        continuity: number;
+        fresh_inputs: number;
+        longest_gap_seconds: number | null;
+        stale_metrics: string[];
     };
     overall_status: string;
 }
@@ -20,6 +20,7 @@ interface Prediction {
     confidence: number;
     key_indicators: string[];
     status_text: string;
+    stale_inputs?: string[];
 }
 
 interface Recommendations {
@@ -29,8 +30,10 @@ interface Recommendations {
 
 interface DataQuality {
     monitoring_coverage: number;
-    lab_accuracy: number;
-    manual_entry: number;
+    continuity: number;
+    fresh_inputs: number;
+    longest_gap_seconds: number | null;
+    stale_metrics: string[];
 }
 
 interface AIPredictionsDashboardProps {
@@ -277,8 +280,8 @@ export default function AIPredictionsDashboard({ data }: AIPredictionsDashboardP
 
                     <div className="space-y-6">
                         <QualityMeter label="Monitoring Coverage" value={data.data_quality.monitoring_coverage} color="text-indigo-500" />
-                        <QualityMeter label="Lab Data Integrity" value={data.data_quality.lab_accuracy} color="text-blue-500" />
-                        <QualityMeter label="Manual Entry Support" value={data.data_quality.manual_entry} color="text-emerald-500" />
+                        <QualityMeter label="Hourly Continuity" value={data.data_quality.continuity} color="text-blue-500" />
+                        <QualityMeter label="Fresh Inputs" value={data.data_quality.fresh_inputs} color="text-emerald-500" />
                     </div>
 
                     <div className="mt-auto p-6 bg-slate-50 dark:bg-slate-800 rounded-3xl border border-slate-100 dark:border-slate-800">